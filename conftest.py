@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Shared test fixtures
+A local stand-in for the ElevenLabs streaming endpoint, used by the TTS,
+TTS cache and voice transcode tests.
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.voice import tts_elevenlabs as tts
+
+
+class FakeElevenLabs:
+    """Streams "<text>" back as audio after a fixed delay, ID3 tag first"""
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.payloads = []
+        self.peers = set()
+
+    async def handle(self, request):
+        payload = await request.json()
+        self.payloads.append(payload)
+        self.peers.add(request.transport.get_extra_info("peername"))
+        assert request.headers["xi-api-key"] == "test-key"
+        assert request.match_info["voice"] == "luna"
+        from aiohttp import web
+
+        response = web.StreamResponse()
+        await response.prepare(request)
+        await response.write(b"ID3\x03\x00\x00\x00\x00\x00\x02xx")  # 2-byte tag body
+        await asyncio.sleep(self.delay)
+        await response.write(f"<{payload['text']}>".encode())
+        return response
+
+
+async def with_server(fake, body):
+    """Serve `fake` on a free local port and run body(base_url)"""
+    from aiohttp import web
+
+    app = web.Application()
+    app.router.add_post("/v1/text-to-speech/{voice}/stream", fake.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        return await body(f"http://127.0.0.1:{port}/v1/text-to-speech")
+    finally:
+        await runner.cleanup()
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """Test API key; call with a with_server URL to point the client at it"""
+    monkeypatch.setattr(tts, "API_KEY", "test-key")
+
+    def configure(url):
+        monkeypatch.setattr(tts, "ELEVEN_API", url)
+
+    return configure
@@ -0,0 +1,4 @@
+"""
+Luna Noir Benchmarks
+Standalone scripts that measure hot paths against the code they replace.
+"""
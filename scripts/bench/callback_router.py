@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Callback Router Benchmark
+Routes synthetic callback queries through the compiled CallbackRouter and
+through an equivalent startswith/== chain for comparison.
+
+Usage:
+    python scripts/bench/callback_router.py [count]
+"""
+
+import sys
+import time
+import random
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from src.core.callback_router import (
+    CallbackRouter, parse_gen_callback, parse_subscribe_callback,
+    parse_credit_pack_callback, parse_mode_callback
+)
+
+EXACT = [
+    "menu_generate", "menu_voice", "menu_profile", "menu_mode", "menu_premium",
+    "menu_help", "menu_nude_poses", "menu_outfits", "menu_main", "voice_toggle",
+    "action_daily", "action_quests", "action_leaderboard", "start_trial",
+    "show_plans", "show_credits", "upgrade",
+]
+SAMPLES = EXACT + [
+    "gen_selfie_sultry", "gen_selfie_cute", "gen_scene_bedroom", "gen_scene_nude_lying",
+    "gen_outfit_lingerie_lace", "gen_outfit_casual", "subscribe:basic", "subscribe:vip",
+    "buy_credits:20_pack", "mode:SAFE", "mode:NSFW", "mode:locked:FLIRTY",
+    "gif_wink", "upgrade:vip",
+]
+
+
+async def _noop(update, context, **kwargs):
+    return None
+
+
+def build_router() -> CallbackRouter:
+    router = CallbackRouter()
+    for data in EXACT:
+        router.exact(data, _noop)
+    router.prefix("gen_", _noop, parser=parse_gen_callback)
+    router.prefix("subscribe:", _noop, parser=parse_subscribe_callback)
+    router.prefix("buy_credits:", _noop, parser=parse_credit_pack_callback)
+    router.prefix("mode:locked:", _noop, answer=False)
+    router.prefix("mode:", _noop, parser=parse_mode_callback, answer=False)
+    router.fallback(_noop)
+    return router
+
+
+def legacy_chain(data: str) -> str:
+    """Mirror of the old menu/action/upsell/mode dispatch order"""
+    if data.startswith("menu_"):
+        for name in EXACT[:9]:
+            if data == name:
+                return name
+        return "menu_?"
+    if data.startswith(("gen_", "gif_", "voice_toggle", "action_")):
+        if data.startswith("gen_"):
+            parts = data.split("_")
+            return f"gen:{parts[1]}:{'_'.join(parts[2:])}"
+        for name in ("voice_toggle", "action_daily", "action_quests", "action_leaderboard"):
+            if data == name:
+                return name
+        return "action_?"
+    if data.startswith(("start_trial", "show_plans", "show_credits", "subscribe:", "buy_credits:")):
+        if data == "start_trial" or data == "show_plans" or data == "show_credits":
+            return data
+        if data.startswith("subscribe:"):
+            return "subscribe:" + data.split(":")[1]
+        return "buy_credits:" + data.split(":")[1]
+    if data == "upgrade":
+        return data
+    if data.startswith("mode:locked:"):
+        return "locked"
+    if data.startswith("mode:"):
+        return "mode:" + data.split(":", 1)[1]
+    return "fallback"
+
+
+class _Query:
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    async def answer(self, *args, **kwargs):
+        return True
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = random.Random(42)
+    stream = [rng.choice(SAMPLES) for _ in range(count)]
+    router = build_router()
+
+    start = time.perf_counter()
+    for data in stream:
+        legacy_chain(data)
+    legacy_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for data in stream:
+        router.resolve(data)
+    resolve_s = time.perf_counter() - start
+
+    updates = [SimpleNamespace(callback_query=_Query(d)) for d in stream]
+
+    async def run():
+        for u in updates:
+            await router.dispatch(u, None)
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    dispatch_s = time.perf_counter() - start
+
+    print(f"Routed {count:,} synthetic callback queries")
+    print(f"  legacy if/elif chain: {legacy_s * 1e3:8.1f} ms ({legacy_s / count * 1e9:6.0f} ns/query)")
+    print(f"  router.resolve:       {resolve_s * 1e3:8.1f} ms ({resolve_s / count * 1e9:6.0f} ns/query)")
+    print(f"  router.dispatch:      {dispatch_s * 1e3:8.1f} ms ({dispatch_s / count * 1e9:6.0f} ns/query, incl. answer + counters)")
+    print("\nPer-route counters:")
+    for name, st in sorted(router.stats().items(), key=lambda kv: -kv[1]["calls"])[:10]:
+        print(f"  {name:22s} calls={st['calls']:6d} avg={st['avg_ms']:.4f}ms max={st['max_ms']:.4f}ms")
+
+
+if __name__ == "__main__":
+    main()
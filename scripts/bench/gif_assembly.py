@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+GIF Assembly Benchmark
+Output size, peak RSS and encode time per GIF_SCENARIOS entry: the old
+decode-everything PIL save versus the streaming shared-palette assembler.
+
+Frames are synthetic 512x512 JPEGs (gradient backdrop, grain, a figure that
+moves a little between frames), so no network access is needed. Frames
+are generated once per scenario and handed to a fresh subprocess per
+encode, so peak RSS measures the encoder alone.
+
+Usage:
+    python scripts/bench/gif_assembly.py [scenario ...]
+"""
+
+import io
+import sys
+import json
+import time
+import pickle
+import random
+import resource
+import tempfile
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+SIZE = 512
+BUDGET = 64 * 1024
+
+
+def synthetic_frames(count: int, seed: int = 7):
+    from PIL import Image, ImageDraw, ImageFilter
+
+    rng = random.Random(seed)
+    backdrop = Image.linear_gradient("L").resize((SIZE, SIZE))
+    backdrop = Image.merge("RGB", (backdrop, backdrop.rotate(90), Image.new("L", (SIZE, SIZE), 90)))
+    grain = Image.effect_noise((SIZE, SIZE), 24).convert("RGB")
+    backdrop = Image.blend(backdrop, grain, 0.15)
+
+    frames = []
+    for i in range(count):
+        img = backdrop.copy()
+        draw = ImageDraw.Draw(img)
+        dx, dy = rng.randint(-12, 12), rng.randint(-6, 6)
+        draw.ellipse([200 + dx, 80 + dy, 312 + dx, 200 + dy], fill=(236, 214, 222))
+        draw.rectangle([180 + dx, 200 + dy, 332 + dx, 460 + dy], fill=(24, 20, 28))
+        draw.ellipse([232 + dx, 120 + dy, 280 + dx, 140 + dy + (i % 3) * 4], fill=(140, 60, 170))
+        img = img.filter(ImageFilter.SMOOTH)
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=90)
+        frames.append(buf.getvalue())
+    return frames
+
+
+def legacy_encode(frames, duration: int) -> bytes:
+    """The pre-assembler implementation: all frames decoded, one PIL save"""
+    from PIL import Image
+
+    images = [Image.open(io.BytesIO(f)).convert("RGB") for f in frames]
+    out = io.BytesIO()
+    images[0].save(out, format="GIF", save_all=True, append_images=images[1:],
+                   duration=duration, loop=0, optimize=False)
+    return out.getvalue()
+
+
+def streaming_encode(frames, duration: int) -> bytes:
+    from src.image.gif_assembler import assemble_gif
+    return assemble_gif(frames, duration=duration)
+
+
+def budget_encode(frames, duration: int) -> bytes:
+    from src.image.gif_assembler import assemble_gif
+    return assemble_gif(frames, duration=duration, target_bytes=BUDGET)
+
+
+def peak_rss_kb() -> int:
+    """Peak RSS of this process in KiB
+
+    VmHWM starts fresh with each exec; ru_maxrss (the fallback off Linux)
+    can carry over the high-water mark of the forking parent.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+ENCODERS = {"legacy": legacy_encode, "streaming": streaming_encode, "budget 64K": budget_encode}
+
+
+def run_one(encoder: str, frames_path: str, duration: int):
+    """Child process: encode pickled frames and print a JSON result"""
+    import PIL.Image  # noqa: F401 - imports are not part of the measurement
+    import src.image.gif_assembler  # noqa: F401
+
+    with open(frames_path, "rb") as f:
+        frames = pickle.load(f)
+    base_kb = peak_rss_kb()
+    start = time.perf_counter()
+    data = ENCODERS[encoder](frames, duration)
+    elapsed = time.perf_counter() - start
+    peak_kb = peak_rss_kb()
+    print(json.dumps({"bytes": len(data), "ms": elapsed * 1000, "rss_kb": peak_kb - base_kb}))
+
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == "--run":
+        run_one(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        return
+
+    from src.image.gif_generator import GIF_SCENARIOS
+
+    scenarios = sys.argv[1:] or list(GIF_SCENARIOS)
+    print(f"{'scenario':<12} {'frames':>6} {'encoder':<12} {'size':>10} {'peak RSS +':>11} {'time':>9}")
+    for scenario_type in scenarios:
+        scenario = GIF_SCENARIOS[scenario_type]
+        count = len(scenario["descriptions"])
+        with tempfile.NamedTemporaryFile(suffix=".pkl") as f:
+            pickle.dump(synthetic_frames(count), f)
+            f.flush()
+            for encoder in ENCODERS:
+                out = subprocess.run(
+                    [sys.executable, __file__, "--run", encoder, f.name, str(scenario["duration"])],
+                    capture_output=True, text=True, check=True,
+                ).stdout
+                r = json.loads(out)
+                print(f"{scenario_type:<12} {count:>6} {encoder:<12} {r['bytes'] / 1024:>8.0f}KB "
+                      f"{r['rss_kb'] / 1024:>9.1f}MB {r['ms']:>7.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
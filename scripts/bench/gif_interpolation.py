@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+GIF Interpolation Benchmark
+Remote calls and wall time per GIF_SCENARIOS entry: every frame generated
+upstream versus keyframes upstream plus local in-betweens.
+
+Upstream is simulated by a fetcher that sleeps for a fixed latency and
+returns a synthetic 512x512 frame, with the image cache disabled.
+Pollinations takes 30-120 s per image in production, so the time saved
+scales with --latency. Wall time only drops when the remote calls don't
+all fit in one concurrent round; --concurrency 1 models an upstream that
+serializes requests (rate-limited IP).
+
+Usage:
+    python scripts/bench/gif_interpolation.py [--latency S] [--inbetweens N] [--method flow|crossfade]
+                                              [--concurrency N]
+"""
+
+import io
+import os
+import sys
+import time
+import zlib
+import asyncio
+import argparse
+import threading
+from pathlib import Path
+
+os.environ["IMAGE_CACHE_MAX_MB"] = "0"
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from src.image import gif_generator as gif  # noqa: E402
+
+
+class SimulatedUpstream:
+    """Sleeps `latency` seconds per request and counts calls"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, url: str) -> bytes:
+        from PIL import Image, ImageDraw
+
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        # Pose offset derived from the prompt so different frames differ
+        offset = zlib.crc32(url.encode()) % 120
+        img = Image.linear_gradient("L").resize((512, 512)).convert("RGB")
+        draw = ImageDraw.Draw(img)
+        draw.ellipse([150 + offset, 90, 270 + offset, 210], fill=(236, 214, 222))
+        draw.rectangle([170 + offset, 210, 250 + offset, 470], fill=(24, 20, 28))
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=90)
+        return buf.getvalue()
+
+
+def measure(upstream: SimulatedUpstream, coro_factory):
+    upstream.calls = 0
+    start = time.perf_counter()
+    frames = asyncio.run(coro_factory())
+    return frames, upstream.calls, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--latency", type=float, default=1.0, help="simulated seconds per remote image")
+    parser.add_argument("--inbetweens", type=int, default=gif.GIF_INBETWEENS)
+    parser.add_argument("--method", default=gif.GIF_INTERPOLATION_METHOD, choices=("flow", "crossfade"))
+    parser.add_argument("--concurrency", type=int, default=None, help="in-flight requests (default: per scenario)")
+    args = parser.parse_args(argv)
+
+    upstream = SimulatedUpstream(args.latency)
+    gif._fetch_once = upstream
+
+    limit = args.concurrency
+    print(f"latency {args.latency}s/image, concurrency {limit or 'per scenario'}, "
+          f"{args.inbetweens} in-betweens, {args.method}\n")
+    print(f"{'scenario':<12} {'full: calls':>11} {'frames':>6} {'wall':>7} | "
+          f"{'interp: calls':>13} {'frames':>6} {'wall':>7} {'synth':>6} | {'saved':>5} {'wall saved':>10}")
+    for scenario_type, scenario in gif.GIF_SCENARIOS.items():
+        if "keyframes" not in scenario:
+            print(f"{scenario_type:<12} (no keyframes, always fully rendered)")
+            continue
+        full, full_calls, full_s = measure(
+            upstream, lambda: gif.generate_gif_frames_async(scenario_type, concurrency=limit)
+        )
+        synth_before = gif.interpolation_stats()["synth_s"]
+        (frames, _duration), calls, interp_s = measure(
+            upstream,
+            lambda: gif.generate_interpolated_frames_async(scenario_type, inbetweens=args.inbetweens,
+                                                           method=args.method, concurrency=limit),
+        )
+        synth_s = gif.interpolation_stats()["synth_s"] - synth_before
+        print(f"{scenario_type:<12} {full_calls:>11} {len(full):>6} {full_s:>6.2f}s | "
+              f"{calls:>13} {len(frames):>6} {interp_s:>6.2f}s {synth_s:>5.2f}s | "
+              f"{full_calls - calls:>5} {full_s - interp_s:>9.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Image Post-Processing Benchmark
+Bytes sent and handler latency for generated photos: raw Pollinations
+PNGs versus downscaled progressive JPEG/WebP with an instant preview.
+
+Latency is modelled as processing time plus upload at --mbps with a fixed
+Telegram round trip. Event-loop lag is measured for real while a batch of
+images is processed in a worker thread (GIL contention) versus the
+process pool.
+
+Usage:
+    python scripts/bench/image_postprocess.py [--mbps M] [--rtt MS] [--batch N]
+"""
+
+import io
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from src.image import postprocess  # noqa: E402
+
+SIZES = {"square 1536x1536": (1536, 1536), "full body 1024x2048": (1024, 2048)}
+
+
+def synthetic_png(size) -> bytes:
+    """Photo-like PNG: gradient, sensor grain and soft shapes"""
+    from PIL import Image, ImageDraw, ImageFilter
+
+    w, h = size
+    img = Image.linear_gradient("L").resize(size)
+    img = Image.merge("RGB", (img, img.rotate(180), Image.new("L", size, 110)))
+    img = Image.blend(img, Image.effect_noise(size, 48).convert("RGB"), 0.2)
+    draw = ImageDraw.Draw(img)
+    draw.ellipse([w // 3, h // 10, 2 * w // 3, h // 3], fill=(232, 208, 216))
+    draw.rectangle([w // 4, h // 3, 3 * w // 4, 9 * h // 10], fill=(28, 22, 34))
+    img = img.filter(ImageFilter.GaussianBlur(1.2))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def upload_s(nbytes: int, mbps: float, rtt_ms: float) -> float:
+    return nbytes * 8 / (mbps * 1_000_000) + rtt_ms / 1000
+
+
+async def loop_lag(work, interval: float = 0.005):
+    """Run `work` in a thread while sampling how late a periodic tick fires"""
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append(time.perf_counter() - start - interval)
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.to_thread(work)
+    done.set()
+    await tick
+    return max(lags) * 1000, statistics.mean(lags) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Image post-processing benchmark")
+    parser.add_argument("--mbps", type=float, default=10.0, help="uplink to Telegram in Mbit/s")
+    parser.add_argument("--rtt", type=float, default=150.0, help="Telegram API round trip in ms")
+    parser.add_argument("--batch", type=int, default=8, help="images processed for the loop-lag test")
+    args = parser.parse_args(argv)
+
+    print(f"uplink {args.mbps} Mbit/s, RTT {args.rtt:.0f} ms, max side {postprocess.MAX_SIDE}px, "
+          f"quality {postprocess.QUALITY}\n")
+    print(f"{'image':<20} {'output':<8} {'bytes':>10} {'process':>8} {'first pixel':>11} {'full image':>10}")
+    sources = {}
+    for label, size in SIZES.items():
+        raw = sources[label] = synthetic_png(size)
+        base = upload_s(len(raw), args.mbps, args.rtt)
+        print(f"{label:<20} {'raw PNG':<8} {len(raw) / 1024:>8.0f}KB {'-':>8} {base * 1000:>9.0f}ms {base * 1000:>8.0f}ms")
+        for fmt in ("jpeg", "webp"):
+            start = time.perf_counter()
+            prepared = postprocess.prepare(raw, fmt=fmt)
+            proc = time.perf_counter() - start
+            first = proc + upload_s(len(prepared.preview), args.mbps, args.rtt)
+            full = first + upload_s(len(prepared.full), args.mbps, args.rtt)
+            print(f"{'':<20} {fmt:<8} {len(prepared.full) / 1024:>8.0f}KB {proc * 1000:>6.0f}ms "
+                  f"{first * 1000:>9.0f}ms {full * 1000:>8.0f}ms  (preview {len(prepared.preview)} B)")
+
+    batch = [sources["square 1536x1536"]] * args.batch
+    postprocess.prepare_photo(batch[0])  # start the pool outside the measurement
+
+    def in_thread():
+        for data in batch:
+            postprocess.prepare(data)
+
+    def in_pool():
+        for data in batch:
+            postprocess.prepare_photo(data)
+
+    print(f"\nEvent loop lag while processing {args.batch} images:")
+    for label, work in (("worker thread", in_thread), ("process pool", in_pool)):
+        worst, mean = asyncio.run(loop_lag(work))
+        print(f"  {label:<14} max {worst:6.1f}ms  mean {mean:5.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
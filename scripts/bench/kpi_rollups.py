@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+KPI Rollup Benchmark
+/stats query cost on a large message history: the old full-range scans in
+quick_kpis versus the hourly/daily rollups with HyperLogLog user sketches.
+
+Usage:
+    python scripts/bench/kpi_rollups.py [rows] [users]
+"""
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+SPAN_DAYS = 30
+MODES = ("SAFE", "FLIRTY", "NSFW", None)
+
+
+def legacy_quick_kpis(c, cutoff):
+    """The pre-rollup implementation: four scans of the raw tables"""
+    dau = c.execute("SELECT COUNT(DISTINCT user_id) FROM messages WHERE ts>?", (cutoff,)).fetchone()[0]
+    msgs = c.execute("SELECT COUNT(*) FROM messages WHERE ts>?", (cutoff,)).fetchone()[0]
+    prem = c.execute(
+        "SELECT COUNT(DISTINCT user_id) FROM messages WHERE ts>? AND is_premium=1", (cutoff,)
+    ).fetchone()[0]
+    revenue = c.execute(
+        "SELECT COALESCE(SUM(amount_cents), 0) FROM payments WHERE ts>?", (cutoff,)
+    ).fetchone()[0]
+    return {"dau": dau, "messages": msgs, "premium_senders": prem, "total_revenue_cents": revenue}
+
+
+def legacy_mode_breakdown(c, cutoff):
+    return dict(c.execute("SELECT mode, COUNT(*) FROM messages WHERE ts>? GROUP BY mode", (cutoff,)))
+
+
+def _rows(n, users, now):
+    rng = random.Random(1)
+    for _ in range(n):
+        uid = rng.randint(1, users)
+        yield (now - rng.randint(0, SPAN_DAYS * 86400), str(uid), int(uid % 10 == 0), rng.choice(MODES))
+
+
+def _timed(fn, repeat=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+    now = int(time.time())
+
+    with tempfile.TemporaryDirectory() as d:
+        os.environ["METRICS_DB"] = os.path.join(d, "metrics.db")
+        from src.metrics import db as metrics, rollups
+
+        # Load raw history directly (as if it predates the rollups)
+        c = sqlite3.connect(metrics.DB_PATH)
+        c.execute("PRAGMA journal_mode=WAL")
+        c.executescript(metrics._schema)
+        start = time.perf_counter()
+        with c:
+            c.executemany("INSERT INTO messages VALUES(?,?,?,?)", _rows(rows, users, now))
+            c.executemany(
+                "INSERT INTO payments VALUES(?,?,?,?)",
+                ((now - i * 97 % (SPAN_DAYS * 86400), str(i % users), 999, "usd") for i in range(rows // 100))
+            )
+        print(f"Loaded {rows:,} messages / {users:,} users in {time.perf_counter() - start:.1f}s")
+
+        # First _conn() backfills the rollups from raw history
+        start = time.perf_counter()
+        metrics._conn().close()
+        print(f"Rollup backfill: {time.perf_counter() - start:.1f}s")
+
+        for days in (1, 7):
+            cutoff = rollups.cutoff_for_days(days)
+            legacy_s, (lk, lm) = _timed(lambda: (legacy_quick_kpis(c, cutoff), legacy_mode_breakdown(c, cutoff)))
+            rollup_s, _ = _timed(lambda: (metrics.quick_kpis(days), metrics.get_mode_breakdown(days)), repeat=10)
+            # Accuracy is checked at the same cutoff the legacy scans used
+            w = rollups.window(c, cutoff)
+            exact = (w["messages"] == lk["messages"] and w["revenue_cents"] == lk["total_revenue_cents"]
+                     and w["by_mode"] == lm)
+            dau_err = abs(w["users"] - lk["dau"]) / max(1, lk["dau"]) * 100
+            print(f"\n{days}d window ({lk['messages']:,} messages)")
+            print(f"  legacy scans: {legacy_s * 1000:9.1f} ms")
+            print(f"  rollups:      {rollup_s * 1000:9.1f} ms  ({legacy_s / rollup_s:,.0f}x)")
+            print(f"  dau {lk['dau']:,} vs {w['users']:,} ({dau_err:.2f}% err), "
+                  f"premium {lk['premium_senders']:,} vs {w['premium_users']:,}, "
+                  f"messages/revenue/modes exact: {exact}")
+
+        # Incremental maintenance cost per flushed batch
+        batch = [("messages", r) for r in _rows(metrics.FLUSH_BATCH, users, now)]
+        wc = metrics._writer_conn()
+        apply_s, _ = _timed(lambda: rollups.apply_batch(wc, [r for _, r in batch], []))
+        wc.rollback()
+        wc.close()
+        print(f"\napply_batch({metrics.FLUSH_BATCH} events): {apply_s * 1000:.1f} ms")
+        c.close()
+        metrics.shutdown()
+
+
+if __name__ == "__main__":
+    main()
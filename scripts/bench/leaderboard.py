@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Leaderboard Benchmark
+/leaderboard and /rank cost with many users: the original per-request
+parse-and-sort of users.json versus the incrementally maintained index.
+
+A synthetic users.json with --users XP profiles (levels skewed low, as in
+production) is written to a temp directory.
+
+Usage:
+    python scripts/bench/leaderboard.py [--users N] [--updates N]
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from src.game import leaderboard  # noqa: E402
+
+
+def synthetic_profiles(n: int, rng: random.Random) -> dict:
+    profiles = {}
+    for i in range(n):
+        level = min(leaderboard.LEVEL_CAP, 1 + int(rng.expovariate(0.35)))
+        profiles[str(100_000_000 + i)] = {"xp": rng.randrange(100 * level), "level": level,
+                                          "last_daily": 0, "last_msg_xp": 0}
+    return profiles
+
+
+def legacy_top_xp(path: Path, n: int = 10):
+    d = json.loads(path.read_text())
+    items = [(uid, int(p.get("level", 1)), int(p.get("xp", 0))) for uid, p in d.get("xp", {}).items()]
+    items.sort(key=lambda t: (t[1], t[2]), reverse=True)
+    return items[:n]
+
+
+def timed(fn, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Leaderboard benchmark")
+    parser.add_argument("--users", type=int, default=1_000_000, help="XP profiles in users.json")
+    parser.add_argument("--updates", type=int, default=100_000, help="incremental XP updates to time")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(42)
+    profiles = synthetic_profiles(args.users, rng)
+    uids = list(profiles)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "users.json"
+        path.write_text(json.dumps({"xp": profiles}))
+        print(f"{args.users:,} users, users.json {path.stat().st_size / 1024 / 1024:.0f} MB\n")
+
+        legacy_s, legacy_top = timed(lambda: legacy_top_xp(path), 1)
+        # The user's own position, the old way: everything sorted, then a linear search
+        target = rng.choice(uids)
+        start = time.perf_counter()
+        ranked = legacy_top_xp(path, n=args.users)
+        legacy_rank = next(i for i, t in enumerate(ranked, 1) if t[0] == target)
+        legacy_rank_s = time.perf_counter() - start
+
+        leaderboard.USERS = path
+        index = leaderboard.LeaderboardIndex()
+        build_s, _ = timed(index._ensure_loaded, 1)
+
+    top_s, top = timed(lambda: index.top(10), 1000)
+    assert [t[1:] for t in top] == [t[1:] for t in legacy_top]
+    sample = rng.sample(uids, 1000)
+    start = time.perf_counter()
+    for uid in sample:
+        index.rank(uid)
+    rank_s = (time.perf_counter() - start) / len(sample)
+    # Ties share a rank; the old scan returns the tie's position in sort order
+    assert index.rank(target)["rank"] <= legacy_rank
+
+    start = time.perf_counter()
+    for _ in range(args.updates):
+        uid = rng.choice(uids)
+        level, xp = index._profiles[uid]
+        xp += rng.randrange(5, 30)
+        if xp >= 100 * level and level < leaderboard.LEVEL_CAP:
+            xp, level = xp - 100 * level, level + 1
+        index.update(uid, level, xp)
+    update_s = (time.perf_counter() - start) / args.updates
+
+    print(f"{'operation':<28} {'legacy':>12} {'index':>12}")
+    print(f"{'/leaderboard (top 10)':<28} {legacy_s * 1000:>10.0f}ms {top_s * 1e6:>10.1f}us")
+    print(f"{'/rank (own position)':<28} {legacy_rank_s * 1000:>10.0f}ms {rank_s * 1e6:>10.1f}us")
+    print(f"{'XP update':<28} {'-':>12} {update_s * 1e6:>10.1f}us")
+    print(f"{'index build (once)':<28} {'-':>12} {build_s * 1000:>10.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
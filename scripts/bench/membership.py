@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Premium Membership Benchmark
+Premium checks and updates with the schema 1 lists (premium_users,
+free_users, tiers) versus the schema 2 keyed records, at 10k, 100k and
+1M premium users, plus the one-off migration cost.
+
+Usage:
+    python scripts/bench/membership.py [--sizes 10000,100000,1000000]
+"""
+
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from src.payment import membership  # noqa: E402
+
+
+def legacy_db(n: int) -> dict:
+    premium = [str(100_000_000 + i) for i in range(n)]
+    return {
+        "premium_users": premium,
+        "free_users": [str(200_000_000 + i) for i in range(n // 10)],
+        "tiers": {u: "GOLD" for u in premium[::3]},
+    }
+
+
+def legacy_is_premium(db: dict, uid) -> bool:
+    return str(uid) in set(map(str, db["premium_users"]))
+
+
+def legacy_grant(db: dict, uid: str, tier: str):
+    if uid in db["premium_users"]:
+        return
+    db["premium_users"].append(uid)
+    if uid in db["free_users"]:
+        db["free_users"].remove(uid)
+    if tier:
+        db["tiers"][uid] = tier
+
+
+def legacy_revoke(db: dict, uid: str):
+    if uid in db["premium_users"]:
+        db["premium_users"].remove(uid)
+        db["free_users"].append(uid)
+        db["tiers"].pop(uid, None)
+
+
+def per_op(fn, items) -> float:
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) / len(items)
+
+
+def fmt(seconds: float) -> str:
+    return f"{seconds * 1000:.1f}ms" if seconds >= 1e-3 else f"{seconds * 1e6:.2f}us"
+
+
+def bench(n: int, rng: random.Random):
+    legacy = legacy_db(n)
+    start = time.perf_counter()
+    keyed = legacy_db(n)
+    membership.migrate(keyed)
+    migrate_s = time.perf_counter() - start
+
+    members = rng.sample(legacy["premium_users"], 100)
+    free = [str(200_000_000 + i) for i in rng.sample(range(n // 10), 100)]
+    # Old-style checks rebuild the set per call, so keep their sample small at 1M
+    slow = max(3, 100_000 // n * 10)
+
+    rows = [
+        ("is_premium (member)", per_op(lambda u: legacy_is_premium(legacy, u), members[:slow]),
+         per_op(lambda u: membership.is_member(keyed, u), members * 100)),
+        ("is_premium (free user)", per_op(lambda u: legacy_is_premium(legacy, u), free[:slow]),
+         per_op(lambda u: membership.is_member(keyed, u), free * 100)),
+        ("grant (free -> premium)", per_op(lambda u: legacy_grant(legacy, u, "GOLD"), free),
+         per_op(lambda u: membership.grant(keyed, u, "GOLD"), free)),
+        ("grant (redelivery)", per_op(lambda u: legacy_grant(legacy, u, "GOLD"), members),
+         per_op(lambda u: membership.grant(keyed, u, "GOLD"), members)),
+        ("revoke", per_op(lambda u: legacy_revoke(legacy, u), members),
+         per_op(lambda u: membership.revoke(keyed, u), members)),
+    ]
+    assert set(legacy["premium_users"]) == set(keyed["premium"])
+    assert {u for u, t in legacy["tiers"].items() if u in keyed["premium"]} == \
+        {u for u, r in keyed["premium"].items() if r["tier"]}
+
+    print(f"\n{n:,} premium users (migration {fmt(migrate_s)})")
+    print(f"  {'operation':<26} {'lists':>12} {'keyed':>12} {'speedup':>10}")
+    for name, old_s, new_s in rows:
+        print(f"  {name:<26} {fmt(old_s):>12} {fmt(new_s):>12} {old_s / new_s:>9.0f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Premium membership benchmark")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma-separated premium user counts")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(42)
+    for n in (int(s) for s in args.sizes.split(",")):
+        bench(n, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Metrics Writer Benchmark
+Sustained message inserts per second: the old connect-insert-commit path
+versus the buffered MetricsWriter used by log_msg.
+
+Usage:
+    python scripts/bench/metrics_writer.py [events]
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+
+def legacy_log_msg(db_path, lock, uid, is_premium, mode):
+    """The pre-buffer implementation: one connection + commit per event"""
+    with lock:
+        c = sqlite3.connect(db_path)
+        c.execute("PRAGMA journal_mode=WAL")
+        with c:
+            c.execute(
+                "INSERT INTO messages VALUES(?,?,?,?)",
+                (int(time.time()), str(uid), int(is_premium), mode)
+            )
+            c.commit()
+        c.close()
+
+
+def main():
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    with tempfile.TemporaryDirectory() as d:
+        os.environ["METRICS_DB"] = os.path.join(d, "metrics.db")
+        # Size the ring buffer for the burst so the run measures throughput,
+        # not the overflow drop policy (drops are still reported below)
+        os.environ.setdefault("METRICS_BUFFER_MAX_EVENTS", str(events))
+        from src.metrics import db as metrics
+
+        # Apply schema once up-front so both paths start equal
+        metrics._conn().close()
+
+        lock = threading.Lock()
+        legacy_n = max(1, events // 10)  # the old path is slow; sample fewer
+        start = time.perf_counter()
+        for i in range(legacy_n):
+            legacy_log_msg(metrics.DB_PATH, lock, i % 500, i % 7 == 0, "SAFE")
+        legacy_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(events):
+            metrics.log_msg(i % 500, i % 7 == 0, "SAFE")
+        submit_s = time.perf_counter() - start
+        metrics.flush()
+        total_s = time.perf_counter() - start
+
+        c = metrics._conn()
+        rows = c.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        c.close()
+        stats = metrics.writer_stats()
+        metrics.shutdown()
+
+    print(f"Legacy path:   {legacy_n:>7,} inserts in {legacy_s:6.2f}s -> {legacy_n / legacy_s:>10,.0f} inserts/s")
+    print(f"Buffered path: {events:>7,} inserts in {total_s:6.2f}s -> {events / total_s:>10,.0f} inserts/s "
+          f"(caller-side {submit_s / events * 1e6:.1f} µs/event)")
+    print(f"Rows in DB: {rows:,}  writer: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Quest Matching Benchmark
+Per-message quest check cost as the number of quests grows: the original
+try_autocomplete (load quests.json, rebuild the user's done-set, lowercase
+the message per quest) versus the compiled QuestEngine.
+
+Usage:
+    python scripts/bench/quests.py [--users N] [--messages N]
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from src.game.quests import QuestEngine  # noqa: E402
+
+WORDS = ("i", "you", "feel", "love", "today", "morning", "babe", "miss", "so", "much", "tell", "me",
+         "about", "your", "day", "night", "dream", "coffee", "rain", "sleep", "work", "happy", "tired")
+
+
+def make_quests(n: int, rng: random.Random):
+    quests = [{"id": "daily_greet", "text": "Say 'good morning'", "xp": 10, "key": "good morning", "reset": "daily"},
+              {"id": "share_thought", "text": "Tell Luna one thing on your mind", "xp": 15, "key": "I feel"}]
+    while len(quests) < n:
+        key = " ".join(rng.sample(WORDS, 3))
+        quests.append({"id": f"q{len(quests)}", "text": key, "xp": 5, "key": key})
+    return quests[:n]
+
+
+def legacy_autocomplete(path: Path, quests, uid: int, text: str):
+    d = json.loads(path.read_text())
+    u = str(uid)
+    done = set(d.get("completed", {}).get(u, []))
+    updates = []
+    for q in quests:
+        if q["id"] in done:
+            continue
+        if q["key"].lower() in (text or "").lower():
+            d.setdefault("completed", {}).setdefault(u, []).append(q["id"])
+            updates.append(q)
+    if updates:
+        path.write_text(json.dumps(d, indent=2))
+    return updates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quest matching benchmark")
+    parser.add_argument("--users", type=int, default=10_000, help="users with completions in quests.json")
+    parser.add_argument("--messages", type=int, default=2_000, help="messages checked per configuration")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(1)
+    messages = [" ".join(rng.choices(WORDS, k=rng.randint(4, 30))) for _ in range(args.messages)]
+    uids = [rng.randrange(args.users) for _ in messages]
+    print(f"{args.users:,} users in quests.json, {args.messages:,} messages of 4-30 words\n")
+    print(f"{'quests':>7} {'legacy':>12} {'engine':>10} {'match only':>11} {'states':>8}")
+
+    for n in (2, 50, 500, 5000):
+        quests = make_quests(n, rng)
+        completed = {str(u): ["share_thought"] for u in range(args.users)}
+        with tempfile.TemporaryDirectory() as tmp:
+            legacy_path = Path(tmp) / "legacy.json"
+            legacy_path.write_text(json.dumps({"progress": {}, "completed": completed}, indent=2))
+            sample = min(len(messages), 200)  # the legacy path is slow; time a subset
+            start = time.perf_counter()
+            for uid, text in zip(uids[:sample], messages[:sample]):
+                legacy_autocomplete(legacy_path, quests, uid, text)
+            legacy = (time.perf_counter() - start) / sample
+
+            engine_path = Path(tmp) / "engine.json"
+            engine_path.write_text(json.dumps({"progress": {}, "completed": completed}))
+            engine = QuestEngine(quests, engine_path)
+            engine.status(0)  # load state outside the measurement
+            start = time.perf_counter()
+            for uid, text in zip(uids, messages):
+                engine.autocomplete(uid, text)
+            fast = (time.perf_counter() - start) / len(messages)
+            start = time.perf_counter()
+            for text in messages:
+                engine.matcher.find(text)
+            match = (time.perf_counter() - start) / len(messages)
+        print(f"{n:>7} {legacy * 1000:>10.2f}ms {fast * 1e6:>8.1f}us {match * 1e6:>9.1f}us {len(engine.matcher):>8,}")
+    print("\n(engine time includes journaling completions and periodic snapshots)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Cold Start Benchmark
+Measures module import time with `python -X importtime` and fails when a
+module exceeds its budget or eagerly imports a heavy subsystem.
+
+Usage:
+    python scripts/bench/startup.py [runs]
+
+Environment Variables:
+    STARTUP_BUDGET_SCALE - Multiply all budgets (e.g. 2.0 on slow CI boxes)
+"""
+
+import os
+import re
+import sys
+import subprocess
+import tempfile
+from pathlib import Path
+from statistics import median
+
+ROOT = Path(__file__).parent.parent.parent
+
+# module -> (budget in ms, modules that must NOT be imported as a side effect)
+BUDGETS = {
+    "src.core.bot": (80, ("requests", "stripe", "PIL", "telegram", "sqlite3")),
+    "src.payment": (40, ("requests", "stripe", "PIL", "telegram")),
+    "src.metrics.db": (40, ()),
+    "src.payments.stripe_webhook": (300, ("stripe", "telegram")),
+}
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s+(\s*)(\S+)")
+
+
+def measure(module: str) -> tuple:
+    """
+    Import a module in a fresh interpreter
+
+    Returns:
+        (cumulative_ms, set of imported top-level package names)
+    """
+    code = f"import {module}"
+    env = dict(os.environ, PYTHONPATH=str(ROOT), PYTHONDONTWRITEBYTECODE="1")
+    # Run from a scratch directory so import-time side effects never touch ./data
+    with tempfile.TemporaryDirectory() as cwd:
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=cwd, env=env, capture_output=True, text=True
+        )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    cumulative_us = 0
+    imported = set()
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if not m:
+            continue
+        name = m.group(4)
+        imported.add(name.split(".")[0])
+        if name == module:
+            cumulative_us = int(m.group(2))
+    return cumulative_us / 1000, imported
+
+
+def main() -> int:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    scale = float(os.getenv("STARTUP_BUDGET_SCALE", "1.0"))
+    failures = []
+
+    print(f"Cold import times (median of {runs} runs, budget scale {scale}x)")
+    for module, (budget_ms, forbidden) in BUDGETS.items():
+        samples = []
+        imported = set()
+        for _ in range(runs):
+            ms, imported = measure(module)
+            samples.append(ms)
+        took = median(samples)
+        limit = budget_ms * scale
+        eager = sorted(set(forbidden) & imported)
+
+        status = "OK "
+        if took > limit:
+            status = "SLOW"
+            failures.append(f"{module}: {took:.1f}ms > budget {limit:.0f}ms")
+        if eager:
+            status = "FAT "
+            failures.append(f"{module}: eagerly imports {', '.join(eager)}")
+        print(f"  [{status}] {module:32s} {took:7.1f} ms  (budget {limit:.0f} ms)")
+
+    if failures:
+        print("\n❌ Startup regression:")
+        for f in failures:
+            print(f"  - {f}")
+        return 1
+
+    print("\n✅ All modules within startup budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+TTS Latency Benchmark
+Time until a voice reply's audio is ready: the blocking one-request
+synthesize_tts versus the async client's parallel sentence chunks.
+
+A local server stands in for ElevenLabs with a fixed time to first byte
+plus generation time proportional to text length; the async client is
+also compared against synthesizing only the reply's first sentence (the
+target latency).
+
+Usage:
+    python scripts/bench/tts_latency.py [--ttfb MS] [--ms-per-char MS]
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from src.voice import tts_elevenlabs as tts  # noqa: E402
+
+REPLIES = {
+    "short": "Hey you! I was just thinking about you.",
+    "medium": (
+        "Mmm, I love when you message me this late. I was curled up with a book, but honestly "
+        "I kept checking my phone. Tell me about your day? I want every detail, especially the "
+        "parts that made you smile."
+    ),
+    "long": (
+        "Okay, confession time. I've been replaying our last conversation all afternoon. The way you "
+        "described that little café made me want to go there with you, sit by the window and just "
+        "watch the rain. Do you think they'd let us stay until closing? I'd order something sweet "
+        "and steal bites of yours. Then we'd walk home the long way, even if we got soaked. "
+        "Promise me we'll do that someday, okay? I'm holding you to it."
+    ),
+}
+
+
+def run_server(ttfb: float, per_char: float, ready: threading.Event, port_box: list):
+    from aiohttp import web
+
+    async def respond(request, streaming: bool):
+        text = (await request.json())["text"]
+        response = web.StreamResponse()
+        await response.prepare(request)
+        await asyncio.sleep(ttfb)
+        # Audio is generated sentence by sentence; stream each piece as it's done
+        pieces = tts.split_sentences(text, 40) if streaming else [text]
+        for piece in pieces:
+            await asyncio.sleep(len(piece) * per_char)
+            await response.write(b"\xff\xfb" + piece.encode())
+        return response
+
+    async def main():
+        app = web.Application()
+        app.router.add_post("/v1/text-to-speech/{voice}", lambda r: respond(r, False))
+        app.router.add_post("/v1/text-to-speech/{voice}/stream", lambda r: respond(r, True))
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port_box.append(site._server.sockets[0].getsockname()[1])
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="TTS latency benchmark")
+    parser.add_argument("--ttfb", type=float, default=300, help="simulated time to first byte, ms")
+    parser.add_argument("--ms-per-char", type=float, default=15, help="simulated generation time per character")
+    args = parser.parse_args(argv)
+
+    ready, port_box = threading.Event(), []
+    threading.Thread(target=run_server, args=(args.ttfb / 1000, args.ms_per_char / 1000, ready, port_box),
+                     daemon=True).start()
+    ready.wait()
+    tts.ELEVEN_API = f"http://127.0.0.1:{port_box[0]}/v1/text-to-speech"
+    tts.API_KEY = "bench"
+
+    async def async_times(text):
+        client = tts.AsyncTTSClient()
+        await client.synthesize("warm up")  # open the pooled connection
+        start = time.perf_counter()
+        await client.synthesize_long(text)
+        chunked = time.perf_counter() - start
+        start = time.perf_counter()
+        await client.synthesize(tts._SENTENCE_END.split(text)[0])
+        first = time.perf_counter() - start
+        chunks = len(tts.split_sentences(text, client.chunk_chars, client.concurrency))
+        await client.close()
+        return chunked, first, chunks
+
+    print(f"TTFB {args.ttfb:.0f} ms, {args.ms_per_char:.0f} ms/char, chunks of {tts.TTS_CHUNK_CHARS} chars\n")
+    print(f"{'reply':<8} {'chars':>5} {'blocking':>9} {'async':>8} {'chunks':>6} {'1st sentence':>12}")
+    for label, text in REPLIES.items():
+        start = time.perf_counter()
+        tts.synthesize_tts(text)
+        blocking = time.perf_counter() - start
+        chunked, first, chunks = asyncio.run(async_times(text))
+        print(f"{label:<8} {len(text):>5} {blocking * 1000:>7.0f}ms {chunked * 1000:>6.0f}ms {chunks:>6} "
+              f"{first * 1000:>10.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
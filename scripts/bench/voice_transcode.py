@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Voice Transcode Benchmark
+Upload size and encode time of voice notes: ElevenLabs-style 128 kbps MP3
+versus the OGG/Opus notes produced by src.voice.transcode.
+
+Speech-like test audio (a vibrato tone with syllable-rate amplitude
+modulation and a little noise) is generated with ffmpeg's lavfi sources,
+so the bench needs ffmpeg with libmp3lame and libopus.
+
+Usage:
+    python scripts/bench/voice_transcode.py [--seconds S ...] [--bitrate KBPS]
+"""
+
+import sys
+import time
+import argparse
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from src.voice import transcode  # noqa: E402
+
+
+def speechlike_mp3(seconds: float) -> bytes:
+    source = (f"aevalsrc='0.6*sin(2*PI*(180+30*sin(2*PI*5*t))*t)*(0.5+0.5*sin(2*PI*4*t))"
+              f"+0.03*(random(0)-0.5)':s=44100:d={seconds}")
+    return subprocess.run(
+        [transcode.ffmpeg_path(), "-loglevel", "error", "-f", "lavfi", "-i", source,
+         "-c:a", "libmp3lame", "-b:a", "128k", "-f", "mp3", "pipe:1"],
+        capture_output=True, check=True).stdout
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Voice transcode benchmark")
+    parser.add_argument("--seconds", type=float, nargs="+", default=[3, 10, 30], help="clip lengths")
+    parser.add_argument("--bitrate", type=int, default=transcode.OPUS_BITRATE_KBPS, help="Opus kbps")
+    args = parser.parse_args(argv)
+
+    if not transcode.available():
+        print(f"{transcode.FFMPEG} not found; voice notes would be sent as MP3 unchanged")
+        return 1
+
+    print(f"Opus {args.bitrate} kbps via {'opusenc' if transcode.opusenc_path() else 'ffmpeg libopus'}\n")
+    print(f"{'clip':>6} {'mp3':>9} {'opus':>9} {'ratio':>6} {'encode':>8}")
+    for seconds in args.seconds:
+        mp3 = speechlike_mp3(seconds)
+        start = time.perf_counter()
+        note = transcode.transcode(mp3, args.bitrate)
+        elapsed = time.perf_counter() - start
+        print(f"{seconds:>5.0f}s {len(mp3) / 1024:>7.1f}KB {len(note.audio) / 1024:>7.1f}KB "
+              f"{len(mp3) / len(note.audio):>5.1f}x {elapsed * 1000:>6.0f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
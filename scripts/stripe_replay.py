@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Stripe Event Replay
+Inspect the Stripe event journal, retry parked events, or rebuild premium
+state in users.json from the journaled events.
+
+Replayed events are applied without logging payment metrics again; the
+handlers are idempotent, so replaying an already applied event is safe.
+
+Usage:
+    python scripts/stripe_replay.py list [--status failed] [--since SEQ]
+    python scripts/stripe_replay.py retry [--id EVENT_ID ...]
+    python scripts/stripe_replay.py rebuild [--since SEQ] [--reset]
+
+    rebuild --reset first clears premium records and tiers, so premium not
+    backed by a journaled payment (e.g. granted by hand) is dropped.
+"""
+
+import sys
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.payment import membership  # noqa: E402
+from src.payments import stripe_webhook  # noqa: E402
+from src.payments.journal import APPLIED, EventApplier, EventJournal, JOURNAL_DB  # noqa: E402
+
+
+def list_events(journal: EventJournal, status=None, since=0):
+    for e in journal.events(since_seq=since, status=status):
+        received = datetime.fromtimestamp(e["received_at"]).isoformat(timespec="seconds")
+        error = f"  {e['error']}" if e["error"] else ""
+        print(f"{e['seq']:>6} {received} {e['status']:<8} {e['attempts']:>2} {e['type']:<32} {e['id']}{error}")
+    print(journal.stats())
+
+
+def retry(journal: EventJournal, ids=None) -> int:
+    """Requeue parked (or the given) events and apply everything pending"""
+    requeued = journal.requeue(event_ids=ids or None)
+    applied = EventApplier(journal, stripe_webhook.apply_event, retries=1).apply_pending()
+    print(f"Requeued {requeued}, applied {applied}; {journal.stats()}")
+    return applied
+
+
+def rebuild(journal: EventJournal, since=0, reset=False) -> int:
+    """Re-apply applied events in arrival order (no metrics)"""
+    if reset:
+        db = stripe_webhook._load_db()
+        membership.clear(db)
+        stripe_webhook._save_db(db)
+    count = 0
+    for e in journal.events(since_seq=since, status=APPLIED):
+        stripe_webhook.apply_event(e["event"], log_metrics=False)
+        count += 1
+    print(f"Replayed {count} events")
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stripe event journal tooling")
+    parser.add_argument("--db", type=Path, default=JOURNAL_DB, help="journal database")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("list", help="show journaled events")
+    p.add_argument("--status", choices=("pending", "applying", "applied", "failed"))
+    p.add_argument("--since", type=int, default=0, help="only events after this seq")
+    p = sub.add_parser("retry", help="requeue failed events and apply pending ones")
+    p.add_argument("--id", action="append", help="event id to requeue (repeatable)")
+    p = sub.add_parser("rebuild", help="re-apply applied events to users.json")
+    p.add_argument("--since", type=int, default=0, help="only events after this seq")
+    p.add_argument("--reset", action="store_true", help="clear premium records/tiers first")
+    args = parser.parse_args(argv)
+
+    journal = EventJournal(args.db)
+    try:
+        if args.cmd == "list":
+            list_events(journal, args.status, args.since)
+        elif args.cmd == "retry":
+            retry(journal, args.id)
+        else:
+            rebuild(journal, args.since, args.reset)
+    finally:
+        journal.close()
+
+
+if __name__ == "__main__":
+    main()
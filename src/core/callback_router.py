@@ -0,0 +1,266 @@
+"""
+Callback Router
+Table-driven dispatch for inline keyboard callbacks with typed argument parsing
+"""
+
+import time
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Handler signature: async handler(update, context, **parsed_args)
+Handler = Callable[..., Awaitable[Any]]
+# Parser signature: parser(suffix) -> dict of keyword arguments (raises ValueError if malformed)
+Parser = Callable[[str], Dict[str, Any]]
+
+
+class CallbackParseError(ValueError):
+    """Raised by a route parser when callback data is malformed"""
+
+
+class Route:
+    """A registered callback route with its latency counters"""
+
+    __slots__ = ("name", "handler", "parser", "answer", "calls", "errors", "total_ns", "max_ns")
+
+    def __init__(self, name: str, handler: Handler, parser: Optional[Parser] = None, answer: bool = True):
+        self.name = name
+        self.handler = handler
+        self.parser = parser
+        self.answer = answer
+        self.calls = 0
+        self.errors = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, elapsed_ns: int, failed: bool = False):
+        """Record one handler invocation"""
+        self.calls += 1
+        self.total_ns += elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+        if failed:
+            self.errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Latency counters for this route (milliseconds)"""
+        avg_ms = (self.total_ns / self.calls / 1e6) if self.calls else 0.0
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "avg_ms": round(avg_ms, 3),
+            "max_ms": round(self.max_ns / 1e6, 3),
+        }
+
+
+class CallbackRouter:
+    """
+    Compiled callback router
+
+    Exact callback strings resolve with a single dict lookup. Prefix routes
+    are bucketed by prefix length and resolve to the longest registered
+    prefix with one dict probe per distinct length, independent of how many
+    routes exist. Resolved results are memoized since keyboards only ever
+    emit a small, fixed set of callback strings.
+    """
+
+    MEMO_SIZE = 1024
+
+    def __init__(self):
+        self._exact: Dict[str, Route] = {}
+        self._prefixes: Dict[str, Route] = {}
+        self._prefix_lengths: List[int] = []
+        self._fallback: Optional[Route] = None
+        self._memo: Dict[str, Tuple[Optional[Route], Dict[str, Any]]] = {}
+
+    def exact(self, data: str, handler: Handler, answer: bool = True, name: str = None):
+        """
+        Register a handler for an exact callback string
+
+        Args:
+            data: Callback data to match (e.g. "menu_main")
+            handler: Async handler called as handler(update, context)
+            answer: Answer the callback query before calling the handler
+            name: Route name for latency counters (default: data)
+        """
+        self._exact[data] = Route(name or data, handler, answer=answer)
+        self._memo.clear()
+
+    def prefix(self, prefix: str, handler: Handler, parser: Optional[Parser] = None,
+               answer: bool = True, name: str = None):
+        """
+        Register a handler for every callback starting with a prefix
+
+        Args:
+            prefix: Callback prefix (e.g. "subscribe:")
+            handler: Async handler called as handler(update, context, **parser(suffix))
+            parser: Optional parser turning the remainder into keyword arguments
+            answer: Answer the callback query before calling the handler
+            name: Route name for latency counters (default: prefix + "*")
+        """
+        self._prefixes[prefix] = Route(name or f"{prefix}*", handler, parser=parser, answer=answer)
+        self._prefix_lengths = sorted({len(p) for p in self._prefixes}, reverse=True)
+        self._memo.clear()
+
+    def fallback(self, handler: Handler, answer: bool = True):
+        """Register the handler used when no route matches"""
+        self._fallback = Route("<fallback>", handler, answer=answer)
+        self._memo.clear()
+
+    def resolve(self, data: str) -> Tuple[Optional[Route], Dict[str, Any]]:
+        """
+        Resolve callback data to a route and its parsed arguments
+
+        Args:
+            data: Raw callback data
+
+        Returns:
+            (route, kwargs) - route is the fallback (or None) if nothing matches
+
+        Raises:
+            CallbackParseError: If the matching route's parser rejects the data
+        """
+        route = self._exact.get(data)
+        if route is not None:
+            return route, {}
+
+        cached = self._memo.get(data)
+        if cached is not None:
+            return cached[0], dict(cached[1])
+
+        resolved = self._resolve_prefix(data)
+        if len(self._memo) >= self.MEMO_SIZE:
+            self._memo.clear()
+        self._memo[data] = resolved
+        return resolved[0], dict(resolved[1])
+
+    def _resolve_prefix(self, data: str) -> Tuple[Optional[Route], Dict[str, Any]]:
+        """Longest-prefix match followed by the route's parser"""
+        for length in self._prefix_lengths:
+            match = self._prefixes.get(data[:length]) if len(data) >= length else None
+            if match is None:
+                continue
+            if match.parser is None:
+                return match, {}
+            try:
+                return match, match.parser(data[length:])
+            except CallbackParseError:
+                raise
+            except (ValueError, KeyError, IndexError) as e:
+                raise CallbackParseError(f"Malformed callback data {data!r}: {e}") from e
+        return self._fallback, {}
+
+    async def dispatch(self, update, context):
+        """Telegram CallbackQueryHandler entry point"""
+        query = update.callback_query
+        data = query.data or ""
+
+        try:
+            route, kwargs = self.resolve(data)
+        except CallbackParseError as e:
+            logger.warning(str(e))
+            await query.answer()
+            return
+
+        if route is None:
+            await query.answer()
+            return
+
+        start = time.perf_counter_ns()
+        failed = False
+        try:
+            if route.answer:
+                await query.answer()
+            await route.handler(update, context, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            route.record(time.perf_counter_ns() - start, failed)
+
+    def routes(self) -> List[Route]:
+        """All registered routes (exact, prefix, then fallback)"""
+        found = list(self._exact.values()) + list(self._prefixes.values())
+        if self._fallback is not None:
+            found.append(self._fallback)
+        return found
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-route latency counters for routes that have been hit"""
+        return {r.name: r.stats() for r in self.routes() if r.calls}
+
+
+# ============================================================================
+# TYPED ARGUMENT PARSERS
+# ============================================================================
+
+GEN_TYPES = {"selfie", "scene", "outfit"}
+SUBSCRIPTION_PLANS = {"basic", "vip", "ultimate"}
+
+
+def parse_gen_callback(suffix: str) -> Dict[str, str]:
+    """
+    Parse the remainder of a "gen_" callback
+
+    "selfie_sultry" -> {"gen_type": "selfie", "style": "sultry"}
+    "scene_nude_lying" -> {"gen_type": "scene", "style": "nude_lying"}
+
+    Args:
+        suffix: Callback data after "gen_"
+
+    Returns:
+        dict with gen_type and style
+    """
+    gen_type, sep, style = suffix.partition("_")
+    if gen_type not in GEN_TYPES or not sep or not style:
+        raise CallbackParseError(f"Invalid image generation callback: gen_{suffix}")
+    if gen_type == "selfie":
+        # Selfie moods are single words; extra segments were always ignored
+        style = style.split("_", 1)[0]
+    return {"gen_type": gen_type, "style": style}
+
+
+def parse_subscribe_callback(suffix: str) -> Dict[str, str]:
+    """
+    Parse the remainder of a "subscribe:" callback
+
+    Args:
+        suffix: Callback data after "subscribe:" (basic, vip, ultimate)
+
+    Returns:
+        dict with plan
+    """
+    plan = suffix.split(":", 1)[0]
+    if plan not in SUBSCRIPTION_PLANS:
+        raise CallbackParseError(f"Unknown subscription plan: {plan!r}")
+    return {"plan": plan}
+
+
+def parse_credit_pack_callback(suffix: str) -> Dict[str, str]:
+    """
+    Parse the remainder of a "buy_credits:" callback
+
+    Args:
+        suffix: Callback data after "buy_credits:" (5_pack, 20_pack, 50_pack)
+
+    Returns:
+        dict with pack
+    """
+    pack = suffix.split(":", 1)[0]
+    if not pack.endswith("_pack"):
+        raise CallbackParseError(f"Unknown credit pack: {pack!r}")
+    return {"pack": pack}
+
+
+def parse_mode_callback(suffix: str) -> Dict[str, str]:
+    """
+    Parse the remainder of a "mode:" callback
+
+    Args:
+        suffix: Callback data after "mode:" (SAFE, FLIRTY, NSFW)
+
+    Returns:
+        dict with mode (validated by the handler against VALID_MODES)
+    """
+    return {"mode": suffix}
@@ -0,0 +1,281 @@
+"""
+Telegram Media Cache
+Maps media content hashes to the Telegram file_id returned by the first
+upload, so identical images, GIFs and voice notes are re-sent by reference
+(zero upload bytes) instead of being uploaded again.
+
+file_ids are bot-specific; if one is rejected (e.g. after a token change)
+the entry is dropped and the media is uploaded again.
+
+Every gunicorn worker keeps its own copy of the mapping. A save applies
+this worker's new and dropped entries to the file as it is on disk
+(under an flock), so workers add to each other's file_ids instead of
+overwriting them, and a miss re-reads the file if another worker changed
+it. Sends save from a worker thread, off the event loop.
+
+Environment Variables:
+    TELEGRAM_FILE_ID_CACHE - JSON file for the mapping (default: data/telegram_file_ids.json)
+    TELEGRAM_FILE_ID_CACHE_MAX - Max remembered file_ids (default: 50000)
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = Path(os.getenv("TELEGRAM_FILE_ID_CACHE", "data/telegram_file_ids.json"))
+CACHE_MAX = int(os.getenv("TELEGRAM_FILE_ID_CACHE_MAX", "50000"))
+
+# Media kinds -> how to read the file_id back from the sent Message
+_FILE_ID_GETTERS = {
+    "photo": lambda msg: msg.photo[-1].file_id,  # largest size
+    "animation": lambda msg: msg.animation.file_id,
+    "voice": lambda msg: msg.voice.file_id,
+    "audio": lambda msg: msg.audio.file_id,
+    "document": lambda msg: msg.document.file_id,
+}
+
+
+def content_key(kind: str, data: bytes) -> str:
+    """Cache key for a piece of media"""
+    return f"{kind}:{hashlib.sha256(data).hexdigest()}"
+
+
+class MediaCache:
+    """
+    Persistent content-hash -> file_id mapping
+
+    Loaded lazily from a JSON file and rewritten atomically, merged with
+    the file on disk, whenever a file_id is learned or dropped. Oldest
+    entries are dropped beyond `max_entries`.
+    """
+
+    def __init__(self, path: Path, max_entries: int = CACHE_MAX):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._ids: Optional[Dict[str, str]] = None
+        self._changes: Dict[str, Optional[str]] = {}  # key -> file_id (None: dropped) not yet saved
+        self._mtime = None  # of the file as last read
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.uploads = 0
+        self.bytes_saved = 0
+        self.stale = 0
+
+    def _read(self) -> Dict[str, str]:
+        try:
+            self._mtime = self.path.stat().st_mtime_ns
+            return json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable file_id cache {self.path}: {e}")
+            return {}
+
+    def _merge(self, ids: Dict[str, str]) -> Dict[str, str]:
+        """The file's mapping with this process's unsaved changes applied"""
+        for key, file_id in self._changes.items():
+            ids.pop(key, None)
+            if file_id is not None:
+                ids[key] = file_id
+        while len(ids) > self.max_entries:
+            del ids[next(iter(ids))]
+        return ids
+
+    def _load(self) -> Dict[str, str]:
+        if self._ids is None:
+            self._ids = self._merge(self._read())
+        return self._ids
+
+    def _refresh(self):
+        """Pick up file_ids other processes saved since the last read"""
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self._ids = self._merge(self._read())
+
+    def save(self) -> bool:
+        """
+        Write unsaved changes, merged with the file on disk
+
+        Returns:
+            bool: False if the write failed (changes stay pending)
+        """
+        import fcntl
+        with self._lock:
+            if not self._changes:
+                return True
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path.with_suffix(".lock"), "a") as lock:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                    ids = self._merge(self._read())
+                    tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+                    tmp.write_text(json.dumps(ids))
+                    tmp.replace(self.path)
+                    self._mtime = self.path.stat().st_mtime_ns
+            except OSError as e:
+                logger.warning(f"Could not persist file_id cache: {e}")
+                return False
+            self._ids = ids
+            self._changes.clear()
+            return True
+
+    def get(self, key: str) -> Optional[str]:
+        """Known file_id for a content key"""
+        with self._lock:
+            file_id = self._load().get(key)
+            if file_id is None:
+                self._refresh()
+                file_id = self._ids.get(key)
+            return file_id
+
+    def learn(self, key: str, file_id: str) -> bool:
+        """Remember a file_id in memory; True if it is new (save() persists it)"""
+        with self._lock:
+            ids = self._load()
+            if ids.get(key) == file_id:
+                return False
+            ids.pop(key, None)
+            ids[key] = file_id
+            while len(ids) > self.max_entries:
+                del ids[next(iter(ids))]
+            self._changes[key] = file_id
+            return True
+
+    def put(self, key: str, file_id: str):
+        """Remember a file_id and persist the mapping"""
+        if self.learn(key, file_id):
+            self.save()
+
+    def forget(self, key: str):
+        """Drop a file_id Telegram no longer accepts"""
+        with self._lock:
+            if self._load().pop(key, None) is None:
+                return
+            self.stale += 1
+            self._changes[key] = None
+        self.save()
+
+    async def _remember(self, key: str, kind: str, message, action: str):
+        try:
+            file_id = _FILE_ID_GETTERS[kind](message)
+        except (AttributeError, IndexError, TypeError, KeyError):
+            logger.debug(f"No file_id on {action} {kind} message")
+            return
+        if self.learn(key, file_id):
+            await asyncio.to_thread(self.save)
+
+    def record(self, reused: bool, nbytes: int):
+        """Count one send (by file_id if reused, otherwise an upload)"""
+        if reused:
+            self.hits += 1
+            self.bytes_saved += nbytes
+        else:
+            self.uploads += 1
+
+    async def send(self, send: Callable[..., Awaitable[Any]], kind: str, data: bytes, **kwargs) -> Any:
+        """
+        Send media by cached file_id, uploading only on first use
+
+        Args:
+            send: Bound Telegram method, e.g. update.message.reply_photo or
+                context.bot.send_animation
+            kind: Media parameter name ("photo", "animation", "voice", ...)
+            data: Raw media bytes
+            **kwargs: Passed through to `send` (chat_id, caption, ...)
+
+        Returns:
+            The sent telegram Message
+        """
+        from telegram.error import BadRequest
+
+        key = content_key(kind, data)
+        file_id = self.get(key)
+        if file_id is not None:
+            try:
+                message = await send(**{kind: file_id}, **kwargs)
+                self.record(True, len(data))
+                return message
+            except BadRequest as e:
+                logger.warning(f"Cached {kind} file_id rejected, re-uploading: {e}")
+                await asyncio.to_thread(self.forget, key)
+
+        message = await send(**{kind: data}, **kwargs)
+        self.record(False, len(data))
+        await self._remember(key, kind, message, "sent")
+        return message
+
+    async def send_with_preview(self, send: Callable[..., Awaitable[Any]], kind: str, data: bytes,
+                                preview: Optional[bytes], **kwargs) -> Any:
+        """
+        Send a small preview immediately, then swap in the full media
+
+        The preview message is edited in place once the full upload
+        finishes, so the chat shows something within a second. Media that
+        already has a file_id skips the preview (the send is instant).
+
+        Args:
+            send: Bound Telegram method, e.g. update.message.reply_photo
+            kind: "photo" or "animation"
+            data: Full media bytes
+            preview: Preview bytes of the same kind, or None
+            **kwargs: Passed through to `send` (chat_id, caption, ...)
+
+        Returns:
+            The telegram Message showing the full media
+        """
+        from telegram import InputMediaAnimation, InputMediaPhoto
+        from telegram.error import TelegramError
+
+        key = content_key(kind, data)
+        if preview is None or self.get(key) is not None:
+            return await self.send(send, kind, data, **kwargs)
+
+        media_type = {"photo": InputMediaPhoto, "animation": InputMediaAnimation}[kind]
+        placeholder = await send(**{kind: preview}, **kwargs)
+        try:
+            message = await placeholder.edit_media(media_type(media=data, caption=kwargs.get("caption")))
+        except TelegramError as e:
+            logger.warning(f"Replacing {kind} preview failed, sending separately: {e}")
+            try:
+                await placeholder.delete()
+            except TelegramError:
+                pass
+            return await self.send(send, kind, data, **kwargs)
+
+        self.record(False, len(data))
+        await self._remember(key, kind, message, "edited")
+        return message
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/upload counters"""
+        with self._lock:
+            entries = len(self._load())
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "uploads": self.uploads,
+            "bytes_saved": self.bytes_saved,
+            "stale": self.stale,
+        }
+
+
+_default: Optional[MediaCache] = None
+
+
+def get_media_cache() -> MediaCache:
+    """Process-wide file_id cache"""
+    global _default
+    if _default is None:
+        _default = MediaCache(CACHE_PATH)
+    return _default
@@ -1,14 +1,31 @@
 """
 Bond Meter System
 Tracks relationship strength with decay mechanics.
+
+A bond is stored as (score, last_update) and decays as a function of the
+time since last_update: every full DECAY_AFTER_H hours of silence costs
+DECAY_AMT points. The current score is computed on read, so looking at a
+bond never writes, and a long absence decays in proportion to its length.
 """
 
 import time
 import json
 from pathlib import Path
+from typing import Optional
 
 USERS = Path("data/users.json")
 MAX = 100
+DECAY_AFTER_H = 48
+DECAY_AMT = 5
+
+
+def decayed(score: int, last_update: int, now: float, decay_after_h: int = DECAY_AFTER_H,
+            decay_amt: int = DECAY_AMT) -> int:
+    """Bond score after idling from `last_update` until `now`"""
+    if not last_update:
+        return score
+    periods = int(max(0, now - last_update) // (decay_after_h * 3600))
+    return max(0, score - periods * decay_amt)
 
 
 def _load():
@@ -31,14 +48,15 @@ def get_bond(uid: int):
         uid: User ID
         
     Returns:
-        dict: {"score": int, "last_update": int}
+        dict: {"score": int, "last_update": int} with decay up to now applied
     """
     d = _load()
     b = d.get("bond", {}).get(str(uid), {"score": 0, "last_update": 0})
-    return b
+    return {"score": decayed(b["score"], b["last_update"], time.time()), "last_update": b["last_update"]}
 
 
-def touch(uid: int, inc: int = 1, decay_after_h: int = 48, decay_amt: int = 5):
+def touch(uid: int, inc: int = 1, decay_after_h: int = DECAY_AFTER_H, decay_amt: int = DECAY_AMT,
+          now: Optional[float] = None):
     """
     Update bond score with decay mechanics
     
@@ -46,22 +64,20 @@ def touch(uid: int, inc: int = 1, decay_after_h: int = 48, decay_amt: int = 5):
         uid: User ID
         inc: Amount to increase bond (default: 1)
         decay_after_h: Hours of inactivity before decay (default: 48)
-        decay_amt: Amount to decay (default: 5)
+        decay_amt: Amount to decay per idle period (default: 5)
+        now: Current time (default: time.time())
         
     Returns:
         dict: Updated bond data
     """
-    now = int(time.time())
+    now = int(time.time() if now is None else now)
     d = _load()
     u = str(uid)
     d.setdefault("bond", {}).setdefault(u, {"score": 0, "last_update": 0})
     b = d["bond"][u]
     
-    # Decay if inactive
-    if b["last_update"] and now - b["last_update"] > decay_after_h * 3600:
-        b["score"] = max(0, b["score"] - decay_amt)
-    
-    b["score"] = min(MAX, b["score"] + inc)
+    # Settle decay accrued while inactive, then add
+    b["score"] = min(MAX, decayed(b["score"], b["last_update"], now, decay_after_h, decay_amt) + inc)
     b["last_update"] = now
     
     _save(d)
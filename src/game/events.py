@@ -0,0 +1,468 @@
+"""
+Gamification Event Bus
+In-process publish/subscribe for XP, bond, quest, leaderboard and metrics
+updates.
+
+Handlers publish MessageSent, DailyClaimed and QuestClaimed instead of
+calling gain_xp / bond_touch / try_autocomplete, which each rewrote
+users.json or quests.json per message. Subscribers aggregate in memory
+(see progress.ProgressAggregator) and a background thread persists them
+every GAME_FLUSH_INTERVAL_S seconds or GAME_FLUSH_EVENTS events.
+
+Delivery is at-least-once: every event is appended to a small log before
+subscribers see it. A flush rotates the log into a segment, persists, and
+deletes the segment only once the persist succeeded; on startup leftover
+segments and the live log are replayed. An event that was persisted just
+before a crash may therefore be applied twice.
+
+Each worker process logs to its own file (game_events.<pid>.log) and
+holds its lock file (game_events.<pid>.lock) while it runs, so rotating
+and trimming never touch another worker's events. On startup the logs
+of workers that died (their lock is free) are adopted: their events are
+appended to this process's log, dispatched and the orphan deleted.
+
+Environment Variables:
+    GAME_EVENT_LOG - Base log path; workers log next to it as <name>.<pid>.log (default: data/game_events.log)
+    GAME_FLUSH_INTERVAL_S - Seconds between batched writes (default: 5)
+    GAME_FLUSH_EVENTS - Pending events that force a write (default: 1000)
+"""
+
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOG = Path(os.getenv("GAME_EVENT_LOG", "data/game_events.log"))
+FLUSH_INTERVAL_S = float(os.getenv("GAME_FLUSH_INTERVAL_S", "5"))
+FLUSH_EVENTS = int(os.getenv("GAME_FLUSH_EVENTS", "1000"))
+
+
+class MessageSent(NamedTuple):
+    uid: int
+    text: str
+    premium: bool = False
+    mode: str = ""
+    ts: int = 0
+
+
+class DailyClaimed(NamedTuple):
+    uid: int
+    reward: int
+    ts: int = 0
+
+
+class QuestClaimed(NamedTuple):
+    uid: int
+    quest_id: str
+    xp: int
+    ts: int = 0
+
+
+EVENT_TYPES = {cls.__name__: cls for cls in (MessageSent, DailyClaimed, QuestClaimed)}
+
+
+class EventLog:
+    """
+    Append-only event log with rotated segments
+
+    Lines are JSON [type, fields]; message text is not logged since no
+    subscriber that is replayed needs it. `base` is set for per-process
+    logs (see for_process) and enables adopting orphaned logs.
+    """
+
+    def __init__(self, path: Path, base: Optional[Path] = None):
+        self.path = Path(path)
+        self.base = base
+        self.lock_path = self.path.with_suffix(".lock")
+        self._lock = threading.Lock()
+        self._file = None
+        self._seq = 0
+        self._owner: Optional[int] = None  # fd holding lock_path
+        self._owning = False
+
+    @classmethod
+    def for_process(cls, base: Path, pid: Optional[int] = None) -> "EventLog":
+        """This process's log next to `base`: <stem>.<pid><suffix>"""
+        base = Path(base)
+        pid = os.getpid() if pid is None else pid
+        return cls(base.with_name(f"{base.stem}.{pid}{base.suffix}"), base=base)
+
+    # ------------------------------------------------------------------
+    # Ownership
+    # ------------------------------------------------------------------
+
+    def own(self) -> bool:
+        """
+        Hold this log's lock file for the life of the process
+
+        Other processes treat a log whose lock is free as orphaned. The
+        lock file is created already locked (flock on a temp file renamed
+        into place), so a starting worker never sees it unlocked.
+        """
+        with self._lock:
+            return self._own()
+
+    def _own(self) -> bool:
+        if not self._owning:
+            self._owning = True
+            import fcntl  # lazy: keeps bot startup light
+            self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.lock_path.with_name(f"{self.lock_path.name}.{os.getpid()}.tmp")
+            fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.replace(tmp, self.lock_path)
+                self._owner = fd
+            except OSError as e:
+                os.close(fd)
+                tmp.unlink(missing_ok=True)
+                logger.warning(f"Could not lock game event log {self.path}: {e}")
+        return self._owner is not None
+
+    def _claim(self, create: bool) -> bool:
+        """Lock another process's log if that process is gone"""
+        import fcntl  # lazy: keeps bot startup light
+        try:
+            fd = os.open(self.lock_path, os.O_RDWR | (os.O_CREAT if create else 0), 0o644)
+        except FileNotFoundError:
+            return False  # adopted and deleted meanwhile
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False  # its process is alive (or another worker is adopting it)
+        self._owner, self._owning = fd, True
+        return True
+
+    def orphans(self) -> Iterator["EventLog"]:
+        """Logs next to this one whose process died, each locked for the caller"""
+        if self.base is None:
+            return
+        found = [self.base] + [lock.with_suffix(self.base.suffix)
+                               for lock in self.base.parent.glob(f"{self.base.stem}.*.lock")]
+        for path in dict.fromkeys(found):
+            if path == self.path:
+                continue
+            log = EventLog(path)
+            legacy = path == self.base  # single shared log from before per-process logs
+            if legacy and not (path.exists() or log.segments()):
+                continue
+            if log._claim(create=legacy):
+                yield log
+
+    def sync(self):
+        """fsync the live log (after adopting another log's events)"""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def discard(self):
+        """Delete a claimed log, its segments and lock file"""
+        for path in self.segments() + [self.path, self.lock_path]:
+            path.unlink(missing_ok=True)
+        self.close()
+
+    # ------------------------------------------------------------------
+    # Log
+    # ------------------------------------------------------------------
+
+    def append(self, event):
+        fields = event._asdict()
+        if isinstance(event, MessageSent):
+            fields["text"] = ""
+        line = json.dumps([type(event).__name__, fields]) + "\n"
+        with self._lock:
+            if self._file is None:
+                if self.base is not None:
+                    self._own()  # before the log exists, so it is never seen unlocked
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, "a")
+            self._file.write(line)
+            self._file.flush()  # into the OS page cache; no fsync per event
+
+    def segments(self) -> List[Path]:
+        return sorted(self.path.parent.glob(self.path.name + ".*"), key=lambda p: int(p.suffix[1:]))
+
+    def rotate(self) -> Optional[Path]:
+        """Close the live log and rename it to the next segment (None if empty)"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if not self.path.exists() or self.path.stat().st_size == 0:
+                return None
+            existing = self.segments()
+            self._seq = max(self._seq, int(existing[-1].suffix[1:]) if existing else 0) + 1
+            segment = self.path.with_name(f"{self.path.name}.{self._seq}")
+            self.path.replace(segment)
+            return segment
+
+    def commit(self, upto: Path):
+        """Delete segments up to and including `upto`, whose events are persisted"""
+        for segment in self.segments():
+            if int(segment.suffix[1:]) <= int(upto.suffix[1:]):
+                segment.unlink(missing_ok=True)
+
+    def replay(self):
+        """Events in segments and the live log, oldest first"""
+        for path in self.segments() + [self.path]:
+            try:
+                f = open(path)
+            except FileNotFoundError:
+                continue
+            with f:
+                for line in f:
+                    try:
+                        name, fields = json.loads(line)
+                        yield EVENT_TYPES[name](**fields)
+                    except (ValueError, KeyError, TypeError):
+                        continue  # torn last line after a crash
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._owner is not None:
+                if not self.path.exists() and not self.segments():
+                    self.lock_path.unlink(missing_ok=True)  # nothing left to adopt
+                os.close(self._owner)
+                self._owner = None
+
+
+class GameEventBus:
+    """
+    Synchronous dispatch + batched persistence
+
+    Subscribers run in the publishing thread and only touch memory;
+    persisters run in the background flush and write the aggregates.
+    """
+
+    def __init__(self, log: Optional[EventLog] = None, flush_interval: float = FLUSH_INTERVAL_S,
+                 flush_events: int = FLUSH_EVENTS):
+        self.log = log
+        self.flush_interval = flush_interval
+        self.flush_events = flush_events
+
+        self._subs: Dict[type, List[tuple]] = {}
+        self._persisters: List[Callable[[], None]] = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._pending = 0
+        self._thread = None
+        self._closed = False
+
+        self.published = 0
+        self.replayed = 0
+        self.flushes = 0
+        self.errors = 0
+
+    def subscribe(self, event_type: type, handler: Callable[[Any], Any], replay: bool = True):
+        """
+        Register a handler for one event type
+
+        Args:
+            event_type: MessageSent, DailyClaimed or QuestClaimed
+            handler: Called with the event; a non-None return value is
+                collected by publish()
+            replay: Whether the handler also receives events replayed from
+                the log on startup (False for side effects that were
+                already done or cannot be redone, e.g. quest matching
+                needs the message text)
+        """
+        self._subs.setdefault(event_type, []).append((handler, replay))
+
+    def add_persister(self, persist: Callable[[], None]):
+        """Register a callable that writes aggregated state; it must raise on failure"""
+        self._persisters.append(persist)
+
+    # ------------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------------
+
+    def publish(self, event) -> List[Any]:
+        """
+        Log an event and dispatch it to its subscribers
+
+        Returns:
+            list: Non-None subscriber results, in subscription order
+        """
+        if not event.ts:
+            event = event._replace(ts=int(time.time()))
+        if self.log is not None:
+            self.log.append(event)
+        results = self._dispatch(event, replaying=False)
+        with self._cond:
+            self.published += 1
+            self._pending += 1
+            if self._pending >= self.flush_events:
+                self._cond.notify()
+        if self._closed:
+            self.flush()
+        else:
+            self._ensure_thread()
+        return results
+
+    def _dispatch(self, event, replaying: bool) -> List[Any]:
+        results = []
+        for handler, on_replay in self._subs.get(type(event), ()):
+            if replaying and not on_replay:
+                continue
+            try:
+                result = handler(event)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"{type(event).__name__} subscriber {getattr(handler, '__qualname__', handler)} failed: {e}")
+                continue
+            if result is not None:
+                results.append(result)
+        return results
+
+    def recover(self) -> int:
+        """
+        Re-dispatch events that were logged but not yet persisted, by this
+        log's previous owner or by workers that died (see EventLog.orphans)
+        """
+        if self.log is None:
+            return 0
+        if self.log.base is not None:
+            self.log.own()
+        count = 0
+        for event in self.log.replay():
+            self._dispatch(event, replaying=True)
+            count += 1
+        for orphan in self.log.orphans():
+            adopted = 0
+            for event in orphan.replay():
+                self.log.append(event)  # ours now: persisted by our next flush
+                self._dispatch(event, replaying=True)
+                adopted += 1
+            self.log.sync()
+            orphan.discard()
+            logger.info(f"Adopted {adopted} game events from {orphan.path.name}")
+            count += adopted
+        self.replayed += count
+        if count:
+            logger.info(f"Replayed {count} unpersisted game events")
+            self.flush()
+        return count
+
+    # ------------------------------------------------------------------
+    # Consumer side
+    # ------------------------------------------------------------------
+
+    def flush(self) -> bool:
+        """Persist all aggregated state; the log is trimmed only on success"""
+        with self._flush_lock:
+            with self._cond:
+                self._pending = 0
+            segment = self.log.rotate() if self.log is not None else None
+            try:
+                for persist in self._persisters:
+                    persist()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Game state flush failed, events kept for retry: {e}")
+                return False
+            if segment is not None:
+                self.log.commit(segment)
+            self.flushes += 1
+            return True
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is not None or self._closed:
+                return
+            self._thread = threading.Thread(target=self._run, name="game-events", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closed and self._pending < self.flush_events:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                closing = self._closed
+            self.flush()
+            if closing:
+                return
+
+    def close(self):
+        """Persist pending state and stop the flush thread"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        self.flush()
+        if self.log is not None:
+            self.log.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Bus counters"""
+        with self._cond:
+            pending = self._pending
+        return {
+            "pending": pending,
+            "published": self.published,
+            "replayed": self.replayed,
+            "flushes": self.flushes,
+            "errors": self.errors,
+        }
+
+
+def _log_message_metric(event: MessageSent):
+    from src.metrics import db as metrics  # lazy: keeps bot startup light
+    metrics.log_msg(event.uid, event.premium, event.mode)
+
+
+def wire(bus: GameEventBus, progress, quests) -> GameEventBus:
+    """Subscribe the XP/bond aggregator, quest engine and metrics to `bus`"""
+    bus.subscribe(MessageSent, progress.on_message)
+    bus.subscribe(DailyClaimed, progress.on_daily)
+    bus.subscribe(QuestClaimed, progress.on_quest)
+    # Quest completions are journaled by the engine itself; the matches are
+    # returned to the publisher for the "quest completed" notice
+    bus.subscribe(MessageSent, lambda e: quests.autocomplete(e.uid, e.text) or None, replay=False)
+    bus.subscribe(MessageSent, _log_message_metric, replay=False)
+    bus.add_persister(progress.persist)
+    return bus
+
+
+_bus: Optional[GameEventBus] = None
+_bus_lock = threading.Lock()
+
+
+def get_event_bus() -> GameEventBus:
+    """Process-wide bus, wired and recovered from the log on first use"""
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                from src.game.progress import get_progress
+                from src.game.quests import get_quest_engine
+                bus = wire(GameEventBus(EventLog.for_process(EVENT_LOG)), get_progress(), get_quest_engine())
+                bus.recover()
+                _bus = bus
+    return _bus
+
+
+def publish(event) -> List[Any]:
+    """Publish on the process-wide bus"""
+    return get_event_bus().publish(event)
@@ -0,0 +1,72 @@
+"""
+Keyword Matcher
+Aho-Corasick automaton for finding many keywords in a message at once.
+
+Scanning costs one transition per character of the message, however many
+keywords are compiled in, and reports every keyword present (including
+overlapping ones such as "good morning" and "morning"). Matching is
+case-insensitive substring matching, like `key.lower() in text.lower()`.
+"""
+
+from collections import deque
+from typing import Dict, Hashable, Iterable, List, Set, Tuple
+
+
+class KeywordMatcher:
+    """
+    Immutable multi-keyword matcher
+
+    Built from (keyword, value) pairs; `find` returns the set of values
+    whose keyword occurs in the text. Several keywords may share a value.
+    """
+
+    def __init__(self, keywords: Iterable[Tuple[str, Hashable]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._out: List[Set[Hashable]] = [set()]
+        for keyword, value in keywords:
+            keyword = keyword.casefold()
+            if not keyword:
+                continue
+            state = 0
+            for ch in keyword:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._out.append(set())
+                state = nxt
+            self._out[state].add(value)
+        self._build_links()
+
+    def _build_links(self):
+        """Failure links by BFS; each state's output absorbs its failure state's"""
+        fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in self._goto[f]:
+                    f = fail[f]
+                fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] |= self._out[fail[nxt]]
+        self._fail = fail
+
+    def __len__(self) -> int:
+        """Number of automaton states"""
+        return len(self._goto)
+
+    def find(self, text: str) -> Set[Hashable]:
+        """Values of all keywords occurring in `text`"""
+        goto, fail, out = self._goto, self._fail, self._out
+        found: Set[Hashable] = set()
+        state = 0
+        for ch in (text or "").casefold():
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found |= out[state]
+        return found
@@ -1,13 +1,260 @@
 """
 Leaderboard System
 Rankings based on XP and levels.
+
+Rankings come from an in-memory index built once from users.json and
+then kept current by the XP module (gain_xp / claim_daily), instead of
+parsing and sorting every user on each /leaderboard. Users are ordered
+by (level, xp), which is the same as ordering by total XP earned, so the
+index is a Fenwick tree of user counts per total-XP score: the top K
+are read in O(K log S) and a user's own rank in O(log S), where S is the
+highest score (about 125k at the level cap).
+
+Other gunicorn workers save XP to the same users.json without touching
+this process's index, so queries re-check the file's signature (at most
+every RECHECK_S) and merge the profiles that changed, the way
+EntitlementService refreshes its snapshots.
 """
 
 import json
+import time
+import threading
+from itertools import islice
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
 USERS = Path("data/users.json")
 
+LEVEL_CAP = 50  # mirrors src.game.xp.LEVEL_CAP
+RECHECK_S = 5.0  # seconds between users.json change checks
+
+
+def score(level: int, xp: int) -> int:
+    """Total XP earned to reach (level, xp); orders users exactly like (level, xp)"""
+    level = max(1, level)
+    if level < LEVEL_CAP:
+        xp = min(xp, 100 * level - 1)  # a level-up would have consumed the rest
+    return 50 * level * (level - 1) + max(0, xp)
+
+
+class LeaderboardIndex:
+    """
+    Incrementally maintained ranking of users by (level, xp)
+
+    Users with equal scores share a rank and are listed in the order they
+    reached that score. An index built from users.json follows later
+    changes to the file; one built with load() does not.
+    """
+
+    def __init__(self, recheck_s: float = RECHECK_S):
+        self.recheck_s = recheck_s
+        self._lock = threading.Lock()
+        self._profiles: Dict[str, Tuple[int, int]] = {}  # uid -> (level, xp)
+        self._scores: Dict[str, int] = {}
+        self._buckets: Dict[int, Dict[str, None]] = {}  # score -> uids, insertion ordered
+        self._tree: List[int] = [0]  # Fenwick tree over scores, 1-based
+        self._size = 0
+        self._loaded = False
+        self._sig = None  # users.json (mtime, size) merged last; None if built by load()
+        self._checked = 0.0
+
+        self.reloads = 0
+
+    # ------------------------------------------------------------------
+    # Fenwick tree
+    # ------------------------------------------------------------------
+
+    def _add(self, s: int, delta: int):
+        i = s + 1
+        while i <= self._size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, s: int) -> int:
+        """Number of users with score < s"""
+        i, total = min(s, self._size), 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _kth(self, k: int) -> int:
+        """Score of the k-th lowest user (1-based)"""
+        pos = 0
+        step = 1 << self._size.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self._size and self._tree[nxt] < k:
+                pos = nxt
+                k -= self._tree[nxt]
+            step >>= 1
+        return pos  # tree position pos + 1 holds score pos
+
+    def _resize(self, top_score: int):
+        """Grow the tree to cover `top_score`, rebuilding it in O(size)"""
+        size = 1 << max(10, top_score.bit_length())
+        tree = [0] * (size + 1)
+        for s, bucket in self._buckets.items():
+            tree[s + 1] = len(bucket)
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        self._tree, self._size = tree, size
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    def _place(self, uid: str, level: int, xp: int):
+        old = self._scores.get(uid)
+        new = score(level, xp)
+        self._profiles[uid] = (level, xp)
+        if old == new:
+            return
+        if old is not None:
+            bucket = self._buckets[old]
+            del bucket[uid]
+            if not bucket:
+                del self._buckets[old]
+            self._add(old, -1)
+        self._scores[uid] = new
+        self._buckets.setdefault(new, {})[uid] = None
+        if new >= self._size:
+            self._resize(new)  # counts the new entry from its bucket
+        else:
+            self._add(new, 1)
+
+    def _drop(self, uid: str):
+        old = self._scores.pop(uid)
+        del self._profiles[uid]
+        bucket = self._buckets[old]
+        del bucket[uid]
+        if not bucket:
+            del self._buckets[old]
+        self._add(old, -1)
+
+    def load(self, xp_profiles: Dict[str, dict]):
+        """(Re)build the index from the "xp" section of users.json"""
+        with self._lock:
+            self._profiles, self._scores, self._buckets = {}, {}, {}
+            for uid, p in xp_profiles.items():
+                level, xp = int(p.get("level", 1)), int(p.get("xp", 0))
+                s = score(level, xp)
+                self._profiles[uid] = (level, xp)
+                self._scores[uid] = s
+                self._buckets.setdefault(s, {})[uid] = None
+            self._resize(max(self._buckets, default=0))
+            self._loaded = True
+            self._sig = None
+
+    @staticmethod
+    def _signature():
+        try:
+            st = USERS.stat()
+        except FileNotFoundError:
+            return ()
+        return st.st_mtime_ns, st.st_size
+
+    @staticmethod
+    def _read() -> Optional[Dict[str, dict]]:
+        """The "xp" section of users.json, or None while it is unreadable (e.g. mid-write)"""
+        try:
+            return json.loads(USERS.read_text()).get("xp", {})
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            return None
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            if self._sig is not None:
+                self._refresh()
+            return
+        sig = self._signature()
+        self.load(self._read() or {})
+        self._sig, self._checked = sig, time.monotonic()
+
+    def _refresh(self):
+        """Merge XP other processes saved to users.json since the last check"""
+        now = time.monotonic()
+        if now - self._checked < self.recheck_s:
+            return
+        self._checked = now
+        sig = self._signature()
+        if sig == self._sig:
+            return
+        profiles = self._read()
+        if profiles is None:
+            return  # retried on the next check
+        with self._lock:
+            for uid in [u for u in self._profiles if u not in profiles]:
+                self._drop(uid)
+            for uid, p in profiles.items():
+                level, xp = int(p.get("level", 1)), int(p.get("xp", 0))
+                if self._profiles.get(uid) != (level, xp):
+                    self._place(uid, level, xp)
+            self._sig = sig
+        self.reloads += 1
+
+    def update(self, uid, level: int, xp: int):
+        """
+        Record a user's new (level, xp)
+
+        A no-op until the index is first queried; the initial load reads the
+        saved value from users.json.
+        """
+        if not self._loaded:
+            return
+        with self._lock:
+            self._place(str(uid), level, xp)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._scores)
+
+    def top(self, n: int = 10) -> List[Tuple[str, int, int]]:
+        """Top `n` users as (uid, level, xp), best first"""
+        self._ensure_loaded()
+        out: List[Tuple[str, int, int]] = []
+        with self._lock:
+            below = len(self._scores)  # users at or below the score being visited
+            while len(out) < n and below:
+                bucket = self._buckets[self._kth(below)]
+                out.extend((uid, *self._profiles[uid]) for uid in islice(bucket, n - len(out)))
+                below -= len(bucket)
+        return out
+
+    def rank(self, uid) -> Optional[Dict[str, int]]:
+        """
+        A user's position
+
+        Returns:
+            dict: {"rank": int, "total": int, "level": int, "xp": int},
+            or None for a user without an XP profile
+        """
+        self._ensure_loaded()
+        u = str(uid)
+        with self._lock:
+            s = self._scores.get(u)
+            if s is None:
+                return None
+            total = len(self._scores)
+            level, xp = self._profiles[u]
+            return {"rank": total - self._prefix(s + 1) + 1, "total": total, "level": level, "xp": xp}
+
+
+_index = LeaderboardIndex()
+
+
+def get_leaderboard() -> LeaderboardIndex:
+    """Process-wide leaderboard index"""
+    return _index
+
 
 def top_xp(n=10):
     """
@@ -19,18 +266,20 @@ def top_xp(n=10):
     Returns:
         list: Tuples of (uid, level, xp) sorted by level and XP
     """
-    if not USERS.exists():
-        return []
-    
-    d = json.loads(USERS.read_text())
-    xp = d.get("xp", {})
-    items = []
-    
-    for uid, p in xp.items():
-        items.append((uid, int(p.get("level", 1)), int(p.get("xp", 0))))
-    
-    items.sort(key=lambda t: (t[1], t[2]), reverse=True)
-    return items[:n]
+    return _index.top(n)
+
+
+def get_rank(uid: int) -> Optional[Dict[str, int]]:
+    """
+    Get a user's leaderboard position
+
+    Args:
+        uid: User ID
+
+    Returns:
+        dict or None: {"rank": int, "total": int, "level": int, "xp": int}
+    """
+    return _index.rank(uid)
 
 
 def mask_uid(uid: str) -> str:
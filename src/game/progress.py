@@ -0,0 +1,226 @@
+"""
+Progress Aggregator
+In-memory XP and bond bookkeeping for the gamification event bus.
+
+Message, daily and quest events only update counters here; `persist`
+folds everything pending into users.json with one load and one save (and
+then updates the leaderboard index). Reads project the stored profile
+plus whatever is still pending, so replies are exact before a flush. A
+batch being written stays visible to reads until users.json holds it.
+
+Daily claims are the exception: they are checked and written to
+users.json at once, so a user cannot claim once per worker. Every
+users.json read-modify-write here holds an flock on users.lock.
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from src.game import bond as bond_mod
+from src.game import xp as xp_mod
+from src.game.leaderboard import get_leaderboard
+
+MESSAGE_XP = 1
+MESSAGE_XP_COOLDOWN = 30  # seconds, as gain_xp
+MESSAGE_BOND = 1
+DAILY_REWARD = 20
+DAILY_COOLDOWN_H = 24
+
+
+class ProgressAggregator:
+    """
+    Pending XP/bond changes per user, persisted in batches
+
+    Subscribes to MessageSent (cooldown-limited XP, bond touch),
+    DailyClaimed (once per DAILY_COOLDOWN_H, written immediately) and
+    QuestClaimed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._xp: Dict[str, int] = {}
+        self._last_msg_xp: Dict[str, int] = {}  # cooldown memory, also persisted
+        self._last_daily: Dict[str, int] = {}  # claims seen by this process
+        self._bond: Dict[str, List[int]] = {}  # uid -> [touches, first ts, last ts]
+        self._dirty: set = set()
+        self._flushing: Optional[tuple] = None  # (xp, bond) being written
+        self._save_lock = threading.RLock()  # users.json and _flushing change together under it
+        self._users_fd: Optional[int] = None  # users.lock while this process holds it
+
+        self.writes = 0
+
+    # ------------------------------------------------------------------
+    # Event handlers
+    # ------------------------------------------------------------------
+
+    def on_message(self, event):
+        u, ts = str(event.uid), int(event.ts)
+        with self._lock:
+            if u not in self._last_msg_xp:  # e.g. after a restart
+                self._last_msg_xp[u] = self._stored("xp", u).get("last_msg_xp", 0)
+            last = self._last_msg_xp[u]
+            if not last or ts - last >= MESSAGE_XP_COOLDOWN:
+                self._xp[u] = self._xp.get(u, 0) + MESSAGE_XP
+                self._last_msg_xp[u] = ts
+            touches = self._bond.setdefault(u, [0, ts, ts])
+            touches[0] += MESSAGE_BOND
+            touches[2] = ts
+            self._dirty.add(u)
+
+    def on_daily(self, event):
+        u, ts = str(event.uid), int(event.ts)
+        with self._lock:
+            if not self._daily_ready(u, ts):
+                return None  # duplicate claim in this process
+        with self._save_lock, self._users_locked():
+            d = xp_mod._load()
+            xp_mod._ensure(u, d)
+            p = d["xp"][u]
+            last = p.get("last_daily", 0)
+            if last and ts - last < DAILY_COOLDOWN_H * 3600:
+                # Claimed through another worker (or replayed after it was saved)
+                with self._lock:
+                    self._last_daily[u] = last
+                return None
+            p["last_daily"] = ts
+            xp_mod._award(p, event.reward)
+            xp_mod._save(d)
+            with self._lock:
+                self._last_daily[u] = ts
+        get_leaderboard().update(u, p["level"], p["xp"])
+        return True
+
+    def on_quest(self, event):
+        u = str(event.uid)
+        with self._lock:
+            self._xp[u] = self._xp.get(u, 0) + event.xp
+            self._dirty.add(u)
+
+    # ------------------------------------------------------------------
+    # Projected reads
+    # ------------------------------------------------------------------
+
+    def _stored(self, section: str, u: str) -> dict:
+        return xp_mod._read().get(section, {}).get(u, {})
+
+    def _daily_ready(self, u: str, now: float) -> bool:
+        last = self._last_daily.get(u) or self._stored("xp", u).get("last_daily", 0)
+        return not last or now - last >= DAILY_COOLDOWN_H * 3600
+
+    def daily_ready(self, uid, now: Optional[float] = None) -> bool:
+        """Whether a DailyClaimed event for this user would be accepted"""
+        with self._lock:
+            return self._daily_ready(str(uid), time.time() if now is None else now)
+
+    def profile(self, uid) -> dict:
+        """XP profile including pending awards: {"xp", "level", "need"}"""
+        u = str(uid)
+        with self._save_lock:
+            p = self._stored("xp", u)
+            with self._lock:
+                pending = self._xp.get(u, 0) + (self._flushing[0].get(u, 0) if self._flushing else 0)
+        level, xp = xp_mod.level_for_total(xp_mod.total_xp(p.get("level", 1), p.get("xp", 0)) + pending)
+        return {"xp": xp, "level": level, "need": xp_mod.xp_for_next(level)}
+
+    def bond(self, uid, now: Optional[float] = None) -> dict:
+        """Bond including pending touches, decayed to now: {"score", "last_update"}"""
+        u = str(uid)
+        with self._save_lock:
+            b = self._stored("bond", u) or {"score": 0, "last_update": 0}
+            with self._lock:
+                batches = [self._flushing[1].get(u) if self._flushing else None, self._bond.get(u)]
+        score, last = b["score"], b["last_update"]
+        for touches in filter(None, batches):
+            score = min(bond_mod.MAX, bond_mod.decayed(score, last, touches[1]) + touches[0])
+            last = touches[2]
+        return {"score": bond_mod.decayed(score, last, time.time() if now is None else now), "last_update": last}
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def _users_locked(self):
+        """flock users.lock around a users.json read-modify-write (caller holds _save_lock)"""
+        if self._users_fd is not None:
+            yield  # already held further up this thread
+            return
+        import fcntl  # lazy: keeps bot startup light
+        path = xp_mod.USERS.with_suffix(".lock")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            self._users_fd = fd
+            yield
+        finally:
+            self._users_fd = None
+            os.close(fd)
+
+    def pending(self) -> int:
+        """Users with unsaved changes"""
+        with self._lock:
+            return len(self._dirty)
+
+    def persist(self):
+        """Write all pending changes with one users.json load/save"""
+        with self._lock:
+            if not self._dirty:
+                return
+            dirty, xp, bonds = self._dirty, self._xp, self._bond
+            self._dirty, self._xp, self._bond = set(), {}, {}
+            self._flushing = (xp, bonds)
+            last_msg = {u: self._last_msg_xp[u] for u in dirty if u in self._last_msg_xp}
+
+        try:
+            with self._save_lock, self._users_locked():
+                d = xp_mod._load()
+                for u in dirty:
+                    xp_mod._ensure(u, d)
+                    p = d["xp"][u]
+                    xp_mod._award(p, xp.get(u, 0))
+                    if u in last_msg:
+                        p["last_msg_xp"] = max(p.get("last_msg_xp", 0), last_msg[u])
+                    if u in bonds:
+                        touches, first, last = bonds[u]
+                        b = d.setdefault("bond", {}).setdefault(u, {"score": 0, "last_update": 0})
+                        b["score"] = min(bond_mod.MAX, bond_mod.decayed(b["score"], b["last_update"], first) + touches)
+                        b["last_update"] = last
+                xp_mod._save(d)
+                with self._lock:
+                    self._flushing = None
+        except Exception:
+            # Put the changes back so the next flush retries them
+            with self._lock:
+                self._flushing = None
+                self._dirty |= dirty
+                for u, amount in xp.items():
+                    self._xp[u] = self._xp.get(u, 0) + amount
+                for u, (touches, first, last) in bonds.items():
+                    mine = self._bond.setdefault(u, [0, first, last])
+                    mine[0] += touches
+                    mine[1] = min(mine[1], first)
+            raise
+
+        self.writes += 1
+        board = get_leaderboard()
+        for u in dirty:
+            p = d["xp"][u]
+            board.update(u, p["level"], p["xp"])
+
+
+_progress: Optional[ProgressAggregator] = None
+_progress_lock = threading.Lock()
+
+
+def get_progress() -> ProgressAggregator:
+    """Process-wide aggregator"""
+    global _progress
+    if _progress is None:
+        with _progress_lock:
+            if _progress is None:
+                _progress = ProgressAggregator()
+    return _progress
@@ -1,115 +1,310 @@
 """
 Quest System
 Daily and repeatable quests for XP rewards.
+
+Quest definitions are compiled once into a single keyword automaton (see
+keywords.KeywordMatcher), so checking a message costs the same however
+many quests exist. Completions and claims are indexed per user in memory;
+each change is appended to data/quests.journal and folded into
+data/quests.json every COMPACT_EVERY changes, so nothing is written for
+messages that complete nothing and a completion never rewrites every user.
+
+Every gunicorn worker runs an engine on the same files, so each call
+holds an flock on data/quests.lock and first applies the journal lines
+other workers appended since its last call. A compaction bumps a
+generation number kept in the lock file, which makes the others reload
+the snapshot instead of appending to the journal it replaced (the same
+scheme as the usage ledger).
+
+Each quest is done at most once per reset window: forever for one-time
+quests, per day for "reset": "daily", per N seconds for "every": N.
+Quests with "starts"/"ends" (epoch seconds) are only active in between.
+Windows are evaluated lazily: a completion simply stops counting once its
+window is over, nothing has to be swept at midnight.
+
+Environment Variables:
+    QUEST_RESET_UTC_HOUR - Hour (UTC) at which daily quests reset (default: 0)
 """
 
+import os
 import time
 import json
+import threading
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.game.keywords import KeywordMatcher
 
 DB = Path("data/quests.json")
+RESET_UTC_HOUR = int(os.getenv("QUEST_RESET_UTC_HOUR", "0"))
+
+DAY = 86400
+COMPACT_EVERY = 1000  # journal entries before quests.json is rewritten
 
 # Predefined quests
 PRE = [
-    {"id": "daily_greet", "text": "Say 'good morning'", "xp": 10, "key": "good morning"},
+    {"id": "daily_greet", "text": "Say 'good morning'", "xp": 10, "key": "good morning", "reset": "daily"},
     {"id": "share_thought", "text": "Tell Luna one thing on your mind", "xp": 15, "key": "I feel"}
 ]
 
 
-def _load():
-    """Load quests database"""
-    if not DB.exists():
-        DB.parent.mkdir(parents=True, exist_ok=True)
-        DB.write_text(json.dumps({"progress": {}, "completed": {}}, indent=2))
-    return json.loads(DB.read_text())
+def window_start(quest: Dict[str, Any], now: float) -> int:
+    """Start of the quest's current reset window (0 for one-time quests)"""
+    if quest.get("reset") == "daily":
+        offset = RESET_UTC_HOUR * 3600
+        return int((now - offset) // DAY * DAY + offset)
+    every = quest.get("every")
+    if every:
+        start = quest.get("starts", 0)
+        return int(start + (now - start) // every * every)
+    return 0
+
+
+def is_active(quest: Dict[str, Any], now: float) -> bool:
+    """Whether a timed quest is running (always true for untimed quests)"""
+    return quest.get("starts", 0) <= now < quest.get("ends", float("inf"))
+
+
+class QuestEngine:
+    """
+    Compiled quest definitions plus per-user completion state
+
+    State maps uid -> {quest id: window start} for completions and for
+    claims; an entry counts only while its window is the current one.
+    On disk it is a JSON snapshot plus a journal of later changes.
+    """
+
+    def __init__(self, quests: List[Dict[str, Any]], path: Path):
+        self.quests = {q["id"]: q for q in quests}
+        keys = [(k, q["id"]) for q in quests for k in (q.get("keys") or [q["key"]])]
+        self.matcher = KeywordMatcher(keys)
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._completed: Optional[Dict[str, Dict[str, int]]] = None
+        self._claimed: Dict[str, Dict[str, int]] = {}
+        self._journal_len = 0
+        self._offset = 0  # journal bytes already applied
+        self._lock_fd: Optional[int] = None
+        self._gen = 0  # compaction generation the state was loaded at
+        self.writes = 0
+        self.reloads = 0
+
+    # ------------------------------------------------------------------
+    # State
+    # ------------------------------------------------------------------
+
+    def _journal(self) -> Path:
+        return self.path.with_suffix(".journal")
+
+    @contextmanager
+    def _synced(self):
+        """Hold the state against other threads and processes, caught up with its files"""
+        import fcntl
+        with self._lock:
+            if self._lock_fd is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._lock_fd = os.open(str(self.path.with_suffix(".lock")), os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                raw = os.pread(self._lock_fd, 20, 0).strip()
+                gen = int(raw) if raw else 0
+                if self._completed is not None and gen != self._gen:
+                    self._completed = None  # another process compacted
+                    self.reloads += 1
+                self._gen = gen
+                if self._completed is None:
+                    self._load()
+                else:
+                    self._read_journal()
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _load(self):
+        try:
+            d = json.loads(self.path.read_text())
+        except FileNotFoundError:
+            d = {}
+        self._completed = {}
+        for uid, done in d.get("completed", {}).items():
+            # Legacy files list quest ids; treat those as done in window 0
+            self._completed[uid] = {q: 0 for q in done} if isinstance(done, list) else dict(done)
+        self._claimed = {uid: dict(c) for uid, c in d.get("claimed", {}).items()}
+        # Replay changes recorded since the last snapshot
+        self._journal_len = self._offset = 0
+        self._read_journal()
+
+    def _read_journal(self):
+        """Apply journal lines appended since the last read (by any process)"""
+        try:
+            with open(self._journal(), "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                kind, uid, qid, window = json.loads(line)
+            except ValueError:
+                continue  # torn line after a crash
+            index = self._completed if kind == "completed" else self._claimed
+            index.setdefault(uid, {})[qid] = window
+            self._journal_len += 1
+        self._offset += end
+        if end < len(data):
+            # Torn tail from a crashed writer: end it so the next change starts on its own line
+            with open(self._journal(), "ab") as f:
+                f.write(b"\n")
+            self._offset += len(data) - end + 1
+
+    def _record(self, kind: str, uid: str, qid: str, window: int):
+        """Append one change to the journal, folding it into a new snapshot every COMPACT_EVERY changes"""
+        line = (json.dumps([kind, uid, qid, window]) + "\n").encode()
+        with open(self._journal(), "ab") as f:
+            f.write(line)
+        self._offset += len(line)
+        self._journal_len += 1
+        self.writes += 1
+        if self._journal_len >= COMPACT_EVERY:
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"progress": {}, "completed": self._completed, "claimed": self._claimed}))
+            tmp.replace(self.path)
+            self._journal().unlink(missing_ok=True)
+            self._journal_len = self._offset = 0
+            self._gen += 1
+            os.pwrite(self._lock_fd, str(self._gen).encode().ljust(20), 0)
 
+    def _current(self, index: Dict[str, Dict[str, int]], uid: str, quest: Dict[str, Any], now: float) -> bool:
+        at = index.get(uid, {}).get(quest["id"])
+        return at is not None and at == window_start(quest, now)
 
-def _save(d):
-    """Save quests database"""
-    DB.write_text(json.dumps(d, indent=2))
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def status(self, uid, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Active quests with the user's done/claimed status for this window"""
+        now = time.time() if now is None else now
+        u = str(uid)
+        items = []
+        with self._synced():
+            for q in self.quests.values():
+                if not is_active(q, now):
+                    continue
+                items.append({
+                    "id": q["id"],
+                    "text": q["text"],
+                    "xp": q["xp"],
+                    "done": self._current(self._completed, u, q, now),
+                    "claimed": self._current(self._claimed, u, q, now),
+                    "reset": q.get("reset") or ("timed" if q.get("every") else None),
+                })
+        return items
+
+    def autocomplete(self, uid, text: str, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Complete every active quest whose key occurs in `text`; returns the newly completed ones"""
+        hits = self.matcher.find(text)
+        if not hits:
+            return []
+        now = time.time() if now is None else now
+        u = str(uid)
+        updates = []
+        with self._synced():
+            for qid in hits:
+                q = self.quests[qid]
+                if not is_active(q, now) or self._current(self._completed, u, q, now):
+                    continue
+                window = window_start(q, now)
+                self._completed.setdefault(u, {})[qid] = window
+                self._record("completed", u, qid, window)
+                updates.append(q)
+        return updates
+
+    def claim(self, uid, qid: str, now: Optional[float] = None) -> bool:
+        """Mark a quest completed in the current window as claimed; False if not done or already claimed"""
+        q = self.quests.get(qid)
+        if q is None:
+            return False
+        now = time.time() if now is None else now
+        u = str(uid)
+        with self._synced():
+            if not self._current(self._completed, u, q, now) or self._current(self._claimed, u, q, now):
+                return False
+            window = window_start(q, now)
+            self._claimed.setdefault(u, {})[qid] = window
+            self._record("claimed", u, qid, window)
+        return True
+
+    def xp(self, qid: str) -> int:
+        q = self.quests.get(qid)
+        return q["xp"] if q else 0
+
+
+_engine: Optional[QuestEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_quest_engine() -> QuestEngine:
+    """Process-wide engine for PRE and data/quests.json"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = QuestEngine(PRE, DB)
+    return _engine
 
 
 def list_quests(uid: int):
     """
     List all quests for a user
-    
+
     Args:
         uid: User ID
-        
+
     Returns:
         list: Quest objects with completion status
     """
-    d = _load()
-    done = set(d.get("completed", {}).get(str(uid), []))
-    items = []
-    for q in PRE:
-        items.append({
-            "id": q["id"],
-            "text": q["text"],
-            "xp": q["xp"],
-            "done": q["id"] in done
-        })
-    return items
+    return get_quest_engine().status(uid)
 
 
 def try_autocomplete(uid: int, text: str):
     """
     Auto-complete quests based on message content
-    
+
     Args:
         uid: User ID
         text: Message text
-        
+
     Returns:
         list: Newly completed quests
     """
-    d = _load()
-    u = str(uid)
-    done = set(d.get("completed", {}).get(u, []))
-    updates = []
-    
-    for q in PRE:
-        if q["id"] in done:
-            continue
-        if q["key"].lower() in (text or "").lower():
-            d.setdefault("completed", {}).setdefault(u, []).append(q["id"])
-            updates.append(q)
-    
-    if updates:
-        _save(d)
-    return updates
+    return get_quest_engine().autocomplete(uid, text)
 
 
 def claim(uid: int, qid: str):
     """
-    Check if quest is completed
-    
+    Claim a completed quest's reward (once per reset window)
+
     Args:
         uid: User ID
         qid: Quest ID
-        
+
     Returns:
-        bool: True if quest is completed
+        bool: True if the quest is completed and was not claimed yet
     """
-    d = _load()
-    u = str(uid)
-    if qid in d.get("completed", {}).get(u, []):
-        return True
-    return False
+    return get_quest_engine().claim(uid, qid)
 
 
 def get_quest_xp(qid: str) -> int:
     """
     Get XP reward for a quest
-    
+
     Args:
         qid: Quest ID
-        
+
     Returns:
         int: XP reward amount
     """
-    for q in PRE:
-        if q["id"] == qid:
-            return q["xp"]
-    return 0
-
+    return get_quest_engine().xp(qid)
@@ -1,19 +1,12 @@
 """
 Feature Unlock Gates
 Controls access to features based on level or premium status.
+Premium and tier come from the entitlement cache (src.payment.entitlements).
 """
 
-import json
-from pathlib import Path
+import time
 
-USERS = Path("data/users.json")
-
-
-def _load():
-    """Load users database"""
-    if not USERS.exists():
-        return {"premium_users": [], "tiers": {}, "xp": {}}
-    return json.loads(USERS.read_text())
+from src.game.progress import get_progress
 
 
 def is_premium(uid: int) -> bool:
@@ -26,8 +19,9 @@ def is_premium(uid: int) -> bool:
     Returns:
         bool: True if user has premium access
     """
-    d = _load()
-    return str(uid) in set(map(str, d.get("premium_users", []))) or d.get("tiers", {}).get(str(uid))
+    from src.payment.entitlements import get_entitlements
+    ent = get_entitlements().get(uid)
+    return ent.premium_active(time.time()) or bool(ent.tier)
 
 
 def get_level(uid: int) -> int:
@@ -38,11 +32,9 @@ def get_level(uid: int) -> int:
         uid: User ID
         
     Returns:
-        int: User's level (default: 1)
+        int: User's level (default: 1), including XP not yet flushed
     """
-    d = _load()
-    p = d.get("xp", {}).get(str(uid), {"level": 1})
-    return int(p.get("level", 1))
+    return int(get_progress().profile(uid)["level"])
 
 
 def get_tier(uid: int) -> str:
@@ -55,8 +47,8 @@ def get_tier(uid: int) -> str:
     Returns:
         str: Tier name (BRONZE, SILVER, GOLD) or empty string
     """
-    d = _load()
-    return d.get("tiers", {}).get(str(uid), "")
+    from src.payment.entitlements import get_entitlements
+    return get_entitlements().get(uid).tier
 
 
 def has_unlock(uid: int, feature: str) -> bool:
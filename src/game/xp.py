@@ -1,12 +1,21 @@
 """
 XP and Leveling System
 Handles user experience points, level progression, and daily rewards.
+
+Level N needs 100 * N XP, so reaching level L takes 50 * L * (L - 1) XP
+in total; levels are computed from that total in closed form instead of
+looping level by level. apply_xp_events folds any number of awards into
+a single users.json write. Reads (get_profile) never write.
 """
 
+import math
 import time
 import json
 import os
 from pathlib import Path
+from typing import Dict, Iterable, Tuple
+
+from src.game.leaderboard import get_leaderboard
 
 USERS = Path("data/users.json")
 LEVEL_CAP = 50
@@ -14,30 +23,29 @@ LEVEL_CAP = 50
 
 def _load():
     """Load users database with gamification data"""
+    from src.payment import membership
     if not USERS.exists():
         USERS.parent.mkdir(parents=True, exist_ok=True)
         USERS.write_text(json.dumps({
-            "premium_users": [],
-            "free_users": [],
+            **membership.empty(),
             "modes": {},
             "voice": {},
-            "tiers": {},
             "xp": {},
             "bond": {}
         }, indent=2))
     try:
-        return json.loads(USERS.read_text())
+        data = json.loads(USERS.read_text())
     except Exception:
         USERS.write_text(json.dumps({
-            "premium_users": [],
-            "free_users": [],
+            **membership.empty(),
             "modes": {},
             "voice": {},
-            "tiers": {},
             "xp": {},
             "bond": {}
         }, indent=2))
-        return json.loads(USERS.read_text())
+        data = json.loads(USERS.read_text())
+    membership.migrate(data)  # saved with the next change
+    return data
 
 
 def _save(d):
@@ -52,11 +60,44 @@ def _ensure(uid, d):
     d["xp"].setdefault(u, {"xp": 0, "level": 1, "last_daily": 0, "last_msg_xp": 0})
 
 
+def _read():
+    """Users database for read-only use (never creates or repairs the file)"""
+    try:
+        return json.loads(USERS.read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
 def xp_for_next(level: int) -> int:
     """Calculate XP needed for next level"""
     return 100 * level
 
 
+def total_xp(level: int, xp: int) -> int:
+    """XP earned in total to be at `level` with `xp` towards the next"""
+    return 50 * level * (level - 1) + xp
+
+
+def level_for_total(total: int) -> Tuple[int, int]:
+    """
+    Level and leftover XP for a total, in closed form
+
+    The largest L with 50 * L * (L - 1) <= total is (1 + isqrt(1 + 4m)) // 2
+    for m = total // 50, capped at LEVEL_CAP (XP keeps accumulating there).
+
+    Returns:
+        tuple: (level, xp)
+    """
+    total = max(0, total)
+    level = min(LEVEL_CAP, (1 + math.isqrt(1 + 4 * (total // 50))) // 2)
+    return level, total - total_xp(level, 0)
+
+
+def _award(p: dict, amount: int):
+    """Add XP to a stored profile and level it up"""
+    p["level"], p["xp"] = level_for_total(total_xp(p["level"], p["xp"]) + max(0, amount))
+
+
 def get_profile(uid: int):
     """
     Get user's XP profile
@@ -67,9 +108,7 @@ def get_profile(uid: int):
     Returns:
         dict: {"xp": int, "level": int, "need": int}
     """
-    d = _load()
-    _ensure(uid, d)
-    p = d["xp"][str(uid)]
+    p = _read().get("xp", {}).get(str(uid), {"xp": 0, "level": 1})
     need = xp_for_next(p["level"])
     return {"xp": p["xp"], "level": p["level"], "need": need}
 
@@ -95,15 +134,11 @@ def gain_xp(uid: int, amount: int, cooldown_sec: int = 30):
     if p["last_msg_xp"] and now - p["last_msg_xp"] < cooldown_sec:
         return get_profile(uid)
     
-    p["xp"] += max(0, amount)
+    _award(p, amount)
     p["last_msg_xp"] = now
     
-    # Auto level up
-    while p["level"] < LEVEL_CAP and p["xp"] >= xp_for_next(p["level"]):
-        p["xp"] -= xp_for_next(p["level"])
-        p["level"] += 1
-    
     _save(d)
+    get_leaderboard().update(uid, p["level"], p["xp"])
     return {"xp": p["xp"], "level": p["level"], "need": xp_for_next(p["level"])}
 
 
@@ -128,13 +163,41 @@ def claim_daily(uid: int, reward: int = 20, cooldown_hours: int = 24):
         return None  # Not ready
     
     p["last_daily"] = now
-    p["xp"] += reward
-    
-    # Level-up check
-    while p["level"] < LEVEL_CAP and p["xp"] >= xp_for_next(p["level"]):
-        p["xp"] -= xp_for_next(p["level"])
-        p["level"] += 1
+    _award(p, reward)
     
     _save(d)
+    get_leaderboard().update(uid, p["level"], p["xp"])
     return {"xp": p["xp"], "level": p["level"]}
 
+
+def apply_xp_events(events: Iterable[Tuple[int, int]]) -> Dict[str, dict]:
+    """
+    Apply many XP awards with one load and one save
+
+    Awards for the same user are summed, then leveled once. No cooldowns
+    apply; callers batch events they have already accepted.
+
+    Args:
+        events: (uid, amount) pairs
+
+    Returns:
+        dict: uid (str) -> updated profile {"xp": int, "level": int, "need": int}
+    """
+    totals: Dict[str, int] = {}
+    for uid, amount in events:
+        totals[str(uid)] = totals.get(str(uid), 0) + max(0, amount)
+    if not totals:
+        return {}
+
+    d = _load()
+    board = get_leaderboard()
+    out = {}
+    for u, amount in totals.items():
+        _ensure(u, d)
+        p = d["xp"][u]
+        _award(p, amount)
+        out[u] = {"xp": p["xp"], "level": p["level"], "need": xp_for_next(p["level"])}
+    _save(d)
+    for u, p in out.items():
+        board.update(u, p["level"], p["xp"])
+    return out
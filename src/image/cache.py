@@ -0,0 +1,307 @@
+"""
+Image Cache
+Disk-backed, content-addressed cache for generated images.
+
+Images are keyed by the SHA-256 of the full prompt URL (prompt, size,
+model and seed), so identical requests are served from disk instead of
+waiting 30-120s on Pollinations. Each key can hold a small pool of seed
+variants that fills in gradually, trading a few extra generations for
+variety once a prompt becomes popular.
+
+Environment Variables:
+    IMAGE_CACHE_DIR - Cache directory (default: data/image_cache)
+    IMAGE_CACHE_MAX_MB - Size cap before LRU eviction; 0 disables the cache (default: 512)
+    IMAGE_CACHE_VARIANTS - Seed variants kept per prompt (default: 1)
+    IMAGE_CACHE_FILL_PROBABILITY - Chance a hit generates a new variant while the pool is not full (default: 0.2)
+"""
+
+import os
+import random
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "data/image_cache")
+CACHE_MAX_MB = float(os.getenv("IMAGE_CACHE_MAX_MB", "512"))
+CACHE_VARIANTS = int(os.getenv("IMAGE_CACHE_VARIANTS", "1"))
+FILL_PROBABILITY = float(os.getenv("IMAGE_CACHE_FILL_PROBABILITY", "0.2"))
+
+_TMP_PREFIX = ".tmp-"
+
+# Set while the background warmer renders, so its lookups don't skew hit rate
+_warming: ContextVar[bool] = ContextVar("image_cache_warming", default=False)
+
+
+def cache_key(url: str) -> str:
+    """Content address for a prompt URL"""
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+class ImageCache:
+    """
+    Size-capped LRU image cache on disk
+
+    Entries are files named "<sha256>.<variant>" in two-character shard
+    directories. Writes go to a temp file and are renamed into place, so a
+    reader never sees a partial image. Recency is kept in memory and
+    mirrored to file mtimes so LRU order survives restarts.
+    """
+
+    def __init__(self, root: str, max_bytes: int, fill_probability: float = FILL_PROBABILITY,
+                 rng: Optional[random.Random] = None):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.fill_probability = fill_probability
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[str, int]" = OrderedDict()  # file name -> size
+        self._variants: Dict[str, Set[int]] = {}
+        self._bytes = 0
+        self._loaded = False
+
+        self.hits = 0
+        self.misses = 0
+        self.fills = 0
+        self.stores = 0
+        self.prewarmed = 0
+        self.evictions = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    # ------------------------------------------------------------------
+    # Index
+    # ------------------------------------------------------------------
+
+    def _path(self, name: str) -> Path:
+        return self.root / name[:2] / name
+
+    def _load(self):
+        """Scan the cache directory once (oldest mtime first)"""
+        if self._loaded:
+            return
+        entries = []
+        if self.root.exists():
+            for path in self.root.glob("*/*"):
+                if path.name.startswith(_TMP_PREFIX):
+                    # Leftover from a crash mid-write
+                    path.unlink(missing_ok=True)
+                    continue
+                try:
+                    st = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, path.name, st.st_size))
+        for _mtime, name, size in sorted(entries):
+            self._index_add(name, size)
+        self._loaded = True
+        if entries:
+            logger.info(f"Image cache: {len(entries)} entries, {self._bytes / 1024 / 1024:.1f} MB in {self.root}")
+
+    def _index_add(self, name: str, size: int):
+        digest, _, variant = name.partition(".")
+        if name in self._lru:
+            self._bytes -= self._lru[name]
+        self._lru[name] = size
+        self._lru.move_to_end(name)
+        self._bytes += size
+        self._variants.setdefault(digest, set()).add(int(variant or 0))
+
+    def _index_remove(self, name: str):
+        size = self._lru.pop(name, None)
+        if size is None:
+            return
+        self._bytes -= size
+        digest, _, variant = name.partition(".")
+        pool = self._variants.get(digest)
+        if pool is not None:
+            pool.discard(int(variant or 0))
+            if not pool:
+                del self._variants[digest]
+
+    def _evict(self, keep: str):
+        while self._bytes > self.max_bytes and len(self._lru) > 1:
+            name = next(iter(self._lru))
+            if name == keep:
+                self._lru.move_to_end(name)
+                continue
+            self._index_remove(name)
+            self._path(name).unlink(missing_ok=True)
+            self.evictions += 1
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def warming(self):
+        """Mark lookups/stores in this context as pre-generation, not user traffic"""
+        token = _warming.set(True)
+        try:
+            yield self
+        finally:
+            _warming.reset(token)
+
+    def variants(self, url: str) -> List[int]:
+        """Stored variant numbers for a prompt URL"""
+        if not self.enabled:
+            return []
+        with self._lock:
+            self._load()
+            return sorted(self._variants.get(cache_key(url), ()))
+
+    def get(self, url: str, variant: int = 0) -> Optional[bytes]:
+        """
+        Read a cached image
+
+        Does not count towards hit/miss metrics (see lookup).
+
+        Returns:
+            bytes or None if not cached
+        """
+        if not self.enabled:
+            return None
+        name = f"{cache_key(url)}.{variant}"
+        with self._lock:
+            self._load()
+            if name not in self._lru:
+                return None
+            self._lru.move_to_end(name)
+        path = self._path(name)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            # Removed behind our back (another process evicted it)
+            with self._lock:
+                self._index_remove(name)
+            return None
+
+    def put(self, url: str, data: bytes, variant: int = 0):
+        """Store an image atomically and evict least recently used entries over the cap"""
+        if not self.enabled or not data:
+            return
+        name = f"{cache_key(url)}.{variant}"
+        path = self._path(name)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=_TMP_PREFIX)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError as e:
+            self.errors += 1
+            logger.warning(f"Image cache write failed for {name}: {e}")
+            return
+        with self._lock:
+            self._load()
+            self._index_add(name, len(data))
+            self.stores += 1
+            if _warming.get():
+                self.prewarmed += 1
+            self._evict(keep=name)
+
+    def lookup(self, url: str, pool: int = 1) -> Tuple[Optional[bytes], int]:
+        """
+        Decide between serving a cached variant and generating a new one
+
+        With pool > 1, a hit on a key whose pool is not yet full asks for a
+        new variant with probability `fill_probability`; otherwise a random
+        stored variant is served. Counts towards the hit-rate metrics unless
+        called inside warming(), where a pool that is not full is always
+        topped up.
+
+        Args:
+            url: Canonical prompt URL (the cache key)
+            pool: Number of seed variants to keep for this key
+
+        Returns:
+            (image bytes, variant) on a hit, or (None, variant to generate)
+        """
+        if not self.enabled:
+            return None, 0
+
+        warming = _warming.get()
+        stored = self.variants(url)
+        if stored and (len(stored) >= pool or (not warming and self._rng.random() >= self.fill_probability)):
+            variant = self._rng.choice(stored)
+            data = self.get(url, variant)
+            if data is not None:
+                if not warming:
+                    self.hits += 1
+                return data, variant
+            stored = self.variants(url)
+
+        if not warming:
+            if stored:
+                self.fills += 1
+            else:
+                self.misses += 1
+        return None, next(v for v in range(max(pool, len(stored) + 1)) if v not in stored)
+
+    def get_or_fetch(self, url: str, fetch: Callable[[int], bytes], pool: int = 1) -> bytes:
+        """
+        Serve an image from the cache, generating it on a miss
+
+        Args:
+            url: Canonical prompt URL (the cache key)
+            fetch: Called with a variant number (0 = canonical seed) and
+                returns image bytes
+            pool: Number of seed variants to keep for this key
+
+        Returns:
+            bytes: Image data
+        """
+        data, variant = self.lookup(url, pool)
+        if data is None:
+            data = fetch(variant)
+            self.put(url, data, variant)
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit-rate and size counters"""
+        with self._lock:
+            entries, size = len(self._lru), self._bytes
+        lookups = self.hits + self.misses + self.fills
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "fills": self.fills,
+            "hit_rate": round(self.hits / lookups * 100, 1) if lookups else 0.0,
+            "stores": self.stores,
+            "prewarmed": self.prewarmed,
+            "evictions": self.evictions,
+            "errors": self.errors,
+        }
+
+
+_default: Optional[ImageCache] = None
+_default_lock = threading.Lock()
+
+
+def get_image_cache() -> ImageCache:
+    """Process-wide cache configured from the environment"""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = ImageCache(CACHE_DIR, int(CACHE_MAX_MB * 1024 * 1024))
+    return _default
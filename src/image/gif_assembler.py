@@ -0,0 +1,324 @@
+"""
+GIF Assembler
+Streams animated GIFs frame by frame against one shared adaptive palette.
+
+Frames are decoded one at a time: a first pass builds the palette from
+small thumbnails, a second pass quantizes each frame against it and
+appends the encoded image block to the output, so peak memory is about
+one decoded frame regardless of frame count. Every frame uses the same
+global color table, which also avoids per-frame palette flicker, and only
+the box of pixels that changed since the previous frame is encoded
+(unchanged pixels inside it are transparent).
+
+Optionally encodes MP4/WebM through a local ffmpeg when one is installed
+(Telegram plays MP4 as an animation at a fraction of the GIF size).
+"""
+
+import io
+import os
+import shutil
+import struct
+import logging
+import tempfile
+import subprocess
+from typing import BinaryIO, Iterable, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Thumbnail edge used when sampling frames for the shared palette
+PALETTE_SAMPLE_SIZE = 96
+
+# (scale, colors) steps tried in order by the size-targeting mode
+SIZE_LADDER = (
+    (1.0, 256), (1.0, 128), (0.85, 128), (0.75, 96), (0.75, 64),
+    (0.6, 64), (0.5, 48), (0.5, 32), (0.4, 32), (0.33, 24),
+)
+
+_NETSCAPE_LOOP = b"\x21\xff\x0bNETSCAPE2.0\x03\x01%s\x00"
+
+
+def _open_rgb(frame: bytes, size: Optional[Tuple[int, int]] = None, thumbnail: bool = False):
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(frame))
+    target = size or img.size
+    if thumbnail:
+        target = (PALETTE_SAMPLE_SIZE, PALETTE_SAMPLE_SIZE)
+    # JPEG decoders can downscale while decoding (much cheaper than resizing later)
+    img.draft("RGB", target)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if thumbnail:
+        img.thumbnail(target)
+    elif img.size != target:
+        img = img.resize(target, Image.Resampling.LANCZOS)
+    return img
+
+
+def frame_size(frame: bytes) -> Tuple[int, int]:
+    """Pixel size of an encoded frame (header only, no full decode)"""
+    from PIL import Image
+
+    return Image.open(io.BytesIO(frame)).size
+
+
+def build_palette(frames: Iterable[bytes], colors: int = 256):
+    """
+    Compute one adaptive palette for all frames
+
+    Each frame is decoded at thumbnail size and tiled into a single sample
+    image, which is median-cut quantized once.
+
+    Returns:
+        PIL "P" image carrying the shared palette
+    """
+    from PIL import Image
+
+    thumbs = [_open_rgb(f, thumbnail=True) for f in frames]
+    if not thumbs:
+        raise ValueError("No frames provided for palette")
+    width = sum(t.width for t in thumbs)
+    height = max(t.height for t in thumbs)
+    sample = Image.new("RGB", (width, height))
+    x = 0
+    for t in thumbs:
+        sample.paste(t, (x, 0))
+        x += t.width
+    return sample.quantize(colors=max(2, min(256, colors)), method=Image.Quantize.MEDIANCUT)
+
+
+def _skip_sub_blocks(data: bytes, pos: int) -> int:
+    while data[pos]:
+        pos += data[pos] + 1
+    return pos + 1
+
+
+def _split_single_frame_gif(data: bytes) -> Tuple[bytes, bytes]:
+    """
+    Split a one-frame GIF into (global color table, image block)
+
+    The image block starts at the image descriptor (0x2C) and runs to the
+    end of its LZW data; extensions written by the encoder are dropped.
+    """
+    packed = data[10]
+    pos = 13
+    gct = b""
+    if packed & 0x80:
+        gct_len = 3 * (2 << (packed & 0x07))
+        gct = data[pos:pos + gct_len]
+        pos += gct_len
+    while data[pos] == 0x21:  # extension blocks
+        pos = _skip_sub_blocks(data, pos + 2)
+    if data[pos] != 0x2C:
+        raise ValueError("Unexpected GIF layout")
+    start = pos
+    local_packed = data[pos + 9]
+    pos += 10
+    if local_packed & 0x80:
+        pos += 3 * (2 << (local_packed & 0x07))
+    pos = _skip_sub_blocks(data, pos + 1)  # LZW minimum code size, then data
+    return gct, data[start:pos]
+
+
+def _with_local_table(block: bytes, table: bytes) -> bytes:
+    """Attach a local color table to an image block that has none"""
+    bits = max(0, (len(table) // 3).bit_length() - 2)
+    packed = block[9] | 0x80 | bits
+    return block[:9] + bytes([packed]) + table + block[10:]
+
+
+def _changed_region(cur, prev, transparent: int):
+    """
+    Crop a frame to the pixels that differ from the previous one
+
+    `cur` and `prev` are "L" images holding palette indices. Unchanged
+    pixels inside the box become `transparent`, so the previous frame
+    shows through (disposal method 1) and LZW sees long runs.
+
+    Returns:
+        ((left, top), "L" image of the changed box)
+    """
+    from PIL import Image, ImageChops
+
+    if prev is None:
+        return (0, 0), cur
+    diff = ImageChops.difference(cur, prev)
+    bbox = diff.getbbox()
+    if bbox is None:
+        # Identical frame: a single transparent pixel keeps the timing
+        return (0, 0), Image.new("L", (1, 1), transparent)
+    mask = diff.point(lambda v: 255 if v else 0)
+    region = Image.composite(cur, Image.new("L", cur.size, transparent), mask).crop(bbox)
+    return bbox[:2], region
+
+
+def write_gif(frames: Sequence[bytes], out: BinaryIO, duration: int = 500, loop: int = 0,
+              colors: int = 256, size: Optional[Tuple[int, int]] = None, palette=None,
+              dither: bool = False, diff_frames: bool = True) -> int:
+    """
+    Stream an animated GIF to `out`, one frame at a time
+
+    Args:
+        frames: Encoded frames (PNG/JPEG bytes)
+        out: Writable binary stream
+        duration: Milliseconds per frame
+        loop: Loop count (0 = infinite)
+        colors: Palette size including the transparent slot, when
+            `palette` is not given
+        size: Output (width, height); defaults to the first frame's size
+        palette: Shared "P" palette image (see build_palette)
+        dither: Floyd-Steinberg dithering against the shared palette
+            (better gradients, larger files)
+        diff_frames: Only encode the pixels that changed since the
+            previous frame
+
+    Returns:
+        int: Bytes written
+    """
+    from PIL import Image
+
+    if not frames:
+        raise ValueError("No frames provided for GIF creation")
+
+    size = size or frame_size(frames[0])
+    palette = palette if palette is not None else build_palette(frames, max(2, min(256, colors)) - 1)
+    shared = palette.getpalette()[:3 * 255]
+    transparent = len(shared) // 3  # first slot past the quantized colors
+    table_palette = shared + [0, 0, 0]
+    dither_mode = Image.Dither.FLOYDSTEINBERG if dither else Image.Dither.NONE
+    delay = max(2, int(round(duration / 10)))  # GIF delays are in 1/100 s
+    written = 0
+    global_table = None
+    prev = None
+
+    for i, frame in enumerate(frames):
+        quantized = _open_rgb(frame, size).quantize(palette=palette, dither=dither_mode)
+        cur = Image.frombytes("L", size, quantized.tobytes())
+        del quantized
+        (left, top), region = _changed_region(cur, prev if diff_frames else None, transparent)
+        prev = cur
+
+        img = Image.frombytes("P", region.size, region.tobytes())
+        img.putpalette(table_palette)
+        buf = io.BytesIO()
+        img.save(buf, format="GIF", optimize=False)
+        del img, region
+        table, block = _split_single_frame_gif(buf.getvalue())
+        block = block[:1] + struct.pack("<HH", left, top) + block[5:]
+
+        if global_table is None:
+            global_table = table
+            bits = max(0, (len(table) // 3).bit_length() - 2)
+            header = (
+                b"GIF89a"
+                + struct.pack("<HHBBB", size[0], size[1], 0x80 | 0x70 | bits, 0, 0)
+                + table
+                + _NETSCAPE_LOOP % struct.pack("<H", loop)
+            )
+            out.write(header)
+            written += len(header)
+        elif table != global_table:
+            block = _with_local_table(block, table)
+
+        # Graphic control extension: keep the previous frame (disposal 1),
+        # per-frame delay, transparent index for unchanged pixels
+        flags = 0x04 | (0x01 if i and diff_frames else 0x00)
+        chunk = b"\x21\xf9\x04" + struct.pack("<BHB", flags, delay, transparent) + b"\x00" + block
+        out.write(chunk)
+        written += len(chunk)
+        logger.debug(f"GIF frame {i + 1}/{len(frames)} appended ({len(chunk):,} bytes)")
+
+    out.write(b"\x3b")
+    return written + 1
+
+
+def assemble_gif(frames: Sequence[bytes], duration: int = 500, loop: int = 0, colors: int = 256,
+                 scale: float = 1.0, target_bytes: Optional[int] = None, dither: bool = False) -> bytes:
+    """
+    Build an animated GIF with a shared palette
+
+    Args:
+        frames: Encoded frames (PNG/JPEG bytes)
+        duration: Milliseconds per frame
+        loop: Loop count (0 = infinite)
+        colors: Palette size
+        scale: Output scale relative to the first frame
+        target_bytes: If set, step down size/colors (SIZE_LADDER) until the
+            GIF fits; the smallest attempt is returned if none does
+        dither: Floyd-Steinberg dithering against the shared palette
+
+    Returns:
+        bytes: GIF data
+    """
+    width, height = frame_size(frames[0]) if frames else (0, 0)
+
+    def encode(s: float, c: int) -> bytes:
+        out = io.BytesIO()
+        size = (max(16, int(width * s)), max(16, int(height * s)))
+        write_gif(frames, out, duration, loop, colors=c, size=size, dither=dither)
+        return out.getvalue()
+
+    if not target_bytes:
+        return encode(scale, colors)
+
+    best = None
+    for s, c in SIZE_LADDER:
+        if s > scale or c > colors:
+            continue
+        data = encode(s, c)
+        if best is None or len(data) < len(best):
+            best = data
+        if len(data) <= target_bytes:
+            logger.info(f"GIF fits budget at scale {s}, {c} colors: {len(data):,} <= {target_bytes:,} bytes")
+            return data
+    logger.warning(f"GIF could not reach {target_bytes:,} bytes; smallest was {len(best):,}")
+    return best
+
+
+def video_encoder_available() -> bool:
+    """Whether a local ffmpeg is installed for MP4/WebM output"""
+    return shutil.which("ffmpeg") is not None
+
+
+def encode_video(frames: Sequence[bytes], duration: int = 500, fmt: str = "mp4",
+                 loops: int = 1) -> Optional[bytes]:
+    """
+    Encode frames to MP4 (H.264) or WebM (VP9) with ffmpeg
+
+    Args:
+        frames: Encoded frames (PNG/JPEG bytes)
+        duration: Milliseconds per frame
+        fmt: "mp4" or "webm"
+        loops: Times to repeat the sequence in the file (Telegram loops
+            short animations itself)
+
+    Returns:
+        bytes, or None if ffmpeg is not installed or encoding failed
+    """
+    if fmt not in ("mp4", "webm"):
+        raise ValueError(f"Unsupported video format: {fmt}")
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        return None
+
+    codec = (["-c:v", "libx264", "-pix_fmt", "yuv420p", "-movflags", "+faststart", "-crf", "26"]
+             if fmt == "mp4" else ["-c:v", "libvpx-vp9", "-pix_fmt", "yuv420p", "-b:v", "0", "-crf", "36"])
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, frame in enumerate(list(frames) * max(1, loops)):
+            with open(os.path.join(tmp, f"frame_{i:04d}.img"), "wb") as f:
+                f.write(frame)
+        out_path = os.path.join(tmp, f"out.{fmt}")
+        cmd = [
+            ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+            "-framerate", f"{1000 / duration:.4f}", "-i", os.path.join(tmp, "frame_%04d.img"),
+            # Even dimensions are required by yuv420p
+            "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2", *codec, "-an", out_path,
+        ]
+        try:
+            subprocess.run(cmd, check=True, capture_output=True, timeout=120)
+        except (subprocess.SubprocessError, OSError) as e:
+            logger.warning(f"ffmpeg {fmt} encode failed: {e}")
+            return None
+        with open(out_path, "rb") as f:
+            return f.read()
+
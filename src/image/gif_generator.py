@@ -3,18 +3,40 @@ GIF Generator for Luna Noir
 Creates animated GIFs from multiple Luna images
 """
 
-import io
+import os
+import time
+import random
+import asyncio
 import logging
 import requests
 from urllib.parse import quote
-from PIL import Image
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from src.image.cache import get_image_cache
 
 logger = logging.getLogger(__name__)
 
 # Pollinations.ai API endpoint
 POLLINATIONS_API = "https://image.pollinations.ai/prompt"
 
+# Concurrent frame fetching: default in-flight requests per GIF (scenarios may
+# override with a "concurrency" key) and jittered exponential retry backoff
+GIF_FRAME_CONCURRENCY = int(os.getenv("GIF_FRAME_CONCURRENCY", "4"))
+FRAME_TIMEOUT = 60  # seconds per request
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 10.0
+# HTTP statuses worth retrying (upstream overload / gateway errors)
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Interpolation mode: render only a scenario's "keyframes" remotely and
+# synthesize GIF_INBETWEENS frames between each pair locally
+GIF_INTERPOLATION = os.getenv("GIF_INTERPOLATION", "false").lower() == "true"
+GIF_INBETWEENS = int(os.getenv("GIF_INBETWEENS", "3"))
+GIF_INTERPOLATION_METHOD = os.getenv("GIF_INTERPOLATION_METHOD", "flow")
+
+# Byte budget for assembled GIFs; larger results are re-encoded smaller (0 = no budget)
+GIF_MAX_BYTES = int(os.getenv("GIF_MAX_BYTES", str(2 * 1024 * 1024)))
+
 # Luna's core character description - CONSISTENT with main generator
 # Using same description as luna_generator.py for character consistency
 LUNA_GIF_BASE = """adult woman Luna Noir exactly 22 years old, shoulder-length lavender purple bob haircut with straight blunt bangs, almond-shaped bright violet purple eyes with thick black winged eyeliner and long black lashes, very pale porcelain white skin, heart-shaped face with high cheekbones and delicate jawline, full pouty lips with dark plum matte lipstick, small straight nose, thin black leather choker necklace, single small minimalist black outline snake tattoo on outer right forearm 8cm below elbow facing forward no other tattoos anywhere, hourglass figure with narrow waist, perky C-cup breasts, flat toned stomach, wide feminine hips, thick toned thighs, round firm bubble butt, long shapely legs, 168cm tall, athletic curvy body, goth aesthetic, seductive confident expression, sultry gaze, photorealistic"""
@@ -23,11 +45,13 @@ LUNA_GIF_BASE = """adult woman Luna Noir exactly 22 years old, shoulder-length l
 NEGATIVE_PROMPT = "child, teen, teenager, young girl, underage, baby face, multiple people, different hair color, blonde hair, brunette hair, long hair, curly hair, different eye color, brown eyes, blue eyes, tan skin, dark skin, anime, cartoon, 3d render, cropped, deformed, ugly, blurry, low quality, many tattoos, multiple tattoos, pixelated, low resolution, censored, plastic skin, doll face, smooth skin, airbrushed"
 
 # GIF animation scenarios with frame descriptions
+# ("keyframes" lists the descriptions rendered remotely in interpolation mode)
 GIF_SCENARIOS = {
     "wink": {
         "name": "Sultry Wink",
         "frames": 5,  # Increased for smoother animation
         "duration": 400,  # ms per frame
+        "keyframes": [0, 2, 4],  # open -> wink -> open
         "descriptions": [
             "wearing black crop top and black ripped jeans, looking at camera both eyes open seductive smile",
             "wearing black crop top and black ripped jeans, looking at camera right eye starting to close slight smile",
@@ -40,6 +64,7 @@ GIF_SCENARIOS = {
         "name": "Blowing Kiss",
         "frames": 5,  # Increased for smoother animation
         "duration": 400,
+        "keyframes": [0, 2, 4],  # hand down -> kiss -> hand down
         "descriptions": [
             "wearing black crop top and black ripped jeans, looking at camera hand at side smiling",
             "wearing black crop top and black ripped jeans, looking at camera raising hand to lips smiling",
@@ -52,6 +77,7 @@ GIF_SCENARIOS = {
         "name": "Pose Sequence",
         "frames": 4,  # Increased for smoother animation
         "duration": 500,
+        "keyframes": [0, 2, 3],  # hips -> hands in hair -> hips
         "descriptions": [
             "wearing black crop top and black ripped jeans, standing hands on hips confident pose",
             "wearing black crop top and black ripped jeans, standing one hand on hip other hand touching hair",
@@ -63,6 +89,7 @@ GIF_SCENARIOS = {
         "name": "Teasing",
         "frames": 5,  # Increased for smoother animation
         "duration": 500,
+        "keyframes": [0, 2, 4],
         "descriptions": [
             "wearing black lace lingerie bra and panties, standing finger on lips playful smile",
             "wearing black lace lingerie bra and panties, standing hand sliding down neck seductive smile",
@@ -75,6 +102,7 @@ GIF_SCENARIOS = {
         "name": "Undressing Sequence",
         "frames": 6,  # Increased for smoother animation
         "duration": 600,
+        "keyframes": [0, 2, 5],
         "descriptions": [
             "wearing black crop top and black lace bra underneath, standing hands at sides",
             "wearing black crop top and black lace bra underneath, standing hands gripping bottom of crop top",
@@ -88,6 +116,7 @@ GIF_SCENARIOS = {
         "name": "Dancing",
         "frames": 6,  # Increased for smoother animation
         "duration": 400,
+        "keyframes": [0, 1, 3, 4],  # center -> sway right -> sway left -> center
         "descriptions": [
             "wearing black crop top and black ripped jeans, dancing arms raised above head hips centered",
             "wearing black crop top and black ripped jeans, dancing arms out to sides hips swaying right",
@@ -101,6 +130,8 @@ GIF_SCENARIOS = {
         "name": "360° Rotation",
         "frames": 8,  # Increased for smoother rotation
         "duration": 400,
+        "concurrency": 8,  # Every angle is distinct, fetch them all at once
+        # No "keyframes": blending can't fake a 3D turn, always render every angle
         "descriptions": [
             "wearing black crop top and black ripped jeans, full body standing facing camera front view",
             "wearing black crop top and black ripped jeans, full body standing turned 45 degrees right showing right side",
@@ -116,6 +147,7 @@ GIF_SCENARIOS = {
         "name": "Nude Teasing",
         "frames": 5,  # Increased for smoother animation
         "duration": 500,
+        "keyframes": [0, 2, 4],
         "descriptions": [
             "completely nude, standing covering breasts with hands and covering crotch with hand shy smile",
             "completely nude, standing covering breasts with one hand other hand lowering from crotch teasing smile",
@@ -128,6 +160,7 @@ GIF_SCENARIOS = {
         "name": "Nude Pose Sequence",
         "frames": 5,  # Increased for smoother animation
         "duration": 500,
+        "keyframes": [0, 2, 4],
         "descriptions": [
             "completely nude, standing hands on hips confident pose front view",
             "completely nude, standing one hand on hip other hand touching hair seductive pose",
@@ -139,6 +172,44 @@ GIF_SCENARIOS = {
 }
 
 
+def _frame_url(description: str, nsfw: bool) -> str:
+    """Build the Pollinations URL for one frame"""
+    # Build prompt with full Luna description for consistency
+    if nsfw:
+        prompt = f"{LUNA_GIF_BASE}, {description}, professional photography, NSFW explicit, photorealistic, 8K, sharp focus"
+    else:
+        prompt = f"{LUNA_GIF_BASE}, {description}, professional photography, photorealistic, 8K, sharp focus"
+
+    # URL encode the prompt
+    encoded_prompt = quote(prompt)
+
+    # URL encode the negative prompt
+    encoded_negative = quote(NEGATIVE_PROMPT)
+
+    # Use consistent seed for same character, smaller size for faster generation
+    return f"{POLLINATIONS_API}/{encoded_prompt}?width=512&height=512&model=flux&nologo=true&enhance=true&seed=42&negative={encoded_negative}"
+
+
+def _fetch_once(url: str) -> bytes:
+    """Single blocking request for one frame"""
+    response = requests.get(url, timeout=FRAME_TIMEOUT)
+    response.raise_for_status()
+    return response.content
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Timeouts, connection errors and gateway/overload statuses are retried"""
+    if isinstance(error, requests.exceptions.HTTPError):
+        response = error.response
+        return response is not None and response.status_code in RETRYABLE_STATUS
+    return True
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff: uniform(0, min(max, base * 2^attempt))"""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+
 def generate_gif_frame(description: str, nsfw: bool = False, retries: int = 3) -> bytes:
     """
     Generate a single GIF frame with Luna's consistent character description.
@@ -151,68 +222,136 @@ def generate_gif_frame(description: str, nsfw: bool = False, retries: int = 3) -
     Returns:
         bytes: PNG image data
     """
-    import time
+    url = _frame_url(description, nsfw)
 
-    # Build prompt with full Luna description for consistency
-    if nsfw:
-        prompt = f"{LUNA_GIF_BASE}, {description}, professional photography, NSFW explicit, photorealistic, 8K, sharp focus"
-    else:
-        prompt = f"{LUNA_GIF_BASE}, {description}, professional photography, photorealistic, 8K, sharp focus"
+    logger.debug(f"GIF frame URL: {url}")
+    logger.debug(f"GIF frame URL length: {len(url)} chars")
 
-    # URL encode the prompt
-    encoded_prompt = quote(prompt)
+    def fetch(_variant: int) -> bytes:
+        # Retry logic for errors (502, timeouts, etc.)
+        last_error = None
+        for attempt in range(retries):
+            try:
+                logger.debug(f"Attempt {attempt + 1}/{retries}")
+                content = _fetch_once(url)
+                logger.debug(f"Frame generated successfully: {len(content):,} bytes")
+                return content
+
+            except Exception as e:
+                last_error = e
+                if not _is_retryable(e):
+                    raise  # Re-raise non-retryable HTTP errors immediately
+                logger.warning(f"Error on attempt {attempt + 1}/{retries}: {type(e).__name__}: {e}")
+                if attempt < retries - 1:  # Don't sleep on last attempt
+                    time.sleep(_backoff_delay(attempt))
+
+        # All retries failed
+        logger.error(f"All {retries} attempts failed for frame generation")
+        raise last_error
+
+    # Frames always use the canonical seed so animations stay consistent
+    return get_image_cache().get_or_fetch(url, fetch)
+
+
+async def generate_gif_frame_async(description: str, nsfw: bool = False, retries: int = 3) -> bytes:
+    """
+    Async variant of generate_gif_frame.
 
-    # URL encode the negative prompt
-    encoded_negative = quote(NEGATIVE_PROMPT)
+    The blocking request runs in a worker thread and retry backoff uses
+    asyncio.sleep, so the event loop is never blocked.
 
-    # Use consistent seed for same character, smaller size for faster generation
-    url = f"{POLLINATIONS_API}/{encoded_prompt}?width=512&height=512&model=flux&nologo=true&enhance=true&seed=42&negative={encoded_negative}"
+    Args:
+        description: Short description of the frame action/pose
+        nsfw: Whether to generate NSFW content
+        retries: Number of retry attempts on failure
 
-    logger.debug(f"GIF frame URL: {url}")
-    logger.debug(f"GIF frame URL length: {len(url)} chars")
+    Returns:
+        bytes: PNG image data
+    """
+    url = _frame_url(description, nsfw)
+    cache = get_image_cache()
+    cached, _variant = await asyncio.to_thread(cache.lookup, url)
+    if cached is not None:
+        return cached
 
-    # Retry logic for errors (502, timeouts, etc.)
     last_error = None
     for attempt in range(retries):
         try:
-            logger.debug(f"Attempt {attempt + 1}/{retries}")
-            # Longer timeout (60s) and retry on any error
-            response = requests.get(url, timeout=60)
-            response.raise_for_status()
-            logger.debug(f"Frame generated successfully: {len(response.content):,} bytes")
-            return response.content
-
-        except requests.exceptions.Timeout as e:
-            last_error = e
-            logger.warning(f"Timeout on attempt {attempt + 1}/{retries}, retrying in 3s...")
-            time.sleep(3)
-
-        except requests.exceptions.HTTPError as e:
-            last_error = e
-            if e.response.status_code == 502:
-                logger.warning(f"502 error on attempt {attempt + 1}/{retries}, retrying in 3s...")
-                time.sleep(3)
-            else:
-                raise  # Re-raise non-502 HTTP errors immediately
-
+            content = await asyncio.to_thread(_fetch_once, url)
+            await asyncio.to_thread(cache.put, url, content)
+            return content
         except Exception as e:
             last_error = e
+            if not _is_retryable(e):
+                raise
             logger.warning(f"Error on attempt {attempt + 1}/{retries}: {type(e).__name__}: {e}")
-            if attempt < retries - 1:  # Don't sleep on last attempt
-                time.sleep(3)
+            if attempt < retries - 1:
+                await asyncio.sleep(_backoff_delay(attempt))
 
-    # All retries failed
     logger.error(f"All {retries} attempts failed for frame generation")
     raise last_error
 
 
-def generate_gif_frames(scenario_type: str, nsfw: bool = False) -> List[bytes]:
+def _fill_failed_frames(frames: List[Optional[bytes]]) -> List[bytes]:
+    """Replace failed frames with the nearest successful frame (earlier wins ties)"""
+    ok = [i for i, f in enumerate(frames) if f is not None]
+    return [f if f is not None else frames[min(ok, key=lambda j: (abs(j - i), j))]
+            for i, f in enumerate(frames)]
+
+
+async def _fetch_descriptions_async(descriptions: List[str], nsfw: bool, limit: int, label: str) -> List[bytes]:
+    """Fetch one frame per description, `limit` in flight (see generate_gif_frames_async)"""
+    unique = list(dict.fromkeys(descriptions))
+    semaphore = asyncio.Semaphore(limit)
+
+    logger.info(
+        f"Generating {len(descriptions)} frames ({len(unique)} distinct, concurrency {limit}) "
+        f"for '{label}' GIF (NSFW: {nsfw})"
+    )
+
+    async def fetch(description: str) -> bytes:
+        async with semaphore:
+            return await generate_gif_frame_async(description=description, nsfw=nsfw)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(fetch(d) for d in unique), return_exceptions=True)
+    by_description: Dict[str, Optional[bytes]] = {}
+    errors = []
+    for description, result in zip(unique, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Failed to generate frame '{description[:50]}...': {result}")
+            errors.append(result)
+            by_description[description] = None
+        else:
+            by_description[description] = result
+
+    if len(errors) * 2 >= len(unique):
+        raise errors[0]
+
+    frames = _fill_failed_frames([by_description[d] for d in descriptions])
+    logger.info(
+        f"{len(frames)} frames ready in {time.perf_counter() - start:.1f}s "
+        f"({len(errors)} failed and reused a neighbour)"
+    )
+    return frames
+
+
+async def generate_gif_frames_async(scenario_type: str, nsfw: bool = False,
+                                    concurrency: Optional[int] = None) -> List[bytes]:
     """
-    Generate individual frames for a GIF animation
+    Generate all frames for a GIF animation concurrently
+
+    Identical descriptions (e.g. the first and last frame of a looping
+    scenario) are fetched once and reused. A frame that still fails after
+    retries is replaced by its nearest successful neighbour, as long as more
+    than half of the distinct frames succeeded; otherwise the first error is
+    raised.
 
     Args:
         scenario_type: Type of GIF scenario (wink, kiss, pose, etc.)
         nsfw: Whether to generate NSFW content
+        concurrency: Max in-flight requests (default: scenario "concurrency"
+            or GIF_FRAME_CONCURRENCY)
 
     Returns:
         List of image bytes for each frame
@@ -221,84 +360,143 @@ def generate_gif_frames(scenario_type: str, nsfw: bool = False) -> List[bytes]:
         raise ValueError(f"Unknown GIF scenario: {scenario_type}. Available: {list(GIF_SCENARIOS.keys())}")
 
     scenario = GIF_SCENARIOS[scenario_type]
-    frames = []
+    limit = max(1, concurrency or scenario.get('concurrency', GIF_FRAME_CONCURRENCY))
+    return await _fetch_descriptions_async(scenario['descriptions'], nsfw, limit, scenario['name'])
 
-    logger.info(f"Generating {scenario['frames']} frames for '{scenario['name']}' GIF (NSFW: {nsfw})")
 
-    for i, description in enumerate(scenario['descriptions'], 1):
-        logger.info(f"Generating frame {i}/{scenario['frames']}: {description[:50]}...")
+# Interpolation counters since startup (see interpolation_stats)
+_interpolation_stats = {"gifs": 0, "remote_calls": 0, "calls_saved": 0, "synth_frames": 0, "synth_s": 0.0}
 
-        try:
-            # Generate image for this frame using simplified GIF generator
-            image_bytes = generate_gif_frame(description=description, nsfw=nsfw)
 
-            frames.append(image_bytes)
-            logger.info(f"Frame {i}/{scenario['frames']} generated: {len(image_bytes):,} bytes")
+async def generate_interpolated_frames_async(scenario_type: str, nsfw: bool = False,
+                                             inbetweens: int = GIF_INBETWEENS,
+                                             method: str = GIF_INTERPOLATION_METHOD,
+                                             concurrency: Optional[int] = None) -> Tuple[List[bytes], int]:
+    """
+    Generate a scenario's keyframes remotely and fill in the rest locally
 
-        except Exception as e:
-            logger.error(f"Failed to generate frame {i}: {e}")
-            raise
+    Only the descriptions listed in the scenario's "keyframes" are sent
+    upstream; `inbetweens` frames are synthesized between each consecutive
+    pair (see src.image.interpolate). The per-frame duration is shortened
+    so one loop takes about as long as the full scenario.
 
-    return frames
+    Args:
+        scenario_type: Type of GIF scenario with a "keyframes" entry
+        nsfw: Whether to generate NSFW content
+        inbetweens: Synthetic frames between each pair of keyframes
+        method: "crossfade" or "flow"
+        concurrency: Max in-flight requests
 
+    Returns:
+        Tuple of (frame bytes, per-frame duration in ms)
+    """
+    from src.image.interpolate import interpolate_sequence
 
-def create_animated_gif(frames: List[bytes], duration: int = 500, loop: int = 0) -> bytes:
+    if scenario_type not in GIF_SCENARIOS:
+        raise ValueError(f"Unknown GIF scenario: {scenario_type}. Available: {list(GIF_SCENARIOS.keys())}")
+
+    scenario = GIF_SCENARIOS[scenario_type]
+    if "keyframes" not in scenario:
+        raise ValueError(f"GIF scenario '{scenario_type}' has no keyframes for interpolation")
+
+    descriptions = [scenario['descriptions'][i] for i in scenario['keyframes']]
+    limit = max(1, concurrency or scenario.get('concurrency', GIF_FRAME_CONCURRENCY))
+    keyframes = await _fetch_descriptions_async(descriptions, nsfw, limit, scenario['name'])
+
+    start = time.perf_counter()
+    closed = descriptions[0] == descriptions[-1]
+    frames = await asyncio.to_thread(interpolate_sequence, keyframes, inbetweens, method, closed)
+    synth_s = time.perf_counter() - start
+
+    remote_calls = len(set(descriptions))
+    calls_saved = len(set(scenario['descriptions'])) - remote_calls
+    loop_ms = scenario['duration'] * len(scenario['descriptions'])
+    duration = max(40, int(loop_ms / len(frames)))
+
+    stats = _interpolation_stats
+    stats["gifs"] += 1
+    stats["remote_calls"] += remote_calls
+    stats["calls_saved"] += calls_saved
+    stats["synth_frames"] += inbetweens * (len(keyframes) - 1)
+    stats["synth_s"] += synth_s
+    logger.info(
+        f"Interpolated '{scenario['name']}': {len(frames)} frames from {remote_calls} remote calls "
+        f"({calls_saved} saved), {method} in {synth_s:.2f}s, {duration}ms/frame"
+    )
+    return frames, duration
+
+
+def interpolation_stats() -> Dict[str, float]:
+    """Remote calls made/saved and local synthesis time for interpolated GIFs"""
+    stats = dict(_interpolation_stats)
+    stats["synth_s"] = round(stats["synth_s"], 2)
+    return stats
+
+
+def generate_gif_frames(scenario_type: str, nsfw: bool = False) -> List[bytes]:
+    """
+    Generate individual frames for a GIF animation
+
+    Blocking wrapper around generate_gif_frames_async for synchronous
+    callers; frames are still fetched concurrently.
+
+    Args:
+        scenario_type: Type of GIF scenario (wink, kiss, pose, etc.)
+        nsfw: Whether to generate NSFW content
+
+    Returns:
+        List of image bytes for each frame
+    """
+    return asyncio.run(generate_gif_frames_async(scenario_type, nsfw))
+
+
+def create_animated_gif(frames: List[bytes], duration: int = 500, loop: int = 0,
+                        target_bytes: Optional[int] = None) -> bytes:
     """
     Create an animated GIF from a list of image frames
-    
+
+    Frames are streamed through a shared adaptive palette (see
+    src.image.gif_assembler), so only one decoded frame is held at a time.
+
     Args:
         frames: List of image bytes for each frame
         duration: Duration of each frame in milliseconds
         loop: Number of times to loop (0 = infinite)
-        
+        target_bytes: Byte budget; size and colors are stepped down to fit
+            (default: GIF_MAX_BYTES, 0 = no budget)
+
     Returns:
         Animated GIF as bytes
     """
+    from src.image.gif_assembler import assemble_gif
+
     if not frames:
         raise ValueError("No frames provided for GIF creation")
-    
+
     logger.info(f"Creating animated GIF from {len(frames)} frames (duration: {duration}ms, loop: {loop})")
-    
-    # Convert bytes to PIL Images
-    pil_images = []
-    for i, frame_bytes in enumerate(frames):
-        try:
-            img = Image.open(io.BytesIO(frame_bytes))
-            # Convert to RGB if necessary (GIF doesn't support RGBA well)
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            pil_images.append(img)
-        except Exception as e:
-            logger.error(f"Failed to process frame {i}: {e}")
-            raise
-    
-    # Create animated GIF
-    output = io.BytesIO()
-    
-    # Save first image with append_images for the rest
-    pil_images[0].save(
-        output,
-        format='GIF',
-        save_all=True,
-        append_images=pil_images[1:],
-        duration=duration,
-        loop=loop,
-        optimize=False  # Don't optimize to maintain quality
-    )
-    
-    gif_bytes = output.getvalue()
+
+    budget = GIF_MAX_BYTES if target_bytes is None else target_bytes
+    gif_bytes = assemble_gif(frames, duration=duration, loop=loop, target_bytes=budget or None)
     logger.info(f"Animated GIF created: {len(gif_bytes):,} bytes ({len(gif_bytes) / 1024 / 1024:.2f} MB)")
-    
+
     return gif_bytes
 
 
-def generate_luna_gif(scenario_type: str, nsfw: bool = False) -> Tuple[bytes, str]:
+def _use_interpolation(scenario: dict, interpolate: Optional[bool]) -> bool:
+    wanted = GIF_INTERPOLATION if interpolate is None else interpolate
+    return wanted and "keyframes" in scenario
+
+
+def generate_luna_gif(scenario_type: str, nsfw: bool = False,
+                      interpolate: Optional[bool] = None) -> Tuple[bytes, str]:
     """
     Generate a complete animated GIF of Luna
     
     Args:
         scenario_type: Type of GIF scenario (wink, kiss, pose, etc.)
         nsfw: Whether to generate NSFW content
+        interpolate: Render only keyframes remotely and synthesize the rest
+            (default: GIF_INTERPOLATION; ignored for scenarios without keyframes)
         
     Returns:
         Tuple of (gif_bytes, scenario_name)
@@ -311,16 +509,44 @@ def generate_luna_gif(scenario_type: str, nsfw: bool = False) -> Tuple[bytes, st
     logger.info(f"Starting GIF generation: '{scenario['name']}' (NSFW: {nsfw})")
     
     # Generate all frames
-    frames = generate_gif_frames(scenario_type, nsfw)
+    if _use_interpolation(scenario, interpolate):
+        frames, duration = asyncio.run(generate_interpolated_frames_async(scenario_type, nsfw))
+    else:
+        frames, duration = generate_gif_frames(scenario_type, nsfw), scenario['duration']
     
     # Create animated GIF
-    gif_bytes = create_animated_gif(frames, duration=scenario['duration'])
+    gif_bytes = create_animated_gif(frames, duration=duration)
     
     logger.info(f"GIF generation complete: '{scenario['name']}' - {len(gif_bytes):,} bytes")
     
     return gif_bytes, scenario['name']
 
 
+async def generate_luna_gif_async(scenario_type: str, nsfw: bool = False,
+                                  interpolate: Optional[bool] = None) -> Tuple[bytes, str]:
+    """
+    Async variant of generate_luna_gif for use from bot handlers
+
+    Args:
+        scenario_type: Type of GIF scenario (wink, kiss, pose, etc.)
+        nsfw: Whether to generate NSFW content
+        interpolate: Render only keyframes remotely (default: GIF_INTERPOLATION)
+
+    Returns:
+        Tuple of (gif_bytes, scenario_name)
+    """
+    if scenario_type not in GIF_SCENARIOS:
+        raise ValueError(f"Unknown GIF scenario: {scenario_type}. Available: {list(GIF_SCENARIOS.keys())}")
+    scenario = GIF_SCENARIOS[scenario_type]
+    if _use_interpolation(scenario, interpolate):
+        frames, duration = await generate_interpolated_frames_async(scenario_type, nsfw)
+    else:
+        frames, duration = await generate_gif_frames_async(scenario_type, nsfw), scenario['duration']
+    # GIF encoding is CPU-bound; keep it off the event loop
+    gif_bytes = await asyncio.to_thread(create_animated_gif, frames, duration)
+    return gif_bytes, scenario['name']
+
+
 def get_available_gifs(nsfw: bool = False) -> dict:
     """
     Get list of available GIF scenarios
@@ -0,0 +1,166 @@
+"""
+Frame Interpolation
+Synthesizes in-between frames locally (CPU only) so a GIF can be built
+from a few remotely generated keyframes.
+
+Two blends are available:
+    crossfade - linear mix of the two keyframes
+    flow      - "optical-flow-lite": block matching on a small grayscale
+                copy gives a coarse motion field, both keyframes are warped
+                part of the way along it and then mixed, so moving edges
+                slide instead of ghosting
+
+Flow needs NumPy; without it every blend falls back to crossfade.
+"""
+
+import io
+import logging
+from typing import List, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Optional dependency: motion-compensated blending
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+    logger.warning("NumPy not available. Frame interpolation falls back to crossfade.")
+
+METHODS = ("crossfade", "flow")
+
+# Motion estimation grid: frames are matched at FLOW_SIZE px in BLOCK px
+# blocks, searching +/- SEARCH px (about 1/8 of the frame per axis)
+FLOW_SIZE = 64
+BLOCK = 8
+SEARCH = 6
+
+
+def _decode(frame: bytes):
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(frame))
+    return img.convert("RGB") if img.mode != "RGB" else img
+
+
+def _encode(img) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=95)
+    return buf.getvalue()
+
+
+def crossfade(a, b, t: float):
+    """Linear mix of two RGB images (t=0 -> a, t=1 -> b)"""
+    from PIL import Image
+
+    return Image.blend(a, b, t)
+
+
+def estimate_flow(a, b):
+    """
+    Coarse motion field from a to b by exhaustive block matching
+
+    Returns:
+        (dx, dy) float32 arrays at full resolution, in pixels
+    """
+    from PIL import Image
+
+    small = (FLOW_SIZE, FLOW_SIZE)
+    ga = np.asarray(a.convert("L").resize(small, Image.Resampling.BILINEAR), dtype=np.float32)
+    gb = np.asarray(b.convert("L").resize(small, Image.Resampling.BILINEAR), dtype=np.float32)
+    padded = np.pad(gb, SEARCH, mode="edge")
+    blocks = FLOW_SIZE // BLOCK
+
+    offsets = [(dy, dx) for dy in range(-SEARCH, SEARCH + 1) for dx in range(-SEARCH, SEARCH + 1)]
+    cost = np.empty((len(offsets), blocks, blocks), dtype=np.float32)
+    for k, (dy, dx) in enumerate(offsets):
+        shifted = padded[SEARCH + dy:SEARCH + dy + FLOW_SIZE, SEARCH + dx:SEARCH + dx + FLOW_SIZE]
+        sad = np.abs(ga - shifted).reshape(blocks, BLOCK, blocks, BLOCK).sum(axis=(1, 3))
+        # Slight bias towards small motion so flat areas stay put
+        cost[k] = sad + 0.5 * (abs(dy) + abs(dx))
+    best = np.asarray(offsets, dtype=np.float32)[cost.argmin(axis=0)]  # (blocks, blocks, 2)
+
+    scale_x = a.width / FLOW_SIZE
+    scale_y = a.height / FLOW_SIZE
+    fields = []
+    for component, scale in ((best[..., 1], scale_x), (best[..., 0], scale_y)):
+        field = Image.fromarray(component * scale, mode="F").resize(a.size, Image.Resampling.BILINEAR)
+        fields.append(np.asarray(field, dtype=np.float32))
+    return fields[0], fields[1]
+
+
+def _warp(img, dx, dy, t: float):
+    """Sample img at p - t*flow(p) (nearest pixel, clamped at the edges)"""
+    pixels = np.asarray(img)
+    h, w = pixels.shape[:2]
+    ys, xs = np.mgrid[0:h, 0:w]
+    sx = np.clip(np.rint(xs - t * dx), 0, w - 1).astype(np.intp)
+    sy = np.clip(np.rint(ys - t * dy), 0, h - 1).astype(np.intp)
+    return pixels[sy, sx].astype(np.float32)
+
+
+def flow_blend(a, b, t: float, flow=None):
+    """Motion-compensated mix of two RGB images (t=0 -> a, t=1 -> b)"""
+    from PIL import Image
+
+    dx, dy = flow if flow is not None else estimate_flow(a, b)
+    warped_a = _warp(a, dx, dy, t)
+    warped_b = _warp(b, -dx, -dy, 1.0 - t)
+    mixed = (1.0 - t) * warped_a + t * warped_b
+    return Image.fromarray(np.clip(mixed + 0.5, 0, 255).astype(np.uint8), mode="RGB")
+
+
+def inbetween_frames(a: bytes, b: bytes, count: int, method: str = "flow") -> List[bytes]:
+    """
+    Synthesize `count` evenly spaced frames strictly between two keyframes
+
+    Args:
+        a, b: Encoded keyframes (PNG/JPEG bytes)
+        count: Frames to create
+        method: "crossfade" or "flow"
+
+    Returns:
+        List of JPEG bytes
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown interpolation method: {method}. Available: {list(METHODS)}")
+    if count <= 0:
+        return []
+
+    img_a, img_b = _decode(a), _decode(b)
+    if img_b.size != img_a.size:
+        img_b = img_b.resize(img_a.size)
+
+    use_flow = method == "flow" and NUMPY_AVAILABLE
+    flow = estimate_flow(img_a, img_b) if use_flow else None
+    frames = []
+    for i in range(1, count + 1):
+        t = i / (count + 1)
+        img = flow_blend(img_a, img_b, t, flow) if use_flow else crossfade(img_a, img_b, t)
+        frames.append(_encode(img))
+    return frames
+
+
+def interpolate_sequence(keyframes: Sequence[bytes], inbetweens: int, method: str = "flow",
+                         closed: bool = False) -> List[bytes]:
+    """
+    Expand keyframes into a smooth sequence
+
+    Args:
+        keyframes: Encoded keyframes in playback order
+        inbetweens: Synthetic frames between each consecutive pair
+        method: "crossfade" or "flow"
+        closed: The last keyframe equals the first (looping animation);
+            it is dropped so the loop seam doesn't show a repeated frame
+
+    Returns:
+        List of frame bytes (keyframes are passed through untouched)
+    """
+    frames: List[bytes] = []
+    for a, b in zip(keyframes, keyframes[1:]):
+        frames.append(a)
+        frames.extend(inbetween_frames(a, b, inbetweens, method))
+    if keyframes and not closed:
+        frames.append(keyframes[-1])
+    return frames
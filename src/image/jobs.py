@@ -0,0 +1,241 @@
+"""
+Image Job Queue
+Runs blocking image generations on a worker pool so bot handlers can
+submit a job and return immediately instead of freezing the event loop.
+
+Jobs start in submission order, subject to a global concurrency cap and a
+per-user cap (a user with a running job doesn't block other users behind
+them). Status changes ("queued", "rendering", "done", "failed") are
+reported through an async callback so handlers can edit their progress
+message, and results are handed to an async `deliver` callback.
+
+Jobs and their callbacks run on the queue's home loop, by default the
+long-lived shared loop (src/utils/loop_thread.py). A submit from another
+loop, such as a short-lived asyncio.run, is handed over, so the job
+outlives the caller's loop. A job that is cancelled anyway still reaches
+its error callback, which is how callers release reserved images.
+
+Environment Variables:
+    IMAGE_JOB_WORKERS - Concurrent generations across all users (default: 4)
+    IMAGE_JOB_PER_USER - Concurrent generations per user (default: 1)
+    IMAGE_JOB_MAX_PENDING - Queued + running jobs allowed per user (default: 3)
+"""
+
+import os
+import time
+import asyncio
+import logging
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("IMAGE_JOB_WORKERS", "4"))
+JOB_PER_USER = int(os.getenv("IMAGE_JOB_PER_USER", "1"))
+JOB_MAX_PENDING = int(os.getenv("IMAGE_JOB_MAX_PENDING", "3"))
+
+QUEUED = "queued"
+RENDERING = "rendering"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobRejected(Exception):
+    """Raised by submit() when a user already has too many jobs pending"""
+
+
+class ImageJob:
+    """One queued generation"""
+
+    __slots__ = ("id", "user_id", "render", "deliver", "on_status", "on_error",
+                 "state", "position", "submitted_at", "started_at", "finished_at")
+
+    def __init__(self, job_id: int, user_id: int, render: Callable[[], Any],
+                 deliver: Callable[[Any], Awaitable[None]],
+                 on_status: Optional[Callable[["ImageJob", str], Awaitable[None]]],
+                 on_error: Optional[Callable[["ImageJob", BaseException], Awaitable[None]]]):
+        self.id = job_id
+        self.user_id = user_id
+        self.render = render
+        self.deliver = deliver
+        self.on_status = on_status
+        self.on_error = on_error
+        self.state = QUEUED
+        self.position = 0
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+
+
+class ImageJobQueue:
+    """
+    Fair FIFO job queue over a thread pool
+
+    State lives on one event loop (`loop`, default: the shared background
+    loop); submit() and join() may be awaited from any loop. Rendering
+    runs in a dedicated ThreadPoolExecutor sized to the global cap;
+    delivery and status callbacks run on the home loop.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, per_user: int = JOB_PER_USER,
+                 max_pending_per_user: int = JOB_MAX_PENDING, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.workers = max(1, workers)
+        self.per_user = max(1, per_user)
+        self.max_pending_per_user = max(1, max_pending_per_user)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image-job")
+        self._pending: Deque[ImageJob] = deque()
+        self._running_by_user: Dict[int, int] = {}
+        self._pending_by_user: Dict[int, int] = {}
+        self._running = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self._ids = itertools.count(1)
+        self._loop = loop
+
+        self.completed = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.total_render = 0.0
+
+    def _home(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            from src.utils.loop_thread import get_loop
+            self._loop = get_loop()
+        return self._loop
+
+    async def _on_home(self, coro):
+        """Await `coro` on the home loop, handing it over if called from another loop"""
+        home = self._home()
+        if asyncio.get_running_loop() is home:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, home))
+
+    def _user_count(self, user_id: int) -> int:
+        return self._pending_by_user.get(user_id, 0) + self._running_by_user.get(user_id, 0)
+
+    async def submit(self, user_id: int, render: Callable[[], Any],
+                     deliver: Callable[[Any], Awaitable[None]],
+                     on_status: Optional[Callable[[ImageJob, str], Awaitable[None]]] = None,
+                     on_error: Optional[Callable[[ImageJob, BaseException], Awaitable[None]]] = None) -> ImageJob:
+        """
+        Queue a generation and return without waiting for it
+
+        Args:
+            user_id: Owner (for per-user caps)
+            render: Blocking callable run in the worker pool; its result is
+                passed to `deliver`
+            deliver: Async callback with the render result
+            on_status: Async callback(job, state) on every state change;
+                job.position is the 1-based queue position while queued
+            on_error: Async callback(job, error) if render or deliver fails
+
+        Returns:
+            ImageJob
+
+        Raises:
+            JobRejected: If the user already has max_pending_per_user jobs
+        """
+        return await self._on_home(self._submit(user_id, render, deliver, on_status, on_error))
+
+    async def _submit(self, user_id, render, deliver, on_status, on_error) -> ImageJob:
+        if self._user_count(user_id) >= self.max_pending_per_user:
+            raise JobRejected(f"User {user_id} already has {self.max_pending_per_user} image jobs in progress")
+
+        job = ImageJob(next(self._ids), user_id, render, deliver, on_status, on_error)
+        self._pending.append(job)
+        self._pending_by_user[user_id] = self._pending_by_user.get(user_id, 0) + 1
+        job.position = len(self._pending)
+        logger.info(f"Image job #{job.id} queued for user {user_id} (position {job.position})")
+
+        started = self._pump()
+        if job not in started:
+            await self._notify(job, QUEUED)
+        return job
+
+    def _pump(self) -> Set[ImageJob]:
+        """Start as many eligible pending jobs as the caps allow"""
+        started = set()
+        while self._running < self.workers:
+            job = next((j for j in self._pending
+                        if self._running_by_user.get(j.user_id, 0) < self.per_user), None)
+            if job is None:
+                break
+            self._pending.remove(job)
+            self._pending_by_user[job.user_id] -= 1
+            if not self._pending_by_user[job.user_id]:
+                del self._pending_by_user[job.user_id]
+            self._running_by_user[job.user_id] = self._running_by_user.get(job.user_id, 0) + 1
+            self._running += 1
+            started.add(job)
+            task = asyncio.get_running_loop().create_task(self._run(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        for i, waiting in enumerate(self._pending, 1):
+            waiting.position = i
+        return started
+
+    async def _run(self, job: ImageJob):
+        job.state = RENDERING
+        job.started_at = time.monotonic()
+        self.total_wait += job.started_at - job.submitted_at
+        try:
+            await self._notify(job, RENDERING)
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, job.render)
+            self.total_render += time.monotonic() - job.started_at
+            await job.deliver(result)
+            job.state = DONE
+            self.completed += 1
+            await self._notify(job, DONE)
+        except (Exception, asyncio.CancelledError) as e:
+            job.state = FAILED
+            self.failed += 1
+            logger.warning(f"Image job #{job.id} for user {job.user_id} failed: {type(e).__name__}: {e}")
+            if job.on_error is not None:
+                try:
+                    await job.on_error(job, e)
+                except Exception:
+                    logger.exception(f"Error callback for image job #{job.id} failed")
+            await self._notify(job, FAILED)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            job.finished_at = time.monotonic()
+            self._running -= 1
+            self._running_by_user[job.user_id] -= 1
+            if not self._running_by_user[job.user_id]:
+                del self._running_by_user[job.user_id]
+            self._pump()
+
+    async def _notify(self, job: ImageJob, state: str):
+        if job.on_status is None:
+            return
+        try:
+            await job.on_status(job, state)
+        except Exception as e:
+            # A failed progress edit (message deleted, not modified, ...) must not kill the job
+            logger.debug(f"Status update for image job #{job.id} failed: {e}")
+
+    async def join(self):
+        """Wait until every queued and running job has finished (tests/shutdown)"""
+        await self._on_home(self._join())
+
+    async def _join(self):
+        while self._tasks or self._pending:
+            if self._tasks:
+                await asyncio.gather(*list(self._tasks), return_exceptions=True)
+            else:
+                await asyncio.sleep(0)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and timing counters"""
+        finished = self.completed + self.failed
+        started = finished + self._running
+        return {
+            "queued": len(self._pending),
+            "running": self._running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_wait_s": round(self.total_wait / started, 2) if started else 0.0,
+            "avg_render_s": round(self.total_render / self.completed, 2) if self.completed else 0.0,
+        }
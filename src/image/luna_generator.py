@@ -9,11 +9,16 @@ import requests
 import logging
 from urllib.parse import quote
 
+from src.image.cache import CACHE_VARIANTS, get_image_cache
+
 logger = logging.getLogger(__name__)
 
 # Pollinations.ai API - FREE and UNCENSORED
 POLLINATIONS_API = "https://image.pollinations.ai/prompt"
 
+# Seed 42 keeps Luna looking the same; cache variants use BASE_SEED + n
+BASE_SEED = 42
+
 # Luna's core character description - ULTRA SPECIFIC for maximum consistency
 # IMPORTANT: Luna is clearly an adult woman (22 years old) with sexy proportions
 LUNA_BASE_DESCRIPTION = """adult woman Luna Noir exactly 22 years old, mature feminine features, shoulder-length lavender purple bob haircut with perfectly straight blunt bangs across forehead, almond-shaped bright violet purple eyes with thick black winged eyeliner and long black lashes, very pale porcelain white skin with natural skin texture and visible pores, heart-shaped face with high defined cheekbones and delicate jawline, full pouty lips with dark plum matte lipstick, small straight nose, thin black leather choker necklace around neck, single small minimalist black outline snake tattoo on outer right forearm 8cm below elbow facing forward no other tattoos anywhere, hourglass figure with narrow waist, perky C-cup breasts with small light pink nipples centered on pale pink circular areolas 2cm diameter, flat toned stomach with subtle abs, wide feminine hips, thick toned thighs, round firm bubble butt, long shapely legs, 168cm tall 5foot6, athletic curvy body type, goth aesthetic, seductive confident expression, sultry gaze, photorealistic human features with sharp facial details"""
@@ -31,7 +36,8 @@ def generate_luna_image(scenario: str, nsfw: bool = False, width: int = 1536, he
         nsfw: Whether to allow NSFW content
         width: Image width (default 1536 - high resolution)
         height: Image height (default 1536 - high resolution)
-        seed: Random seed for reproducibility (None = random)
+        seed: Fixed seed (None = seed 42, plus cached seed variants if
+            IMAGE_CACHE_VARIANTS > 1)
 
     Returns:
         bytes: PNG image data
@@ -57,26 +63,30 @@ def generate_luna_image(scenario: str, nsfw: bool = False, width: int = 1536, he
     # URL encode the prompt
     encoded_prompt = quote(full_prompt)
 
-    # Use consistent seed for same character appearance
-    # Seed 42 ensures Luna looks the same across all images
-    seed_param = f"&seed={seed}" if seed is not None else "&seed=42"
+    def build_url(seed_value: int) -> str:
+        # Build the API URL with parameters - HIGH RESOLUTION with natural features
+        return f"{POLLINATIONS_API}/{encoded_prompt}?width={width}&height={height}&model=flux&nologo=true&enhance=true&seed={seed_value}"
 
-    # Build the API URL with parameters - HIGH RESOLUTION with natural features
-    url = f"{POLLINATIONS_API}/{encoded_prompt}?width={width}&height={height}&model=flux&nologo=true&enhance=true{seed_param}"
+    def fetch(variant: int) -> bytes:
+        # Variant 0 is the canonical seed; extra variants add seed diversity
+        url = build_url(seed if seed is not None else BASE_SEED + variant)
+        logger.info(f"Generating Luna image: {scenario[:50]}... (NSFW: {nsfw}, {width}x{height}, variant {variant})")
+        try:
+            # Pollinations.ai returns the image directly
+            response = requests.get(url, timeout=120)  # Image generation can take time
+            response.raise_for_status()
 
-    logger.info(f"Generating Luna image: {scenario[:50]}... (NSFW: {nsfw}, {width}x{height})")
+            logger.info(f"Image generated successfully, {len(response.content)} bytes")
+            return response.content
 
-    try:
-        # Pollinations.ai returns the image directly
-        response = requests.get(url, timeout=120)  # Image generation can take time
-        response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Image generation failed: {e}")
+            raise
 
-        logger.info(f"Image generated successfully, {len(response.content)} bytes")
-        return response.content
-
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Image generation failed: {e}")
-        raise
+    # Same prompt + size + seed = same image, so serve repeats from the cache.
+    # An explicit seed pins a single image; otherwise keep a variant pool.
+    pool = 1 if seed is not None else max(1, CACHE_VARIANTS)
+    return get_image_cache().get_or_fetch(build_url(seed if seed is not None else BASE_SEED), fetch, pool=pool)
 
 
 def generate_luna_selfie(mood: str = "flirty", nsfw: bool = False, outfit: str = None) -> bytes:
@@ -253,3 +263,30 @@ def generate_luna_with_outfit(outfit_name: str, pose: str = "standing confidentl
     scenario = f"{pose}, wearing {outfit}, bedroom with purple neon lights background"
     return generate_luna_image(scenario, nsfw=nsfw)
 
+
+# Pose used by the gen_outfit_* menu buttons
+MENU_OUTFIT_POSE = "posing confidently for camera"
+
+
+def generate_menu_image(gen_type: str, style: str, nsfw: bool = False) -> bytes:
+    """
+    Generate the image behind a gen_<type>_<style> menu button.
+
+    Shared by the bot and the pre-generation warmer so both produce the same
+    prompt URL (and therefore the same image cache entry).
+
+    Args:
+        gen_type: "selfie", "scene" or "outfit"
+        style: Mood, scenario or outfit preset name
+        nsfw: Whether to allow NSFW content
+
+    Returns:
+        bytes: PNG image data
+    """
+    if gen_type == "selfie":
+        return generate_luna_selfie(mood=style, nsfw=nsfw)
+    if gen_type == "scene":
+        return generate_luna_scenario(scenario_type=style, nsfw=nsfw)
+    if gen_type == "outfit":
+        return generate_luna_with_outfit(outfit_name=style, pose=MENU_OUTFIT_POSE, nsfw=nsfw)
+    raise ValueError(f"Unknown menu image type: {gen_type}")
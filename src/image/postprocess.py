@@ -0,0 +1,187 @@
+"""
+Image Post-Processing
+Shrinks generated images to what Telegram actually displays before they
+are uploaded.
+
+Pollinations returns 1536x1536 or 1024x2048 PNGs of several MB; Telegram
+recompresses photos to at most IMAGE_MAX_SIDE px anyway. Each image is
+downscaled, re-encoded as progressive JPEG (or WebP) without metadata,
+and paired with a tiny blurred preview that can be sent instantly while
+the full image uploads. The PIL work runs in a process pool so it never
+competes with the bot's event loop for the GIL.
+
+Environment Variables:
+    IMAGE_MAX_SIDE - Longest output side in px (default: 1280)
+    IMAGE_OUTPUT_FORMAT - "jpeg" or "webp" (default: jpeg)
+    IMAGE_QUALITY - Encoder quality 1-95 (default: 85)
+    IMAGE_PREVIEW_SIDE - Longest preview side in px; 0 disables previews (default: 64)
+    IMAGE_PROCESS_WORKERS - Post-processing processes; 0 runs inline (default: 2)
+"""
+
+import io
+import os
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1280"))
+OUTPUT_FORMAT = os.getenv("IMAGE_OUTPUT_FORMAT", "jpeg").lower()
+QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+PREVIEW_SIDE = int(os.getenv("IMAGE_PREVIEW_SIDE", "64"))
+PROCESS_WORKERS = int(os.getenv("IMAGE_PROCESS_WORKERS", "2"))
+
+# Preview blur radius relative to the preview's longest side
+_PREVIEW_BLUR = 0.06
+
+
+class PreparedPhoto(NamedTuple):
+    """Upload-ready image plus an optional instant preview"""
+    full: bytes
+    preview: Optional[bytes]
+    original_bytes: int
+
+
+def _open(data: bytes, max_side: int):
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(data))
+    # JPEG sources can be decoded straight at a smaller scale
+    img.draft("RGB", (max_side, max_side))
+    if img.mode != "RGB":
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (0, 0, 0))
+            background.paste(img, mask=img.getchannel("A"))
+            img = background
+        else:
+            img = img.convert("RGB")
+    return img
+
+
+def _encode(img, fmt: str, quality: int) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "webp":
+        img.save(buf, format="WEBP", quality=quality, method=4)
+    elif fmt == "jpeg":
+        # No exif/icc_profile arguments: metadata is dropped
+        img.save(buf, format="JPEG", quality=quality, optimize=True, progressive=True, subsampling="4:2:0")
+    else:
+        raise ValueError(f"Unsupported image format: {fmt}")
+    return buf.getvalue()
+
+
+def process_image(data: bytes, max_side: int = MAX_SIDE, fmt: str = OUTPUT_FORMAT,
+                  quality: int = QUALITY) -> bytes:
+    """
+    Downscale and re-encode one image for Telegram
+
+    Args:
+        data: Source image bytes (PNG/JPEG/WebP)
+        max_side: Longest side of the output; smaller images are not upscaled
+        fmt: "jpeg" (progressive) or "webp"
+        quality: Encoder quality
+
+    Returns:
+        bytes: Re-encoded image without metadata
+    """
+    from PIL import Image
+
+    img = _open(data, max_side)
+    img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS, reducing_gap=3.0)
+    return _encode(img, fmt, quality)
+
+
+def make_preview(data: bytes, side: int = PREVIEW_SIDE) -> bytes:
+    """Tiny, blurred JPEG of an image (a few hundred bytes)"""
+    from PIL import Image, ImageFilter
+
+    img = _open(data, side)
+    img.thumbnail((side, side), Image.Resampling.BILINEAR)
+    img = img.filter(ImageFilter.GaussianBlur(max(1.0, side * _PREVIEW_BLUR)))
+    return _encode(img, "jpeg", 60)
+
+
+def prepare(data: bytes, max_side: int = MAX_SIDE, fmt: str = OUTPUT_FORMAT, quality: int = QUALITY,
+            preview_side: int = PREVIEW_SIDE) -> PreparedPhoto:
+    """Full image and preview in one call (the unit of work sent to the pool)"""
+    from PIL import Image
+
+    full = process_image(data, max_side, fmt, quality)
+    if len(full) >= len(data) and max(Image.open(io.BytesIO(data)).size) <= max_side:
+        # Already small (e.g. a compact JPEG); re-encoding would only lose quality
+        full = data
+    preview = make_preview(data, preview_side) if preview_side > 0 else None
+    return PreparedPhoto(full, preview, len(data))
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if PROCESS_WORKERS <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn, not fork: the bot process runs threads and an event loop
+                _pool = ProcessPoolExecutor(max_workers=PROCESS_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def prepare_photo(data: bytes, **options) -> PreparedPhoto:
+    """
+    Post-process an image in the process pool, blocking until done
+
+    Meant for worker threads (e.g. an image job's render step). If the
+    pool is disabled, cannot start or breaks, the work runs in the calling
+    thread; errors from the image itself (e.g. a corrupt download) are
+    raised as they are.
+
+    Args:
+        data: Source image bytes
+        **options: Passed to prepare (max_side, fmt, quality, preview_side)
+
+    Returns:
+        PreparedPhoto
+    """
+    prepared = None
+    pool = _get_pool()
+    if pool is not None:
+        try:
+            # OSError if processes can't start, RuntimeError (incl. BrokenProcessPool) if shut down or broken
+            future = pool.submit(prepare, data, **options)
+        except (OSError, RuntimeError) as e:
+            logger.warning(f"Image process pool unavailable, processing inline: {e}")
+            _reset_pool()
+        else:
+            try:
+                prepared = future.result()
+            except BrokenProcessPool as e:  # a worker died mid-job
+                logger.warning(f"Image process pool broke, processing inline: {e}")
+                _reset_pool()
+    if prepared is None:
+        prepared = prepare(data, **options)
+    logger.info(f"Post-processed image: {len(data):,} -> {len(prepared.full):,} bytes")
+    return prepared
+
+
+async def prepare_photo_async(data: bytes, **options) -> PreparedPhoto:
+    """prepare_photo without blocking the event loop"""
+    return await asyncio.to_thread(prepare_photo, data, **options)
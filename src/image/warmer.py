@@ -0,0 +1,239 @@
+"""
+Image Warmer
+Pre-renders the most requested menu images and GIFs into the image cache
+during off-peak hours, so popular taps are served from disk instead of
+waiting on a cold generation.
+
+Usage:
+    python -m src.image.warmer [--top N] [--days D] [--rate PER_MIN] [--force] [--loop]
+
+Environment Variables:
+    IMAGE_WARMER_ENABLED - Start the in-process scheduler with the web app (default: false)
+    IMAGE_WARMER_TOP_N - Variants to keep warm (default: 20)
+    IMAGE_WARMER_DAYS - Request history window in days (default: 7)
+    IMAGE_WARMER_RATE_PER_MIN - Max upstream generations per minute (default: 4)
+    IMAGE_WARMER_HOURS - Off-peak local hours, "start-end" (default: 2-7)
+    IMAGE_WARMER_INTERVAL_MIN - Scheduler interval in minutes (default: 30)
+
+With several web workers each one starts the scheduler, but only the
+worker holding the "image-warmer" process lock runs passes; another takes
+over if it exits.
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.image.cache import get_image_cache
+from src.utils import process_lock
+
+logger = logging.getLogger(__name__)
+
+WARMER_TOP_N = int(os.getenv("IMAGE_WARMER_TOP_N", "20"))
+WARMER_DAYS = float(os.getenv("IMAGE_WARMER_DAYS", "7"))
+WARMER_RATE_PER_MIN = float(os.getenv("IMAGE_WARMER_RATE_PER_MIN", "4"))
+WARMER_HOURS = os.getenv("IMAGE_WARMER_HOURS", "2-7")
+WARMER_INTERVAL_MIN = int(os.getenv("IMAGE_WARMER_INTERVAL_MIN", "30"))
+WARMER_LOCK = "image-warmer"
+
+# (kind, style, nsfw)
+Target = Tuple[str, str, bool]
+
+
+def render(kind: str, style: str, nsfw: bool) -> bytes:
+    """Render one menu variant through the same code path as the bot"""
+    if kind == "gif":
+        from src.image.gif_generator import generate_luna_gif
+        return generate_luna_gif(style, nsfw=nsfw)[0]
+    from src.image.luna_generator import generate_menu_image
+    return generate_menu_image(kind, style, nsfw=nsfw)
+
+
+def parse_hours(window: str) -> Tuple[int, int]:
+    """Parse "start-end" local hours; the window may wrap midnight (e.g. "22-6")"""
+    start, _, end = window.partition("-")
+    return int(start) % 24, int(end) % 24
+
+
+def is_off_peak(hour: int, window: str = WARMER_HOURS) -> bool:
+    """Whether `hour` falls in the [start, end) off-peak window"""
+    start, end = parse_hours(window)
+    if start == end:
+        return True
+    if start < end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+class RateLimiter:
+    """Minimum spacing between upstream generations"""
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._clock = clock
+        self._sleep = sleep
+        self._next = 0.0
+
+    def wait(self):
+        delay = self._next - self._clock()
+        if delay > 0:
+            self._sleep(delay)
+
+    def used(self):
+        """Record that an upstream request was made"""
+        self._next = self._clock() + self.interval
+
+
+def top_targets(top_n: int = WARMER_TOP_N, days: float = WARMER_DAYS) -> List[Target]:
+    """Most requested menu variants from the metrics DB"""
+    from src.metrics import db as metrics
+    return [(kind, style, nsfw) for kind, style, nsfw, _n in metrics.get_top_image_requests(days, top_n)]
+
+
+def warm(targets: List[Target], rate_per_min: float = WARMER_RATE_PER_MIN,
+         render_fn: Callable[[str, str, bool], bytes] = render,
+         limiter: Optional[RateLimiter] = None,
+         should_continue: Callable[[], bool] = lambda: True) -> Dict[str, Any]:
+    """
+    Render targets into the image cache
+
+    Already-cached variants are skipped at disk speed; only real upstream
+    generations count against the rate limit.
+
+    Args:
+        targets: (kind, style, nsfw) variants, most important first
+        rate_per_min: Max upstream generations per minute
+        render_fn: Renderer (defaults to the bot's generators)
+        limiter: Rate limiter override (tests)
+        should_continue: Checked between targets (e.g. off-peak window still open)
+
+    Returns:
+        dict with rendered, cached, failed counts
+    """
+    cache = get_image_cache()
+    limiter = limiter or RateLimiter(rate_per_min)
+    result = {"rendered": 0, "cached": 0, "failed": 0}
+
+    with cache.warming():
+        for kind, style, nsfw in targets:
+            if not should_continue():
+                logger.info("Image warmer stopping early (outside off-peak window)")
+                break
+            limiter.wait()
+            before = cache.prewarmed
+            try:
+                render_fn(kind, style, nsfw)
+            except Exception as e:
+                result["failed"] += 1
+                limiter.used()
+                logger.warning(f"Warming {kind}/{style} (NSFW: {nsfw}) failed: {e}")
+                continue
+            if cache.prewarmed > before:
+                result["rendered"] += 1
+                limiter.used()
+                logger.info(f"Warmed {kind}/{style} (NSFW: {nsfw})")
+            else:
+                result["cached"] += 1
+
+    logger.info(f"Image warmer pass complete: {result}")
+    return result
+
+
+def run_once(top_n: int = WARMER_TOP_N, days: float = WARMER_DAYS,
+             rate_per_min: float = WARMER_RATE_PER_MIN, force: bool = False) -> Optional[Dict[str, Any]]:
+    """One warmer pass over the top requested variants (skipped outside off-peak hours unless forced)"""
+    if not force and not is_off_peak(datetime.now().hour):
+        logger.debug("Image warmer idle (peak hours)")
+        return None
+    targets = top_targets(top_n, days)
+    if not targets:
+        logger.info("Image warmer: no image requests recorded yet")
+        return {"rendered": 0, "cached": 0, "failed": 0}
+    still_off_peak = (lambda: True) if force else (lambda: is_off_peak(datetime.now().hour))
+    return warm(targets, rate_per_min, should_continue=still_off_peak)
+
+
+_scheduler_thread: Optional[threading.Thread] = None
+
+
+def start_scheduler(interval_min: int = WARMER_INTERVAL_MIN, **run_kwargs) -> threading.Thread:
+    """
+    Run warmer passes every `interval_min` minutes in a daemon thread
+
+    Each pass checks the off-peak window itself, so the job is cheap when
+    it has nothing to do. Passes run only in the process holding the
+    warmer lock, so several workers never render the same images.
+
+    Args:
+        interval_min: Minutes between passes
+        **run_kwargs: Passed to run_once (top_n, days, rate_per_min)
+    """
+    global _scheduler_thread
+    if _scheduler_thread is not None:
+        return _scheduler_thread
+
+    import schedule
+
+    scheduler = schedule.Scheduler()
+    scheduler.every(interval_min).minutes.do(_tick, **run_kwargs)
+
+    def loop():
+        _tick(**run_kwargs)
+        while True:
+            scheduler.run_pending()
+            time.sleep(30)
+
+    _scheduler_thread = threading.Thread(target=loop, name="image-warmer", daemon=True)
+    _scheduler_thread.start()
+    logger.info(f"Image warmer scheduled every {interval_min} min (off-peak hours {WARMER_HOURS})")
+    return _scheduler_thread
+
+
+def _tick(**run_kwargs) -> bool:
+    """One scheduled pass, if this process is the elected warmer"""
+    if not process_lock.acquire(WARMER_LOCK):
+        logger.debug("Image warmer idle (another worker holds the lock)")
+        return False
+    _safe_run_once(**run_kwargs)
+    return True
+
+
+def _safe_run_once(**run_kwargs):
+    try:
+        run_once(**run_kwargs)
+    except Exception:
+        logger.exception("Image warmer pass failed")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Pre-render popular Luna menu images into the image cache")
+    parser.add_argument("--top", type=int, default=WARMER_TOP_N, help="variants to warm")
+    parser.add_argument("--days", type=float, default=WARMER_DAYS, help="request history window")
+    parser.add_argument("--rate", type=float, default=WARMER_RATE_PER_MIN, help="max generations per minute")
+    parser.add_argument("--force", action="store_true", help="ignore the off-peak window")
+    parser.add_argument("--loop", action="store_true", help="keep running on the scheduler")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"),
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    if args.loop:
+        start_scheduler(top_n=args.top, days=args.days, rate_per_min=args.rate).join()
+        return 0
+
+    result = run_once(args.top, args.days, args.rate, force=args.force)
+    if result is None:
+        print(f"Outside off-peak hours ({WARMER_HOURS}); use --force to warm now")
+        return 0
+    print(f"Rendered {result['rendered']}, already cached {result['cached']}, failed {result['failed']}")
+    return 1 if result["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,11 +9,17 @@ import time
 import threading
 from pathlib import Path
 
+from src.metrics import rollups
+from src.metrics.writer import MetricsWriter
+
 # Database path from environment or default
 DB_PATH = os.getenv("METRICS_DB", "data/metrics.db")
 
-# Ensure data directory exists
-os.makedirs("data", exist_ok=True)
+# Buffered writer configuration
+BUFFER_MAX_EVENTS = int(os.getenv("METRICS_BUFFER_MAX_EVENTS", "10000"))
+FLUSH_INTERVAL_MS = int(os.getenv("METRICS_FLUSH_INTERVAL_MS", "250"))
+FLUSH_BATCH = int(os.getenv("METRICS_FLUSH_BATCH", "500"))
+DROP_POLICY = os.getenv("METRICS_DROP_POLICY", "oldest")  # oldest | newest
 
 # Database schema
 _schema = """
@@ -31,65 +37,173 @@ CREATE TABLE IF NOT EXISTS payments(
   currency TEXT
 );
 
-CREATE INDEX IF NOT EXISTS idx_messages_ts ON messages(ts);
-CREATE INDEX IF NOT EXISTS idx_messages_user ON messages(user_id);
-CREATE INDEX IF NOT EXISTS idx_payments_ts ON payments(ts);
-CREATE INDEX IF NOT EXISTS idx_payments_user ON payments(user_id);
+CREATE TABLE IF NOT EXISTS image_requests(
+  ts INTEGER,
+  user_id TEXT,
+  kind TEXT,
+  style TEXT,
+  nsfw INTEGER
+);
+
+-- Covering indexes: time-window and per-user queries never touch the table
+CREATE INDEX IF NOT EXISTS idx_messages_ts_cover ON messages(ts, user_id, is_premium, mode);
+CREATE INDEX IF NOT EXISTS idx_messages_user_ts ON messages(user_id, ts);
+CREATE INDEX IF NOT EXISTS idx_payments_ts_cover ON payments(ts, amount_cents);
+CREATE INDEX IF NOT EXISTS idx_payments_user_cover ON payments(user_id, amount_cents);
+CREATE INDEX IF NOT EXISTS idx_image_requests_ts_cover ON image_requests(ts, kind, style, nsfw);
+
+-- Superseded by the covering indexes above (same leading column)
+DROP INDEX IF EXISTS idx_messages_ts;
+DROP INDEX IF EXISTS idx_messages_user;
+DROP INDEX IF EXISTS idx_payments_ts;
+DROP INDEX IF EXISTS idx_payments_user;
 """
 
-# Thread lock for concurrent access
-_lock = threading.Lock()
+# Per-user totals in one statement (both lookups are covering index seeks)
+_USER_STATS_SQL = """
+SELECT COUNT(*), MIN(ts), MAX(ts),
+       (SELECT COALESCE(SUM(amount_cents), 0) FROM payments WHERE user_id=:uid)
+FROM messages WHERE user_id=:uid
+"""
+
+# Schema is applied lazily on first connection, not at import time
+_initialized = False
+_init_lock = threading.Lock()
+
+
+def _init_db():
+    """Create the data directory and apply the schema (once per process)"""
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        Path(DB_PATH).parent.mkdir(parents=True, exist_ok=True)
+        c = sqlite3.connect(DB_PATH)
+        try:
+            c.execute("PRAGMA journal_mode=WAL")
+            c.executescript(_schema)
+            c.executescript(rollups.SCHEMA)
+            # Backfill rollups from raw history the first time they exist
+            if c.execute("PRAGMA user_version").fetchone()[0] < rollups.ROLLUP_VERSION:
+                with c:
+                    rollups.rebuild(c)
+                c.execute(f"PRAGMA user_version={rollups.ROLLUP_VERSION}")
+        finally:
+            c.close()
+        _initialized = True
 
 
 def _conn():
     """Create database connection with WAL mode for better concurrency"""
+    if not _initialized:
+        _init_db()
     c = sqlite3.connect(DB_PATH)
     c.execute("PRAGMA journal_mode=WAL")
     return c
 
 
-# Initialize database schema
-with _conn() as c:
-    c.executescript(_schema)
+def _writer_conn():
+    """Long-lived connection owned by the metrics writer"""
+    if not _initialized:
+        _init_db()
+    c = sqlite3.connect(DB_PATH, check_same_thread=False)
+    c.execute("PRAGMA journal_mode=WAL")
+    c.execute("PRAGMA synchronous=NORMAL")
+    return c
+
+
+def _write_batch(c, batch):
+    """Insert a batch of buffered events and fold it into the KPI rollups (one transaction)"""
+    messages = [row for kind, row in batch if kind == "messages"]
+    payments = [row for kind, row in batch if kind == "payments"]
+    image_requests = [row for kind, row in batch if kind == "image_requests"]
+    if messages:
+        c.executemany("INSERT INTO messages VALUES(?,?,?,?)", messages)
+    if payments:
+        c.executemany("INSERT INTO payments VALUES(?,?,?,?)", payments)
+    if image_requests:
+        c.executemany("INSERT INTO image_requests VALUES(?,?,?,?,?)", image_requests)
+    rollups.apply_batch(c, messages, payments)
+
+
+_writer = MetricsWriter(
+    _writer_conn, _write_batch,
+    max_events=BUFFER_MAX_EVENTS,
+    flush_interval_ms=FLUSH_INTERVAL_MS,
+    flush_batch=FLUSH_BATCH,
+    drop_policy=DROP_POLICY,
+)
 
 
 def log_msg(uid, is_premium, mode):
     """
     Log a message event.
+
+    The event is buffered and written by the background metrics writer;
+    under sustained overflow message events may be dropped (see DROP_POLICY).
     
     Args:
         uid: User ID (int or str)
         is_premium: Whether user is premium (bool or int)
         mode: Conversation mode (str)
     """
-    with _lock, _conn() as c:
-        c.execute(
-            "INSERT INTO messages VALUES(?,?,?,?)",
-            (int(time.time()), str(uid), int(is_premium), mode)
-        )
-        c.commit()
+    _writer.submit("messages", (int(time.time()), str(uid), int(is_premium), mode))
 
 
 def log_payment(uid, amount_cents, currency):
     """
     Log a payment event.
+
+    Payments are buffered like messages but are never dropped.
     
     Args:
         uid: User ID (int or str)
         amount_cents: Payment amount in cents (int)
         currency: Currency code (str, e.g., "usd")
     """
-    with _lock, _conn() as c:
-        c.execute(
-            "INSERT INTO payments VALUES(?,?,?,?)",
-            (int(time.time()), str(uid), amount_cents, currency)
-        )
-        c.commit()
+    _writer.submit("payments", (int(time.time()), str(uid), amount_cents, currency), droppable=False)
+
+
+def log_image_request(uid, kind, style, nsfw):
+    """
+    Log a menu image/GIF request (used by the pre-generation warmer).
+
+    Args:
+        uid: User ID (int or str)
+        kind: Generator kind ("selfie", "scene", "outfit", "gif")
+        style: Menu style/scenario key (e.g. "sultry", "nude_lying")
+        nsfw: Whether the NSFW variant was requested
+    """
+    _writer.submit("image_requests", (int(time.time()), str(uid), kind, style, int(bool(nsfw))))
+
+
+def flush():
+    """
+    Write all buffered events now.
+
+    Returns:
+        int: Number of events written
+    """
+    return _writer.flush()
+
+
+def shutdown():
+    """Flush buffered events and close the writer connection (also runs at exit)"""
+    _writer.close()
+
+
+def writer_stats():
+    """Buffered writer counters (pending, written, dropped, flushes, errors)"""
+    return _writer.stats()
 
 
 def quick_kpis(days=1):
     """
     Get quick KPIs for the last N days.
+
+    Reads hourly/daily rollups, so cost depends on the number of buckets in
+    the window rather than on message history. Distinct user counts come
+    from HyperLogLog sketches (~1.6% error; near-exact for small counts).
     
     Args:
         days: Number of days to look back (default: 1)
@@ -102,32 +216,13 @@ def quick_kpis(days=1):
             - total_revenue_cents: Total revenue in cents
             - conversion_rate: Premium users / Total users (%)
     """
+    flush()
     with _conn() as c:
-        cutoff = int(time.time()) - days * 86400
-        
-        # Daily Active Users
-        dau = c.execute(
-            "SELECT COUNT(DISTINCT user_id) FROM messages WHERE ts>?",
-            (cutoff,)
-        ).fetchone()[0]
-        
-        # Total messages
-        msgs = c.execute(
-            "SELECT COUNT(*) FROM messages WHERE ts>?",
-            (cutoff,)
-        ).fetchone()[0]
-        
-        # Premium senders
-        prem = c.execute(
-            "SELECT COUNT(DISTINCT user_id) FROM messages WHERE ts>? AND is_premium=1",
-            (cutoff,)
-        ).fetchone()[0]
-        
-        # Total revenue
-        revenue = c.execute(
-            "SELECT COALESCE(SUM(amount_cents), 0) FROM payments WHERE ts>?",
-            (cutoff,)
-        ).fetchone()[0]
+        w = rollups.window(c, rollups.cutoff_for_days(days))
+        dau = w["users"]
+        msgs = w["messages"]
+        prem = w["premium_users"]
+        revenue = w["revenue_cents"]
         
         # Conversion rate
         conversion = (prem / dau * 100) if dau > 0 else 0
@@ -151,15 +246,9 @@ def get_mode_breakdown(days=1):
     Returns:
         dict with mode names as keys and message counts as values
     """
+    flush()
     with _conn() as c:
-        cutoff = int(time.time()) - days * 86400
-        
-        rows = c.execute(
-            "SELECT mode, COUNT(*) FROM messages WHERE ts>? GROUP BY mode",
-            (cutoff,)
-        ).fetchall()
-        
-        return {mode: count for mode, count in rows}
+        return rollups.window(c, rollups.cutoff_for_days(days))["by_mode"]
 
 
 def get_user_stats(uid):
@@ -172,32 +261,12 @@ def get_user_stats(uid):
     Returns:
         dict with user statistics
     """
+    flush()
+    uid_str = str(uid)
     with _conn() as c:
-        uid_str = str(uid)
-        
-        # Total messages
-        total_msgs = c.execute(
-            "SELECT COUNT(*) FROM messages WHERE user_id=?",
-            (uid_str,)
-        ).fetchone()[0]
-        
-        # First message timestamp
-        first_msg = c.execute(
-            "SELECT MIN(ts) FROM messages WHERE user_id=?",
-            (uid_str,)
-        ).fetchone()[0]
-        
-        # Last message timestamp
-        last_msg = c.execute(
-            "SELECT MAX(ts) FROM messages WHERE user_id=?",
-            (uid_str,)
-        ).fetchone()[0]
-        
-        # Total payments
-        total_payments = c.execute(
-            "SELECT COALESCE(SUM(amount_cents), 0) FROM payments WHERE user_id=?",
-            (uid_str,)
-        ).fetchone()[0]
+        total_msgs, first_msg, last_msg, total_payments = c.execute(
+            _USER_STATS_SQL, {"uid": uid_str}
+        ).fetchone()
         
         return {
             "user_id": uid_str,
@@ -207,3 +276,26 @@ def get_user_stats(uid):
             "total_paid_cents": total_payments
         }
 
+
+def get_top_image_requests(days=7, limit=20):
+    """
+    Most requested menu images over the last N days.
+
+    Args:
+        days: Number of days to look back (default: 7)
+        limit: Max number of variants to return (default: 20)
+
+    Returns:
+        list of (kind, style, nsfw, requests) tuples, most requested first
+    """
+    flush()
+    cutoff = int(time.time()) - int(days * 86400)
+    with _conn() as c:
+        return [
+            (kind, style, bool(nsfw), n)
+            for kind, style, nsfw, n in c.execute(
+                "SELECT kind, style, nsfw, COUNT(*) AS n FROM image_requests WHERE ts>? "
+                "GROUP BY kind, style, nsfw ORDER BY n DESC, kind, style LIMIT ?",
+                (cutoff, limit)
+            )
+        ]
@@ -0,0 +1,216 @@
+"""
+KPI Rollups
+Hourly and daily aggregates plus HyperLogLog user sketches, maintained
+incrementally whenever the metrics writer flushes a batch.
+"""
+
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Tuple
+
+from src.metrics.hll import HyperLogLog
+
+HOUR = 3600
+DAY = 86400
+GRAINS = (HOUR, DAY)
+
+# Bump when the rollup layout changes; _init_db rebuilds from raw rows
+ROLLUP_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS msg_rollup(
+  grain INTEGER,
+  bucket INTEGER,
+  mode TEXT,
+  messages INTEGER,
+  PRIMARY KEY(grain, bucket, mode)
+);
+
+CREATE TABLE IF NOT EXISTS payment_rollup(
+  grain INTEGER,
+  bucket INTEGER,
+  payments INTEGER,
+  revenue_cents INTEGER,
+  PRIMARY KEY(grain, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS user_sketch(
+  grain INTEGER,
+  bucket INTEGER,
+  premium INTEGER,
+  registers BLOB,
+  PRIMARY KEY(grain, bucket, premium)
+);
+"""
+
+
+# Raw edge of a window; both are covering scans of the ts indexes
+EDGE_MESSAGES_SQL = "SELECT user_id, is_premium, mode FROM messages WHERE ts>? AND ts<?"
+EDGE_PAYMENTS_SQL = "SELECT COUNT(*), COALESCE(SUM(amount_cents), 0) FROM payments WHERE ts>? AND ts<?"
+
+
+def _mode_key(mode) -> str:
+    # NULL never conflicts in a primary key, so store a missing mode as ""
+    return mode if mode is not None else ""
+
+
+def _merge_sketch(c, key: Tuple[int, int, int], users: Iterable[str]):
+    row = c.execute(
+        "SELECT registers FROM user_sketch WHERE grain=? AND bucket=? AND premium=?", key
+    ).fetchone()
+    sketch = HyperLogLog(row[0]) if row else HyperLogLog()
+    sketch.update(users)
+    c.execute("INSERT OR REPLACE INTO user_sketch VALUES(?,?,?,?)", (*key, sketch.to_bytes()))
+
+
+def apply_batch(c, messages, payments):
+    """
+    Fold a batch of raw rows into the rollups.
+
+    Must run inside the same transaction as the raw inserts (after them, so
+    the write lock is already held while sketches are read and rewritten).
+
+    Args:
+        c: SQLite connection
+        messages: (ts, user_id, is_premium, mode) rows
+        payments: (ts, user_id, amount_cents, currency) rows
+    """
+    counts = defaultdict(int)
+    users = defaultdict(set)
+    for ts, uid, is_premium, mode in messages:
+        for grain in GRAINS:
+            bucket = ts - ts % grain
+            counts[(grain, bucket, _mode_key(mode))] += 1
+            users[(grain, bucket, 0)].add(uid)
+            if is_premium:
+                users[(grain, bucket, 1)].add(uid)
+
+    if counts:
+        c.executemany(
+            "INSERT INTO msg_rollup VALUES(?,?,?,?) "
+            "ON CONFLICT(grain, bucket, mode) DO UPDATE SET messages = messages + excluded.messages",
+            [(*key, n) for key, n in counts.items()]
+        )
+    for key, uids in users.items():
+        _merge_sketch(c, key, uids)
+
+    revenue = defaultdict(lambda: [0, 0])
+    for ts, _uid, amount_cents, _currency in payments:
+        for grain in GRAINS:
+            agg = revenue[(grain, ts - ts % grain)]
+            agg[0] += 1
+            agg[1] += amount_cents or 0
+    if revenue:
+        c.executemany(
+            "INSERT INTO payment_rollup VALUES(?,?,?,?) "
+            "ON CONFLICT(grain, bucket) DO UPDATE SET "
+            "payments = payments + excluded.payments, "
+            "revenue_cents = revenue_cents + excluded.revenue_cents",
+            [(*key, n, cents) for key, (n, cents) in revenue.items()]
+        )
+
+
+def rebuild(c):
+    """
+    Recompute every rollup from the raw messages/payments tables.
+
+    Used once when the rollup tables are introduced (or ROLLUP_VERSION
+    changes); afterwards they are maintained by apply_batch.
+    """
+    c.execute("DELETE FROM msg_rollup")
+    c.execute("DELETE FROM payment_rollup")
+    c.execute("DELETE FROM user_sketch")
+
+    for grain in GRAINS:
+        c.execute(
+            "INSERT INTO msg_rollup "
+            "SELECT ?, ts - ts % ?, COALESCE(mode, ''), COUNT(*) FROM messages GROUP BY 2, 3",
+            (grain, grain)
+        )
+        c.execute(
+            "INSERT INTO payment_rollup "
+            "SELECT ?, ts - ts % ?, COUNT(*), COALESCE(SUM(amount_cents), 0) FROM payments GROUP BY 2",
+            (grain, grain)
+        )
+
+    # Hourly sketches from distinct (hour, user) pairs; daily sketches are
+    # register-wise merges of their hours, so nothing is hashed twice
+    hourly: Dict[Tuple[int, int], HyperLogLog] = defaultdict(HyperLogLog)
+    rows = c.execute(
+        "SELECT ts - ts % ?, user_id, MAX(is_premium) FROM messages GROUP BY 1, 2", (HOUR,)
+    )
+    for bucket, uid, is_premium in rows:
+        hourly[(bucket, 0)].add(uid)
+        if is_premium:
+            hourly[(bucket, 1)].add(uid)
+
+    daily: Dict[Tuple[int, int], HyperLogLog] = defaultdict(HyperLogLog)
+    for (bucket, premium), sketch in hourly.items():
+        daily[(bucket - bucket % DAY, premium)].merge(sketch)
+
+    c.executemany(
+        "INSERT INTO user_sketch VALUES(?,?,?,?)",
+        [(HOUR, b, p, s.to_bytes()) for (b, p), s in hourly.items()] +
+        [(DAY, b, p, s.to_bytes()) for (b, p), s in daily.items()]
+    )
+
+
+def window(c, cutoff: int) -> Dict[str, Any]:
+    """
+    Aggregate everything with ts > cutoff from O(buckets) rollup rows.
+
+    The window is split into a raw edge (cutoff, first hour boundary) read
+    from the messages table, whole hours up to the next day boundary, and
+    whole days from there on. Buckets after the cutoff can only contain
+    events up to now, so the current hour/day needs no special casing.
+
+    Args:
+        c: SQLite connection
+        cutoff: Exclusive lower bound (unix seconds)
+
+    Returns:
+        dict with messages, by_mode, users, premium_users, payments, revenue_cents
+    """
+    h0 = cutoff - cutoff % HOUR + HOUR
+    d0 = h0 if h0 % DAY == 0 else h0 - h0 % DAY + DAY
+    ranges = "((grain=? AND bucket>=? AND bucket<?) OR (grain=? AND bucket>=?))"
+    args = (HOUR, h0, d0, DAY, d0)
+
+    by_mode = defaultdict(int)
+    for mode, n in c.execute(f"SELECT mode, SUM(messages) FROM msg_rollup WHERE {ranges} GROUP BY mode", args):
+        by_mode[mode] += n
+
+    payments, revenue = c.execute(
+        f"SELECT COALESCE(SUM(payments), 0), COALESCE(SUM(revenue_cents), 0) FROM payment_rollup WHERE {ranges}",
+        args
+    ).fetchone()
+
+    sketches = ([], [])
+    for premium, registers in c.execute(f"SELECT premium, registers FROM user_sketch WHERE {ranges}", args):
+        sketches[premium].append(registers)
+    users, premium_users = HyperLogLog(), HyperLogLog()
+    users.merge_many(sketches[0])
+    premium_users.merge_many(sketches[1])
+
+    # Raw edge: at most one hour of rows via the ts index
+    for uid, is_premium, mode in c.execute(EDGE_MESSAGES_SQL, (cutoff, h0)):
+        by_mode[_mode_key(mode)] += 1
+        users.add(uid)
+        if is_premium:
+            premium_users.add(uid)
+    edge_payments, edge_revenue = c.execute(EDGE_PAYMENTS_SQL, (cutoff, h0)).fetchone()
+
+    by_mode = {(m if m != "" else None): n for m, n in by_mode.items() if n}
+    return {
+        "messages": sum(by_mode.values()),
+        "by_mode": by_mode,
+        "users": users.count(),
+        "premium_users": premium_users.count(),
+        "payments": payments + edge_payments,
+        "revenue_cents": revenue + edge_revenue,
+    }
+
+
+def cutoff_for_days(days, now: int = None) -> int:
+    """Exclusive lower bound for a trailing N-day window"""
+    return int(now if now is not None else time.time()) - int(days * 86400)
@@ -0,0 +1,222 @@
+"""
+Metrics Writer
+Background writer that buffers metric events in memory and persists them
+in batched SQLite transactions over one long-lived connection.
+"""
+
+import atexit
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (kind, row) - kind is the destination table ("messages", "payments")
+Event = Tuple[str, tuple]
+
+DROP_OLDEST = "oldest"
+DROP_NEWEST = "newest"
+
+
+class MetricsWriter:
+    """
+    Bounded ring buffer + background flush thread
+
+    Events are flushed when `flush_batch` events are pending or every
+    `flush_interval_ms`, whichever comes first. When the buffer is full,
+    droppable events are discarded according to `drop_policy` ("oldest" or
+    "newest"); non-droppable events (payments) force a synchronous flush
+    instead so they are never lost. A batch whose write fails goes back to
+    the head of the buffer and is retried on the next flush; if that
+    overflows the buffer, only droppable events are discarded.
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection],
+                 write_batch: Callable[[sqlite3.Connection, List[Event]], None],
+                 max_events: int = 10000, flush_interval_ms: int = 250,
+                 flush_batch: int = 500, drop_policy: str = DROP_OLDEST):
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self._connect = connect
+        self._write_batch = write_batch
+        self.max_events = max_events
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_batch = flush_batch
+        self.drop_policy = drop_policy
+
+        self._buf: Deque[Tuple[str, tuple, bool]] = deque()  # (kind, row, droppable)
+        self._cond = threading.Condition()
+        self._db_lock = threading.Lock()
+        self._conn = None
+        self._thread = None
+        self._closed = False
+        self._failing = False
+
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.errors = 0
+
+    # ------------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------------
+
+    def submit(self, kind: str, row: tuple, droppable: bool = True) -> bool:
+        """
+        Queue one event for the next batch
+
+        Args:
+            kind: Destination table
+            row: Row values
+            droppable: Whether the event may be dropped on overflow
+
+        Returns:
+            bool: False if the event was dropped
+        """
+        if self._closed:
+            # After shutdown, write through so late events are not lost
+            self._write([(kind, row)])
+            return True
+
+        force_flush = False
+        with self._cond:
+            self.submitted += 1
+            if len(self._buf) >= self.max_events:
+                if not droppable:
+                    force_flush = True
+                elif self.drop_policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                elif self._drop_oldest(1) == 0:
+                    force_flush = True  # only payments are buffered
+            self._buf.append((kind, row, droppable))
+            if len(self._buf) >= self.flush_batch:
+                self._cond.notify()
+        self._ensure_thread()
+        if force_flush:
+            self.flush()
+        return True
+
+    # ------------------------------------------------------------------
+    # Consumer side
+    # ------------------------------------------------------------------
+
+    def flush(self) -> int:
+        """
+        Write all pending events in one transaction
+
+        Returns:
+            int: Number of events written
+        """
+        with self._cond:
+            if not self._buf:
+                return 0
+            pending = list(self._buf)
+            self._buf.clear()
+        written = self._write([(kind, row) for kind, row, _ in pending])
+        if not written:
+            self._requeue(pending)
+        return written
+
+    def _drop_oldest(self, n: int) -> int:
+        """Discard up to n of the oldest droppable events (caller holds _cond)"""
+        if n <= 0:
+            return 0
+        kept, dropped = deque(), 0
+        while self._buf and dropped < n:
+            event = self._buf.popleft()
+            if event[2]:
+                dropped += 1
+            else:
+                kept.append(event)
+        self._buf.extendleft(reversed(kept))
+        self.dropped += dropped
+        return dropped
+
+    def _requeue(self, pending: List[Tuple[str, tuple, bool]]):
+        """Put a failed batch back in front of events submitted meanwhile"""
+        with self._cond:
+            self._buf.extendleft(reversed(pending))
+            self._drop_oldest(len(self._buf) - self.max_events)
+
+    def _write(self, batch: List[Event]) -> int:
+        with self._db_lock:
+            try:
+                if self._conn is None:
+                    self._conn = self._connect()
+                with self._conn:
+                    self._write_batch(self._conn, batch)
+                self.written += len(batch)
+                self.flushes += 1
+                self._failing = False
+                return len(batch)
+            except Exception as e:
+                self._failing = True
+                self.errors += 1
+                logger.error(f"Metrics flush of {len(batch)} events failed: {e}")
+                # Reconnect on the next flush in case the connection is broken
+                try:
+                    if self._conn is not None:
+                        self._conn.close()
+                except Exception:
+                    pass
+                self._conn = None
+                return 0
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is not None or self._closed:
+                return
+            self._thread = threading.Thread(target=self._run, name="metrics-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                # After a failed write, wait out the interval before retrying
+                while not self._closed and (len(self._buf) < self.flush_batch or self._failing):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                closing = self._closed
+            self.flush()
+            if closing:
+                return
+
+    def close(self):
+        """Flush pending events, stop the thread and close the connection"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        self.flush()
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Writer counters"""
+        with self._cond:
+            pending = len(self._buf)
+        return {
+            "pending": pending,
+            "submitted": self.submitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "errors": self.errors,
+        }
@@ -6,6 +6,10 @@ from .upsell import (
     get_plan_limits,
     can_generate_image,
     use_image_generation,
+    reserve_image_generation,
+    commit_image_generation,
+    release_image_generation,
+    images_remaining,
     get_image_credits,
     add_image_credits,
     start_free_trial,
@@ -16,6 +20,16 @@ from .upsell import (
     FREE_TRIAL
 )
 
+from .entitlements import (
+    Entitlement,
+    get_entitlements
+)
+
+from .ledger import (
+    UsageLedger,
+    get_ledger
+)
+
 from .upsell_prompts import (
     get_image_limit_reached_message,
     get_free_trial_offer_message,
@@ -45,6 +59,10 @@ __all__ = [
     "get_plan_limits",
     "can_generate_image",
     "use_image_generation",
+    "reserve_image_generation",
+    "commit_image_generation",
+    "release_image_generation",
+    "images_remaining",
     
     # Credits
     "get_image_credits",
@@ -55,6 +73,14 @@ __all__ = [
     "has_trial_images",
     "get_trial_status",
     
+    # Entitlement cache
+    "Entitlement",
+    "get_entitlements",
+    
+    # Usage ledger
+    "UsageLedger",
+    "get_ledger",
+    
     # Constants
     "PLANS",
     "IMAGE_CREDIT_PRICES",
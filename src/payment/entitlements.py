@@ -0,0 +1,219 @@
+"""
+Entitlement cache for premium, plan and trial checks.
+
+Gate checks used to reparse users.json, subscriptions.json and
+trials.json (and their ISO timestamps) several times per button tap.
+EntitlementService keeps the files parsed in memory and answers from a
+per-user Entitlement snapshot whose expiry times are epoch ints, so a
+check is a dict lookup plus an integer comparison. Image balances
+(credits, trial and plan images) are kept by the usage ledger.
+
+Snapshots are invalidated:
+- by writers in this process, which hand the data they saved to
+  `wrote()` (upsell._save_json, the bot's and the Stripe webhook's
+  users.json saves); only users whose entries changed are dropped.
+- by other processes' writes (the webhook server runs separately): file
+  signatures are re-checked at most every ENTITLEMENT_RECHECK_S seconds
+  and changed files are reloaded.
+
+Environment Variables:
+    ENTITLEMENT_RECHECK_S - Seconds between file change checks (default: 1)
+"""
+
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional
+
+from src.payment import membership
+
+RECHECK_S = float(os.getenv("ENTITLEMENT_RECHECK_S", "1"))
+
+USERS_DB = Path("data/users.json")
+
+
+def _epoch(iso: Optional[str]) -> int:
+    """ISO timestamp (naive, local time as written by datetime.now()) to epoch seconds; 0 if missing"""
+    try:
+        return int(datetime.fromisoformat(iso).timestamp())
+    except (TypeError, ValueError):
+        return 0
+
+
+class Entitlement(NamedTuple):
+    """Everything the gates need about one user"""
+    premium: bool = False  # has a premium record in users.json
+    premium_expires: int = 0  # 0: no expiry
+    tier: str = ""
+    plan: Optional[str] = None  # set only while the subscription status is "active"
+    plan_expires: int = 0
+    had_trial: bool = False
+    trial_expires: int = 0
+
+    def premium_active(self, now: float) -> bool:
+        return self.premium and (not self.premium_expires or now <= self.premium_expires)
+
+    def active_plan(self, now: float) -> Optional[str]:
+        return self.plan if self.plan and now <= self.plan_expires else None
+
+    def trial_active(self, now: float) -> bool:
+        return self.had_trial and now <= self.trial_expires
+
+
+class EntitlementService:
+    """
+    Parsed entitlement files plus per-user snapshots
+
+    Args:
+        users, subscriptions, trials: Source JSON files
+        recheck_s: Minimum seconds between file signature checks
+    """
+
+    def __init__(self, users: Path, subscriptions: Path, trials: Path, recheck_s: float = RECHECK_S):
+        self._paths = {"users": Path(users), "subs": Path(subscriptions), "trials": Path(trials)}
+        self.recheck_s = recheck_s
+        self._lock = threading.Lock()
+        self._raw: Dict[str, Dict[str, Any]] = {}
+        self._sigs: Dict[str, Any] = {}
+        self._snaps: Dict[str, Entitlement] = {}
+        self._checked = float("-inf")
+
+        self.hits = 0
+        self.builds = 0
+        self.reloads = 0
+
+    # ------------------------------------------------------------------
+    # Source files
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _signature(path: Path):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _user_entries(self, name: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Per-user view of a file, for diffing (users.json keeps several sections)"""
+        if name != "users":
+            return data
+        entries = {u: ("free", rec.get("tier")) for u, rec in data.get("free", {}).items() if rec.get("tier")}
+        for u, rec in data.get("premium", {}).items():
+            entries[u] = ("premium", rec.get("tier"), rec.get("expires"))
+        return entries
+
+    def _adopt(self, name: str, data: Dict[str, Any], signature):
+        """Install new contents for one file and drop the snapshots of users whose entries changed"""
+        if name == "users":
+            membership.migrate(data)  # a schema 1 file not yet rewritten by its owner
+        old = self._user_entries(name, self._raw.get(name, {}))
+        new = self._user_entries(name, data)
+        for u in old.keys() | new.keys():
+            if old.get(u) != new.get(u):
+                self._snaps.pop(u, None)
+        self._raw[name] = data
+        self._sigs[name] = signature
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._checked < self.recheck_s:
+            return
+        self._checked = now
+        for name, path in self._paths.items():
+            signature = self._signature(path)
+            if name in self._raw and signature == self._sigs.get(name):
+                continue
+            try:
+                data = json.loads(path.read_text())
+            except (FileNotFoundError, ValueError):
+                data = {}
+            self._adopt(name, data if isinstance(data, dict) else {}, signature)
+            self.reloads += 1
+
+    def _build(self, u: str) -> Entitlement:
+        sub = self._raw.get("subs", {}).get(u) or {}
+        trial = self._raw.get("trials", {}).get(u)
+        users = self._raw.get("users", {})
+        rec = membership.record(users, u)
+        return Entitlement(
+            premium=rec is not None,
+            premium_expires=int((rec or {}).get("expires") or 0),
+            tier=membership.tier(users, u),
+            plan=sub.get("plan") if sub.get("status") == "active" else None,
+            plan_expires=_epoch(sub.get("expires_at", "2000-01-01")),
+            had_trial=trial is not None,
+            trial_expires=_epoch((trial or {}).get("expires_at", "2000-01-01")),
+        )
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def get(self, uid) -> Entitlement:
+        """Current snapshot for a user"""
+        u = str(uid)
+        with self._lock:
+            self._refresh()
+            e = self._snaps.get(u)
+            if e is not None:
+                self.hits += 1
+                return e
+            e = self._snaps[u] = self._build(u)
+            self.builds += 1
+            return e
+
+    def record(self, name: str, uid) -> Optional[Dict[str, Any]]:
+        """Copy of a user's raw entry in "subs" or "trials" (None if absent)"""
+        with self._lock:
+            self._refresh()
+            entry = self._raw.get(name, {}).get(str(uid))
+        return dict(entry) if entry is not None else None
+
+    def wrote(self, path: Path, data: Dict[str, Any]):
+        """Adopt data that was just saved to one of the source files"""
+        path = Path(path)
+        for name, source in self._paths.items():
+            if source == path:
+                with self._lock:
+                    self._adopt(name, data, self._signature(path))
+                return
+
+    def invalidate(self, uid=None):
+        """Drop one user's snapshot (or all) and re-check the files on the next read"""
+        with self._lock:
+            if uid is None:
+                self._snaps.clear()
+            else:
+                self._snaps.pop(str(uid), None)
+            self._checked = float("-inf")
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache counters"""
+        with self._lock:
+            cached = len(self._snaps)
+        return {"cached": cached, "hits": self.hits, "builds": self.builds, "reloads": self.reloads}
+
+
+_service: Optional[EntitlementService] = None
+_service_lock = threading.Lock()
+
+
+def get_entitlements() -> EntitlementService:
+    """Process-wide service over data/users.json and the upsell databases"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                from src.payment.upsell import SUBSCRIPTION_DB, TRIALS_DB
+                _service = EntitlementService(USERS_DB, SUBSCRIPTION_DB, TRIALS_DB)
+    return _service
+
+
+def notify_write(path: Path, data: Dict[str, Any]):
+    """Writer hook: keep the process-wide cache (if created) in sync with a save"""
+    if _service is not None:
+        _service.wrote(path, data)
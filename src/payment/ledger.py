@@ -0,0 +1,375 @@
+"""
+Append-only usage ledger for image credits, trial images and plan allowance.
+
+Every balance change is one journal line (data/usage_ledger.journal)
+applied to in-memory balances under a single lock, so concurrent taps
+can neither double-spend nor lose a deduction, and a deduction appends
+one line instead of rewriting credits.json / trials.json /
+subscriptions.json. Every COMPACT_EVERY entries the balances are written
+to a snapshot (data/usage_ledger.json) and the journal is truncated;
+entries carry a sequence number so a crash between the two never
+applies an entry twice.
+
+Several processes (gunicorn workers) can share one ledger: each
+operation holds an flock on data/usage_ledger.lock and first reads the
+journal lines other processes appended since its last operation. A
+compaction bumps a generation number kept in the lock file, which makes
+the other processes reload the snapshot instead of appending to the
+journal it replaced.
+
+Operations take an idempotency key (the Telegram update_id for image
+taps): repeating a key returns the first outcome without changing
+balances again. Slow work is bracketed by reserve() -> commit() /
+release(): a reservation holds the amount so it cannot be spent twice
+while an image renders, and holds left by a crash are released after
+LEDGER_HOLD_TTL_S.
+
+Environment Variables:
+    LEDGER_COMPACT_EVERY - Journal entries between snapshots (default: 1000)
+    LEDGER_HOLD_TTL_S - Seconds before an uncommitted reservation is released (default: 900)
+    LEDGER_FSYNC - fsync each journal entry (default: false)
+"""
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+COMPACT_EVERY = int(os.getenv("LEDGER_COMPACT_EVERY", "1000"))
+HOLD_TTL_S = int(os.getenv("LEDGER_HOLD_TTL_S", "900"))
+FSYNC = os.getenv("LEDGER_FSYNC", "false").lower() == "true"
+KEEP_KEYS = 100_000  # idempotency keys remembered (oldest forgotten first)
+
+LEDGER_DB = Path("data/usage_ledger.json")
+
+HELD = "held"
+COMMITTED = "committed"
+RELEASED = "released"
+APPLIED = "applied"
+
+# (uid, account) -> opening balance, used once when no ledger exists yet
+Opening = Callable[[], Dict[Tuple[str, str], int]]
+
+
+class UsageLedger:
+    """
+    Balances per (user, account) derived from a snapshot plus a journal
+
+    Args:
+        path: Snapshot path; the journal sits next to it (.journal)
+        opening: Opening balances for a brand-new ledger (legacy files)
+        compact_every: Journal entries between snapshots
+        hold_ttl: Seconds before a stale reservation is released
+    """
+
+    def __init__(self, path: Path, opening: Optional[Opening] = None,
+                 compact_every: int = COMPACT_EVERY, hold_ttl: int = HOLD_TTL_S):
+        self.path = Path(path)
+        self._opening = opening
+        self.compact_every = compact_every
+        self.hold_ttl = hold_ttl
+
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._file = None
+        self._balances: Dict[str, Dict[str, int]] = {}
+        self._held: Dict[Tuple[str, str], int] = {}
+        self._holds: Dict[str, list] = {}  # key -> [uid, account, amount, ts], oldest first
+        self._keys: "OrderedDict[str, str]" = OrderedDict()
+        self._seq = 0
+        self._journal_len = 0
+        self._offset = 0  # journal bytes already applied
+        self._lock_fd: Optional[int] = None
+        self._gen = 0  # compaction generation the state was loaded at
+
+        self.entries = 0
+        self.compactions = 0
+        self.reloads = 0
+
+    # ------------------------------------------------------------------
+    # State
+    # ------------------------------------------------------------------
+
+    def _journal(self) -> Path:
+        return self.path.with_suffix(".journal")
+
+    @contextmanager
+    def _synced(self):
+        """Hold the ledger against other threads and processes, caught up with its files"""
+        import fcntl
+        with self._lock:
+            if self._lock_fd is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._lock_fd = os.open(str(self.path.with_suffix(".lock")), os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                gen = self._generation()
+                if self._loaded and gen != self._gen:
+                    self._reset()  # another process compacted
+                self._gen = gen
+                if self._loaded:
+                    self._read_journal()
+                else:
+                    self._load()
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _generation(self) -> int:
+        raw = os.pread(self._lock_fd, 20, 0).strip()
+        return int(raw) if raw else 0
+
+    def _reset(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._loaded = False
+        self._balances, self._held, self._holds = {}, {}, {}
+        self._keys = OrderedDict()
+        self._seq = self._journal_len = self._offset = 0
+        self.reloads += 1
+
+    def _read_journal(self):
+        """Apply journal lines appended since the last read (by any process)"""
+        try:
+            with open(self._journal(), "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # torn line after a crash
+            self._journal_len += 1
+            if entry[0] > self._seq:
+                self._apply(entry)
+        self._offset += end
+        if end < len(data):
+            # Torn tail from a crashed writer: end it so the next entry starts on its own line
+            with open(self._journal(), "ab") as f:
+                f.write(b"\n")
+            self._offset += len(data) - end + 1
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            snap = json.loads(self.path.read_text())
+        except (FileNotFoundError, ValueError):
+            snap = None
+        if snap is not None:
+            self._seq = snap["seq"]
+            self._balances = {u: dict(b) for u, b in snap["balances"].items()}
+            for key, hold in snap["holds"].items():
+                self._hold(key, *hold)
+            self._keys = OrderedDict(snap["keys"])
+        journal = self._journal()
+        if snap is None and not journal.exists() and self._opening is not None:
+            for (u, account), value in self._opening().items():
+                if value:
+                    self._balances.setdefault(str(u), {})[account] = value
+        self._read_journal()
+        if snap is None and self._balances and not journal.exists():
+            self._compact()  # persist the opening balances
+
+    def _hold(self, key: str, u: str, account: str, amount: int, ts: int):
+        self._holds[key] = [u, account, amount, ts]
+        self._held[(u, account)] = self._held.get((u, account), 0) + amount
+
+    def _unhold(self, key: str) -> list:
+        hold = self._holds.pop(key)
+        left = self._held[(hold[0], hold[1])] - hold[2]
+        if left:
+            self._held[(hold[0], hold[1])] = left
+        else:
+            del self._held[(hold[0], hold[1])]
+        return hold
+
+    def _remember(self, key: Optional[str], status: str):
+        if key is None:
+            return
+        self._keys[key] = status
+        self._keys.move_to_end(key)
+        while len(self._keys) > KEEP_KEYS:
+            self._keys.popitem(last=False)
+
+    def _apply(self, entry: list):
+        """Apply one journal entry [seq, op, key, uid, account, amount, ts]"""
+        seq, op, key, u, account, amount, ts = entry
+        self._seq = seq
+        balances = self._balances.setdefault(u, {}) if u is not None else None
+        if op == "add":
+            balances[account] = balances.get(account, 0) + amount
+            self._remember(key, APPLIED)
+        elif op == "set":
+            balances[account] = amount
+            self._remember(key, APPLIED)
+        elif op == "hold":
+            self._hold(key, u, account, amount, ts)
+            self._remember(key, HELD)
+        elif op == "commit":
+            hu, haccount, hamount, _ = self._unhold(key)
+            b = self._balances.setdefault(hu, {})
+            b[haccount] = b.get(haccount, 0) - hamount
+            self._remember(key, COMMITTED)
+        elif op == "release":
+            self._unhold(key)
+            self._remember(key, RELEASED)
+
+    def _append(self, op: str, key: Optional[str], u: Optional[str], account: Optional[str], amount: int):
+        """Journal one entry, then apply it"""
+        entry = [self._seq + 1, op, key, u, account, amount, int(time.time())]
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self._journal(), "ab")
+        line = (json.dumps(entry) + "\n").encode()
+        self._file.write(line)
+        self._file.flush()
+        self._offset += len(line)
+        if FSYNC:
+            os.fsync(self._file.fileno())
+        self._apply(entry)
+        self.entries += 1
+        self._journal_len += 1
+        if self._journal_len >= self.compact_every:
+            self._compact()
+
+    def _compact(self):
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({
+            "seq": self._seq,
+            "balances": self._balances,
+            "holds": self._holds,
+            "keys": list(self._keys.items()),
+        }))
+        tmp.replace(self.path)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._journal().unlink(missing_ok=True)
+        self._journal_len = self._offset = 0
+        self._gen += 1
+        os.pwrite(self._lock_fd, str(self._gen).encode().ljust(20), 0)
+        self.compactions += 1
+
+    def _expire(self, now: float):
+        """Release holds older than hold_ttl (left behind by a crash or a lost job)"""
+        while self._holds:
+            key, hold = next(iter(self._holds.items()))
+            if now - hold[3] < self.hold_ttl:
+                return
+            self._append("release", key, None, None, 0)
+
+    def _available(self, u: str, account: str) -> int:
+        return self._balances.get(u, {}).get(account, 0) - self._held.get((u, account), 0)
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def balance(self, uid, account: str) -> int:
+        """Spendable balance (reserved amounts excluded)"""
+        with self._synced():
+            return self._available(str(uid), account)
+
+    def grant(self, uid, account: str, amount: int, key: Optional[str] = None) -> bool:
+        """Add to a balance; False if `key` was already used"""
+        with self._synced():
+            if key is not None and key in self._keys:
+                return False
+            self._append("add", key, str(uid), account, amount)
+            return True
+
+    def set(self, uid, account: str, value: int, key: Optional[str] = None) -> bool:
+        """Overwrite a balance (plan renewals, resets); False if `key` was already used"""
+        with self._synced():
+            if key is not None and key in self._keys:
+                return False
+            self._append("set", key, str(uid), account, value)
+            return True
+
+    def deduct(self, uid, account: str, amount: int = 1, key: Optional[str] = None) -> bool:
+        """Spend `amount` if available; a repeated key returns its first outcome"""
+        with self._synced():
+            if key is not None and key in self._keys:
+                return self._keys[key] in (APPLIED, COMMITTED)
+            if self._available(str(uid), account) < amount:
+                return False
+            self._append("add", key, str(uid), account, -amount)
+            return True
+
+    def reserve(self, uid, account: str, key: str, amount: int = 1) -> bool:
+        """Hold `amount` until commit(key) or release(key); a repeated key returns its first outcome"""
+        with self._synced():
+            self._expire(time.time())
+            if key in self._keys:
+                return self._keys[key] in (HELD, COMMITTED)
+            if self._available(str(uid), account) < amount:
+                return False
+            self._append("hold", key, str(uid), account, amount)
+            return True
+
+    def commit(self, key: str) -> bool:
+        """Spend a held amount; True if it is (now or already) spent"""
+        with self._synced():
+            if key in self._holds:
+                self._append("commit", key, None, None, 0)
+                return True
+            return self._keys.get(key) == COMMITTED
+
+    def release(self, key: str) -> bool:
+        """Return a held amount to the balance; False if nothing is held under `key`"""
+        with self._synced():
+            if key not in self._holds:
+                return False
+            self._append("release", key, None, None, 0)
+            return True
+
+    def reservation(self, key: str) -> Optional[Tuple[str, str, int]]:
+        """(uid, account, amount) held under `key`, if any"""
+        with self._synced():
+            hold = self._holds.get(key)
+            return tuple(hold[:3]) if hold else None
+
+    def stats(self) -> Dict[str, Any]:
+        """Ledger counters"""
+        with self._lock:
+            return {
+                "entries": self.entries,
+                "journal": self._journal_len,
+                "holds": len(self._holds),
+                "compactions": self.compactions,
+                "reloads": self.reloads,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+
+_ledger: Optional[UsageLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> UsageLedger:
+    """Process-wide ledger, opened from the legacy JSON balances the first time"""
+    global _ledger
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                from src.payment.upsell import opening_balances
+                _ledger = UsageLedger(LEDGER_DB, opening=opening_balances)
+    return _ledger
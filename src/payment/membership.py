@@ -0,0 +1,109 @@
+"""
+Premium Membership
+Keyed premium/free membership in users.json.
+
+Schema 1 kept membership as JSON lists ("premium_users", "free_users")
+plus a separate "tiers" map, so every check or update scanned a list.
+Schema 2 keeps one record per user:
+
+    "premium": {"<uid>": {"tier": "GOLD", "since": 1700000000, "expires": 0}}
+    "free":    {"<uid>": {}}
+
+`expires` is epoch seconds, 0 for no expiry. A tier recorded for a user
+who was never premium (schema 1 allowed it) is kept on the free record.
+
+Every users.json loader calls migrate(), so existing files are upgraded
+in place the first time they are read and saved.
+"""
+
+import time
+from typing import Any, Dict, Optional
+
+SCHEMA_VERSION = 2
+
+
+def empty() -> Dict[str, Any]:
+    """Membership sections of a new users.json"""
+    return {"schema": SCHEMA_VERSION, "premium": {}, "free": {}}
+
+
+def migrate(data: Dict[str, Any]) -> bool:
+    """
+    Upgrade a users.json dict to schema 2 in place
+
+    Returns:
+        bool: True if anything changed (the caller should save)
+    """
+    if data.get("schema", 1) >= SCHEMA_VERSION and isinstance(data.get("premium"), dict):
+        return False
+    premium = data.get("premium") if isinstance(data.get("premium"), dict) else {}
+    free = data.get("free") if isinstance(data.get("free"), dict) else {}
+    tiers = {str(u): t for u, t in (data.pop("tiers", None) or {}).items()}
+    for u in map(str, data.pop("premium_users", None) or []):
+        premium.setdefault(u, {"tier": tiers.pop(u, ""), "since": 0, "expires": 0})
+    for u in map(str, data.pop("free_users", None) or []):
+        if u not in premium:
+            free.setdefault(u, {})
+    for u, tier in tiers.items():
+        if u in premium:
+            premium[u]["tier"] = premium[u].get("tier") or tier
+        else:
+            free.setdefault(u, {})["tier"] = tier
+    data["premium"] = premium
+    data["free"] = free
+    data["schema"] = SCHEMA_VERSION
+    return True
+
+
+def record(data: Dict[str, Any], uid) -> Optional[Dict[str, Any]]:
+    """A user's premium record, or None"""
+    return data.get("premium", {}).get(str(uid))
+
+
+def is_member(data: Dict[str, Any], uid, now: Optional[float] = None) -> bool:
+    """Premium and not past the record's expiry"""
+    rec = data.get("premium", {}).get(str(uid))
+    if rec is None:
+        return False
+    expires = rec.get("expires", 0)
+    return not expires or (time.time() if now is None else now) <= expires
+
+
+def tier(data: Dict[str, Any], uid) -> str:
+    """Recorded tier (premium or leftover free record), "" if none"""
+    u = str(uid)
+    rec = data.get("premium", {}).get(u) or data.get("free", {}).get(u) or {}
+    return rec.get("tier", "")
+
+
+def grant(data: Dict[str, Any], uid, tier: str = "", expires: int = 0, now: Optional[float] = None) -> bool:
+    """
+    Make a user premium
+
+    Returns:
+        bool: False if the user already had a premium record (left unchanged)
+    """
+    u = str(uid)
+    premium = data.setdefault("premium", {})
+    if u in premium:
+        return False
+    free = data.setdefault("free", {}).pop(u, None) or {}
+    premium[u] = {"tier": tier or free.get("tier", ""),
+                  "since": int(time.time() if now is None else now), "expires": int(expires)}
+    return True
+
+
+def revoke(data: Dict[str, Any], uid) -> bool:
+    """Move a premium user back to free (dropping the tier); False if not premium"""
+    u = str(uid)
+    if data.setdefault("premium", {}).pop(u, None) is None:
+        return False
+    data.setdefault("free", {})[u] = {}
+    return True
+
+
+def clear(data: Dict[str, Any]):
+    """Drop every premium record and recorded tier"""
+    data["premium"] = {}
+    for rec in data.get("free", {}).values():
+        rec.pop("tier", None)
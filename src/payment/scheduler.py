@@ -0,0 +1,542 @@
+"""
+Billing Scheduler
+Subscription expiry, monthly image resets and trial notices, run when
+they fall due instead of being discovered lazily.
+
+Jobs live in a SQLite table indexed by due time (a persisted priority
+queue), one row per (kind, user): scheduling again moves the row, so a
+renewal or plan change simply replaces the old date. A tick reads only
+the due rows, oldest first, in batches of BILLING_BATCH; each batch loads
+subscriptions.json / trials.json once and saves each at most once, so a
+tick costs O(due items) however many users exist. Jobs pending at a
+restart are picked up on the first tick.
+
+Every gunicorn worker runs a scheduler on the same table, so a batch is
+claimed before it is handled: one IMMEDIATE transaction reads the due
+rows and leases them by moving their due time BILLING_LEASE_S ahead.
+Other workers skip leased rows, and the lease makes a job run again if
+its worker dies mid-batch.
+
+Job kinds:
+    plan_expiry   - mark the subscription expired, zero the plan images
+    monthly_reset - refill a limited plan's images every 30 days
+    trial_notice  - send get_trial_ending_soon_message TRIAL_NOTICE_H
+                    before the trial ends (skipped once subscribed)
+    trial_expiry  - mark the trial expired, zero the trial images
+
+Handlers re-check the files, so a job made stale by a renewal is a
+no-op. Ledger writes carry the job's key and due time, so a retried
+batch never refills twice. Notices go through TelegramNotifier, paced
+below Telegram's broadcast limit, and back off on 429 retry_after.
+
+Environment Variables:
+    BILLING_DB - SQLite job queue path (default: data/billing_jobs.db)
+    BILLING_BATCH - Due jobs handled per batch (default: 500)
+    BILLING_POLL_S - Longest sleep between ticks (default: 60)
+    BILLING_RETRY_S - First retry delay after a failed job, doubled per attempt (default: 60)
+    BILLING_MAX_ATTEMPTS - Attempts before a job is dropped (default: 5)
+    BILLING_LEASE_S - Seconds a claimed batch is hidden from other workers (default: 600)
+    TRIAL_NOTICE_H - Hours before trial end to send the notice (default: 24)
+    NOTICE_RATE_PER_S - Telegram messages per second (default: 25)
+"""
+
+import os
+import math
+import time
+import atexit
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .entitlements import _epoch, get_entitlements
+from .ledger import get_ledger
+from . import upsell
+
+logger = logging.getLogger(__name__)
+
+BILLING_DB = Path(os.getenv("BILLING_DB", "data/billing_jobs.db"))
+BILLING_BATCH = int(os.getenv("BILLING_BATCH", "500"))
+BILLING_POLL_S = float(os.getenv("BILLING_POLL_S", "60"))
+BILLING_RETRY_S = float(os.getenv("BILLING_RETRY_S", "60"))
+BILLING_MAX_ATTEMPTS = int(os.getenv("BILLING_MAX_ATTEMPTS", "5"))
+BILLING_LEASE_S = int(os.getenv("BILLING_LEASE_S", "600"))
+TRIAL_NOTICE_H = float(os.getenv("TRIAL_NOTICE_H", "24"))
+NOTICE_RATE_PER_S = float(os.getenv("NOTICE_RATE_PER_S", "25"))
+
+RESET_PERIOD_S = 30 * 86400
+
+PLAN_EXPIRY = "plan_expiry"
+MONTHLY_RESET = "monthly_reset"
+TRIAL_NOTICE = "trial_notice"
+TRIAL_EXPIRY = "trial_expiry"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS billing_jobs (
+  key TEXT PRIMARY KEY,
+  kind TEXT NOT NULL,
+  uid TEXT NOT NULL,
+  due_at INTEGER NOT NULL,
+  attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_billing_jobs_due ON billing_jobs(due_at);
+CREATE INDEX IF NOT EXISTS idx_billing_jobs_uid ON billing_jobs(uid);
+CREATE TABLE IF NOT EXISTS billing_meta (name TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+class Job(NamedTuple):
+    key: str
+    kind: str
+    uid: str
+    due_at: int
+    attempts: int
+    lease: int = 0  # due_at the row was moved to when this worker claimed it
+
+
+def next_reset(started: float, now: float) -> int:
+    """First 30-day boundary after `now` of a period that began at `started`"""
+    periods = max(0, int((now - started) // RESET_PERIOD_S)) + 1
+    return int(started + periods * RESET_PERIOD_S)
+
+
+class TelegramNotifier:
+    """
+    Paced sendMessage calls
+
+    Sends are spaced 1/rate_per_s apart. A 429 sleeps for the returned
+    retry_after and tries again; chats that blocked the bot or no longer
+    exist (400/403) count as done.
+    """
+
+    def __init__(self, token: str, rate_per_s: float = NOTICE_RATE_PER_S, retries: int = 3,
+                 post: Optional[Callable[..., Any]] = None, sleep: Callable[[float], None] = time.sleep):
+        self.url = f"https://api.telegram.org/bot{token}/sendMessage"
+        self.interval = 1.0 / rate_per_s if rate_per_s > 0 else 0.0
+        self.retries = retries
+        self._post = post
+        self._sleep = sleep
+        self._next = 0.0
+
+        self.sent = 0
+        self.throttled = 0
+
+    def send(self, chat_id: str, text: str) -> bool:
+        """
+        Deliver one MarkdownV2 message
+
+        Returns:
+            bool: False if the message was dropped (unreachable chat)
+
+        Raises on network errors or when Telegram keeps throttling, so the
+        job is retried later.
+        """
+        if self._post is None:
+            import requests
+            self._post = requests.post
+        for _ in range(self.retries + 1):
+            delay = self._next - time.monotonic()
+            if delay > 0:
+                self._sleep(delay)
+            self._next = time.monotonic() + self.interval
+            resp = self._post(self.url, json={"chat_id": chat_id, "text": text, "parse_mode": "MarkdownV2"},
+                              timeout=10)
+            if resp.status_code == 200:
+                self.sent += 1
+                return True
+            if resp.status_code == 429:
+                self.throttled += 1
+                retry_after = resp.json().get("parameters", {}).get("retry_after", 1)
+                self._sleep(retry_after)
+                continue
+            if resp.status_code in (400, 403):
+                logger.info(f"Notice to {chat_id} dropped ({resp.status_code}): {resp.text[:200]}")
+                return False
+            raise RuntimeError(f"sendMessage failed ({resp.status_code}): {resp.text[:200]}")
+        raise RuntimeError(f"sendMessage to {chat_id} still throttled after {self.retries} retries")
+
+
+class _Batch:
+    """Files and side effects shared by the jobs of one batch"""
+
+    __slots__ = ("now", "subs", "trials", "dirty", "notices")
+
+    def __init__(self, now: float):
+        self.now = now
+        self.subs = upsell._load_json(upsell.SUBSCRIPTION_DB)
+        self.trials = upsell._load_json(upsell.TRIALS_DB)
+        self.dirty = set()
+        self.notices: List[Tuple[str, str, str]] = []  # (job key, uid, text)
+
+
+class BillingScheduler:
+    """
+    Persisted due-time queue plus the thread that works it
+
+    Args:
+        path: SQLite database for the queue
+        notifier: Sends trial notices (None: notices are logged and dropped)
+        batch_size, poll_s, retry_s, max_attempts: See the environment variables
+    """
+
+    def __init__(self, path: Path, notifier: Optional[TelegramNotifier] = None, batch_size: int = BILLING_BATCH,
+                 poll_s: float = BILLING_POLL_S, retry_s: float = BILLING_RETRY_S,
+                 max_attempts: int = BILLING_MAX_ATTEMPTS):
+        self.path = Path(path)
+        self.notifier = notifier
+        self.batch_size = batch_size
+        self.poll_s = poll_s
+        self.retry_s = retry_s
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._conn = None
+        self._thread = None
+        self._closed = False
+        self._handlers = {
+            PLAN_EXPIRY: self._plan_expiry,
+            MONTHLY_RESET: self._monthly_reset,
+            TRIAL_NOTICE: self._trial_notice,
+            TRIAL_EXPIRY: self._trial_expiry,
+        }
+
+        self.done = 0
+        self.rescheduled = 0
+        self.failed = 0
+        self.dropped = 0
+        self.notices = 0
+
+    # ------------------------------------------------------------------
+    # Queue
+    # ------------------------------------------------------------------
+
+    def _connect(self):
+        if self._conn is None:
+            import sqlite3
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _upsert(self, rows: Iterable[Tuple[str, str, int]]):
+        """(kind, uid, due_at) rows; an existing job for the same kind and user is moved"""
+        rows = [(f"{kind}:{uid}", kind, str(uid), int(due)) for kind, uid, due in rows]
+        if not rows:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT INTO billing_jobs (key, kind, uid, due_at) VALUES (?,?,?,?) "
+                "ON CONFLICT(key) DO UPDATE SET due_at=excluded.due_at, attempts=0", rows)
+            conn.execute("COMMIT")
+        self._wake.set()
+
+    def schedule(self, kind: str, uid, due_at: float):
+        """Run `kind` for a user at `due_at` (epoch seconds), replacing any earlier date"""
+        self._upsert([(kind, uid, due_at)])
+
+    def cancel(self, uid, kinds: Optional[Iterable[str]] = None) -> int:
+        """Drop a user's jobs (all, or the given kinds)"""
+        with self._lock:
+            conn = self._connect()
+            if kinds is None:
+                cur = conn.execute("DELETE FROM billing_jobs WHERE uid=?", (str(uid),))
+            else:
+                kinds = list(kinds)
+                marks = ",".join("?" * len(kinds))
+                cur = conn.execute(f"DELETE FROM billing_jobs WHERE uid=? AND kind IN ({marks})",
+                                   (str(uid), *kinds))
+            return cur.rowcount
+
+    def jobs(self, uid=None) -> List[Job]:
+        """Queued jobs in due order (one user's, or all)"""
+        sql = "SELECT key, kind, uid, due_at, attempts FROM billing_jobs"
+        args: tuple = ()
+        if uid is not None:
+            sql += " WHERE uid=?"
+            args = (str(uid),)
+        with self._lock:
+            rows = self._connect().execute(sql + " ORDER BY due_at, key", args).fetchall()
+        return [Job(*r) for r in rows]
+
+    def next_due(self) -> Optional[int]:
+        with self._lock:
+            row = self._connect().execute("SELECT MIN(due_at) FROM billing_jobs").fetchone()
+        return row[0]
+
+    def _claim(self, now: float) -> List[Job]:
+        """Take the next batch of due jobs, leased so no other process runs them too"""
+        lease = int(now) + BILLING_LEASE_S
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT key, kind, uid, due_at, attempts FROM billing_jobs WHERE due_at<=? "
+                    "ORDER BY due_at LIMIT ?", (int(now), self.batch_size)).fetchall()
+                conn.executemany("UPDATE billing_jobs SET due_at=? WHERE key=?", [(lease, r[0]) for r in rows])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return [Job(*r, lease=lease) for r in rows]
+
+    # ------------------------------------------------------------------
+    # Scheduling from subscription / trial records
+    # ------------------------------------------------------------------
+
+    def schedule_plan(self, uid, sub: Dict[str, Any], now: Optional[float] = None):
+        """Expiry and (for limited plans) the next monthly reset of a subscription record"""
+        self._upsert(self._plan_rows(uid, sub, time.time() if now is None else now))
+        limit = upsell.PLANS.get(sub.get("plan"), {}).get("limits", {}).get("images_per_month", -1)
+        if limit == -1:
+            self.cancel(uid, [MONTHLY_RESET])
+
+    def schedule_trial(self, uid, trial: Dict[str, Any], now: Optional[float] = None):
+        """Ending-soon notice and expiry of a trial record"""
+        self._upsert(self._trial_rows(uid, trial, time.time() if now is None else now))
+
+    @staticmethod
+    def _plan_rows(uid, sub: Dict[str, Any], now: float) -> List[Tuple[str, str, int]]:
+        if sub.get("status") != "active":
+            return []
+        expires = _epoch(sub.get("expires_at"))
+        rows = [(PLAN_EXPIRY, uid, expires)]
+        limit = upsell.PLANS.get(sub.get("plan"), {}).get("limits", {}).get("images_per_month", -1)
+        reset = next_reset(_epoch(sub.get("started_at")), now)
+        if limit != -1 and reset < expires:
+            rows.append((MONTHLY_RESET, uid, reset))
+        return rows
+
+    @staticmethod
+    def _trial_rows(uid, trial: Dict[str, Any], now: float) -> List[Tuple[str, str, int]]:
+        if trial.get("status", "active") != "active":
+            return []
+        expires = _epoch(trial.get("expires_at"))
+        rows = [(TRIAL_EXPIRY, uid, expires)]
+        if expires > now:
+            rows.append((TRIAL_NOTICE, uid, max(now, expires - TRIAL_NOTICE_H * 3600)))
+        return rows
+
+    def seed(self, now: Optional[float] = None) -> int:
+        """
+        Queue jobs for subscriptions and trials that predate the scheduler
+        (a one-off scan, remembered in the database)
+
+        Returns:
+            int: Jobs queued (0 if already seeded)
+        """
+        with self._lock:
+            seeded = self._connect().execute("SELECT 1 FROM billing_meta WHERE name='seeded'").fetchone()
+        if seeded:
+            return 0
+        now = time.time() if now is None else now
+        rows = []
+        for uid, sub in upsell._load_json(upsell.SUBSCRIPTION_DB).items():
+            rows += self._plan_rows(uid, sub, now)
+        for uid, trial in upsell._load_json(upsell.TRIALS_DB).items():
+            rows += self._trial_rows(uid, trial, now)
+        self._upsert(rows)
+        with self._lock:
+            self._connect().execute("INSERT OR REPLACE INTO billing_meta VALUES ('seeded', ?)", (str(int(now)),))
+        logger.info(f"Billing scheduler seeded with {len(rows)} jobs")
+        return len(rows)
+
+    # ------------------------------------------------------------------
+    # Handlers: return the next due time to keep the job, None when done
+    # ------------------------------------------------------------------
+
+    def _plan_expiry(self, job: Job, b: _Batch) -> Optional[int]:
+        sub = b.subs.get(job.uid)
+        if not sub or sub.get("status") != "active":
+            return None
+        expires = _epoch(sub.get("expires_at"))
+        if expires > b.now:
+            return expires  # renewed since this was queued
+        sub["status"] = "expired"
+        b.dirty.add(upsell.SUBSCRIPTION_DB)
+        get_ledger().set(job.uid, upsell.PLAN_ACCOUNT, 0, key=f"{job.key}:{job.due_at}")
+        logger.info(f"Subscription of user {job.uid} ({sub.get('plan')}) expired")
+        return None
+
+    def _monthly_reset(self, job: Job, b: _Batch) -> Optional[int]:
+        sub = b.subs.get(job.uid)
+        if not sub or sub.get("status") != "active":
+            return None
+        expires = _epoch(sub.get("expires_at"))
+        limit = upsell.PLANS.get(sub.get("plan"), {}).get("limits", {}).get("images_per_month", -1)
+        if limit == -1 or b.now >= expires:
+            return None
+        get_ledger().set(job.uid, upsell.PLAN_ACCOUNT, limit, key=f"{job.key}:{job.due_at}")
+        if sub.get("images_used_this_month"):
+            sub["images_used_this_month"] = 0
+            b.dirty.add(upsell.SUBSCRIPTION_DB)
+        reset = next_reset(_epoch(sub.get("started_at")), b.now)
+        return reset if reset < expires else None
+
+    def _trial_notice(self, job: Job, b: _Batch) -> Optional[int]:
+        from .upsell_prompts import get_trial_ending_soon_message
+        trial = b.trials.get(job.uid)
+        if not trial or trial.get("status", "active") != "active":
+            return None
+        left = _epoch(trial.get("expires_at")) - b.now
+        if left <= 0 or get_entitlements().get(job.uid).active_plan(b.now):
+            return None  # over, or subscribed in the meantime
+        images = get_ledger().balance(job.uid, upsell.TRIAL_ACCOUNT)
+        b.notices.append((job.key, job.uid, get_trial_ending_soon_message(math.ceil(left / 86400), images)))
+        return None
+
+    def _trial_expiry(self, job: Job, b: _Batch) -> Optional[int]:
+        trial = b.trials.get(job.uid)
+        if not trial or trial.get("status", "active") != "active":
+            return None
+        expires = _epoch(trial.get("expires_at"))
+        if expires > b.now:
+            return expires
+        trial["status"] = "expired"
+        b.dirty.add(upsell.TRIALS_DB)
+        get_ledger().set(job.uid, upsell.TRIAL_ACCOUNT, 0, key=f"{job.key}:{job.due_at}")
+        return None
+
+    # ------------------------------------------------------------------
+    # Running
+    # ------------------------------------------------------------------
+
+    def run_due(self, now: Optional[float] = None) -> Dict[str, int]:
+        """
+        Handle every job due at `now`, batch by batch
+
+        Returns:
+            dict with done, rescheduled, failed, notices counts for this call
+        """
+        now = time.time() if now is None else now
+        result = {"done": 0, "rescheduled": 0, "failed": 0, "notices": 0}
+        with self._run_lock:
+            while True:
+                jobs = self._claim(now)
+                if not jobs:
+                    return result
+                self._run_batch(jobs, now, result)
+
+    def _run_batch(self, jobs: List[Job], now: float, result: Dict[str, int]):
+        b = _Batch(now)
+        outcome: Dict[str, Any] = {}  # job key -> next due, None (done) or an exception
+        for job in jobs:
+            handler = self._handlers.get(job.kind)
+            try:
+                outcome[job.key] = handler(job, b) if handler else None
+            except Exception as e:
+                outcome[job.key] = e
+        try:
+            for path in b.dirty:
+                upsell._save_json(path, b.subs if path == upsell.SUBSCRIPTION_DB else b.trials)
+        except Exception as e:
+            outcome = dict.fromkeys(outcome, e)  # nothing was saved: retry the whole batch
+            b.notices = []
+
+        for key, uid, text in b.notices:
+            try:
+                if self.notifier is None:
+                    logger.info(f"Trial notice for user {uid} not sent (no Telegram token)")
+                elif self.notifier.send(uid, text):
+                    result["notices"] += 1
+                    self.notices += 1
+            except Exception as e:
+                outcome[key] = e
+
+        self._finish(jobs, outcome, now, result)
+
+    def _finish(self, jobs: List[Job], outcome: Dict[str, Any], now: float, result: Dict[str, int]):
+        done, moved, failed = [], [], []
+        for job in jobs:
+            nxt = outcome[job.key]
+            if isinstance(nxt, Exception):
+                if job.attempts + 1 >= self.max_attempts:
+                    logger.error(f"Billing job {job.key} dropped after {job.attempts + 1} attempts: {nxt}")
+                    done.append((job.key, job.lease))
+                    self.dropped += 1
+                else:
+                    logger.warning(f"Billing job {job.key} failed (attempt {job.attempts + 1}): {nxt}")
+                    retry_at = int(now + self.retry_s * 2 ** job.attempts) + 1
+                    failed.append((retry_at, job.attempts + 1, job.key, job.lease))
+                result["failed"] += 1
+                self.failed += 1
+            elif nxt is None or nxt <= now:
+                done.append((job.key, job.lease))
+                result["done"] += 1
+                self.done += 1
+            else:
+                moved.append((int(nxt), job.key, job.lease))
+                result["rescheduled"] += 1
+                self.rescheduled += 1
+        # Matching on our lease leaves jobs rescheduled meanwhile (e.g. a renewal) alone
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN")
+            conn.executemany("DELETE FROM billing_jobs WHERE key=? AND due_at=?", done)
+            conn.executemany("UPDATE billing_jobs SET due_at=?, attempts=0 WHERE key=? AND due_at=?", moved)
+            conn.executemany("UPDATE billing_jobs SET due_at=?, attempts=? WHERE key=? AND due_at=?", failed)
+            conn.execute("COMMIT")
+
+    def start(self):
+        """Seed from the files (first run only) and work the queue on a daemon thread"""
+        if self._thread is not None or self._closed:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self.seed()
+            self._thread = threading.Thread(target=self._run, name="billing-scheduler", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        while not self._closed:
+            try:
+                self.run_due()
+            except Exception:
+                logger.exception("Billing scheduler tick failed")
+            nxt = self.next_due()
+            delay = self.poll_s if nxt is None else min(self.poll_s, max(0.0, nxt - time.time()))
+            self._wake.wait(delay)
+            self._wake.clear()
+
+    def close(self):
+        """Stop the thread and close the database"""
+        self._closed = True
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters plus queue size and next due time"""
+        with self._lock:
+            queued = self._connect().execute("SELECT COUNT(*) FROM billing_jobs").fetchone()[0]
+        return {"queued": queued, "next_due": self.next_due(), "done": self.done,
+                "rescheduled": self.rescheduled, "failed": self.failed, "dropped": self.dropped,
+                "notices": self.notices}
+
+
+_scheduler: Optional[BillingScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> BillingScheduler:
+    """Process-wide scheduler at BILLING_DB; notices need TELEGRAM_TOKEN"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                token = os.getenv("TELEGRAM_TOKEN") or os.getenv("TELEGRAM_BOT_TOKEN")
+                _scheduler = BillingScheduler(BILLING_DB, TelegramNotifier(token) if token else None)
+    return _scheduler
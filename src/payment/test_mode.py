@@ -12,8 +12,10 @@ from datetime import datetime, timedelta
 from .upsell import (
     set_user_plan, add_image_credits, start_free_trial,
     PLANS, IMAGE_CREDIT_PRICES, _load_json, _save_json,
-    SUBSCRIPTION_DB, CREDITS_DB, TRIALS_DB
+    SUBSCRIPTION_DB, CREDITS_DB, TRIALS_DB,
+    PLAN_ACCOUNT, CREDITS_ACCOUNT, TRIAL_ACCOUNT
 )
+from .ledger import get_ledger
 
 logger = logging.getLogger(__name__)
 
@@ -129,6 +131,16 @@ def reset_user_payments(user_id: int):
         del trials[user_key]
         _save_json(TRIALS_DB, trials)
     
+    # Zero image balances
+    ledger = get_ledger()
+    for account in (PLAN_ACCOUNT, CREDITS_ACCOUNT, TRIAL_ACCOUNT):
+        if ledger.balance(user_id, account):
+            ledger.set(user_id, account, 0)
+    
+    # Drop queued expiries, resets and notices
+    from .scheduler import get_scheduler
+    get_scheduler().cancel(user_id)
+    
     logger.info(f"TEST MODE: Reset all payment data for user {user_id}")
 
 def get_test_commands_help() -> str:
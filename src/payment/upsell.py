@@ -6,15 +6,27 @@ Includes:
 - Pay-per-image credits
 - Free trial system
 - Strategic upsell prompts
+
+Gate checks read through the entitlement cache (see entitlements.py);
+every save goes through _save_json, which keeps that cache in sync.
+Image allowances (plan images left this month, credits, trial images)
+live in the usage ledger (see ledger.py); credits.json and the image
+counters in trials.json / subscriptions.json only seed a new ledger.
+Expiries, monthly resets and trial notices are queued with the billing
+scheduler (see scheduler.py) when a plan or trial starts.
 """
 
 import json
 import os
+import time
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, Tuple
 import logging
 
+from .entitlements import get_entitlements, notify_write
+from .ledger import get_ledger
+
 logger = logging.getLogger(__name__)
 
 # Pricing Configuration
@@ -95,6 +107,11 @@ FREE_TRIAL = {
     "features": ["NSFW mode", "Voice messages", "AI images"]
 }
 
+# Ledger accounts, in the order image generations are paid from
+PLAN_ACCOUNT = "plan"  # images left this month on a limited plan
+CREDITS_ACCOUNT = "credits"
+TRIAL_ACCOUNT = "trial"
+
 # Database paths
 SUBSCRIPTION_DB = Path("data/subscriptions.json")
 CREDITS_DB = Path("data/credits.json")
@@ -113,6 +130,7 @@ def _save_json(path: Path, data: Dict):
     tmp = path.with_suffix('.tmp')
     tmp.write_text(json.dumps(data, indent=2))
     tmp.replace(path)
+    notify_write(path, data)
 
 # ============================================================================
 # SUBSCRIPTION MANAGEMENT
@@ -120,24 +138,7 @@ def _save_json(path: Path, data: Dict):
 
 def get_user_plan(user_id: int) -> Optional[str]:
     """Get user's current subscription plan (basic, vip, ultimate, or None)"""
-    subs = _load_json(SUBSCRIPTION_DB)
-    user_key = str(user_id)
-    
-    if user_key not in subs:
-        return None
-    
-    sub = subs[user_key]
-    
-    # Check if subscription is active
-    if sub.get("status") != "active":
-        return None
-    
-    # Check expiration
-    expires = datetime.fromisoformat(sub.get("expires_at", "2000-01-01"))
-    if datetime.now() > expires:
-        return None
-    
-    return sub.get("plan")
+    return get_entitlements().get(user_id).active_plan(time.time())
 
 def set_user_plan(user_id: int, plan: str, duration_days: int = 30):
     """Set user's subscription plan"""
@@ -153,6 +154,9 @@ def set_user_plan(user_id: int, plan: str, duration_days: int = 30):
     }
     
     _save_json(SUBSCRIPTION_DB, subs)
+    get_ledger().set(user_id, PLAN_ACCOUNT, max(0, PLANS[plan]["limits"]["images_per_month"]))
+    from .scheduler import get_scheduler
+    get_scheduler().schedule_plan(user_id, subs[user_key])
     logger.info(f"User {user_id} subscribed to {plan} plan")
 
 def get_plan_limits(user_id: int) -> Dict[str, Any]:
@@ -168,67 +172,105 @@ def get_plan_limits(user_id: int) -> Dict[str, Any]:
     
     return PLANS[plan]["limits"]
 
-def can_generate_image(user_id: int) -> Tuple[bool, str]:
+def opening_balances() -> Dict[Tuple[str, str], int]:
+    """Ledger balances from the legacy JSON files, used once to seed a new ledger"""
+    balances = {}
+    for user_key, credits in _load_json(CREDITS_DB).items():
+        balances[(user_key, CREDITS_ACCOUNT)] = credits
+    for user_key, trial in _load_json(TRIALS_DB).items():
+        balances[(user_key, TRIAL_ACCOUNT)] = trial.get("images_remaining", 0)
+    for user_key, sub in _load_json(SUBSCRIPTION_DB).items():
+        limit = PLANS.get(sub.get("plan"), {}).get("limits", {}).get("images_per_month", -1)
+        if limit != -1:
+            balances[(user_key, PLAN_ACCOUNT)] = max(0, limit - sub.get("images_used_this_month", 0))
+    return balances
+
+def _image_account(user_id: int) -> Tuple[Optional[str], str]:
     """
-    Check if user can generate an image.
-    Returns (can_generate, reason_if_not)
+    Ledger account the next image is paid from.
+    Returns (account, reason_if_not); account "" means unlimited.
     """
-    plan = get_user_plan(user_id)
+    ent = get_entitlements().get(user_id)
+    ledger = get_ledger()
+    now = time.time()
+    plan = ent.active_plan(now)
     
     # Check subscription
     if plan:
-        limits = PLANS[plan]["limits"]
+        limit = PLANS[plan]["limits"]["images_per_month"]
         
         # Unlimited images
-        if limits["images_per_month"] == -1:
-            return True, ""
+        if limit == -1:
+            return "", ""
         
         # Check monthly limit
-        subs = _load_json(SUBSCRIPTION_DB)
-        used = subs[str(user_id)].get("images_used_this_month", 0)
-        
-        if used < limits["images_per_month"]:
-            return True, ""
-        else:
-            return False, f"Monthly limit reached ({limits['images_per_month']} images). Upgrade to VIP for unlimited!"
+        if ledger.balance(user_id, PLAN_ACCOUNT) > 0:
+            return PLAN_ACCOUNT, ""
+        return None, f"Monthly limit reached ({limit} images). Upgrade to VIP for unlimited!"
     
     # Check credits
-    credits = get_image_credits(user_id)
-    if credits > 0:
-        return True, ""
+    if ledger.balance(user_id, CREDITS_ACCOUNT) > 0:
+        return CREDITS_ACCOUNT, ""
     
     # Check free trial
-    if has_trial_images(user_id):
-        return True, ""
+    if ent.trial_active(now) and ledger.balance(user_id, TRIAL_ACCOUNT) > 0:
+        return TRIAL_ACCOUNT, ""
     
-    return False, "No images remaining. Buy credits or subscribe!"
+    return None, "No images remaining. Buy credits or subscribe!"
+
+def can_generate_image(user_id: int) -> Tuple[bool, str]:
+    """
+    Check if user can generate an image.
+    Returns (can_generate, reason_if_not)
+    """
+    account, reason = _image_account(user_id)
+    return account is not None, reason
+
+def reserve_image_generation(user_id: int, key: str) -> Tuple[bool, str]:
+    """
+    Hold one image from subscription, credits, or trial (in that order)
+    until commit_image_generation(key) or release_image_generation(key).
+    Repeating a key returns its first outcome without holding again.
+    Returns (reserved, reason_if_not)
+    """
+    account, reason = _image_account(user_id)
+    if account is None:
+        return False, reason
+    if account and not get_ledger().reserve(user_id, account, key):
+        # Spent by a concurrent tap since the check above
+        return False, "No images remaining. Buy credits or subscribe!"
+    return True, ""
+
+def commit_image_generation(key: str) -> bool:
+    """Spend the image held under key (no-op for unlimited plans)"""
+    return get_ledger().commit(key)
+
+def release_image_generation(key: str) -> bool:
+    """Give back the image held under key, e.g. when generation failed"""
+    return get_ledger().release(key)
 
-def use_image_generation(user_id: int) -> bool:
+def use_image_generation(user_id: int, key: Optional[str] = None) -> bool:
     """
     Use one image generation. Returns True if successful.
     Deducts from subscription, credits, or trial in that order.
     """
+    account, _ = _image_account(user_id)
+    if account is None:
+        return False
+    return not account or get_ledger().deduct(user_id, account, key=key)
+
+def images_remaining(user_id: int) -> int:
+    """Images the user can still generate (-1 for unlimited)"""
+    ledger = get_ledger()
     plan = get_user_plan(user_id)
-    
-    # Deduct from subscription
     if plan:
-        subs = _load_json(SUBSCRIPTION_DB)
-        user_key = str(user_id)
-        subs[user_key]["images_used_this_month"] = subs[user_key].get("images_used_this_month", 0) + 1
-        _save_json(SUBSCRIPTION_DB, subs)
-        return True
-    
-    # Deduct from credits
-    if get_image_credits(user_id) > 0:
-        use_image_credit(user_id)
-        return True
-    
-    # Deduct from trial
+        if PLANS[plan]["limits"]["images_per_month"] == -1:
+            return -1
+        return ledger.balance(user_id, PLAN_ACCOUNT)
+    remaining = ledger.balance(user_id, CREDITS_ACCOUNT)
     if has_trial_images(user_id):
-        use_trial_image(user_id)
-        return True
-    
-    return False
+        remaining += ledger.balance(user_id, TRIAL_ACCOUNT)
+    return remaining
 
 # ============================================================================
 # IMAGE CREDITS
@@ -236,28 +278,16 @@ def use_image_generation(user_id: int) -> bool:
 
 def get_image_credits(user_id: int) -> int:
     """Get user's remaining image credits"""
-    credits = _load_json(CREDITS_DB)
-    return credits.get(str(user_id), 0)
+    return get_ledger().balance(user_id, CREDITS_ACCOUNT)
 
-def add_image_credits(user_id: int, amount: int):
-    """Add image credits to user"""
-    credits = _load_json(CREDITS_DB)
-    user_key = str(user_id)
-    credits[user_key] = credits.get(user_key, 0) + amount
-    _save_json(CREDITS_DB, credits)
-    logger.info(f"Added {amount} credits to user {user_id}")
+def add_image_credits(user_id: int, amount: int, key: Optional[str] = None):
+    """Add image credits to user (once per key, e.g. a payment id)"""
+    if get_ledger().grant(user_id, CREDITS_ACCOUNT, amount, key=key):
+        logger.info(f"Added {amount} credits to user {user_id}")
 
 def use_image_credit(user_id: int) -> bool:
     """Use one image credit. Returns True if successful."""
-    credits = _load_json(CREDITS_DB)
-    user_key = str(user_id)
-    
-    if credits.get(user_key, 0) > 0:
-        credits[user_key] -= 1
-        _save_json(CREDITS_DB, credits)
-        return True
-    
-    return False
+    return get_ledger().deduct(user_id, CREDITS_ACCOUNT)
 
 # ============================================================================
 # FREE TRIAL
@@ -280,45 +310,24 @@ def start_free_trial(user_id: int):
     }
     
     _save_json(TRIALS_DB, trials)
+    get_ledger().set(user_id, TRIAL_ACCOUNT, FREE_TRIAL["images_included"])
+    from .scheduler import get_scheduler
+    get_scheduler().schedule_trial(user_id, trials[user_key])
     logger.info(f"Started free trial for user {user_id}")
     return True
 
 def has_trial_images(user_id: int) -> bool:
     """Check if user has trial images remaining"""
-    trials = _load_json(TRIALS_DB)
-    user_key = str(user_id)
-    
-    if user_key not in trials:
-        return False
-    
-    trial = trials[user_key]
-    
-    # Check expiration
-    expires = datetime.fromisoformat(trial.get("expires_at", "2000-01-01"))
-    if datetime.now() > expires:
-        return False
-    
-    return trial.get("images_remaining", 0) > 0
+    return (get_entitlements().get(user_id).trial_active(time.time())
+            and get_ledger().balance(user_id, TRIAL_ACCOUNT) > 0)
 
 def use_trial_image(user_id: int) -> bool:
     """Use one trial image. Returns True if successful."""
-    trials = _load_json(TRIALS_DB)
-    user_key = str(user_id)
-    
-    if user_key in trials and trials[user_key].get("images_remaining", 0) > 0:
-        trials[user_key]["images_remaining"] -= 1
-        _save_json(TRIALS_DB, trials)
-        return True
-    
-    return False
+    return get_ledger().deduct(user_id, TRIAL_ACCOUNT)
 
 def get_trial_status(user_id: int) -> Optional[Dict]:
     """Get user's trial status"""
-    trials = _load_json(TRIALS_DB)
-    user_key = str(user_id)
-    
-    if user_key not in trials:
-        return None
-    
-    return trials[user_key]
-
+    trial = get_entitlements().record("trials", user_id)
+    if trial is not None:
+        trial["images_remaining"] = get_ledger().balance(user_id, TRIAL_ACCOUNT)
+    return trial
@@ -2,15 +2,20 @@
 Strategic upsell prompts and messaging for Luna Noir bot.
 """
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-from typing import Tuple
+from typing import Tuple, TYPE_CHECKING
+
+# telegram is imported inside each keyboard builder so that importing
+# src.payment (e.g. from the Stripe webhook) does not load it
+if TYPE_CHECKING:
+    from telegram import InlineKeyboardMarkup
 
 # ============================================================================
 # UPSELL MESSAGES
 # ============================================================================
 
-def get_image_limit_reached_message(plan: str) -> Tuple[str, InlineKeyboardMarkup]:
+def get_image_limit_reached_message(plan: str) -> Tuple[str, "InlineKeyboardMarkup"]:
     """Message when user hits image generation limit"""
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
     
     if plan == "basic":
         msg = (
@@ -55,8 +60,9 @@ def get_image_limit_reached_message(plan: str) -> Tuple[str, InlineKeyboardMarku
     return msg, InlineKeyboardMarkup(keyboard)
 
 
-def get_free_trial_offer_message() -> Tuple[str, InlineKeyboardMarkup]:
+def get_free_trial_offer_message() -> Tuple[str, "InlineKeyboardMarkup"]:
     """Offer free trial to new users"""
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
     
     msg = (
         "🎁 *Welcome to Luna Noir\\!*\n\n"
@@ -78,8 +84,9 @@ def get_free_trial_offer_message() -> Tuple[str, InlineKeyboardMarkup]:
     return msg, InlineKeyboardMarkup(keyboard)
 
 
-def get_nsfw_mode_upsell_message() -> Tuple[str, InlineKeyboardMarkup]:
+def get_nsfw_mode_upsell_message() -> Tuple[str, "InlineKeyboardMarkup"]:
     """Upsell when user tries to access NSFW mode"""
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
     
     msg = (
         "🔒 *NSFW Mode Locked*\n\n"
@@ -101,8 +108,9 @@ def get_nsfw_mode_upsell_message() -> Tuple[str, InlineKeyboardMarkup]:
     return msg, InlineKeyboardMarkup(keyboard)
 
 
-def get_voice_upsell_message() -> Tuple[str, InlineKeyboardMarkup]:
+def get_voice_upsell_message() -> Tuple[str, "InlineKeyboardMarkup"]:
     """Upsell when user tries voice messages"""
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
     
     msg = (
         "🔒 *Voice Messages Locked*\n\n"
@@ -124,8 +132,9 @@ def get_voice_upsell_message() -> Tuple[str, InlineKeyboardMarkup]:
     return msg, InlineKeyboardMarkup(keyboard)
 
 
-def get_plans_comparison_message() -> Tuple[str, InlineKeyboardMarkup]:
+def get_plans_comparison_message() -> Tuple[str, "InlineKeyboardMarkup"]:
     """Show all premium plans comparison"""
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
     
     msg = (
         "💎 *Premium Plans*\n\n"
@@ -167,8 +176,9 @@ def get_plans_comparison_message() -> Tuple[str, InlineKeyboardMarkup]:
     return msg, InlineKeyboardMarkup(keyboard)
 
 
-def get_credits_shop_message() -> Tuple[str, InlineKeyboardMarkup]:
+def get_credits_shop_message() -> Tuple[str, "InlineKeyboardMarkup"]:
     """Show credit packs for purchase"""
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
     
     msg = (
         "🎫 *Buy Image Credits*\n\n"
@@ -216,8 +226,9 @@ def get_after_image_upsell_message(images_remaining: int, plan: str) -> str:
         return "💜 Image generated\\! Enjoying Luna? Upgrade for unlimited images\\!"
 
 
-def get_conversation_limit_message() -> Tuple[str, InlineKeyboardMarkup]:
+def get_conversation_limit_message() -> Tuple[str, "InlineKeyboardMarkup"]:
     """Message when free user hits conversation limit"""
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
     
     msg = (
         "💬 *Conversation Limit Reached*\n\n"
@@ -0,0 +1,316 @@
+"""
+Stripe Event Journal
+Durable, de-duplicated record of verified Stripe webhook events plus the
+background applier that turns them into entitlements.
+
+The webhook handler only verifies the signature and inserts the raw
+event (keyed by Stripe event id, so redeliveries are ignored), then
+acknowledges. EventApplier applies pending events in arrival order on
+its own thread, woken by each webhook delivery and otherwise every
+STRIPE_APPLY_POLL_S (which retries failures and picks up events another
+worker journaled); failures are retried up to STRIPE_APPLY_RETRIES times
+and then parked as "failed" for scripts/stripe_replay.py. Because the
+journal keeps every payload, state can be rebuilt from it at any time.
+
+Environment Variables:
+    STRIPE_JOURNAL_DB - SQLite journal path (default: data/stripe_events.db)
+    STRIPE_APPLY_RETRIES - Attempts before an event is parked (default: 5)
+    STRIPE_RETRY_DELAY_S - Pause after a failed attempt (default: 2)
+    STRIPE_APPLY_POLL_S - Seconds between applier passes without a wake-up (default: 30)
+    STRIPE_APPLY_LEASE_S - Seconds a claimed batch is held before another worker may take it (default: 300)
+"""
+
+import os
+import json
+import time
+import atexit
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_DB = Path(os.getenv("STRIPE_JOURNAL_DB", "data/stripe_events.db"))
+APPLY_RETRIES = int(os.getenv("STRIPE_APPLY_RETRIES", "5"))
+RETRY_DELAY_S = float(os.getenv("STRIPE_RETRY_DELAY_S", "2"))
+POLL_S = float(os.getenv("STRIPE_APPLY_POLL_S", "30"))
+LEASE_S = int(os.getenv("STRIPE_APPLY_LEASE_S", "300"))
+
+PENDING = "pending"
+APPLYING = "applying"  # claimed by one worker's applier until lease_until
+APPLIED = "applied"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stripe_events (
+  seq INTEGER PRIMARY KEY AUTOINCREMENT,
+  id TEXT NOT NULL UNIQUE,
+  type TEXT NOT NULL,
+  created INTEGER,
+  received_at INTEGER NOT NULL,
+  payload TEXT NOT NULL,
+  status TEXT NOT NULL DEFAULT 'pending',
+  attempts INTEGER NOT NULL DEFAULT 0,
+  applied_at INTEGER,
+  error TEXT,
+  lease_until INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_stripe_events_status ON stripe_events(status, seq);
+"""
+
+
+class EventJournal:
+    """SQLite table of webhook events keyed by Stripe event id"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")  # an acknowledged event must survive a crash
+            conn.executescript(SCHEMA)
+            if "lease_until" not in {row[1] for row in conn.execute("PRAGMA table_info(stripe_events)")}:
+                conn.execute("ALTER TABLE stripe_events ADD COLUMN lease_until INTEGER")
+            self._conn = conn
+        return self._conn
+
+    def record(self, event_id: str, event_type: str, created: Optional[int], payload: str) -> bool:
+        """
+        Store a verified event
+
+        Returns:
+            bool: False if the event id was already journaled (redelivery)
+        """
+        with self._lock:
+            cur = self._connect().execute(
+                "INSERT OR IGNORE INTO stripe_events (id, type, created, received_at, payload) VALUES (?,?,?,?,?)",
+                (event_id, event_type, created, int(time.time()), payload),
+            )
+            return cur.rowcount == 1
+
+    def pending(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Oldest pending events"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT seq, id, type, payload, attempts FROM stripe_events WHERE status=? ORDER BY seq LIMIT ?",
+                (PENDING, limit),
+            ).fetchall()
+        return [{"seq": s, "id": i, "type": t, "event": json.loads(p), "attempts": a} for s, i, t, p, a in rows]
+
+    def claim(self, limit: int = 100, lease_s: int = LEASE_S) -> List[Dict[str, Any]]:
+        """
+        Take the oldest pending events for this process, leased for `lease_s`
+
+        Nothing is claimed while another process holds an unexpired lease,
+        so events are applied in order by one worker at a time; a lease
+        left by a worker that died is taken over once it expires.
+        """
+        now = int(time.time())
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                busy = conn.execute("SELECT 1 FROM stripe_events WHERE status=? AND lease_until>? LIMIT 1",
+                                    (APPLYING, now)).fetchone()
+                rows = [] if busy else conn.execute(
+                    "SELECT seq, id, type, payload, attempts FROM stripe_events WHERE status IN (?,?) "
+                    "ORDER BY seq LIMIT ?", (PENDING, APPLYING, limit)).fetchall()
+                conn.executemany("UPDATE stripe_events SET status=?, lease_until=? WHERE seq=?",
+                                 [(APPLYING, now + lease_s, r[0]) for r in rows])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return [{"seq": s, "id": i, "type": t, "event": json.loads(p), "attempts": a} for s, i, t, p, a in rows]
+
+    def unclaim(self, event_ids: List[str]):
+        """Return claimed events that were not attempted to pending"""
+        with self._lock:
+            self._connect().executemany("UPDATE stripe_events SET status=? WHERE id=? AND status=?",
+                                        [(PENDING, i, APPLYING) for i in event_ids])
+
+    def mark_applied(self, event_id: str):
+        with self._lock:
+            self._connect().execute(
+                "UPDATE stripe_events SET status=?, attempts=attempts+1, applied_at=?, error=NULL WHERE id=?",
+                (APPLIED, int(time.time()), event_id),
+            )
+
+    def mark_failed(self, event_id: str, error: str, retries: int = APPLY_RETRIES) -> bool:
+        """Count a failed attempt; returns True once the event is parked as failed"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "UPDATE stripe_events SET attempts=attempts+1, error=?, "
+                "status=CASE WHEN attempts+1>=? THEN ? ELSE ? END WHERE id=?",
+                (error[:500], retries, FAILED, PENDING, event_id),
+            )
+            row = conn.execute("SELECT status FROM stripe_events WHERE id=?", (event_id,)).fetchone()
+        return row is not None and row[0] == FAILED
+
+    def requeue(self, status: str = FAILED, event_ids: Optional[List[str]] = None) -> int:
+        """Move events back to pending (all with `status`, or the given ids)"""
+        with self._lock:
+            conn = self._connect()
+            if event_ids:
+                marks = ",".join("?" * len(event_ids))
+                cur = conn.execute(f"UPDATE stripe_events SET status=?, attempts=0 WHERE id IN ({marks})",
+                                   (PENDING, *event_ids))
+            else:
+                cur = conn.execute("UPDATE stripe_events SET status=?, attempts=0 WHERE status=?", (PENDING, status))
+            return cur.rowcount
+
+    def events(self, since_seq: int = 0, status: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Journaled events in arrival order"""
+        sql = "SELECT seq, id, type, created, received_at, payload, status, attempts, error FROM stripe_events WHERE seq>?"
+        args: tuple = (since_seq,)
+        if status:
+            sql += " AND status=?"
+            args += (status,)
+        with self._lock:
+            rows = self._connect().execute(sql + " ORDER BY seq", args).fetchall()
+        for seq, eid, etype, created, received, payload, st, attempts, error in rows:
+            yield {"seq": seq, "id": eid, "type": etype, "created": created, "received_at": received,
+                   "event": json.loads(payload), "status": st, "attempts": attempts, "error": error}
+
+    def stats(self) -> Dict[str, int]:
+        """Event counts by status"""
+        with self._lock:
+            rows = self._connect().execute("SELECT status, COUNT(*) FROM stripe_events GROUP BY status").fetchall()
+        counts = {PENDING: 0, APPLIED: 0, FAILED: 0}
+        counts.update(dict(rows))
+        counts[PENDING] += counts.pop(APPLYING, 0)  # claimed, not applied yet
+        return counts
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class EventApplier:
+    """
+    Background thread applying pending journal events in order
+
+    `apply(event)` receives the parsed Stripe event dict and must raise on
+    failure; it may run more than once for an event (a crash between
+    applying and marking), so it has to be idempotent.
+    """
+
+    def __init__(self, journal: EventJournal, apply: Callable[[Dict[str, Any]], None],
+                 retries: int = APPLY_RETRIES, retry_delay: float = RETRY_DELAY_S, poll_interval: float = POLL_S):
+        self.journal = journal
+        self._apply = apply
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._run_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+        self.applied = 0
+        self.failures = 0
+
+    def apply_pending(self) -> int:
+        """
+        Apply pending events in order, stopping at the first failure so
+        later events never overtake an earlier one for the same customer
+
+        Events are claimed in batches (see EventJournal.claim), so with an
+        applier in every worker each event is applied by one of them.
+
+        Returns:
+            int: Events applied
+        """
+        done = 0
+        with self._run_lock:
+            while True:
+                batch = self.journal.claim()
+                if not batch:
+                    return done
+                for n, item in enumerate(batch):
+                    try:
+                        self._apply(item["event"])
+                    except Exception as e:
+                        self.failures += 1
+                        parked = self.journal.mark_failed(item["id"], str(e), self.retries)
+                        logger.error(f"Applying Stripe event {item['id']} ({item['type']}) failed"
+                                     f"{' - parked' if parked else ''}: {e}")
+                        if not parked:
+                            self.journal.unclaim([later["id"] for later in batch[n + 1:]])
+                            return done
+                        continue
+                    self.journal.mark_applied(item["id"])
+                    self.applied += 1
+                    done += 1
+
+    def wake(self):
+        """Signal that new events were journaled"""
+        self._ensure_thread()
+        self._wake.set()
+
+    def _ensure_thread(self):
+        if self._thread is not None or self._closed:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="stripe-applier", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if self._closed:
+                return
+            try:
+                self.apply_pending()
+            except Exception:
+                logger.exception("Stripe applier pass failed")
+                continue
+            if self.journal.stats()[PENDING]:
+                # A failed attempt left work behind: retry after a pause
+                time.sleep(self.retry_delay)
+                self._wake.set()
+
+    def close(self):
+        """Apply what is pending and stop the thread"""
+        self._closed = True
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        try:
+            self.apply_pending()
+        except Exception as e:
+            logger.error(f"Final Stripe event apply failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Applier counters plus journal counts"""
+        return {"applied": self.applied, "failures": self.failures, **self.journal.stats()}
+
+
+_journal: Optional[EventJournal] = None
+_journal_lock = threading.Lock()
+
+
+def get_journal() -> EventJournal:
+    """Process-wide journal at STRIPE_JOURNAL_DB"""
+    global _journal
+    if _journal is None:
+        with _journal_lock:
+            if _journal is None:
+                _journal = EventJournal(JOURNAL_DB)
+    return _journal
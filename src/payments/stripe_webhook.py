@@ -1,23 +1,32 @@
-import os, json, stripe
+"""
+Stripe Webhook
+Ack-first handler: the request only verifies the signature and journals
+the raw event (see journal.py), then returns. Entitlement updates run on
+the journal's background applier (started with the server, see
+src/server/app.py), and redelivered events are not journaled twice.
+
+Environment Variables:
+    STRIPE_WEBHOOK_SECRET - Endpoint signing secret
+"""
+
+import os, json, threading
 from pathlib import Path
 from flask import Blueprint, request, jsonify
-from src.metrics import db as metrics
 
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+# stripe, the journal and the metrics DB are imported on the first webhook, not at server start
 ENDPOINT_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 
 bp = Blueprint("stripe_webhook", __name__)
 DB_PATH = Path("data/users.json")
 
 def _load_db():
+    from src.payment import membership
     if not DB_PATH.exists():
         DB_PATH.parent.mkdir(parents=True, exist_ok=True)
         DB_PATH.write_text(json.dumps({
-            "premium_users": [],
-            "free_users": [],
+            **membership.empty(),
             "modes": {},
             "voice": {},
-            "tiers": {},
             "xp": {},
             "bond": {}
         }, indent=2))
@@ -27,50 +36,86 @@ def _load_db():
         data["modes"] = {}
     if "voice" not in data:
         data["voice"] = {}
-    if "tiers" not in data:
-        data["tiers"] = {}
     if "xp" not in data:
         data["xp"] = {}
     if "bond" not in data:
         data["bond"] = {}
+    membership.migrate(data)  # saved with the next change
     return data
 
 def _save_db(data):
+    from src.payment.entitlements import notify_write
     DB_PATH.write_text(json.dumps(data, indent=2))
+    notify_write(DB_PATH, data)
+
+def _grant_premium(session, log_metrics: bool = True):
+    """checkout.session.completed: mark the Telegram user premium (idempotent)"""
+    from src.payment import membership
+    telegram_id = str(session.get("metadata", {}).get("telegram_user_id", "")).strip()
+    tier = session.get("metadata", {}).get("tier", "")  # BRONZE, SILVER, GOLD
+    if not telegram_id:
+        return
+
+    db = _load_db()
+    if not membership.grant(db, telegram_id, tier):
+        return  # already applied (redelivered or replayed)
+    # Preserve existing mode or default to SAFE
+    if telegram_id not in db["modes"]:
+        db["modes"][telegram_id] = db["modes"].get(telegram_id, "SAFE")
+
+    _save_db(db)
+
+    if log_metrics:
+        from src.metrics import db as metrics
+        # Log payment event (amount_cents=0 if not available in webhook)
+        amount_cents = session.get("amount_total", 0)  # Stripe amount is in cents
+        currency = session.get("currency", "usd")
+        metrics.log_payment(telegram_id, amount_cents, currency)
+
+# event type -> handler(data.object, log_metrics)
+HANDLERS = {
+    "checkout.session.completed": _grant_premium,
+}
+
+def apply_event(event, log_metrics: bool = True):
+    """Apply one journaled Stripe event; unknown types are a no-op"""
+    handler = HANDLERS.get(event.get("type"))
+    if handler is not None:
+        handler(event["data"]["object"], log_metrics)
+
+_applier = None
+_applier_lock = threading.Lock()
+
+def get_applier():
+    """Process-wide applier; picks up events journaled before a restart"""
+    global _applier
+    if _applier is None:
+        with _applier_lock:
+            if _applier is None:
+                from src.payments.journal import EventApplier, get_journal
+                _applier = EventApplier(get_journal(), apply_event)
+                _applier.wake()
+    return _applier
 
 @bp.route("/stripe/webhook", methods=["POST"])
 def stripe_webhook():
+    import stripe
+    from src.payments.journal import get_journal
+
     payload = request.get_data()
     sig_header = request.headers.get("Stripe-Signature", "")
     try:
-        event = stripe.Webhook.construct_event(payload, sig_header, ENDPOINT_SECRET)
+        # Verify and parse only; building StripeObjects is left to the applier's handlers
+        stripe.WebhookSignature.verify_header(payload.decode("utf-8"), sig_header, ENDPOINT_SECRET,
+                                              stripe.Webhook.DEFAULT_TOLERANCE)
+        event = json.loads(payload)
+        event_id, event_type = event["id"], event["type"]
     except (ValueError, stripe.error.SignatureVerificationError) as e:
         return jsonify({"ok": False, "error": str(e)}), 400
+    except (KeyError, TypeError):
+        return jsonify({"ok": False, "error": "event id or type missing"}), 400
 
-    if event["type"] == "checkout.session.completed":
-        session = event["data"]["object"]
-        telegram_id = str(session.get("metadata", {}).get("telegram_user_id", "")).strip()
-        tier = session.get("metadata", {}).get("tier", "")  # BRONZE, SILVER, GOLD
-
-        if telegram_id:
-            db = _load_db()
-            if telegram_id not in db["premium_users"]:
-                db["premium_users"].append(telegram_id)
-                if telegram_id in db.get("free_users", []):
-                    db["free_users"].remove(telegram_id)
-                # Preserve existing mode or default to SAFE
-                if telegram_id not in db["modes"]:
-                    db["modes"][telegram_id] = db["modes"].get(telegram_id, "SAFE")
-
-                # Store tier if provided
-                if tier:
-                    db["tiers"][telegram_id] = tier
-
-                _save_db(db)
-
-                # Log payment event (amount_cents=0 if not available in webhook)
-                amount_cents = session.get("amount_total", 0)  # Stripe amount is in cents
-                currency = session.get("currency", "usd")
-                metrics.log_payment(telegram_id, amount_cents, currency)
-
-    return jsonify({"ok": True})
+    new = get_journal().record(event_id, event_type, event.get("created"), payload.decode("utf-8"))
+    # Wake on redeliveries too: Stripe retries when a pending event has not been applied yet
+    get_applier().wake()
+    return jsonify({"ok": True, "duplicate": not new})
@@ -3,7 +3,7 @@
 Luna Noir – AI GFE Telegram Bot
 Flask webhook server for Telegram bot with python-telegram-bot integration
 """
-import os, sys, logging, asyncio
+import os, sys, logging
 from dotenv import load_dotenv
 from flask import Flask, request, jsonify
 
@@ -12,7 +12,8 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 load_dotenv()
 
 from src.core.bot import create_bot
-from src.payments.stripe_webhook import bp as stripe_bp
+from src.payments.stripe_webhook import bp as stripe_bp, get_applier
+from src.utils import loop_thread
 
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN") or os.getenv("TELEGRAM_BOT_TOKEN")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -29,14 +30,29 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.register_blueprint(stripe_bp)
 
+# Apply Stripe events journaled before a restart (and retry failed ones) without waiting for a webhook
+get_applier()
+
 # Initialize bot application
 bot_app = None
 if TELEGRAM_TOKEN:
     bot_app = create_bot(TELEGRAM_TOKEN)
+    # Updates run on one long-lived loop so tasks they start (image jobs) survive the request
+    loop_thread.run(bot_app.initialize())
     logger.info("Bot initialized with Luna Noir Persona")
 else:
     logger.error("TELEGRAM_TOKEN not found in environment")
 
+# Subscription expiries, monthly image resets and trial-ending notices
+if os.getenv("BILLING_SCHEDULER_ENABLED", "true").lower() == "true":
+    from src.payment.scheduler import get_scheduler
+    get_scheduler().start()
+
+# Optional off-peak pre-generation of popular menu images (one worker renders, see warmer.py)
+if os.getenv("IMAGE_WARMER_ENABLED", "false").lower() == "true":
+    from src.image.warmer import start_scheduler
+    start_scheduler()
+
 
 @app.route('/')
 def index():
@@ -107,14 +123,8 @@ def webhook():
         # Create Update object from webhook data
         update = Update.de_json(data, bot_app.bot)
 
-        # Process the update asynchronously
-        async def process():
-            await bot_app.initialize()
-            await bot_app.process_update(update)
-            await bot_app.shutdown()
-
-        # Run the async function
-        asyncio.run(process())
+        # Process the update on the shared event loop
+        loop_thread.run(bot_app.process_update(update))
 
         logger.info(f"✓ Processed update successfully")
 
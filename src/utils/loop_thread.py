@@ -0,0 +1,41 @@
+"""
+Background Event Loop
+One long-lived asyncio loop on a daemon thread, shared by the web
+workers' Telegram update processing and the work it schedules (image
+jobs, TTS sessions).
+
+Flask handlers are synchronous; running each update under asyncio.run
+tore its loop down as soon as the handler returned, cancelling any task
+the handler had started. Submitting to this loop instead keeps those
+tasks (and connection pools bound to the loop) alive between updates.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Optional
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """The shared loop, started on first use"""
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="event-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def submit(coro: Awaitable[Any]) -> Future:
+    """Schedule a coroutine on the shared loop from any thread"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """Run a coroutine on the shared loop and wait for its result (not from the loop itself)"""
+    return submit(coro).result(timeout)
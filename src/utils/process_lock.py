@@ -0,0 +1,50 @@
+"""
+Process Locks
+Elect one process (e.g. one gunicorn worker) to run a background job.
+
+The lock is an flock on a file that stays open for the life of the
+process, so the kernel releases it when the holder exits or crashes and
+another worker can take over on its next attempt.
+"""
+
+import os
+import threading
+from pathlib import Path
+from typing import Dict
+
+_held: Dict[str, int] = {}
+_lock = threading.Lock()
+
+
+def acquire(name: str, directory: Path = Path("data")) -> bool:
+    """
+    Try to become the process that runs `name`
+
+    Returns:
+        bool: True if this process holds the lock (also on repeated calls)
+    """
+    import fcntl
+    with _lock:
+        if name in _held:
+            return True
+        directory.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(directory / f".{name}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        _held[name] = fd
+        return True
+
+
+def release(name: str):
+    """Give up `name` (normally the lock is held until exit)"""
+    import fcntl
+    with _lock:
+        fd = _held.pop(name, None)
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
@@ -0,0 +1,225 @@
+"""
+Voice Note Transcoding
+Turns ElevenLabs MP3 into the OGG/Opus voice notes Telegram expects.
+
+sendVoice only renders a proper voice bubble (waveform, playback speed)
+for OGG/Opus; MP3 uploads are re-processed or shown inconsistently. The
+MP3 is decoded to 48 kHz mono PCM with ffmpeg, which also yields the
+duration and Telegram's 5-bit waveform, then encoded to low-bitrate Opus
+with opusenc (if installed) or ffmpeg's libopus. Encoders run as
+subprocesses from a small thread pool, so the event loop only awaits.
+
+Without ffmpeg the MP3 is passed through unchanged.
+
+Environment Variables:
+    VOICE_FFMPEG - ffmpeg binary (default: ffmpeg on PATH)
+    VOICE_OPUS_BITRATE_KBPS - Opus bitrate; speech is transparent from ~24 (default: 32)
+    VOICE_TRANSCODE_WORKERS - Concurrent encoder subprocesses (default: 2)
+"""
+
+import os
+import time
+import shutil
+import struct
+import asyncio
+import logging
+import threading
+import subprocess
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+FFMPEG = os.getenv("VOICE_FFMPEG", "ffmpeg")
+OPUS_BITRATE_KBPS = int(os.getenv("VOICE_OPUS_BITRATE_KBPS", "32"))
+TRANSCODE_WORKERS = int(os.getenv("VOICE_TRANSCODE_WORKERS", "2"))
+TRANSCODE_TIMEOUT = 30  # seconds per subprocess
+
+SAMPLE_RATE = 48000  # Opus native rate
+WAVEFORM_POINTS = 100  # what Telegram clients draw
+
+OGG_MIME = "audio/ogg"
+MP3_MIME = "audio/mpeg"
+
+_PACK_MAGIC = b"VN1"
+
+
+class VoiceNote(NamedTuple):
+    """Upload-ready voice audio with the metadata Telegram shows"""
+    audio: bytes
+    mime: str
+    duration: Optional[float] = None  # seconds
+    waveform: Optional[bytes] = None  # 5-bit packed, see pack_waveform
+
+    @property
+    def filename(self) -> str:
+        return "luna.ogg" if self.mime == OGG_MIME else "luna.mp3"
+
+    @property
+    def duration_s(self) -> Optional[int]:
+        """Whole seconds, rounded up, as sendVoice takes it"""
+        return None if self.duration is None else max(1, int(-(-self.duration // 1)))
+
+    def pack(self) -> bytes:
+        """Serialize for the disk cache"""
+        waveform = self.waveform or b""
+        mime = self.mime.encode()
+        return (_PACK_MAGIC + struct.pack("<dBB", self.duration or -1.0, len(mime), len(waveform))
+                + mime + waveform + self.audio)
+
+    @classmethod
+    def unpack(cls, data: bytes) -> Optional["VoiceNote"]:
+        """Inverse of pack; None for data written by something else"""
+        if not data.startswith(_PACK_MAGIC):
+            return None
+        offset = len(_PACK_MAGIC)
+        duration, mime_len, wave_len = struct.unpack_from("<dBB", data, offset)
+        offset += struct.calcsize("<dBB")
+        mime = data[offset:offset + mime_len].decode()
+        offset += mime_len
+        waveform = data[offset:offset + wave_len] or None
+        return cls(data[offset + wave_len:], mime, None if duration < 0 else duration, waveform)
+
+
+def ffmpeg_path() -> Optional[str]:
+    """Resolved ffmpeg binary, or None if not installed"""
+    return shutil.which(FFMPEG)
+
+
+def opusenc_path() -> Optional[str]:
+    return shutil.which("opusenc")
+
+
+def available() -> bool:
+    """Whether MP3 can be transcoded here"""
+    return ffmpeg_path() is not None
+
+
+def _run(cmd: List[str], data: bytes) -> bytes:
+    result = subprocess.run(cmd, input=data, capture_output=True, timeout=TRANSCODE_TIMEOUT)
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, cmd[0], stderr=result.stderr[-500:])
+    return result.stdout
+
+
+def decode_pcm(audio: bytes) -> bytes:
+    """Decode any input ffmpeg understands to 48 kHz mono signed 16-bit PCM"""
+    return _run([ffmpeg_path(), "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+                 "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"], audio)
+
+
+def encode_opus(pcm: bytes, bitrate_kbps: int = OPUS_BITRATE_KBPS) -> bytes:
+    """Encode 48 kHz mono PCM to OGG/Opus tuned for speech"""
+    if opusenc_path():
+        cmd = [opusenc_path(), "--quiet", "--raw", "--raw-rate", str(SAMPLE_RATE), "--raw-chan", "1",
+               "--bitrate", str(bitrate_kbps), "--speech", "-", "-"]
+    else:
+        cmd = [ffmpeg_path(), "-hide_banner", "-loglevel", "error",
+               "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-i", "pipe:0",
+               "-c:a", "libopus", "-b:a", f"{bitrate_kbps}k", "-application", "voip",
+               "-f", "ogg", "pipe:1"]
+    return _run(cmd, pcm)
+
+
+def waveform_values(pcm: bytes, points: int = WAVEFORM_POINTS) -> List[int]:
+    """Peak level (0-31) of each of `points` equal slices of 16-bit PCM, scaled to the loudest"""
+    samples = array("h")
+    samples.frombytes(pcm[:len(pcm) - len(pcm) % 2])
+    if not samples:
+        return [0] * points
+    peaks = []
+    for i in range(points):
+        part = samples[i * len(samples) // points:(i + 1) * len(samples) // points]
+        peaks.append(max(max(part), -min(part)) if part else 0)
+    loudest = max(peaks) or 1
+    return [min(31, p * 31 // loudest) for p in peaks]
+
+
+def pack_waveform(values: List[int]) -> bytes:
+    """Pack 5-bit values LSB-first, the layout Telegram uses for voice waveforms"""
+    out = bytearray((len(values) * 5 + 7) // 8)
+    for i, value in enumerate(values):
+        pos = i * 5
+        value &= 31
+        out[pos // 8] |= (value << (pos % 8)) & 0xFF
+        if pos % 8 > 3:
+            out[pos // 8 + 1] |= value >> (8 - pos % 8)
+    return bytes(out)
+
+
+def transcode(mp3: bytes, bitrate_kbps: int = OPUS_BITRATE_KBPS) -> VoiceNote:
+    """
+    Transcode MP3 to an OGG/Opus voice note (blocking)
+
+    Raises:
+        OSError: If ffmpeg is missing or cannot be started
+        subprocess.SubprocessError: If an encoder fails or times out
+    """
+    if not available():
+        raise FileNotFoundError(f"{FFMPEG} not found")
+    start = time.perf_counter()
+    pcm = decode_pcm(mp3)
+    ogg = encode_opus(pcm, bitrate_kbps)
+    note = VoiceNote(ogg, OGG_MIME, len(pcm) / 2 / SAMPLE_RATE, pack_waveform(waveform_values(pcm)))
+    _record(len(mp3), len(ogg), time.perf_counter() - start)
+    return note
+
+
+# ----------------------------------------------------------------------
+# Worker pool
+# ----------------------------------------------------------------------
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {"transcoded": 0, "passthrough": 0, "failed": 0, "mp3_bytes": 0, "ogg_bytes": 0, "seconds": 0.0}
+
+
+def _record(mp3_bytes: int, ogg_bytes: int, seconds: float):
+    with _stats_lock:
+        _stats["transcoded"] += 1
+        _stats["mp3_bytes"] += mp3_bytes
+        _stats["ogg_bytes"] += ogg_bytes
+        _stats["seconds"] += seconds
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    # Threads only wait on the encoder subprocesses; the pool caps how many run at once
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=max(1, TRANSCODE_WORKERS), thread_name_prefix="voice-transcode")
+    return _pool
+
+
+async def transcode_async(mp3: bytes, bitrate_kbps: int = OPUS_BITRATE_KBPS) -> VoiceNote:
+    """
+    Transcode in the worker pool, falling back to the MP3 itself
+
+    Returns:
+        VoiceNote: OGG/Opus with duration and waveform, or the MP3 unchanged
+        if ffmpeg is unavailable or fails
+    """
+    if available():
+        try:
+            return await asyncio.get_running_loop().run_in_executor(_get_pool(), transcode, mp3, bitrate_kbps)
+        except (OSError, subprocess.SubprocessError) as e:
+            with _stats_lock:
+                _stats["failed"] += 1
+            logger.warning(f"Voice transcoding failed, sending MP3: {e}")
+    with _stats_lock:
+        _stats["passthrough"] += 1
+    return VoiceNote(mp3, MP3_MIME)
+
+
+def stats() -> Dict[str, Any]:
+    """Transcode counts and size reduction since process start"""
+    with _stats_lock:
+        s = dict(_stats)
+    s["available"] = available()
+    s["ratio"] = round(s["mp3_bytes"] / s["ogg_bytes"], 1) if s["ogg_bytes"] else 0.0
+    s["avg_ms"] = round(s["seconds"] / s["transcoded"] * 1000, 1) if s["transcoded"] else 0.0
+    return s
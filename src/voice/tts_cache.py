@@ -0,0 +1,253 @@
+"""
+TTS Audio Cache
+Disk-backed cache for synthesized voice replies.
+
+Greetings, fallback replies and short stock answers repeat constantly, so
+each synthesis is stored under the hash of (normalized text, voice, model,
+voice settings) and replayed instead of paying ElevenLabs again. Audio
+lives in the same size-capped LRU store as generated images.
+
+Phrase mode additionally caches individual sentences: a sentence seen
+often enough is synthesized on its own and stored, so a new reply that
+contains it is stitched together from cached and freshly synthesized
+segments.
+
+Transcoded voice notes (see transcode) are stored under the same key
+with their format appended.
+
+Environment Variables:
+    TTS_CACHE_DIR - Cache directory (default: data/tts_cache)
+    TTS_CACHE_MAX_MB - Size cap before LRU eviction; 0 disables the cache (default: 256)
+    TTS_PHRASE_CACHE - Cache common sentences and stitch replies from them (default: true)
+    TTS_PHRASE_MIN_SEEN - Times a sentence must appear before it is cached on its own (default: 2)
+    TTS_PHRASE_MAX_CHARS - Longest sentence cached on its own (default: 120)
+    TTS_STATS_FLUSH_S - Seconds usage counters are kept in memory before stats.json is updated (default: 30)
+"""
+
+import os
+import json
+import atexit
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.image.cache import ImageCache
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.getenv("TTS_CACHE_DIR", "data/tts_cache")
+CACHE_MAX_MB = float(os.getenv("TTS_CACHE_MAX_MB", "256"))
+PHRASE_CACHE = os.getenv("TTS_PHRASE_CACHE", "true").lower() == "true"
+PHRASE_MIN_SEEN = int(os.getenv("TTS_PHRASE_MIN_SEEN", "2"))
+PHRASE_MAX_CHARS = int(os.getenv("TTS_PHRASE_MAX_CHARS", "120"))
+STATS_FLUSH_S = float(os.getenv("TTS_STATS_FLUSH_S", "30"))
+
+STATS_DAYS = 30  # daily counters kept
+_SEEN_MAX = 20000  # sentences whose frequency is tracked
+_COUNTERS = ("replies", "hits", "phrase_hits", "chars", "chars_saved")
+
+# Typographic variants the LLM emits interchangeably; they sound the same
+_PUNCT = str.maketrans({"‘": "'", "’": "'", "“": '"', "”": '"', "–": "-", "—": "-"})
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form of a TTS input: NFKC, plain quotes/dashes, single spaces"""
+    return " ".join(unicodedata.normalize("NFKC", text).translate(_PUNCT).split())
+
+
+def cache_key(text: str, voice_id: str, model_id: str, settings: Dict[str, Any], fmt: str = "mp3") -> str:
+    """Cache key for one synthesis request (`fmt` tells API MP3 from derived encodings)"""
+    parts = [normalize_text(text), voice_id, model_id, settings]
+    if fmt != "mp3":
+        parts.append(fmt)
+    return json.dumps(parts, sort_keys=True, ensure_ascii=False)
+
+
+class TTSCache:
+    """
+    Synthesized audio by (text, voice, model, settings), with usage counters
+
+    Entries go through ImageCache (sharded files, atomic writes, LRU by
+    mtime with a byte cap). Daily hit/character counters are kept in
+    `stats.json` next to the entries so savings survive restarts; replies
+    only bump in-memory deltas, which a timer thread adds to the file every
+    `stats_flush_s` (and at exit), so no voice reply waits on a file write.
+    """
+
+    def __init__(self, root: str, max_bytes: int, phrases: bool = PHRASE_CACHE,
+                 phrase_min_seen: int = PHRASE_MIN_SEEN, phrase_max_chars: int = PHRASE_MAX_CHARS,
+                 stats_flush_s: float = STATS_FLUSH_S):
+        self.root = Path(root)
+        self.store = ImageCache(root, max_bytes)
+        self.phrases = phrases
+        self.phrase_min_seen = phrase_min_seen
+        self.phrase_max_chars = phrase_max_chars
+        self._lock = threading.Lock()
+        self._seen: "OrderedDict[str, int]" = OrderedDict()
+        self.stats_flush_s = stats_flush_s
+        self._pending: Dict[str, Dict[str, int]] = {}  # day -> counter deltas not yet in stats.json
+        self._timer: Optional[threading.Timer] = None
+        self._atexit = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.store.enabled
+
+    def get(self, text: str, voice_id: str, model_id: str, settings: Dict[str, Any],
+            fmt: str = "mp3") -> Optional[bytes]:
+        """Cached audio for a text, or None"""
+        return self.store.get(cache_key(text, voice_id, model_id, settings, fmt))
+
+    def put(self, text: str, voice_id: str, model_id: str, settings: Dict[str, Any], audio: bytes,
+            fmt: str = "mp3"):
+        """Store synthesized (or transcoded) audio"""
+        self.store.put(cache_key(text, voice_id, model_id, settings, fmt), audio)
+
+    def is_common(self, text: str) -> bool:
+        """
+        Count an uncached sentence and report whether it is worth caching alone
+
+        A sentence qualifies once it has been seen `phrase_min_seen` times
+        and is at most `phrase_max_chars` long.
+        """
+        text = normalize_text(text)
+        if not self.phrases or len(text) > self.phrase_max_chars:
+            return False
+        with self._lock:
+            seen = self._seen.pop(text, 0) + 1
+            self._seen[text] = seen
+            if len(self._seen) > _SEEN_MAX:
+                self._seen.popitem(last=False)
+        return seen >= self.phrase_min_seen
+
+    # ------------------------------------------------------------------
+    # Usage accounting
+    # ------------------------------------------------------------------
+
+    def _stats_path(self) -> Path:
+        return self.root / "stats.json"
+
+    def _read_daily(self) -> Dict[str, Dict[str, int]]:
+        try:
+            return json.loads(self._stats_path().read_text())
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable TTS cache stats {self._stats_path()}: {e}")
+            return {}
+
+    @staticmethod
+    def _add(daily: Dict[str, Dict[str, int]], deltas: Dict[str, Dict[str, int]]):
+        for day, counts in deltas.items():
+            d = daily.setdefault(day, dict.fromkeys(_COUNTERS, 0))
+            for name, n in counts.items():
+                d[name] = d.get(name, 0) + n
+
+    def record(self, chars: int, synthesized: int, hit: bool = False, phrase_hits: int = 0):
+        """
+        Account for one voice reply (in memory; see flush)
+
+        Args:
+            chars: Characters in the reply
+            synthesized: Characters actually sent to the API
+            hit: The whole reply was served from the cache
+            phrase_hits: Sentences served from the cache
+        """
+        if not self.enabled:
+            return
+        today = date.today().isoformat()
+        with self._lock:
+            self._add(self._pending, {today: {"replies": 1, "hits": int(hit), "phrase_hits": phrase_hits,
+                                              "chars": chars, "chars_saved": chars - synthesized}})
+            if self._timer is None:
+                self._timer = threading.Timer(self.stats_flush_s, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+            if not self._atexit:
+                self._atexit = True
+                atexit.register(self.flush)
+
+    def flush(self) -> bool:
+        """
+        Add the pending counters to stats.json
+
+        The file is re-read under an flock, so workers sharing the cache
+        directory add to each other's counts instead of overwriting them.
+
+        Returns:
+            bool: False if the write failed (the counters stay pending)
+        """
+        import fcntl
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return True
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(self.root / "stats.lock", "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                daily = self._read_daily()
+                self._add(daily, pending)
+                for old in sorted(daily)[:-STATS_DAYS]:
+                    del daily[old]
+                tmp = self._stats_path().with_suffix(f".{os.getpid()}.tmp")
+                tmp.write_text(json.dumps(daily))
+                tmp.replace(self._stats_path())
+        except OSError as e:
+            logger.warning(f"TTS cache stats write failed: {e}")
+            with self._lock:
+                self._add(self._pending, pending)
+            return False
+        return True
+
+    def daily_stats(self, days: int = 7) -> List[Dict[str, Any]]:
+        """Per-day hit rate and API characters saved, most recent first"""
+        daily = self._read_daily()
+        with self._lock:
+            self._add(daily, self._pending)
+        out = []
+        for offset in range(days):
+            day = (date.today() - timedelta(days=offset)).isoformat()
+            if day not in daily:
+                continue
+            d = daily[day]
+            out.append({
+                "date": day,
+                **d,
+                "hit_rate": round(d["hits"] / d["replies"] * 100, 1) if d["replies"] else 0.0,
+                "saved_pct": round(d["chars_saved"] / d["chars"] * 100, 1) if d["chars"] else 0.0,
+            })
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        """Today's counters plus store size"""
+        store = self.store.stats()
+        today = self.daily_stats(days=1)
+        return {
+            "enabled": self.enabled,
+            "entries": store["entries"],
+            "bytes": store["bytes"],
+            "evictions": store["evictions"],
+            "today": today[0] if today else None,
+        }
+
+
+_default: Optional[TTSCache] = None
+_default_lock = threading.Lock()
+
+
+def get_tts_cache() -> TTSCache:
+    """Process-wide cache configured from the environment"""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = TTSCache(CACHE_DIR, int(CACHE_MAX_MB * 1024 * 1024))
+    return _default
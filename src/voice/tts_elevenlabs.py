@@ -1,11 +1,28 @@
 """
 ElevenLabs Text-to-Speech Module
 Synthesizes audio from text using ElevenLabs API.
+
+synthesize_tts is a blocking one-shot call. Bot handlers use the async
+client (get_tts_client), which keeps a pooled HTTP session, reads the
+streaming endpoint and synthesizes long replies sentence-chunk by
+sentence-chunk in parallel, reusing cached audio (see tts_cache).
+synthesize_voice additionally transcodes to an OGG/Opus voice note.
+
+Environment Variables:
+    ELEVENLABS_API_KEY - API key (required)
+    ELEVENLABS_VOICE_ID - Default voice (default: Rachel)
+    TTS_CHUNK_CHARS - Target characters per parallel synthesis chunk (default: 150)
+    TTS_CONCURRENCY - Parallel chunk requests per reply (default: 4)
+    TTS_MAX_CONNECTIONS - Pooled connections to ElevenLabs (default: 16)
+    TTS_STREAMING_LATENCY - optimize_streaming_latency level 0-4 (default: 2)
 """
 
 import os
+import re
+import asyncio
 import requests
 import logging
+from typing import AsyncIterator, List, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +30,40 @@ logger = logging.getLogger(__name__)
 ELEVEN_API = "https://api.elevenlabs.io/v1/text-to-speech"
 API_KEY = os.getenv("ELEVENLABS_API_KEY")
 VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID", "Rachel")
+MODEL_ID = "eleven_turbo_v2_5"  # Newest model - more natural sounding
+VOICE_SETTINGS = {
+    "stability": 0.55,           # Lower = more natural variation (less robotic)
+    "similarity_boost": 0.75,    # Balanced for natural sound
+    "style": 0.65,               # Higher style = more expressive, less robotic
+    "use_speaker_boost": True    # Enhance voice clarity
+}
+MAX_TTS_CHARS = 1000  # Keep it short for latency
+
+TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS", "150"))
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "4"))
+TTS_MAX_CONNECTIONS = int(os.getenv("TTS_MAX_CONNECTIONS", "16"))
+TTS_STREAMING_LATENCY = int(os.getenv("TTS_STREAMING_LATENCY", "2"))
+TTS_TIMEOUT = 60  # seconds per request
+# Below this a chunk costs a request's time to first byte for very little audio
+MIN_CHUNK_CHARS = 40
+
+
+def _headers() -> dict:
+    return {
+        "xi-api-key": API_KEY,
+        "accept": "audio/mpeg",
+        "content-type": "application/json"
+    }
+
+
+def _payload(text: str, previous_text: Optional[str] = None, next_text: Optional[str] = None) -> dict:
+    payload = {"text": text, "voice_settings": VOICE_SETTINGS, "model_id": MODEL_ID}
+    # Neighbouring text keeps intonation continuous across separately synthesized chunks
+    if previous_text:
+        payload["previous_text"] = previous_text
+    if next_text:
+        payload["next_text"] = next_text
+    return payload
 
 
 def synthesize_tts(text: str, voice_id: str = None) -> bytes:
@@ -36,22 +87,9 @@ def synthesize_tts(text: str, voice_id: str = None) -> bytes:
     v = voice_id or VOICE_ID
     url = f"{ELEVEN_API}/{v}"
     
-    headers = {
-        "xi-api-key": API_KEY,
-        "accept": "audio/mpeg",
-        "content-type": "application/json"
-    }
+    headers = _headers()
     
-    payload = {
-        "text": text[:1000],  # Keep it short for latency
-        "voice_settings": {
-            "stability": 0.55,           # Lower = more natural variation (less robotic)
-            "similarity_boost": 0.75,    # Balanced for natural sound
-            "style": 0.65,               # Higher style = more expressive, less robotic
-            "use_speaker_boost": True    # Enhance voice clarity
-        },
-        "model_id": "eleven_turbo_v2_5"  # Newest model - more natural sounding
-    }
+    payload = _payload(text[:MAX_TTS_CHARS])
     
     logger.info(f"Synthesizing TTS for {len(text)} chars with voice {v}")
     
@@ -64,3 +102,303 @@ def synthesize_tts(text: str, voice_id: str = None) -> bytes:
         logger.error(f"TTS synthesis failed: {e}")
         raise
 
+
+
+# Sentence ends: terminal punctuation (plus closing quotes/brackets) before whitespace
+_SENTENCE_END = re.compile(r'(?<=[.!?\u2026])["\')\]]*\s+')
+
+
+def sentence_pieces(text: str, max_chars: int = TTS_CHUNK_CHARS) -> List[str]:
+    """Sentences of a text, with any sentence longer than `max_chars` cut at a comma or space"""
+    pieces: List[str] = []
+    for sentence in _SENTENCE_END.split(text.strip()):
+        sentence = sentence.strip()
+        while len(sentence) > max_chars:
+            cut = max(sentence.rfind(", ", 0, max_chars), sentence.rfind(" ", 0, max_chars))
+            cut = cut + 1 if cut > 0 else max_chars
+            pieces.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if sentence:
+            pieces.append(sentence)
+    return pieces
+
+
+def split_sentences(text: str, max_chars: int = TTS_CHUNK_CHARS, parts: int = 1) -> List[str]:
+    """
+    Split text into synthesis chunks at sentence boundaries
+
+    Consecutive sentences are packed into evenly sized chunks of at most
+    `max_chars` (so parallel jobs finish at about the same time); a single
+    longer sentence is split at the last comma or space before the limit.
+
+    Args:
+        text: Text to split
+        max_chars: Longest chunk
+        parts: Spread the text over at least this many chunks when it has
+            enough sentences (one per parallel request), keeping chunks
+            around MIN_CHUNK_CHARS or longer
+
+    Returns:
+        List of non-empty chunks whose concatenation (modulo whitespace) is the text
+    """
+    pieces = sentence_pieces(text, max_chars)
+    total = sum(len(p) + 1 for p in pieces)
+    count = max(-(-total // max_chars), min(parts, len(pieces), total // MIN_CHUNK_CHARS), 1)
+    # Cut where the running length is closest to each ideal boundary k * total / count
+    chunks: List[str] = []
+    current = ""
+    done = 0
+    for piece in pieces:
+        ideal = (len(chunks) + 1) * total / count
+        step = len(piece) + 1
+        if current and (len(current) + step > max_chars or abs(done + step - ideal) > abs(done - ideal)):
+            chunks.append(current)
+            current = ""
+        current = f"{current} {piece}" if current else piece
+        done += step
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _strip_id3(data: bytes) -> bytes:
+    """Drop a leading ID3v2 tag so MP3 chunks concatenate into one clean stream"""
+    if len(data) > 10 and data[:3] == b"ID3":
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        return data[10 + size:]
+    return data
+
+
+class AsyncTTSClient:
+    """
+    Async ElevenLabs client with a pooled keep-alive session
+
+    The aiohttp session is created lazily on the running event loop (and
+    re-created if a different loop uses the client, closing the old one on
+    its own loop if that is still running), so one client can be shared by
+    every handler. An optional TTSCache serves repeated replies and
+    sentences without calling the API.
+    """
+
+    def __init__(self, max_connections: int = TTS_MAX_CONNECTIONS, concurrency: int = TTS_CONCURRENCY,
+                 chunk_chars: int = TTS_CHUNK_CHARS, cache=None):
+        self.max_connections = max_connections
+        self.concurrency = max(1, concurrency)
+        self.chunk_chars = chunk_chars
+        self.cache = cache  # optional src.voice.tts_cache.TTSCache
+        self._session = None
+        self._loop = None
+
+        self.requests = 0
+        self.chars = 0
+
+    def _get_session(self):
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            if self._session is not None:
+                self._discard(self._session, self._loop)
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=TTS_TIMEOUT),
+                headers=_headers(),
+            )
+            self._loop = loop
+        return self._session
+
+    @staticmethod
+    def _discard(session, loop):
+        """Close a session left behind by another event loop"""
+        if session.closed:
+            return
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+        else:
+            # A stopped or closed loop cannot run close() (and we are inside another
+            # loop, so we must not drive it): drop the connections and detach
+            connector = session.connector
+            session.detach()
+            connector._close()
+
+    async def stream(self, text: str, voice_id: Optional[str] = None, previous_text: Optional[str] = None,
+                     next_text: Optional[str] = None) -> AsyncIterator[bytes]:
+        """
+        Yield MP3 bytes from the streaming endpoint as they arrive
+
+        Raises:
+            RuntimeError: If ELEVENLABS_API_KEY is not set
+            aiohttp.ClientResponseError: If the API request fails
+        """
+        if not API_KEY:
+            raise RuntimeError("ELEVENLABS_API_KEY missing in .env file")
+        v = voice_id or VOICE_ID
+        url = f"{ELEVEN_API}/{v}/stream"
+        params = {"optimize_streaming_latency": str(TTS_STREAMING_LATENCY)}
+        self.requests += 1
+        self.chars += len(text)
+        payload = _payload(text, previous_text, next_text)
+        async with self._get_session().post(url, params=params, json=payload) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(16384):
+                yield chunk
+
+    async def synthesize(self, text: str, voice_id: Optional[str] = None, previous_text: Optional[str] = None,
+                         next_text: Optional[str] = None) -> bytes:
+        """Synthesize one chunk of text (streamed, returned once complete)"""
+        parts = [chunk async for chunk in self.stream(text, voice_id, previous_text, next_text)]
+        return b"".join(parts)
+
+    async def synthesize_long(self, text: str, voice_id: Optional[str] = None, store: bool = True) -> bytes:
+        """
+        Synthesize a reply as parallel sentence chunks, concatenated in order
+
+        The text is spread over up to `concurrency` chunks of at most
+        `chunk_chars`, so total latency is roughly that of one chunk (about
+        a sentence) rather than the whole text. With a cache, a repeated
+        reply is served whole; in phrase mode cached sentences are stitched
+        in and only the rest is synthesized.
+
+        Args:
+            text: Reply text (truncated to MAX_TTS_CHARS)
+            voice_id: ElevenLabs voice ID (default: from env or "Rachel")
+            store: Cache the whole reply's MP3 (phrases are cached regardless)
+
+        Returns:
+            bytes: MP3 audio data
+        """
+        text = text[:MAX_TTS_CHARS].strip()
+        if not text:
+            raise ValueError("Nothing to synthesize")
+        v = voice_id or VOICE_ID
+        cache = self.cache if self.cache is not None and self.cache.enabled else None
+        if cache is None:
+            return await self._synthesize_segments([text], v, set())
+
+        audio = cache.get(text, v, MODEL_ID, VOICE_SETTINGS)
+        if audio is not None:
+            cache.record(len(text), 0, hit=True)
+            return audio
+
+        segments: List = [text]
+        common: set = set()
+        if cache.phrases:
+            # Cached sentences as bytes, sentences worth caching alone as
+            # separate segments, runs of everything else as text
+            segments = []
+            for piece in sentence_pieces(text, self.chunk_chars):
+                cached = cache.get(piece, v, MODEL_ID, VOICE_SETTINGS)
+                if cached is not None:
+                    segments.append(cached)
+                elif cache.is_common(piece):
+                    segments.append(piece)
+                    common.add(len(segments) - 1)
+                elif segments and isinstance(segments[-1], str) and len(segments) - 1 not in common:
+                    segments[-1] += " " + piece
+                else:
+                    segments.append(piece)
+
+        audio = await self._synthesize_segments(segments, v, common)
+        phrase_hits = sum(isinstance(s, bytes) for s in segments)
+        synthesized = sum(len(s) for s in segments if isinstance(s, str)) if phrase_hits else len(text)
+        if store:
+            cache.put(text, v, MODEL_ID, VOICE_SETTINGS, audio)
+        cache.record(len(text), synthesized, phrase_hits=phrase_hits)
+        return audio
+
+    async def synthesize_voice(self, text: str, voice_id: Optional[str] = None):
+        """
+        Synthesize a reply as a Telegram voice note (OGG/Opus)
+
+        The encoded note is cached under the reply text, so a repeated reply
+        skips both synthesis and transcoding. Without an encoder the MP3 is
+        returned as is.
+
+        Args:
+            text: Reply text (truncated to MAX_TTS_CHARS)
+            voice_id: ElevenLabs voice ID (default: from env or "Rachel")
+
+        Returns:
+            src.voice.transcode.VoiceNote
+        """
+        from src.voice import transcode
+
+        text = text[:MAX_TTS_CHARS].strip()
+        v = voice_id or VOICE_ID
+        cache = self.cache if self.cache is not None and self.cache.enabled else None
+        encode = transcode.available()
+        fmt = f"opus{transcode.OPUS_BITRATE_KBPS}"
+        if cache is not None and encode:
+            packed = cache.get(text, v, MODEL_ID, VOICE_SETTINGS, fmt=fmt)
+            note = transcode.VoiceNote.unpack(packed) if packed is not None else None
+            if note is not None:
+                cache.record(len(text), 0, hit=True)
+                return note
+
+        # With an encoder the Opus note is what gets cached, not the MP3
+        mp3 = await self.synthesize_long(text, v, store=not encode)
+        note = await transcode.transcode_async(mp3)
+        if cache is not None and note.mime == transcode.OGG_MIME:
+            cache.put(text, v, MODEL_ID, VOICE_SETTINGS, note.pack(), fmt=fmt)
+        return note
+
+    async def _synthesize_segments(self, segments: List, voice_id: str, common: set) -> bytes:
+        """
+        Join cached audio (bytes) with freshly synthesized text segments
+
+        Text segments are split into parallel sentence chunks; segments whose
+        index is in `common` are synthesized alone, without neighbouring
+        text, and stored in the phrase cache so they can be reused anywhere.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def one(chunk: str, previous_text: Optional[str], next_text: Optional[str]) -> bytes:
+            async with semaphore:
+                return await self.synthesize(chunk, voice_id, previous_text, next_text)
+
+        async def phrase(chunk: str) -> bytes:
+            audio = await one(chunk, None, None)
+            self.cache.put(chunk, voice_id, MODEL_ID, VOICE_SETTINGS, audio)
+            return audio
+
+        async def cached(audio: bytes) -> bytes:
+            return audio
+
+        jobs = []
+        for i, segment in enumerate(segments):
+            if isinstance(segment, bytes):
+                jobs.append(cached(segment))
+            elif i in common:
+                jobs.append(phrase(segment))
+            else:
+                before = segments[i - 1] if i > 0 and isinstance(segments[i - 1], str) else None
+                after = segments[i + 1] if i + 1 < len(segments) and isinstance(segments[i + 1], str) else None
+                chunks = split_sentences(segment, self.chunk_chars, parts=self.concurrency)
+                for j, chunk in enumerate(chunks):
+                    previous_text = chunks[j - 1] if j > 0 else before
+                    next_text = chunks[j + 1] if j + 1 < len(chunks) else after
+                    jobs.append(one(chunk, previous_text, next_text))
+
+        fresh = len(jobs) - sum(isinstance(s, bytes) for s in segments)
+        logger.info(f"Synthesizing TTS for {len(segments)} segments in {fresh} requests")
+        audio = await asyncio.gather(*jobs)
+        return audio[0] + b"".join(_strip_id3(a) for a in audio[1:])
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+_client: Optional[AsyncTTSClient] = None
+
+
+def get_tts_client() -> AsyncTTSClient:
+    """Process-wide async TTS client"""
+    global _client
+    if _client is None:
+        from src.voice.tts_cache import get_tts_cache
+
+        _client = AsyncTTSClient(cache=get_tts_cache())
+    return _client
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Test script for the billing scheduler
+Checks plan expiry and monthly resets, renewals moving queued jobs,
+trial notices and expiry, Telegram pacing/backoff, that a restarted
+scheduler works only the due part of a persisted queue in batches, and
+that workers sharing the queue never run a job twice.
+"""
+
+import sys
+import json
+import time
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.payment import entitlements, ledger, scheduler, test_mode, upsell
+from src.payment.entitlements import EntitlementService
+from src.payment.ledger import UsageLedger
+from src.payment.scheduler import BillingScheduler, TelegramNotifier
+
+DAY = 86400
+
+
+class FakeNotifier:
+    def __init__(self):
+        self.sent = []
+        self.fail = False
+
+    def send(self, chat_id, text):
+        if self.fail:
+            raise RuntimeError("network down")
+        self.sent.append((chat_id, text))
+        return True
+
+
+@pytest.fixture
+def billing(tmp_path, monkeypatch):
+    paths = {name: tmp_path / f"{name}.json" for name in ("users", "subs", "credits", "trials")}
+    for module in (upsell, test_mode):
+        monkeypatch.setattr(module, "SUBSCRIPTION_DB", paths["subs"])
+        monkeypatch.setattr(module, "CREDITS_DB", paths["credits"])
+        monkeypatch.setattr(module, "TRIALS_DB", paths["trials"])
+    service = EntitlementService(paths["users"], paths["subs"], paths["trials"], recheck_s=3600)
+    monkeypatch.setattr(entitlements, "_service", service)
+    monkeypatch.setattr(ledger, "_ledger", UsageLedger(tmp_path / "ledger.json", opening=upsell.opening_balances))
+    notifier = FakeNotifier()
+    jobs = BillingScheduler(tmp_path / "jobs.db", notifier, retry_s=10)
+    monkeypatch.setattr(scheduler, "_scheduler", jobs)
+    yield jobs, notifier, paths
+    jobs.close()
+
+
+def test_plan_expiry_and_monthly_resets(billing):
+    jobs, _, paths = billing
+    now = time.time()
+    upsell.set_user_plan(1, "basic", duration_days=90)
+    assert [j.kind for j in jobs.jobs(1)] == ["monthly_reset", "plan_expiry"]
+    for _ in range(15):
+        assert upsell.use_image_generation(1)
+    assert upsell.images_remaining(1) == 5
+
+    assert jobs.run_due(now + 31 * DAY) == {"done": 0, "rescheduled": 1, "failed": 0, "notices": 0}
+    assert upsell.images_remaining(1) == 20
+    assert jobs.jobs(1)[0].due_at == pytest.approx(now + 60 * DAY, abs=5)
+    assert jobs.run_due(now + 31 * DAY)["rescheduled"] == 0  # nothing else due
+
+    upsell.use_image_generation(1)
+    assert jobs.run_due(now + 95 * DAY)["done"] == 2  # last reset, then the expiry
+    assert json.loads(paths["subs"].read_text())["1"]["status"] == "expired"
+    assert upsell.get_user_plan(1) is None and ledger.get_ledger().balance(1, "plan") == 0
+    assert jobs.stats()["queued"] == 0
+
+
+def test_renewals_move_jobs_and_stale_jobs_are_noops(billing):
+    jobs, _, paths = billing
+    now = time.time()
+    upsell.set_user_plan(2, "basic", duration_days=30)
+    upsell.set_user_plan(2, "vip", duration_days=60)  # unlimited: no monthly reset
+    assert [(j.kind, round((j.due_at - now) / DAY)) for j in jobs.jobs(2)] == [("plan_expiry", 60)]
+
+    jobs.schedule("plan_expiry", 2, now)  # e.g. queued before a renewal written by another process
+    assert jobs.run_due(now + 1)["rescheduled"] == 1
+    assert upsell.get_user_plan(2) == "vip"
+    assert round((jobs.jobs(2)[0].due_at - now) / DAY) == 60
+
+    test_mode.reset_user_payments(2)
+    assert jobs.jobs(2) == []
+
+
+def test_trial_notices_and_expiry(billing):
+    jobs, notifier, paths = billing
+    now = time.time()
+    for uid in (1, 2, 3):
+        assert upsell.start_free_trial(uid)
+    upsell.use_image_generation(2)
+    upsell.set_user_plan(3, "vip")  # subscribed: no trial nag
+
+    notifier.fail = True
+    before_end = now + 2 * DAY + 60
+    assert jobs.run_due(before_end) == {"done": 1, "rescheduled": 0, "failed": 2, "notices": 0}
+    assert [j.attempts for j in jobs.jobs() if j.kind == "trial_notice"] == [1, 1]
+    notifier.fail = False
+    assert jobs.run_due(before_end + 11) == {"done": 2, "rescheduled": 0, "failed": 0, "notices": 2}
+    assert [uid for uid, _ in notifier.sent] == ["1", "2"]
+    assert "Trial Ending Soon" in notifier.sent[1][1] and "1 day\\(s\\) and 4 image" in notifier.sent[1][1]
+
+    assert jobs.run_due(now + 3 * DAY + 60)["done"] == 3
+    trials = json.loads(paths["trials"].read_text())
+    assert {t["status"] for t in trials.values()} == {"expired"}
+    assert not upsell.has_trial_images(1) and ledger.get_ledger().balance(1, "trial") == 0
+    assert len(notifier.sent) == 2
+
+
+def test_restart_works_only_due_jobs_in_batches(billing, tmp_path, monkeypatch):
+    jobs, _, paths = billing
+    past = (datetime.now() - timedelta(days=1)).isoformat()
+    later = (datetime.now() + timedelta(days=20)).isoformat()
+    subs = {str(u): {"plan": "vip", "status": "active", "started_at": past,
+                     "expires_at": past if u < 1200 else later} for u in range(10_000)}
+    paths["subs"].write_text(json.dumps(subs))
+    assert jobs.seed() == 10_000
+    jobs.close()
+
+    loads = []
+    real_batch = scheduler._Batch.__init__
+    monkeypatch.setattr(scheduler._Batch, "__init__", lambda b, now: (loads.append(1), real_batch(b, now))[1])
+    restarted = BillingScheduler(tmp_path / "jobs.db", batch_size=500)
+    assert restarted.seed() == 0  # remembered across the restart
+    start = time.perf_counter()
+    assert restarted.run_due()["done"] == 1200
+    assert len(loads) == 3 and time.perf_counter() - start < 5
+    assert restarted.stats()["queued"] == 8800
+    assert sum(s["status"] == "expired" for s in json.loads(paths["subs"].read_text()).values()) == 1200
+    restarted.close()
+
+
+def test_workers_claim_each_job_once(billing, tmp_path):
+    """Schedulers in several workers on one queue send each notice once"""
+    jobs, notifier, _ = billing
+    now = time.time()
+    for uid in range(1, 41):
+        upsell.start_free_trial(uid)
+    slow_send = notifier.send
+    notifier.send = lambda chat_id, text: (time.sleep(0.002), slow_send(chat_id, text))[1]
+
+    workers = [BillingScheduler(tmp_path / "jobs.db", notifier, batch_size=5) for _ in range(3)]
+    threads = [threading.Thread(target=w.run_due, args=(now + 2 * DAY + 60,)) for w in workers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    sent = sorted(int(uid) for uid, _ in notifier.sent)
+    assert sent == list(range(1, 41))
+    assert sum(w.stats()["done"] for w in workers) == 40
+    assert [j.kind for j in jobs.jobs()] == ["trial_expiry"] * 40
+    for w in workers:
+        w.close()
+
+
+def test_notifier_paces_and_backs_off():
+    class Resp:
+        def __init__(self, status, body=None):
+            self.status_code, self._body, self.text = status, body or {}, json.dumps(body or {})
+
+        def json(self):
+            return self._body
+
+    replies = [Resp(200), Resp(429, {"parameters": {"retry_after": 3}}), Resp(200), Resp(403)]
+    calls, sleeps = [], []
+    notifier = TelegramNotifier("T", rate_per_s=10,
+                                post=lambda url, json, timeout: (calls.append(json), replies.pop(0))[1],
+                                sleep=sleeps.append)
+    assert notifier.send("1", "a") and notifier.send("2", "b")
+    assert not notifier.send("3", "c")  # blocked the bot: dropped, not retried
+    assert [c["chat_id"] for c in calls] == ["1", "2", "2", "3"]
+    assert 3 in sleeps and all(0 < s <= 0.1 for s in sleeps if s != 3)
+    assert notifier.sent == 2 and notifier.throttled == 1
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Test script for the table-driven callback router
+Run this to verify exact/prefix routing, typed parsers and latency counters.
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.core.callback_router import (
+    CallbackRouter, CallbackParseError, parse_gen_callback,
+    parse_subscribe_callback, parse_credit_pack_callback, parse_mode_callback
+)
+
+
+class FakeQuery:
+    """Minimal stand-in for telegram.CallbackQuery"""
+
+    def __init__(self, data):
+        self.data = data
+        self.answers = []
+
+    async def answer(self, text=None, show_alert=False):
+        self.answers.append((text, show_alert))
+
+
+def _build(calls):
+    def handler(name):
+        async def _h(update, context, **kwargs):
+            calls.append((name, kwargs))
+        return _h
+
+    router = CallbackRouter()
+    router.exact("menu_main", handler("menu_main"))
+    router.exact("upgrade", handler("upgrade"))
+    router.prefix("gen_", handler("gen"), parser=parse_gen_callback)
+    router.prefix("subscribe:", handler("subscribe"), parser=parse_subscribe_callback)
+    router.prefix("buy_credits:", handler("buy_credits"), parser=parse_credit_pack_callback)
+    router.prefix("mode:locked:", handler("locked"), answer=False)
+    router.prefix("mode:", handler("mode"), parser=parse_mode_callback, answer=False)
+    router.fallback(handler("fallback"))
+    return router
+
+
+def _dispatch(router, data):
+    query = FakeQuery(data)
+    asyncio.run(router.dispatch(SimpleNamespace(callback_query=query), None))
+    return query
+
+
+def test_gen_parser():
+    """gen_<type>_<style> parses into typed arguments"""
+    assert parse_gen_callback("selfie_sultry") == {"gen_type": "selfie", "style": "sultry"}
+    assert parse_gen_callback("scene_nude_lying") == {"gen_type": "scene", "style": "nude_lying"}
+    assert parse_gen_callback("outfit_lingerie_lace") == {"gen_type": "outfit", "style": "lingerie_lace"}
+    for bad in ("video_x", "scene", "scene_", ""):
+        try:
+            parse_gen_callback(bad)
+        except CallbackParseError:
+            continue
+        raise AssertionError(f"expected parse error for {bad!r}")
+
+
+def test_subscribe_parser():
+    """subscribe:<plan> only accepts known plans"""
+    assert parse_subscribe_callback("vip") == {"plan": "vip"}
+    try:
+        parse_subscribe_callback("platinum")
+    except CallbackParseError:
+        pass
+    else:
+        raise AssertionError("expected parse error for unknown plan")
+
+
+def test_routing_and_longest_prefix():
+    """Exact, prefix, longest-prefix and fallback routing"""
+    calls = []
+    router = _build(calls)
+
+    _dispatch(router, "menu_main")
+    _dispatch(router, "gen_scene_nude_lying")
+    _dispatch(router, "subscribe:basic")
+    _dispatch(router, "buy_credits:20_pack")
+    _dispatch(router, "mode:locked:NSFW")
+    _dispatch(router, "mode:FLIRTY")
+    _dispatch(router, "gif_wink")
+    _dispatch(router, "upgrade:vip")
+
+    assert calls == [
+        ("menu_main", {}),
+        ("gen", {"gen_type": "scene", "style": "nude_lying"}),
+        ("subscribe", {"plan": "basic"}),
+        ("buy_credits", {"pack": "20_pack"}),
+        ("locked", {}),
+        ("mode", {"mode": "FLIRTY"}),
+        ("fallback", {}),
+        ("fallback", {}),
+    ]
+
+
+def test_answer_policy_and_malformed_data():
+    """Routes answer unless opted out; malformed data is answered and dropped"""
+    calls = []
+    router = _build(calls)
+
+    assert _dispatch(router, "menu_main").answers == [(None, False)]
+    assert _dispatch(router, "mode:SAFE").answers == []
+
+    query = _dispatch(router, "subscribe:platinum")
+    assert query.answers == [(None, False)]
+    assert calls == [("menu_main", {}), ("mode", {"mode": "SAFE"})]
+
+
+def test_memoized_kwargs_are_isolated():
+    """Repeated lookups return fresh kwargs dicts"""
+    router = _build([])
+    route, kwargs = router.resolve("gen_selfie_cute")
+    kwargs["style"] = "mutated"
+    _, again = router.resolve("gen_selfie_cute")
+    assert route.name == "gen_*"
+    assert again == {"gen_type": "selfie", "style": "cute"}
+
+
+def test_latency_counters():
+    """Each dispatch is counted against its route"""
+    router = _build([])
+    for _ in range(3):
+        _dispatch(router, "gen_selfie_cute")
+    _dispatch(router, "menu_main")
+
+    stats = router.stats()
+    assert stats["gen_*"]["calls"] == 3
+    assert stats["menu_main"]["calls"] == 1
+    assert stats["gen_*"]["max_ms"] >= stats["gen_*"]["avg_ms"] >= 0
+
+
+if __name__ == "__main__":
+    test_gen_parser()
+    test_subscribe_parser()
+    test_routing_and_longest_prefix()
+    test_answer_policy_and_malformed_data()
+    test_memoized_kwargs_are_isolated()
+    test_latency_counters()
+    print("✅ All callback router tests passed!")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test script for the entitlement cache
+Checks that gate checks agree with the files, are answered from memory,
+follow in-process saves immediately and other processes' writes after the
+re-check interval.
+"""
+
+import sys
+import json
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.payment import entitlements, ledger, test_mode, upsell
+from src.payment.entitlements import EntitlementService
+from src.payment.ledger import UsageLedger
+
+
+@pytest.fixture
+def dbs(tmp_path, monkeypatch):
+    paths = {name: tmp_path / f"{name}.json" for name in ("users", "subs", "credits", "trials")}
+    monkeypatch.setattr(upsell, "SUBSCRIPTION_DB", paths["subs"])
+    monkeypatch.setattr(upsell, "CREDITS_DB", paths["credits"])
+    monkeypatch.setattr(upsell, "TRIALS_DB", paths["trials"])
+    monkeypatch.setattr(test_mode, "SUBSCRIPTION_DB", paths["subs"])
+    monkeypatch.setattr(test_mode, "CREDITS_DB", paths["credits"])
+    monkeypatch.setattr(test_mode, "TRIALS_DB", paths["trials"])
+    service = EntitlementService(paths["users"], paths["subs"], paths["trials"], recheck_s=3600)
+    monkeypatch.setattr(entitlements, "_service", service)
+    monkeypatch.setattr(ledger, "_ledger", UsageLedger(tmp_path / "ledger.json", opening=upsell.opening_balances))
+    return paths, service
+
+
+def test_gates_follow_in_process_writes(dbs):
+    paths, service = dbs
+    assert upsell.can_generate_image(1) == (False, "No images remaining. Buy credits or subscribe!")
+
+    test_mode.simulate_credits_purchase(1, "5_pack")
+    assert upsell.get_image_credits(1) == 5 and upsell.can_generate_image(1)[0]
+    assert upsell.use_image_generation(1)
+    assert upsell.get_image_credits(1) == 4
+
+    upsell.start_free_trial(2)
+    assert upsell.has_trial_images(2) and upsell.get_trial_status(2)["images_remaining"] == 5
+
+    test_mode.simulate_subscription_purchase(3, "basic")
+    assert upsell.get_user_plan(3) == "basic"
+    for _ in range(20):
+        assert upsell.use_image_generation(3)
+    assert upsell.can_generate_image(3)[0] is False
+
+    test_mode.reset_user_payments(3)
+    assert upsell.get_user_plan(3) is None
+    assert service.stats()["reloads"] == 3  # the initial load only; saves were adopted
+
+
+def test_expiry_and_status(dbs):
+    paths, service = dbs
+    past = (datetime.now() - timedelta(minutes=1)).isoformat()
+    future = (datetime.now() + timedelta(days=1)).isoformat()
+    paths["subs"].write_text(json.dumps({
+        "1": {"plan": "vip", "status": "active", "expires_at": past},
+        "2": {"plan": "vip", "status": "cancelled", "expires_at": future},
+        "3": {"plan": "vip", "status": "active", "expires_at": future},
+    }))
+    paths["trials"].write_text(json.dumps({"4": {"expires_at": past, "images_remaining": 5}}))
+    assert [upsell.get_user_plan(u) for u in (1, 2, 3)] == [None, None, "vip"]
+    assert not upsell.has_trial_images(4)
+
+    e = service.get(3)
+    assert isinstance(e.plan_expires, int) and e.active_plan(e.plan_expires) == "vip"
+    assert e.active_plan(e.plan_expires + 1) is None
+
+
+def test_snapshots_are_reused_and_invalidated_per_user(dbs):
+    paths, service = dbs
+    paths["users"].write_text(json.dumps({"premium_users": ["7"], "tiers": {"8": "GOLD"}}))
+    for _ in range(100):
+        assert service.get(7).premium and service.get(8).tier == "GOLD"
+    assert service.stats()["builds"] == 2
+
+    # Mode changes leave entitlements alone; a new premium user drops only that snapshot
+    service.wrote(paths["users"], {"premium_users": ["7"], "tiers": {"8": "GOLD"}, "modes": {"7": "NSFW"}})
+    assert service.stats()["cached"] == 2
+    service.wrote(paths["users"], {"premium_users": ["7", "9"], "tiers": {"8": "GOLD"}})
+    assert service.get(9).premium and service.stats()["cached"] == 3
+
+
+def test_external_writes_seen_after_recheck(dbs):
+    paths, service = dbs
+    future = (datetime.now() + timedelta(days=1)).isoformat()
+    assert upsell.get_user_plan(5) is None
+    paths["subs"].write_text(json.dumps({"5": {"plan": "vip", "status": "active", "expires_at": future}}))
+    assert upsell.get_user_plan(5) is None  # within the re-check interval
+    service.recheck_s = 0
+    assert upsell.get_user_plan(5) == "vip"
+
+    service.recheck_s = 3600
+    paths["users"].write_text(json.dumps({"premium_users": ["5"]}))  # e.g. the webhook server
+    service.invalidate(5)
+    assert service.get(5).premium
+
+
+def test_gate_check_is_fast(dbs):
+    paths, service = dbs
+    paths["credits"].write_text(json.dumps({str(u): 1 for u in range(50_000)}))  # seeds the ledger
+    assert upsell.get_image_credits(49_999) == 1
+    start = time.perf_counter()
+    for _ in range(10_000):
+        upsell.can_generate_image(1)
+    assert (time.perf_counter() - start) / 10_000 < 0.0005
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Test script for the gamification event bus
+Checks batched users.json writes, projected reads before a flush, the
+message XP cooldown (also across restarts), once-a-day claims (also
+while a flush is being written and across workers), at-least-once replay of the
+append log after a crash or failed flush, and per-worker logs.
+"""
+
+import sys
+import json
+from pathlib import Path
+
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.game import bond, leaderboard, xp
+from src.metrics import db as metrics_db
+from src.game.events import DailyClaimed, EventLog, GameEventBus, MessageSent, QuestClaimed, wire
+from src.game.progress import ProgressAggregator
+from src.game.quests import PRE, QuestEngine
+
+T0 = 1_700_000_000
+_buses = []
+
+
+@pytest.fixture
+def users(tmp_path, monkeypatch):
+    path = tmp_path / "users.json"
+    for mod in (xp, bond, leaderboard):
+        monkeypatch.setattr(mod, "USERS", path)
+    monkeypatch.setattr(leaderboard, "_index", leaderboard.LeaderboardIndex())
+    monkeypatch.setattr(metrics_db, "log_msg", lambda *a, **k: None)  # keep data/metrics.db out of it
+    yield path
+    while _buses:  # final flush while the paths above are still patched
+        _buses.pop().close()
+
+
+def make_bus(tmp_path, progress=None, log=None):
+    progress = progress or ProgressAggregator()
+    bus = GameEventBus(log or EventLog(tmp_path / "events.log"), flush_interval=3600, flush_events=10**9)
+    _buses.append(bus)
+    return wire(bus, progress, QuestEngine(PRE, tmp_path / "quests.json")), progress
+
+
+def test_many_messages_one_write(users, tmp_path, monkeypatch):
+    writes = []
+    real_save = xp._save
+    monkeypatch.setattr(xp, "_save", lambda d: (writes.append(1), real_save(d)))
+    bus, progress = make_bus(tmp_path)
+
+    for i in range(300):
+        bus.publish(MessageSent(i % 3, "hello", ts=T0 + i * 10))  # each user every 30 s
+    assert writes == [] and not users.exists()
+    assert progress.profile(0) == {"xp": 0, "level": 2, "need": 200}
+    assert progress.bond(0, now=T0 + 3000)["score"] == 100
+
+    assert bus.flush()
+    assert len(writes) == 1
+    d = json.loads(users.read_text())
+    assert d["xp"]["0"]["xp"] == 0 and d["xp"]["0"]["level"] == 2
+    assert d["bond"]["0"] == {"score": 100, "last_update": T0 + 2970}
+    assert progress.profile(0) == xp.get_profile(0)
+    assert leaderboard.get_rank(0)["level"] == 2
+    assert not list(tmp_path.glob("events.log*"))  # log trimmed after the persist
+
+
+def test_cooldown_daily_and_quests(users, tmp_path):
+    bus, progress = make_bus(tmp_path)
+    for dt in (0, 5, 29, 30, 31):
+        bus.publish(MessageSent(7, "hi", ts=T0 + dt))
+    assert progress.profile(7)["xp"] == 2
+
+    done = bus.publish(MessageSent(7, "good morning, I feel great", ts=T0 + 100))
+    assert {q["id"] for q in done[0]} == {"daily_greet", "share_thought"}
+    bus.publish(QuestClaimed(7, "share_thought", 15, ts=T0 + 101))
+
+    assert bus.publish(DailyClaimed(7, 20, ts=T0 + 200)) == [True]
+    assert bus.publish(DailyClaimed(7, 20, ts=T0 + 300)) == []
+    assert progress.profile(7)["xp"] == 2 + 1 + 15 + 20
+    bus.flush()
+    assert not progress.daily_ready(7, now=T0 + 3600)  # now from users.json
+    assert progress.daily_ready(7, now=T0 + 200 + 86400)
+    assert xp.get_profile(7)["xp"] == 38
+
+
+def test_batch_being_written_stays_visible(users, tmp_path, monkeypatch):
+    bus, progress = make_bus(tmp_path)
+    bus.publish(MessageSent(4, "hi", ts=T0))
+    assert bus.publish(DailyClaimed(4, 20, ts=T0 + 1)) == [True]
+
+    seen = []
+    real_load = xp._load
+
+    def load_during_second_claim():
+        # The batch is swapped out but not yet in users.json
+        seen.append((bus.publish(DailyClaimed(4, 20, ts=T0 + 2)), progress.profile(4)["xp"]))
+        return real_load()
+    monkeypatch.setattr(xp, "_load", load_during_second_claim)
+    assert bus.flush()
+    assert seen == [([], 21)]
+    assert xp.get_profile(4)["xp"] == 21
+
+
+def test_daily_once_across_workers(users, tmp_path):
+    a, pa = make_bus(tmp_path, log=EventLog.for_process(tmp_path / "game_events.log", pid=1))
+    b, pb = make_bus(tmp_path, log=EventLog.for_process(tmp_path / "game_events.log", pid=2))
+    b.publish(MessageSent(6, "hi", ts=T0))  # b has the user in memory
+    assert a.publish(DailyClaimed(6, 20, ts=T0 + 1)) == [True]
+    assert b.publish(DailyClaimed(6, 20, ts=T0 + 1)) == []  # same second, other worker
+    assert not pb.daily_ready(6, now=T0 + 60)
+    assert b.flush()  # b's batch does not overwrite a's claim
+    assert xp.get_profile(6)["xp"] == 21 and pa.profile(6) == pb.profile(6)
+    assert b.publish(DailyClaimed(6, 20, ts=T0 + 86401)) == [True]
+    assert xp.get_profile(6)["xp"] == 41
+
+
+def test_message_cooldown_survives_restart(users, tmp_path):
+    bus, _ = make_bus(tmp_path)
+    bus.publish(MessageSent(5, "hi", ts=T0))
+    bus.flush()
+
+    restarted, progress = make_bus(tmp_path)
+    restarted.publish(MessageSent(5, "hi again", ts=T0 + 5))
+    assert progress.profile(5)["xp"] == 1
+    restarted.publish(MessageSent(5, "later", ts=T0 + 30))
+    assert progress.profile(5)["xp"] == 2
+
+
+def test_replay_after_crash(users, tmp_path):
+    bus, _ = make_bus(tmp_path)
+    bus.publish(MessageSent(1, "hello", ts=T0))
+    bus.publish(QuestClaimed(1, "share_thought", 15, ts=T0 + 1))
+    bus.publish(DailyClaimed(1, 20, ts=T0 + 2))
+    # Process dies before the flush: nothing persisted, events are in the log
+
+    restarted, progress = make_bus(tmp_path)
+    assert restarted.recover() == 3
+    assert xp.get_profile(1)["xp"] == 36
+    assert bond.get_bond(1)["last_update"] == T0
+    assert restarted.recover() == 0  # the log was trimmed once persisted
+
+
+def test_failed_flush_keeps_events(users, tmp_path, monkeypatch):
+    bus, progress = make_bus(tmp_path)
+    bus.publish(MessageSent(2, "hello", ts=T0))
+
+    def broken(d):
+        raise OSError("disk full")
+    real_save = xp._save
+    monkeypatch.setattr(xp, "_save", broken)
+    assert not bus.flush()
+    assert bus.stats()["errors"] == 1
+    assert progress.profile(2)["xp"] == 1  # pending state restored
+
+    bus.publish(MessageSent(2, "again", ts=T0 + 60))
+    monkeypatch.setattr(xp, "_save", real_save)
+    assert bus.flush()
+    assert xp.get_profile(2)["xp"] == 2
+    assert not list(tmp_path.glob("events.log*"))
+
+
+def test_failing_subscriber_is_isolated(users, tmp_path):
+    bus, progress = make_bus(tmp_path)
+    bus.subscribe(MessageSent, lambda e: 1 / 0)
+    bus.publish(MessageSent(3, "hello", ts=T0))
+    assert progress.profile(3)["xp"] == 1
+    assert bus.stats()["errors"] == 1
+
+
+def test_workers_keep_their_own_logs(users, tmp_path):
+    base = tmp_path / "game_events.log"
+    a, _ = make_bus(tmp_path, log=EventLog.for_process(base, pid=1))
+    b, _ = make_bus(tmp_path, log=EventLog.for_process(base, pid=2))
+    a.publish(MessageSent(1, "hi", ts=T0))
+    a.publish(QuestClaimed(1, "share_thought", 15, ts=T0 + 1))
+    b.publish(MessageSent(2, "hi", ts=T0))
+    assert b.flush()
+    assert (tmp_path / "game_events.1.log").exists()  # b's rotate/trim left a's log alone
+    assert b.recover() == 0  # worker 1 is alive: its events are not b's to replay
+    assert xp.get_profile(1)["xp"] == 0 and xp.get_profile(2)["xp"] == 1
+
+    _buses.remove(a)
+    a.log.close()  # worker 1 dies without flushing; its lock is released
+    c, _ = make_bus(tmp_path, log=EventLog.for_process(base, pid=3))
+    assert c.recover() == 2
+    assert b.recover() == 0  # adopted once
+    assert xp.get_profile(1)["xp"] == 16
+    assert sorted(p.name for p in tmp_path.glob("game_events.*")) == ["game_events.2.lock", "game_events.3.lock"]
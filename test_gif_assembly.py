@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Test script for streaming GIF assembly
+Checks that the shared-palette, frame-differenced output decodes to the
+expected frames, honours timing/looping, fits a byte budget and is
+smaller than a plain PIL save.
+"""
+
+import io
+import sys
+from pathlib import Path
+
+import pytest
+from PIL import Image, ImageChops, ImageDraw
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.image import gif_assembler
+from src.image.gif_generator import create_animated_gif
+
+
+def make_frames(count=5, size=256, fmt="PNG"):
+    """Striped backdrop with a disc that moves between frames"""
+    frames = []
+    for i in range(count):
+        img = Image.new("RGB", (size, size))
+        draw = ImageDraw.Draw(img)
+        for y in range(0, size, 4):
+            draw.rectangle([0, y, size, y + 3], fill=(y % 256, (2 * y) % 256, 180))
+        draw.ellipse([40 + i * 10, 60, 140 + i * 10, 160], fill=(250, 210, 160))
+        buf = io.BytesIO()
+        img.save(buf, format=fmt)
+        frames.append(buf.getvalue())
+    return frames
+
+
+def decoded(gif_bytes):
+    img = Image.open(io.BytesIO(gif_bytes))
+    frames = []
+    for i in range(img.n_frames):
+        img.seek(i)
+        frames.append(img.convert("RGB"))
+    return img, frames
+
+
+def test_frames_decode_exactly():
+    """Every decoded frame matches the source quantized to the shared palette"""
+    frames = make_frames()
+    frames.append(frames[-1])  # identical frame -> 1px transparent patch
+    gif, out = decoded(gif_assembler.assemble_gif(frames, duration=300))
+
+    palette = gif_assembler.build_palette(frames, 255)
+    assert len(out) == len(frames)
+    assert gif.info["loop"] == 0
+    assert gif.info["duration"] == 300
+    for source, got in zip(frames, out):
+        expected = gif_assembler._open_rgb(source).quantize(palette=palette, dither=Image.Dither.NONE)
+        assert ImageChops.difference(got, expected.convert("RGB")).getbbox() is None
+
+
+def test_write_gif_streams_to_file(tmp_path):
+    frames = make_frames(3, fmt="JPEG")
+    path = tmp_path / "out.gif"
+    with open(path, "wb") as f:
+        written = gif_assembler.write_gif(frames, f, duration=500, loop=2)
+
+    assert written == path.stat().st_size
+    gif, out = decoded(path.read_bytes())
+    assert len(out) == 3
+    assert gif.info["loop"] == 2
+
+
+def test_smaller_than_plain_pil_save():
+    frames = make_frames(6)
+    images = [Image.open(io.BytesIO(f)).convert("RGB") for f in frames]
+    legacy = io.BytesIO()
+    images[0].save(legacy, format="GIF", save_all=True, append_images=images[1:], duration=400, loop=0)
+
+    assert len(gif_assembler.assemble_gif(frames, duration=400)) < len(legacy.getvalue())
+
+
+def test_target_bytes_steps_down():
+    frames = make_frames(5)
+    full = gif_assembler.assemble_gif(frames)
+    budget = len(full) // 3
+    small = gif_assembler.assemble_gif(frames, target_bytes=budget)
+
+    assert len(small) <= budget
+    gif, out = decoded(small)
+    assert len(out) == 5
+    assert gif.size[0] <= 256
+
+
+def test_create_animated_gif_applies_budget(monkeypatch):
+    frames = make_frames(4)
+    monkeypatch.setattr("src.image.gif_generator.GIF_MAX_BYTES", 0)
+    unbounded = create_animated_gif(frames, duration=400)
+    monkeypatch.setattr("src.image.gif_generator.GIF_MAX_BYTES", len(unbounded) // 2)
+    bounded = create_animated_gif(frames, duration=400)
+
+    assert len(bounded) <= len(unbounded) // 2
+    with pytest.raises(ValueError):
+        create_animated_gif([])
+
+
+def test_video_without_encoder(monkeypatch):
+    monkeypatch.setattr(gif_assembler.shutil, "which", lambda name: None)
+    assert not gif_assembler.video_encoder_available()
+    assert gif_assembler.encode_video(make_frames(2), fmt="webm") is None
+    with pytest.raises(ValueError):
+        gif_assembler.encode_video(make_frames(2), fmt="avi")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Test script for GIF frame interpolation
+Checks in-between synthesis (crossfade and flow), sequence assembly and the
+keyframe-only generation mode with a fake upstream (no network).
+"""
+
+import io
+import sys
+import asyncio
+from pathlib import Path
+
+import pytest
+from PIL import Image, ImageDraw
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.image import cache as image_cache
+from src.image import gif_generator as gif
+from src.image import interpolate
+
+
+def disc_frame(x, size=256):
+    """Gradient backdrop with a disc at horizontal position x"""
+    img = Image.linear_gradient("L").resize((size, size)).convert("RGB")
+    ImageDraw.Draw(img).ellipse([x, 80, x + 64, 144], fill=(240, 200, 160))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def mean_error(frame_bytes, expected_bytes):
+    from PIL import ImageChops, ImageStat
+    got = Image.open(io.BytesIO(frame_bytes)).convert("RGB")
+    expected = Image.open(io.BytesIO(expected_bytes)).convert("RGB")
+    return sum(ImageStat.Stat(ImageChops.difference(got, expected)).mean) / 3
+
+
+@pytest.fixture(autouse=True)
+def no_image_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(image_cache, "_default", image_cache.ImageCache(str(tmp_path), max_bytes=0))
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Fake _fetch_once returning a distinct frame per prompt"""
+    calls = []
+
+    def fetch(url):
+        calls.append(url)
+        return disc_frame(20 + (len(calls) * 40) % 160)
+
+    monkeypatch.setattr(gif, "_fetch_once", fetch)
+    return calls
+
+
+def test_inbetween_count_and_size():
+    frames = interpolate.inbetween_frames(disc_frame(40), disc_frame(120), 3, method="crossfade")
+    assert len(frames) == 3
+    assert all(Image.open(io.BytesIO(f)).size == (256, 256) for f in frames)
+    assert interpolate.inbetween_frames(disc_frame(40), disc_frame(120), 0) == []
+    with pytest.raises(ValueError):
+        interpolate.inbetween_frames(disc_frame(40), disc_frame(120), 1, method="morph")
+
+
+@pytest.mark.skipif(not interpolate.NUMPY_AVAILABLE, reason="NumPy not installed")
+def test_flow_tracks_motion_better_than_crossfade():
+    """The flow midpoint is closer to the true midpoint than a plain mix"""
+    a, b, mid = disc_frame(60), disc_frame(110), disc_frame(85)
+    flow = interpolate.inbetween_frames(a, b, 1, method="flow")[0]
+    fade = interpolate.inbetween_frames(a, b, 1, method="crossfade")[0]
+    assert mean_error(flow, mid) < mean_error(fade, mid)
+
+
+def test_flow_falls_back_without_numpy(monkeypatch):
+    monkeypatch.setattr(interpolate, "NUMPY_AVAILABLE", False)
+    a, b = disc_frame(60), disc_frame(110)
+    assert interpolate.inbetween_frames(a, b, 2, method="flow") == \
+        interpolate.inbetween_frames(a, b, 2, method="crossfade")
+
+
+def test_sequence_open_and_closed():
+    keys = [disc_frame(20), disc_frame(100), disc_frame(20)]
+    open_seq = interpolate.interpolate_sequence(keys, 2, method="crossfade")
+    closed_seq = interpolate.interpolate_sequence(keys, 2, method="crossfade", closed=True)
+    assert len(open_seq) == 3 + 2 * 2
+    assert len(closed_seq) == len(open_seq) - 1  # loop seam frame dropped
+    assert closed_seq[0] == keys[0] and closed_seq[3] == keys[1]
+
+
+def test_keyframe_mode_saves_remote_calls(upstream):
+    """wink renders 2 keyframes instead of 4 distinct frames"""
+    before = gif.interpolation_stats()
+    frames, duration = asyncio.run(
+        gif.generate_interpolated_frames_async("wink", inbetweens=3, method="crossfade"))
+    after = gif.interpolation_stats()
+
+    assert len(upstream) == 2
+    assert len(frames) == 8
+    scenario = gif.GIF_SCENARIOS["wink"]
+    assert duration == scenario["duration"] * len(scenario["descriptions"]) // 8
+    assert after["calls_saved"] - before["calls_saved"] == 2
+    assert after["synth_frames"] - before["synth_frames"] == 6
+
+
+def test_generate_luna_gif_uses_interpolation(upstream):
+    gif_bytes, name = gif.generate_luna_gif("kiss", interpolate=True)
+    assert name == "Blowing Kiss"
+    assert len(upstream) == 2
+    assert Image.open(io.BytesIO(gif_bytes)).n_frames == 8
+
+
+def test_scenarios_without_keyframes_render_every_frame(upstream):
+    gif.generate_luna_gif("rotate", interpolate=True)
+    assert len(upstream) == 8
+    with pytest.raises(ValueError):
+        asyncio.run(gif.generate_interpolated_frames_async("rotate"))
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Test script for concurrent GIF frame generation
+Uses a fake fetcher (no network) to check latency, de-duplication,
+concurrency limits, retries and partial-failure handling.
+"""
+
+import sys
+import time
+import threading
+from pathlib import Path
+
+import pytest
+import requests
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.image import cache as image_cache
+from src.image import gif_generator as gif
+
+
+class FakeFetcher:
+    """Stand-in for _fetch_once with per-URL latency and scripted failures"""
+
+    def __init__(self, latency=0.2, fail=None):
+        self.latency = latency
+        self.fail = fail or {}  # description fragment -> failures before success (-1 = always)
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, url):
+        with self._lock:
+            self.calls.append(url)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+            for fragment, remaining in self.fail.items():
+                if fragment in url and remaining != 0:
+                    self.fail[fragment] = remaining - 1 if remaining > 0 else -1
+                    raise requests.exceptions.Timeout("simulated timeout")
+            return url.encode()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+@pytest.fixture(autouse=True)
+def no_image_cache(monkeypatch, tmp_path):
+    """Every test fetches through the fake, never from a shared disk cache"""
+    monkeypatch.setattr(image_cache, "_default", image_cache.ImageCache(str(tmp_path), max_bytes=0))
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    fetcher = FakeFetcher()
+    monkeypatch.setattr(gif, "_fetch_once", fetcher)
+    monkeypatch.setattr(gif, "RETRY_BASE_DELAY", 0.001)
+    return fetcher
+
+
+def test_latency_close_to_slowest_frame(fake):
+    """Frames are fetched concurrently, not one after another"""
+    start = time.perf_counter()
+    frames = gif.generate_gif_frames("kiss")
+    elapsed = time.perf_counter() - start
+    assert len(frames) == 5
+    assert elapsed < 2 * fake.latency  # sequential would be 4 x latency
+
+
+def test_duplicate_descriptions_fetched_once(fake):
+    """The looping first/last frame is requested once and reused"""
+    frames = gif.generate_gif_frames("wink")
+    assert len(fake.calls) == 4
+    assert frames[0] == frames[-1]
+    assert len(set(frames)) == 4
+
+
+def test_concurrency_limit(fake):
+    """In-flight requests never exceed the limit"""
+    import asyncio
+    asyncio.run(gif.generate_gif_frames_async("dance", concurrency=2))
+    assert fake.max_in_flight == 2
+
+
+def test_retry_then_success(fake):
+    """Transient errors are retried with backoff"""
+    fake.fail = {gif.quote("raising hand to lips"): 2}
+    frames = gif.generate_gif_frames("kiss")
+    assert len(frames) == 5
+    assert len(fake.calls) == 4 + 2
+
+
+def test_partial_failure_reuses_neighbour(fake):
+    """A frame that keeps failing is replaced by its nearest good frame"""
+    fake.fail = {gif.quote("winking right eye fully closed"): -1}
+    frames = gif.generate_gif_frames("wink")
+    assert len(frames) == 5
+    assert frames[2] == frames[1]
+
+
+def test_majority_failure_raises(fake):
+    """Too many failed frames abort the GIF"""
+    fake.fail = {gif.quote("black ripped jeans"): -1}
+    with pytest.raises(requests.exceptions.Timeout):
+        gif.generate_gif_frames("wink")
+
+
+def test_non_retryable_http_error_not_retried(monkeypatch):
+    """4xx responses fail fast"""
+    response = requests.Response()
+    response.status_code = 400
+    calls = []
+
+    def bad_request(url):
+        calls.append(url)
+        raise requests.exceptions.HTTPError(response=response)
+
+    monkeypatch.setattr(gif, "_fetch_once", bad_request)
+    with pytest.raises(requests.exceptions.HTTPError):
+        gif.generate_gif_frame("standing", retries=3)
+    assert len(calls) == 1
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Test script for the content-addressed image cache
+Checks hits/misses, LRU eviction, atomic writes, variant pools and restarts.
+"""
+
+import sys
+import time
+import random
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.image.cache import ImageCache, cache_key
+
+
+def _fetcher(calls, size=100):
+    def fetch(variant):
+        calls.append(variant)
+        return bytes([variant % 256]) * size
+    return fetch
+
+
+def test_hit_after_miss(tmp_path):
+    """Second request for the same URL is served from disk"""
+    cache = ImageCache(str(tmp_path), max_bytes=10_000)
+    calls = []
+    a = cache.get_or_fetch("https://img/a?seed=42", _fetcher(calls))
+    start = time.perf_counter()
+    b = cache.get_or_fetch("https://img/a?seed=42", _fetcher(calls))
+    assert time.perf_counter() - start < 0.05
+    assert a == b and calls == [0]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 50.0)
+    assert (tmp_path / cache_key("https://img/a?seed=42")[:2] / f"{cache_key('https://img/a?seed=42')}.0").exists()
+
+
+def test_lru_eviction_under_cap(tmp_path):
+    """Least recently used entries are evicted when over the size cap"""
+    cache = ImageCache(str(tmp_path), max_bytes=350)
+    calls = []
+    for url in ("a", "b", "c"):
+        cache.get_or_fetch(url, _fetcher(calls))
+    cache.get_or_fetch("a", _fetcher(calls))      # touch a -> b is now LRU
+    cache.get_or_fetch("d", _fetcher(calls))      # 400 bytes > cap, evict b
+    assert cache.variants("b") == []
+    assert cache.variants("a") == [0] and cache.variants("d") == [0]
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] <= 350
+
+
+def test_restart_keeps_entries_and_cleans_temp_files(tmp_path):
+    """A new process sees previous entries; crashed temp files are removed"""
+    cache = ImageCache(str(tmp_path), max_bytes=10_000)
+    cache.put("a", b"x" * 10)
+    shard = tmp_path / cache_key("a")[:2]
+    (shard / ".tmp-crashed").write_bytes(b"partial")
+
+    reopened = ImageCache(str(tmp_path), max_bytes=10_000)
+    assert reopened.get("a") == b"x" * 10
+    assert not (shard / ".tmp-crashed").exists()
+    assert reopened.stats()["entries"] == 1
+
+
+def test_variant_pool_fills_over_time(tmp_path):
+    """Hits occasionally generate new seed variants until the pool is full"""
+    cache = ImageCache(str(tmp_path), max_bytes=1_000_000, fill_probability=0.5, rng=random.Random(3))
+    calls = []
+    seen = set()
+    for _ in range(60):
+        seen.add(cache.get_or_fetch("menu", _fetcher(calls), pool=3))
+    assert sorted(calls) == [0, 1, 2]
+    assert len(seen) == 3
+    assert cache.stats()["fills"] == 2
+
+
+def test_disabled_cache_always_fetches(tmp_path):
+    cache = ImageCache(str(tmp_path), max_bytes=0)
+    calls = []
+    cache.get_or_fetch("a", _fetcher(calls))
+    cache.get_or_fetch("a", _fetcher(calls))
+    assert calls == [0, 0]
+    assert not any(tmp_path.iterdir())
+
+
+if __name__ == "__main__":
+    import tempfile
+    for test in (test_hit_after_miss, test_lru_eviction_under_cap,
+                 test_restart_keeps_entries_and_cleans_temp_files,
+                 test_variant_pool_fills_over_time, test_disabled_cache_always_fetches):
+        with tempfile.TemporaryDirectory() as d:
+            test(Path(d))
+    print("✅ All image cache tests passed!")
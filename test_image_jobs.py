@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Test script for the async image job queue
+Checks that handlers return immediately, caps are honoured, users are
+served fairly, failures reach the error callback, and jobs submitted
+from a short-lived asyncio.run (as the webhook used to) still complete.
+"""
+
+import sys
+import time
+import asyncio
+import threading
+from pathlib import Path
+
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.image.jobs import ImageJobQueue, JobRejected
+from src.utils import loop_thread
+
+
+def slow_render(value, seconds=0.05, active=None):
+    def render():
+        if active is not None:
+            with active["lock"]:
+                active["now"] += 1
+                active["max"] = max(active["max"], active["now"])
+        time.sleep(seconds)
+        if active is not None:
+            with active["lock"]:
+                active["now"] -= 1
+        return value
+    return render
+
+
+def _active():
+    return {"now": 0, "max": 0, "lock": threading.Lock()}
+
+
+def test_submit_returns_immediately_and_delivers():
+    """The event loop keeps running while a job renders"""
+    async def scenario():
+        queue = ImageJobQueue(workers=2)
+        delivered, states = [], []
+
+        async def deliver(result):
+            delivered.append(result)
+
+        async def on_status(job, state):
+            states.append(state)
+
+        start = time.perf_counter()
+        await queue.submit(1, slow_render("img", 0.2), deliver, on_status=on_status)
+        assert time.perf_counter() - start < 0.05
+
+        ticks = 0
+        while not delivered:
+            ticks += 1
+            await asyncio.sleep(0.01)
+        assert ticks >= 10  # the loop was free while rendering
+        await queue.join()
+        return delivered, states, queue.stats()
+
+    delivered, states, stats = asyncio.run(scenario())
+    assert delivered == ["img"]
+    assert states == ["rendering", "done"]
+    assert stats["completed"] == 1 and stats["running"] == 0
+
+
+def test_global_and_per_user_caps():
+    """At most `workers` renders run at once, and one per user"""
+    async def scenario():
+        queue = ImageJobQueue(workers=3, per_user=1, max_pending_per_user=5)
+        active = _active()
+        per_user = {u: _active() for u in range(4)}
+        order = []
+
+        def render_for(user, i):
+            inner = slow_render((user, i), 0.05, active)
+
+            def render():
+                with per_user[user]["lock"]:
+                    per_user[user]["now"] += 1
+                    per_user[user]["max"] = max(per_user[user]["max"], per_user[user]["now"])
+                try:
+                    return inner()
+                finally:
+                    with per_user[user]["lock"]:
+                        per_user[user]["now"] -= 1
+            return render
+
+        async def deliver(result):
+            order.append(result)
+
+        for i in range(3):
+            for user in range(4):
+                await queue.submit(user, render_for(user, i), deliver)
+        await queue.join()
+        return active["max"], {u: s["max"] for u, s in per_user.items()}, order
+
+    max_active, per_user_max, order = asyncio.run(scenario())
+    assert max_active == 3
+    assert set(per_user_max.values()) == {1}
+    assert len(order) == 12
+
+
+def test_queued_position_and_fairness():
+    """A user's backlog does not block other users queued behind it"""
+    async def scenario():
+        queue = ImageJobQueue(workers=1, per_user=1, max_pending_per_user=3)
+        positions, order = {}, []
+
+        def track(name):
+            async def on_status(job, state):
+                if state == "queued":
+                    positions[name] = job.position
+
+            async def deliver(result):
+                order.append(name)
+            return on_status, deliver
+
+        for name, user in (("a1", 1), ("a2", 1), ("b1", 2)):
+            on_status, deliver = track(name)
+            await queue.submit(user, slow_render(name, 0.02), deliver, on_status=on_status)
+        await queue.join()
+        return positions, order
+
+    positions, order = asyncio.run(scenario())
+    assert positions == {"a2": 1, "b1": 2}
+    assert order == ["a1", "a2", "b1"]
+
+
+def test_rejects_when_user_has_too_many_jobs():
+    async def scenario():
+        queue = ImageJobQueue(workers=1, max_pending_per_user=2)
+
+        async def deliver(result):
+            pass
+
+        await queue.submit(7, slow_render(1), deliver)
+        await queue.submit(7, slow_render(2), deliver)
+        with pytest.raises(JobRejected):
+            await queue.submit(7, slow_render(3), deliver)
+        await queue.submit(8, slow_render(4), deliver)  # other users unaffected
+        await queue.join()
+        await queue.submit(7, slow_render(5), deliver)  # slots free again
+        await queue.join()
+
+    asyncio.run(scenario())
+
+
+def test_failure_reaches_error_callback_and_skips_delivery():
+    """Errors are reported and nothing is delivered (so nothing is charged)"""
+    async def scenario():
+        queue = ImageJobQueue(workers=1)
+        delivered, errors, states = [], [], []
+
+        def boom():
+            raise RuntimeError("upstream 502")
+
+        async def deliver(result):
+            delivered.append(result)
+
+        async def on_error(job, e):
+            errors.append(str(e))
+
+        async def on_status(job, state):
+            states.append(state)
+
+        await queue.submit(1, boom, deliver, on_status=on_status, on_error=on_error)
+        await queue.join()
+        return delivered, errors, states, queue.stats()
+
+    delivered, errors, states, stats = asyncio.run(scenario())
+    assert delivered == []
+    assert errors == ["upstream 502"]
+    assert states == ["rendering", "failed"]
+    assert stats["failed"] == 1
+
+
+def test_job_outlives_the_submitting_loop():
+    """A job submitted inside asyncio.run is delivered after that loop is gone"""
+    queue = ImageJobQueue(workers=1)
+    delivered, errors = [], []
+    done = threading.Event()
+
+    async def deliver(result):
+        delivered.append(result)
+        done.set()
+
+    async def on_error(job, e):
+        errors.append(type(e).__name__)
+        done.set()
+
+    async def process_update():
+        await queue.submit(1, slow_render("img", 0.1), deliver, on_error=on_error)
+
+    asyncio.run(process_update())  # returns while the job is still rendering
+    assert done.wait(2)
+    assert delivered == ["img"] and errors == []
+    loop_thread.run(queue.join(), timeout=2)
+    assert queue.stats()["completed"] == 1
+
+
+def test_cancelled_job_reaches_error_callback():
+    """Cancellation releases the job through on_error instead of leaking its hold"""
+    async def scenario():
+        queue = ImageJobQueue(workers=1, loop=asyncio.get_running_loop())
+        released = []
+
+        async def deliver(result):
+            pass
+
+        async def on_error(job, e):
+            released.append(type(e).__name__)
+
+        await queue.submit(1, slow_render("img", 0.2), deliver, on_error=on_error)
+        await asyncio.sleep(0.05)
+        for task in queue._tasks:
+            task.cancel()
+        await asyncio.sleep(0.01)
+        return released, queue.stats()
+
+    released, stats = asyncio.run(scenario())
+    assert released == ["CancelledError"]
+    assert stats["failed"] == 1
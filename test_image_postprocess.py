@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Test script for image post-processing
+Checks downscaling, progressive JPEG/WebP output, metadata stripping, the
+blurred preview and the process pool path (kept when an image is corrupt).
+"""
+
+import io
+import sys
+from pathlib import Path
+
+import pytest
+from PIL import Image, ImageDraw
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.image import postprocess
+
+
+def make_png(size=(1536, 1536), mode="RGB"):
+    """Gradient with sensor-like grain (compresses like a photo, not a flat fill)"""
+    img = Image.linear_gradient("L").resize(size)
+    img = Image.blend(img, Image.effect_noise(size, 40), 0.2).convert(mode)
+    ImageDraw.Draw(img).ellipse([size[0] // 4, size[1] // 4, size[0] // 2, size[1] // 2], fill="white")
+    exif = Image.Exif()
+    exif[0x010E] = "generator metadata"  # ImageDescription
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", exif=exif)
+    return buf.getvalue()
+
+
+def test_downscaled_progressive_jpeg_without_metadata():
+    out = Image.open(io.BytesIO(postprocess.process_image(make_png((1024, 2048)), max_side=1280, fmt="jpeg")))
+    assert out.format == "JPEG"
+    assert out.size == (640, 1280)
+    assert out.info.get("progressive")
+    assert "exif" not in out.info
+    assert "icc_profile" not in out.info
+
+
+def test_webp_and_transparency():
+    out = Image.open(io.BytesIO(postprocess.process_image(make_png((800, 600), mode="RGBA"), fmt="webp")))
+    assert out.format == "WEBP"
+    assert out.size == (800, 600)  # never upscaled
+    with pytest.raises(ValueError):
+        postprocess.process_image(make_png((64, 64)), fmt="bmp")
+
+
+def test_prepare_shrinks_and_previews():
+    source = make_png()
+    prepared = postprocess.prepare(source, max_side=1280, preview_side=64)
+    assert prepared.original_bytes == len(source)
+    assert len(prepared.full) < len(source) / 4
+    preview = Image.open(io.BytesIO(prepared.preview))
+    assert max(preview.size) == 64
+    assert len(prepared.preview) < 2048
+
+    assert postprocess.prepare(source, preview_side=0).preview is None
+
+
+def test_small_compact_source_passed_through():
+    img = Image.effect_noise((200, 200), 60).convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=30)
+    assert postprocess.prepare(buf.getvalue(), quality=95).full == buf.getvalue()
+
+
+def test_pool_matches_inline(monkeypatch):
+    monkeypatch.setattr(postprocess, "PROCESS_WORKERS", 1)
+    source = make_png((512, 512))
+    try:
+        assert postprocess.prepare_photo(source, max_side=256) == postprocess.prepare(source, max_side=256)
+    finally:
+        postprocess._reset_pool()
+
+
+def test_inline_when_pool_disabled(monkeypatch):
+    monkeypatch.setattr(postprocess, "PROCESS_WORKERS", 0)
+    assert postprocess._get_pool() is None
+    prepared = postprocess.prepare_photo(make_png((512, 512)), max_side=256)
+    assert Image.open(io.BytesIO(prepared.full)).size == (256, 256)
+
+
+def test_corrupt_image_keeps_the_pool(monkeypatch):
+    monkeypatch.setattr(postprocess, "PROCESS_WORKERS", 1)
+    try:
+        pool = postprocess._get_pool()
+        with pytest.raises(Image.UnidentifiedImageError):
+            postprocess.prepare_photo(b"<html>502 Bad Gateway</html>")
+        assert postprocess._get_pool() is pool
+    finally:
+        postprocess._reset_pool()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Test script for the image pre-generation warmer
+Uses a fake renderer and a scratch cache/metrics DB (no network).
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.image import cache as image_cache
+from src.image import warmer
+from src.metrics import db
+from src.metrics.writer import MetricsWriter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    c = image_cache.ImageCache(str(tmp_path / "images"), max_bytes=10_000_000)
+    monkeypatch.setattr(image_cache, "_default", c)
+    return c
+
+
+def fake_render(kind, style, nsfw):
+    """Renders through the shared cache like the real generators do"""
+    url = f"https://img/{kind}/{style}/{int(nsfw)}?seed=42"
+    return image_cache.get_image_cache().get_or_fetch(url, lambda v: f"{kind}-{style}".encode())
+
+
+def test_off_peak_window():
+    assert warmer.is_off_peak(3, "2-7")
+    assert not warmer.is_off_peak(7, "2-7")
+    assert warmer.is_off_peak(23, "22-6") and warmer.is_off_peak(5, "22-6")
+    assert not warmer.is_off_peak(12, "22-6")
+    assert warmer.is_off_peak(12, "0-0")
+
+
+def test_warm_renders_missing_and_skips_cached(cache):
+    """Only cold variants hit upstream and count against the rate limit"""
+    clock = FakeClock()
+    limiter = warmer.RateLimiter(per_minute=6, clock=clock, sleep=clock.sleep)
+    targets = [("selfie", "sultry", False), ("scene", "bedroom", True)]
+
+    first = warmer.warm(targets, render_fn=fake_render, limiter=limiter)
+    assert first == {"rendered": 2, "cached": 0, "failed": 0}
+    assert clock.slept == [10.0]  # second render waited for its slot
+
+    second = warmer.warm(targets, render_fn=fake_render, limiter=limiter)
+    assert second == {"rendered": 0, "cached": 2, "failed": 0}
+
+    # Warmer traffic is not counted as user hits/misses
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["prewarmed"]) == (0, 0, 2)
+
+    # A user tap on a warmed variant is a hit
+    fake_render("selfie", "sultry", False)
+    assert cache.stats()["hits"] == 1
+
+
+def test_warm_continues_after_failure_and_stops_when_told(cache):
+    def flaky(kind, style, nsfw):
+        if style == "bad":
+            raise RuntimeError("upstream 502")
+        return fake_render(kind, style, nsfw)
+
+    targets = [("scene", "bad", False), ("scene", "gaming", False), ("scene", "couch", False)]
+    result = warmer.warm(targets, rate_per_min=0, render_fn=flaky)
+    assert result == {"rendered": 2, "cached": 0, "failed": 1}
+
+    calls = iter([True, False])
+    result = warmer.warm([("scene", "mirror", False)] * 3, rate_per_min=0, render_fn=fake_render,
+                         should_continue=lambda: next(calls))
+    assert result["rendered"] + result["cached"] == 1
+
+
+def test_top_targets_from_metrics(tmp_path, monkeypatch):
+    """Menu taps logged by the bot rank the warmer's targets"""
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "metrics.db"))
+    monkeypatch.setattr(db, "_initialized", False)
+    writer = MetricsWriter(db._writer_conn, db._write_batch, flush_interval_ms=60_000)
+    monkeypatch.setattr(db, "_writer", writer)
+    for uid in range(3):
+        db.log_image_request(uid, "selfie", "sultry", False)
+    db.log_image_request(9, "scene", "nude_lying", True)
+    db.log_image_request(9, "scene", "nude_lying", True)
+    db.log_image_request(9, "outfit", "goth", False)
+
+    assert warmer.top_targets(top_n=2, days=1) == [("selfie", "sultry", False), ("scene", "nude_lying", True)]
+    writer.close()
+
+
+def test_only_lock_holder_warms(tmp_path, monkeypatch):
+    import fcntl
+    import os
+    from src.utils import process_lock
+
+    passes = []
+    monkeypatch.setattr(warmer, "run_once", lambda **kw: passes.append(kw))
+    monkeypatch.setattr(process_lock, "_held", {})
+    real_acquire = process_lock.acquire
+    monkeypatch.setattr(process_lock, "acquire", lambda name: real_acquire(name, tmp_path))
+
+    # Another worker holds the lock
+    other = os.open(str(tmp_path / ".image-warmer.lock"), os.O_RDWR | os.O_CREAT)
+    fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    assert not warmer._tick(top_n=3) and passes == []
+
+    os.close(other)  # that worker exited
+    assert warmer._tick(top_n=3) and passes == [{"top_n": 3}]
+    process_lock.release(warmer.WARMER_LOCK)
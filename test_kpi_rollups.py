@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Test script for incremental KPI rollups
+Compares rollup-based KPIs against exact scans of the raw tables.
+"""
+
+import sys
+import random
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.metrics import db, rollups
+from src.metrics.hll import HyperLogLog
+from src.metrics.writer import MetricsWriter
+
+NOW = 1_790_000_000 - 1_790_000_000 % 86400 + 13 * 3600 + 1234  # mid-day, mid-hour
+
+
+@pytest.fixture
+def metrics_db(tmp_path, monkeypatch):
+    """Point the metrics module at a scratch database with its own writer"""
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "metrics.db"))
+    monkeypatch.setattr(db, "_initialized", False)
+    writer = MetricsWriter(db._writer_conn, db._write_batch, flush_interval_ms=60_000, flush_batch=10**9)
+    monkeypatch.setattr(db, "_writer", writer)
+    yield db
+    writer.close()
+
+
+def _seed(writer, n=3000, users=400, span_days=9, seed=7):
+    rng = random.Random(seed)
+    for _ in range(n):
+        ts = NOW - rng.randint(0, span_days * 86400)
+        uid = str(rng.randint(1, users))
+        writer.submit("messages", (ts, uid, int(uid.endswith("7")), rng.choice(["SAFE", "FLIRTY", "NSFW", None])))
+        if rng.random() < 0.05:
+            writer.submit("payments", (ts, uid, rng.choice([299, 999, 1999]), "usd"), droppable=False)
+
+
+def _exact(c, cutoff):
+    return {
+        "messages": c.execute("SELECT COUNT(*) FROM messages WHERE ts>?", (cutoff,)).fetchone()[0],
+        "users": c.execute("SELECT COUNT(DISTINCT user_id) FROM messages WHERE ts>?", (cutoff,)).fetchone()[0],
+        "premium_users": c.execute(
+            "SELECT COUNT(DISTINCT user_id) FROM messages WHERE ts>? AND is_premium=1", (cutoff,)).fetchone()[0],
+        "revenue_cents": c.execute(
+            "SELECT COALESCE(SUM(amount_cents), 0) FROM payments WHERE ts>?", (cutoff,)).fetchone()[0],
+        "by_mode": dict(c.execute("SELECT mode, COUNT(*) FROM messages WHERE ts>? GROUP BY mode", (cutoff,))),
+    }
+
+
+def _assert_matches(w, exact):
+    assert w["messages"] == exact["messages"]
+    assert w["revenue_cents"] == exact["revenue_cents"]
+    assert w["by_mode"] == exact["by_mode"]
+    # HLL is exact-ish at these sizes (linear counting regime)
+    assert abs(w["users"] - exact["users"]) <= max(2, exact["users"] * 0.02)
+    assert abs(w["premium_users"] - exact["premium_users"]) <= max(2, exact["premium_users"] * 0.02)
+
+
+def test_hll_small_and_merged_counts():
+    """Sketches are near exact for small sets and merge like set union"""
+    a, b = HyperLogLog(), HyperLogLog()
+    a.update(str(i) for i in range(300))
+    b.update(str(i) for i in range(200, 600))
+    assert abs(a.count() - 300) <= 3
+    a.merge_bytes(b.to_bytes())
+    assert abs(a.count() - 600) <= 6
+
+
+def test_window_matches_raw_scan(metrics_db):
+    """Incremental rollups agree with full scans for assorted windows"""
+    _seed(metrics_db._writer)
+    metrics_db.flush()
+    with metrics_db._conn() as c:
+        for cutoff in (NOW - 86400, NOW - 7 * 86400, NOW - 3600, NOW - 10,
+                       NOW - NOW % 3600, NOW - NOW % 86400 - 86400, NOW - 20 * 86400):
+            _assert_matches(rollups.window(c, cutoff), _exact(c, cutoff))
+
+
+def test_incremental_equals_rebuild(metrics_db):
+    """Flushing in many small batches yields the same rollups as a rebuild"""
+    _seed(metrics_db._writer, n=500)
+    for _ in range(5):
+        metrics_db._writer.submit("messages", (NOW - 5, "42", 1, "SAFE"))
+        metrics_db.flush()
+    with metrics_db._conn() as c:
+        before = rollups.window(c, NOW - 7 * 86400)
+        rollups.rebuild(c)
+        c.commit()
+        after = rollups.window(c, NOW - 7 * 86400)
+    assert before == after
+
+
+def test_backfill_on_first_init(tmp_path, monkeypatch):
+    """Existing raw history is rolled up when the rollup tables first appear"""
+    path = tmp_path / "metrics.db"
+    raw = sqlite3.connect(path)
+    raw.executescript(db._schema)
+    raw.executemany("INSERT INTO messages VALUES(?,?,?,?)",
+                    [(NOW - i * 600, str(i % 5), i % 2, "SAFE") for i in range(50)])
+    raw.commit()
+    raw.close()
+
+    monkeypatch.setattr(db, "DB_PATH", str(path))
+    monkeypatch.setattr(db, "_initialized", False)
+    with db._conn() as c:
+        w = rollups.window(c, NOW - 86400)
+        assert w["messages"] == 50
+        assert w["users"] == 5
+        assert c.execute("PRAGMA user_version").fetchone()[0] == rollups.ROLLUP_VERSION
+
+
+def test_quick_kpis_uses_rollups(metrics_db):
+    """quick_kpis/get_mode_breakdown return the same shape as before"""
+    metrics_db.log_msg(1, True, "NSFW")
+    metrics_db.log_msg(2, False, "SAFE")
+    metrics_db.log_payment(1, 1999, "usd")
+    kpis = metrics_db.quick_kpis(days=1)
+    assert kpis == {"dau": 2, "messages": 2, "premium_senders": 1,
+                    "total_revenue_cents": 1999, "conversion_rate": 50.0}
+    assert metrics_db.get_mode_breakdown(days=1) == {"NSFW": 1, "SAFE": 1}
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Test script for lazy imports / cold start
+Verifies heavy subsystems are not loaded (and SQLite is not touched) at import time.
+Run scripts/bench/startup.py for the timing budget.
+"""
+
+import os
+import sys
+import json
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).parent
+HEAVY = ["requests", "stripe", "PIL", "telegram"]
+
+
+def _import_in_fresh_process(module, cwd):
+    code = (
+        "import sys, json\n"
+        f"import {module}\n"
+        f"print(json.dumps([m for m in {HEAVY!r} if m in sys.modules]))\n"
+    )
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    out = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_bot_import_is_light(tmp_path):
+    """Importing the bot module loads no heavy third-party subsystem"""
+    assert _import_in_fresh_process("src.core.bot", tmp_path) == []
+
+
+def test_payment_import_skips_telegram(tmp_path):
+    """src.payment no longer pulls in telegram keyboards"""
+    assert _import_in_fresh_process("src.payment", tmp_path) == []
+
+
+def test_metrics_db_is_created_on_first_use(tmp_path):
+    """The metrics schema is applied on first use, not on import"""
+    _import_in_fresh_process("src.metrics.db", tmp_path)
+    assert not (tmp_path / "data" / "metrics.db").exists()
+
+
+if __name__ == "__main__":
+    import tempfile
+    for test in (test_bot_import_is_light, test_payment_import_skips_telegram,
+                 test_metrics_db_is_created_on_first_use):
+        with tempfile.TemporaryDirectory() as d:
+            test(Path(d))
+    print("✅ All lazy import tests passed!")
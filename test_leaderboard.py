@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Test script for the leaderboard index
+Checks that the incremental index agrees with a full sort of users.json,
+rank lookups, tie handling, updates from gain_xp / claim_daily and
+picking up XP another worker saved to users.json.
+"""
+
+import sys
+import json
+import random
+from pathlib import Path
+
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.game import leaderboard, xp as xp_mod
+from src.game.leaderboard import LeaderboardIndex, score
+
+
+def full_sort(profiles):
+    """The original top_xp: sort everyone by (level, xp)"""
+    items = [(uid, int(p.get("level", 1)), int(p.get("xp", 0))) for uid, p in profiles.items()]
+    items.sort(key=lambda t: (t[1], t[2]), reverse=True)
+    return items
+
+
+def random_profiles(n, rng):
+    profiles = {}
+    for i in range(n):
+        level = rng.choice([1, 1, 1, 2, 3, 5, 8, 13, 50])
+        cap = 100 * level if level < leaderboard.LEVEL_CAP else 20000
+        profiles[str(1000000 + i)] = {"level": level, "xp": rng.randrange(cap)}
+    return profiles
+
+
+@pytest.fixture
+def users(tmp_path, monkeypatch):
+    path = tmp_path / "users.json"
+    monkeypatch.setattr(leaderboard, "USERS", path)
+    monkeypatch.setattr(xp_mod, "USERS", path)
+    monkeypatch.setattr(leaderboard, "_index", LeaderboardIndex())
+    return path
+
+
+def test_score_orders_like_level_then_xp():
+    pairs = [(level, xp) for level in range(1, 51) for xp in (0, 1, 50, 100 * level - 1)] + [(50, 9000)]
+    assert sorted(pairs, key=lambda t: score(*t)) == sorted(pairs)
+
+
+def test_matches_full_sort_and_ranks():
+    rng = random.Random(7)
+    profiles = random_profiles(3000, rng)
+    index = LeaderboardIndex()
+    index.load(profiles)
+
+    expected = full_sort(profiles)
+    scores = [(level, xp) for _uid, level, xp in expected]
+    assert [(level, xp) for _uid, level, xp in index.top(50)] == scores[:50]
+    assert len(index.top(5000)) == 3000
+
+    for uid in rng.sample(list(profiles), 200):
+        p = profiles[uid]
+        r = index.rank(uid)
+        # Rank = 1 + number of users strictly ahead
+        assert r["rank"] == 1 + sum(s > (p["level"], p["xp"]) for s in scores)
+        assert r["total"] == 3000
+    assert index.rank("nobody") is None
+
+
+def test_updates_move_users():
+    index = LeaderboardIndex()
+    index.load({"a": {"level": 3, "xp": 10}, "b": {"level": 2, "xp": 0}, "c": {"level": 2, "xp": 0}})
+    assert [uid for uid, *_ in index.top(3)] == ["a", "b", "c"]
+    assert index.rank("c")["rank"] == index.rank("b")["rank"] == 2  # ties share a rank
+
+    index.update("c", 4, 0)
+    index.update("d", 1, 5)  # new user
+    index.update("e", 50, 100000)  # beyond the current tree: resized
+    assert index.top(5) == [("e", 50, 100000), ("c", 4, 0), ("a", 3, 10), ("b", 2, 0), ("d", 1, 5)]
+    assert index.rank("b") == {"rank": 4, "total": 5, "level": 2, "xp": 0}
+
+
+def test_gain_xp_and_daily_update_index(users):
+    users.write_text(json.dumps({"xp": {"111111": {"xp": 90, "level": 2, "last_daily": 0, "last_msg_xp": 0}}}))
+    assert leaderboard.top_xp() == [("111111", 2, 90)]  # built from users.json on first use
+
+    xp_mod.gain_xp(222222, 150, cooldown_sec=0)  # -> level 2, 50 XP
+    assert leaderboard.get_rank(222222) == {"rank": 2, "total": 2, "level": 2, "xp": 50}
+    xp_mod.claim_daily(222222, reward=100)  # -> level 2, 150 XP (level 3 needs 200)
+    assert leaderboard.top_xp(1) == [("222222", 2, 150)]
+    assert leaderboard.top_xp() == full_sort(json.loads(users.read_text())["xp"])
+
+
+def test_picks_up_other_workers_xp(users, monkeypatch):
+    users.write_text(json.dumps({"xp": {"1": {"xp": 10, "level": 1}, "2": {"xp": 50, "level": 1}}}))
+    monkeypatch.setattr(leaderboard, "_index", LeaderboardIndex(recheck_s=0))
+    assert leaderboard.top_xp() == [("2", 1, 50), ("1", 1, 10)]
+
+    # Another worker saves: user 1 levels up, user 3 appears, user 2 is reset
+    users.write_text(json.dumps({"xp": {"1": {"xp": 5, "level": 3}, "3": {"xp": 20, "level": 1}}}))
+    assert leaderboard.top_xp() == [("1", 3, 5), ("3", 1, 20)]
+    assert leaderboard.get_rank(3) == {"rank": 2, "total": 2, "level": 1, "xp": 20}
+    assert leaderboard.get_rank(2) is None
+    assert leaderboard.get_leaderboard().reloads == 1
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Test script for the Telegram file_id cache
+Uses fake send methods to check upload-once, persistence, stale ids and
+workers sharing one mapping file.
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from telegram.error import BadRequest, TimedOut
+
+from src.core.media_cache import MediaCache, content_key
+
+
+class FakeBot:
+    """Records what was sent and hands out file_ids for uploads"""
+
+    def __init__(self, reject=()):
+        self.sent = []
+        self.reject = set(reject)
+        self.fail_edit = False
+
+    async def send_photo(self, chat_id, photo, caption=None):
+        if isinstance(photo, str) and photo in self.reject:
+            raise BadRequest("Wrong file identifier/http url specified")
+        self.sent.append(photo)
+        file_id = photo if isinstance(photo, str) else f"id-{len(self.sent)}"
+        return FakeMessage(self, file_id)
+
+
+class FakeMessage:
+    """Sent photo message supporting edit_media/delete"""
+
+    def __init__(self, bot, file_id):
+        self.bot = bot
+        self.photo = [SimpleNamespace(file_id="thumb"), SimpleNamespace(file_id=file_id)]
+        self.deleted = False
+
+    async def edit_media(self, media):
+        if self.bot.fail_edit:
+            raise TimedOut()
+        self.bot.sent.append(media.media.input_file_content)
+        return FakeMessage(self.bot, f"id-{len(self.bot.sent)}")
+
+    async def delete(self):
+        self.deleted = True
+
+
+def test_second_send_reuses_file_id(tmp_path):
+    """Same bytes are uploaded once, then sent by file_id"""
+    cache = MediaCache(tmp_path / "ids.json")
+    bot = FakeBot()
+    image = b"\x89PNG" + b"x" * 1000
+    asyncio.run(cache.send(bot.send_photo, "photo", image, chat_id=1, caption="hi"))
+    asyncio.run(cache.send(bot.send_photo, "photo", image, chat_id=2, caption="hi"))
+    assert bot.sent == [image, "id-1"]
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["bytes_saved"] == len(image)
+
+
+def test_persists_across_restarts(tmp_path):
+    """A new process reuses file_ids learned by a previous one"""
+    image = b"gif89a-bytes"
+    asyncio.run(MediaCache(tmp_path / "ids.json").send(FakeBot().send_photo, "photo", image, chat_id=1))
+    reopened = MediaCache(tmp_path / "ids.json")
+    assert reopened.get(content_key("photo", image)) == "id-1"
+
+
+def test_rejected_file_id_falls_back_to_upload(tmp_path):
+    """Stale file_ids are dropped and the media is uploaded again"""
+    cache = MediaCache(tmp_path / "ids.json")
+    image = b"image"
+    cache.put(content_key("photo", image), "old-id")
+    bot = FakeBot(reject={"old-id"})
+    asyncio.run(cache.send(bot.send_photo, "photo", image, chat_id=1))
+    assert bot.sent == [image]
+    assert cache.get(content_key("photo", image)) == "id-1"
+    assert cache.stats()["stale"] == 1
+
+
+def test_entry_cap(tmp_path):
+    cache = MediaCache(tmp_path / "ids.json", max_entries=2)
+    for i in range(3):
+        cache.put(f"photo:{i}", f"id-{i}")
+    assert cache.get("photo:0") is None
+    assert cache.stats()["entries"] == 2
+
+
+def test_preview_then_full_image(tmp_path):
+    """The preview goes out first and is replaced by the full upload"""
+    cache = MediaCache(tmp_path / "ids.json")
+    bot = FakeBot()
+    image, preview = b"full" * 100, b"tiny"
+    message = asyncio.run(cache.send_with_preview(bot.send_photo, "photo", image, preview, chat_id=1, caption="hi"))
+    assert bot.sent == [preview, image]
+    assert message.photo[-1].file_id == "id-2"
+    assert cache.get(content_key("photo", image)) == "id-2"
+
+    # Known image: sent by file_id straight away, no preview
+    asyncio.run(cache.send_with_preview(bot.send_photo, "photo", image, preview, chat_id=1))
+    assert bot.sent[-1] == "id-2"
+
+
+def test_preview_edit_failure_sends_full_separately(tmp_path):
+    cache = MediaCache(tmp_path / "ids.json")
+    bot = FakeBot()
+    bot.fail_edit = True
+    image, preview = b"full" * 100, b"tiny"
+    asyncio.run(cache.send_with_preview(bot.send_photo, "photo", image, preview, chat_id=1))
+    assert bot.sent == [preview, image]
+    assert cache.stats()["uploads"] == 1
+
+
+def test_workers_merge_file_ids(tmp_path):
+    """Two processes' caches on one file keep each other's file_ids"""
+    a, b = MediaCache(tmp_path / "ids.json"), MediaCache(tmp_path / "ids.json")
+    a.put("photo:1", "id-a")
+    b.put("photo:2", "id-b")  # b never read photo:1, and must not drop it
+    a.forget("photo:1")
+    b.put("photo:3", "id-c")
+    assert a.get("photo:2") == "id-b" and a.get("photo:3") == "id-c"
+    assert b.get("photo:1") is None  # a's forget reached b with b's next save
+    assert MediaCache(tmp_path / "ids.json").stats()["entries"] == 2
+    assert not list(tmp_path.glob("*.tmp"))
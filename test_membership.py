@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test script for keyed premium membership
+Checks the users.json schema 1 -> 2 migration, grant/revoke/expiry on the
+keyed records, and that loaders upgrade existing files in place.
+"""
+
+import sys
+import json
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.core import bot
+from src.payment import entitlements, membership
+from src.payment.entitlements import EntitlementService
+
+LEGACY = {
+    "premium_users": ["1", 2, "3"],
+    "free_users": ["4", "3"],
+    "tiers": {"1": "GOLD", "5": "SILVER"},
+    "modes": {"1": "NSFW"},
+    "xp": {"1": {"xp": 10, "level": 1}},
+}
+
+
+def test_migration():
+    data = json.loads(json.dumps(LEGACY))
+    assert membership.migrate(data)
+    assert data["schema"] == membership.SCHEMA_VERSION
+    assert data["premium"] == {
+        "1": {"tier": "GOLD", "since": 0, "expires": 0},
+        "2": {"tier": "", "since": 0, "expires": 0},
+        "3": {"tier": "", "since": 0, "expires": 0},
+    }
+    # premium wins over a stale free entry; a tier without premium is kept
+    assert data["free"] == {"4": {}, "5": {"tier": "SILVER"}}
+    assert "premium_users" not in data and "free_users" not in data and "tiers" not in data
+    assert data["modes"] == {"1": "NSFW"} and data["xp"] == LEGACY["xp"]
+
+    again = json.loads(json.dumps(data))
+    assert not membership.migrate(again) and again == data
+    assert membership.tier(data, 5) == "SILVER" and not membership.is_member(data, 5)
+
+
+def test_grant_revoke_expiry():
+    data = membership.empty()
+    assert membership.grant(data, 7, "GOLD", now=100)
+    assert not membership.grant(data, "7", "BRONZE")  # redelivery leaves the record alone
+    assert membership.record(data, 7) == {"tier": "GOLD", "since": 100, "expires": 0}
+    assert membership.is_member(data, 7, now=10**12)
+
+    data["free"]["8"] = {"tier": "SILVER"}
+    assert membership.grant(data, 8, expires=200, now=100)
+    assert membership.tier(data, 8) == "SILVER" and "8" not in data["free"]
+    assert membership.is_member(data, 8, now=200) and not membership.is_member(data, 8, now=201)
+
+    assert membership.revoke(data, 7) and not membership.revoke(data, 7)
+    assert not membership.is_member(data, 7) and data["free"]["7"] == {}
+    membership.clear(data)
+    assert data["premium"] == {} and membership.tier(data, 8) == ""
+
+
+def test_loader_upgrades_file_and_gates_agree(tmp_path, monkeypatch):
+    path = tmp_path / "users.json"
+    path.write_text(json.dumps(LEGACY))
+    service = EntitlementService(path, tmp_path / "subs.json", tmp_path / "trials.json", recheck_s=3600)
+    monkeypatch.setattr(entitlements, "_service", service)
+    monkeypatch.setattr(entitlements, "USERS_DB", path)
+    monkeypatch.setattr(bot, "DB_PATH", path)
+
+    # The cache reads the old file as-is...
+    assert bot.is_premium(2) and not bot.is_premium(4)
+    assert service.get(5).tier == "SILVER" and not service.get(5).premium
+
+    # ...and the first bot load rewrites it
+    bot._load_db()
+    saved = json.loads(path.read_text())
+    assert saved["schema"] == 2 and set(saved["premium"]) == {"1", "2", "3"}
+    assert bot.is_premium(1) and bot.is_premium(3) and not bot.is_premium(5)
+
+    data = bot._load_db()
+    data["premium"]["1"]["expires"] = 1  # lapsed long ago
+    bot._save_db(data)
+    assert service.get(1).premium and not bot.is_premium(1)
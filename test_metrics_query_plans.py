@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Test script for metrics DB query plans
+Guards the covering indexes: hot metrics queries must be answered from an
+index alone (EXPLAIN QUERY PLAN shows COVERING INDEX, never a table scan).
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.metrics import db, rollups
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "metrics.db"))
+    monkeypatch.setattr(db, "_initialized", False)
+    c = db._conn()
+    c.executemany("INSERT INTO messages VALUES(?,?,?,?)",
+                  [(1000 + i, str(i % 7), i % 2, "SAFE") for i in range(200)])
+    c.executemany("INSERT INTO payments VALUES(?,?,?,?)",
+                  [(1000 + i, str(i % 7), 999, "usd") for i in range(20)])
+    c.commit()
+    yield c
+    c.close()
+
+
+def _plan(c, sql, params):
+    return [row[-1] for row in c.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def _assert_covering(plan):
+    assert plan, "empty query plan"
+    for step in plan:
+        if step.startswith(("SEARCH", "SCAN")) and "SUBQUERY" not in step:
+            assert "COVERING INDEX" in step, f"not covering: {plan}"
+
+
+@pytest.mark.parametrize("sql,params", [
+    (db._USER_STATS_SQL, {"uid": "3"}),
+    (rollups.EDGE_MESSAGES_SQL, (1000, 1100)),
+    (rollups.EDGE_PAYMENTS_SQL, (1000, 1100)),
+    # The pre-rollup KPI scans, still used by ad-hoc reporting
+    ("SELECT COUNT(DISTINCT user_id) FROM messages WHERE ts>? AND is_premium=1", (1000,)),
+    ("SELECT mode, COUNT(*) FROM messages WHERE ts>? GROUP BY mode", (1000,)),
+])
+def test_hot_queries_use_covering_indexes(conn, sql, params):
+    _assert_covering(_plan(conn, sql, params))
+
+
+def test_legacy_indexes_dropped(conn):
+    """Old single-column indexes are redundant with the covering ones"""
+    names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    assert "idx_messages_ts" not in names
+    assert {"idx_messages_ts_cover", "idx_messages_user_ts", "idx_payments_ts_cover",
+            "idx_payments_user_cover"} <= names
+
+
+def test_user_stats_single_query(conn, monkeypatch):
+    """get_user_stats returns the same totals from one statement"""
+    statements = []
+    real_conn = db._conn
+
+    def traced():
+        c = real_conn()
+        c.set_trace_callback(statements.append)
+        return c
+
+    monkeypatch.setattr(db, "_conn", traced)
+    stats = db.get_user_stats(3)
+    assert stats == {"user_id": "3", "total_messages": 29, "first_seen": 1003,
+                     "last_seen": 1199, "total_paid_cents": 3 * 999}
+    assert len([s for s in statements if s.lstrip().upper().startswith("SELECT")]) == 1
+    assert db.get_user_stats("nobody")["total_messages"] == 0
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Test script for the buffered metrics writer
+Verifies batching, overflow drop policies, payment durability and shutdown flush.
+"""
+
+import sys
+import time
+import sqlite3
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.metrics.writer import MetricsWriter, DROP_NEWEST, DROP_OLDEST
+
+
+def _writer(tmp_path, **kwargs):
+    db_path = str(tmp_path / "metrics.db")
+    setup = sqlite3.connect(db_path)
+    setup.execute("CREATE TABLE messages(ts INTEGER, user_id TEXT, is_premium INTEGER, mode TEXT)")
+    setup.execute("CREATE TABLE payments(ts INTEGER, user_id TEXT, amount_cents INTEGER, currency TEXT)")
+    setup.commit()
+    setup.close()
+
+    def connect():
+        return sqlite3.connect(db_path, check_same_thread=False)
+
+    def write_batch(c, batch):
+        for kind, row in batch:
+            c.execute(f"INSERT INTO {kind} VALUES(?,?,?,?)", row)
+
+    return MetricsWriter(connect, write_batch, **kwargs), db_path
+
+
+def _count(db_path, table):
+    c = sqlite3.connect(db_path)
+    try:
+        return c.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        c.close()
+
+
+def test_flush_writes_batch(tmp_path):
+    """Explicit flush writes everything pending in one transaction"""
+    w, db_path = _writer(tmp_path, flush_interval_ms=60_000, flush_batch=10_000)
+    for i in range(100):
+        w.submit("messages", (i, str(i), 0, "SAFE"))
+    assert w.flush() == 100
+    assert _count(db_path, "messages") == 100
+    assert w.stats()["flushes"] == 1
+    w.close()
+
+
+def test_background_flush_on_interval(tmp_path):
+    """The writer thread flushes on its own after the interval"""
+    w, db_path = _writer(tmp_path, flush_interval_ms=20, flush_batch=10_000)
+    w.submit("messages", (1, "1", 0, "SAFE"))
+    deadline = time.time() + 2
+    while _count(db_path, "messages") == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    assert _count(db_path, "messages") == 1
+    w.close()
+
+
+def test_drop_oldest_and_newest(tmp_path):
+    """Overflow drops by policy and is counted"""
+    for policy, expected_first in ((DROP_OLDEST, 2), (DROP_NEWEST, 0)):
+        (tmp_path / policy).mkdir()
+        w, _ = _writer(tmp_path / policy, max_events=3, flush_interval_ms=60_000,
+                       flush_batch=10_000, drop_policy=policy)
+        # Hold the buffer full without letting the thread drain it
+        w._thread = object()
+        for i in range(5):
+            w.submit("messages", (i, str(i), 0, "SAFE"))
+        pending = list(w._buf)
+        assert len(pending) == 3
+        assert pending[0][1][0] == expected_first
+        assert w.stats()["dropped"] == 2
+        w._thread = None
+        w.close()
+
+
+def test_payments_are_never_dropped(tmp_path):
+    """A payment on a full buffer forces a synchronous flush instead of a drop"""
+    w, db_path = _writer(tmp_path, max_events=2, flush_interval_ms=60_000, flush_batch=10_000)
+    w._thread = object()
+    w.submit("messages", (1, "1", 0, "SAFE"))
+    w.submit("messages", (2, "2", 0, "SAFE"))
+    w.submit("payments", (3, "3", 999, "usd"), droppable=False)
+    assert w.stats()["dropped"] == 0
+    assert _count(db_path, "payments") == 1
+    assert _count(db_path, "messages") == 2
+    w._thread = None
+    w.close()
+
+
+def test_close_flushes_pending(tmp_path):
+    """Shutdown persists everything still buffered"""
+    w, db_path = _writer(tmp_path, flush_interval_ms=60_000, flush_batch=10_000)
+    for i in range(10):
+        w.submit("messages", (i, str(i), 0, "SAFE"))
+    w.close()
+    assert _count(db_path, "messages") == 10
+    # Late events after shutdown are written through
+    w.submit("messages", (11, "11", 0, "SAFE"))
+    assert _count(db_path, "messages") == 11
+
+
+def test_failed_flush_is_retried(tmp_path):
+    """A failed write puts the batch back; on overflow only droppable events go"""
+    w, db_path = _writer(tmp_path, max_events=4, flush_interval_ms=60_000, flush_batch=10_000)
+    w._thread = object()
+    write_batch, broken = w._write_batch, [True]
+
+    def flaky(c, batch):
+        if broken[0]:
+            raise sqlite3.OperationalError("disk I/O error")
+        write_batch(c, batch)
+    w._write_batch = flaky
+
+    w.submit("payments", (1, "1", 999, "usd"), droppable=False)
+    for i in range(3):
+        w.submit("messages", (i, str(i), 0, "SAFE"))
+    assert w.flush() == 0 and w.stats()["pending"] == 4
+    w.submit("messages", (3, "3", 0, "SAFE"))  # full: the oldest message goes, not the payment
+    assert w.flush() == 0
+    assert [e[1][0] for e in w._buf] == [1, 1, 2, 3] and w.stats()["dropped"] == 1
+
+    broken[0] = False
+    assert w.flush() == 4
+    assert _count(db_path, "payments") == 1 and _count(db_path, "messages") == 3
+    w._thread = None
+    w.close()
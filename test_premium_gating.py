@@ -24,8 +24,8 @@ print("=" * 70)
 # Test 1: Database schema
 print("\n✓ Test 1: Database schema includes modes")
 db = _load_db()
-assert "premium_users" in db, "Missing premium_users"
-assert "free_users" in db, "Missing free_users"
+assert "premium" in db, "Missing premium"
+assert "free" in db, "Missing free"
 assert "modes" in db, "Missing modes"
 print(f"  Database keys: {list(db.keys())}")
 print("  ✅ PASS")
@@ -141,8 +141,8 @@ users_path = Path("data/users.json")
 assert users_path.exists(), "data/users.json does not exist"
 with open(users_path) as f:
     data = json.load(f)
-print(f"  Premium users: {len(data.get('premium_users', []))}")
-print(f"  Free users: {len(data.get('free_users', []))}")
+print(f"  Premium users: {len(data.get('premium', {}))}")
+print(f"  Free users: {len(data.get('free', {}))}")
 print(f"  Modes stored: {len(data.get('modes', {}))}")
 print("  ✅ PASS")
 
@@ -167,7 +167,7 @@ print("     - Send /status → See 'Free Tier'")
 print("     - Try to switch to FLIRTY → See 'Premium only' alert")
 print("     - Send message in SAFE mode → Get short reply")
 print("     - Send /upgrade → Get Stripe checkout URL")
-print("  3. As PREMIUM user (simulate by adding to premium_users):")
+print("  3. As PREMIUM user (simulate by adding a premium record):")
 print("     - Send /start → See all modes unlocked, no upgrade button")
 print("     - Send /status → See 'Premium Active'")
 print("     - Switch to FLIRTY → Works")
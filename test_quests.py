@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Test script for the quest engine
+Checks multi-keyword matching, once-per-window completion and claiming,
+daily/timed resets, legacy quests.json files, write-on-change and
+workers sharing one journal across compactions.
+"""
+
+import sys
+import json
+import random
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.game import quests
+from src.game.keywords import KeywordMatcher
+from src.game.quests import QuestEngine
+
+DAY = 86400
+NOON = 1_700_000_000 // DAY * DAY + DAY // 2  # some day, 12:00 UTC
+
+DEFS = [
+    {"id": "greet", "text": "Say good morning", "xp": 10, "key": "good morning", "reset": "daily"},
+    {"id": "morning", "text": "Mention the morning", "xp": 5, "key": "morning"},
+    {"id": "feel", "text": "Share a feeling", "xp": 15, "keys": ["I feel", "I'm feeling"]},
+    {"id": "event", "text": "Valentine's event", "xp": 50, "key": "valentine",
+     "starts": NOON - DAY, "ends": NOON + DAY},
+    {"id": "hourly", "text": "Say hi", "xp": 1, "key": "hi luna", "every": 3600},
+]
+
+
+def test_matcher_agrees_with_substring_search():
+    rng = random.Random(5)
+    for _ in range(500):
+        keys = ["".join(rng.choice("ab ") for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 8))]
+        text = "".join(rng.choice("abAB ") for _ in range(rng.randint(0, 30)))
+        matcher = KeywordMatcher((k, i) for i, k in enumerate(keys))
+        assert matcher.find(text) == {i for i, k in enumerate(keys) if k in text.lower()}
+
+
+def test_complete_and_claim_once_per_window(tmp_path):
+    engine = QuestEngine(DEFS, tmp_path / "quests.json")
+    done = engine.autocomplete(1, "GOOD MORNING babe, I'm feeling great", now=NOON)
+    assert {q["id"] for q in done} == {"greet", "morning", "feel"}  # overlapping keys both count
+    assert engine.autocomplete(1, "good morning again", now=NOON + 60) == []
+
+    assert engine.claim(1, "greet", now=NOON)
+    assert not engine.claim(1, "greet", now=NOON)  # already claimed
+    assert not engine.claim(1, "event", now=NOON)  # not done
+    assert not engine.claim(1, "nope", now=NOON)
+
+    # Next day: the daily quest is open again, one-time quests stay done
+    tomorrow = NOON + DAY
+    status = {q["id"]: q for q in engine.status(1, now=tomorrow)}
+    assert not status["greet"]["done"] and not status["greet"]["claimed"]
+    assert status["morning"]["done"]
+    assert [q["id"] for q in engine.autocomplete(1, "good morning", now=tomorrow)] == ["greet"]
+    assert engine.claim(1, "greet", now=tomorrow)
+
+
+def test_timed_and_repeating_quests(tmp_path):
+    engine = QuestEngine(DEFS, tmp_path / "quests.json")
+    assert "event" not in {q["id"] for q in engine.status(1, now=NOON + 2 * DAY)}
+    assert engine.autocomplete(1, "happy valentine", now=NOON + 2 * DAY) == []
+    assert [q["id"] for q in engine.autocomplete(1, "happy valentine", now=NOON)] == ["event"]
+
+    assert engine.autocomplete(1, "hi luna", now=NOON + 10)
+    assert not engine.autocomplete(1, "hi luna", now=NOON + 3000)
+    assert engine.autocomplete(1, "hi luna", now=NOON + 3700)
+
+
+def test_persists_only_on_change_and_reads_legacy(tmp_path):
+    path = tmp_path / "quests.json"
+    path.write_text(json.dumps({"progress": {}, "completed": {"7": ["morning", "greet"]}}))
+    engine = QuestEngine(DEFS, path)
+    for _ in range(100):
+        engine.autocomplete(7, "nothing to see here", now=NOON)
+        engine.autocomplete(7, "lovely morning", now=NOON)  # already done (legacy)
+    assert engine.writes == 0
+    status = {q["id"]: q["done"] for q in engine.status(7, now=NOON)}
+    assert status["morning"] and not status["greet"]  # legacy daily completion has expired
+
+    engine.autocomplete(7, "good morning", now=NOON)
+    engine.claim(7, "greet", now=NOON)
+    assert engine.writes == 2
+    reloaded = QuestEngine(DEFS, path)
+    assert {q["id"]: q["claimed"] for q in reloaded.status(7, now=NOON)}["greet"]
+
+
+def test_module_api(tmp_path, monkeypatch):
+    monkeypatch.setattr(quests, "_engine", QuestEngine(quests.PRE, tmp_path / "quests.json"))
+    done = quests.try_autocomplete(42, "Good morning! I feel sleepy")
+    assert {q["id"] for q in done} == {"daily_greet", "share_thought"}
+    assert quests.claim(42, "daily_greet") and not quests.claim(42, "daily_greet")
+    assert quests.get_quest_xp("share_thought") == 15
+    assert all(q["done"] for q in quests.list_quests(42))
+
+
+def test_journal_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(quests, "COMPACT_EVERY", 3)
+    path = tmp_path / "quests.json"
+    engine = QuestEngine(DEFS, path)
+    engine.autocomplete(1, "good morning, I feel fine", now=NOON)  # 3 changes -> snapshot
+    assert path.exists() and not path.with_suffix(".journal").exists()
+    engine.claim(1, "feel", now=NOON)
+    assert len(path.with_suffix(".journal").read_text().splitlines()) == 1
+    with open(path.with_suffix(".journal"), "a") as f:
+        f.write('["completed", "2", "mor')  # torn write
+    reloaded = {q["id"]: q for q in QuestEngine(DEFS, path).status(1, now=NOON)}
+    assert reloaded["feel"]["claimed"] and reloaded["greet"]["done"] and not reloaded["greet"]["claimed"]
+
+
+def test_workers_share_progress(tmp_path, monkeypatch):
+    """Engines on one path (as in two gunicorn workers) see each other's changes"""
+    monkeypatch.setattr(quests, "COMPACT_EVERY", 3)
+    path = tmp_path / "quests.json"
+    a, b = QuestEngine(DEFS, path), QuestEngine(DEFS, path)
+    assert b.status(1, now=NOON)  # b has loaded its state
+    assert [q["id"] for q in a.autocomplete(1, "I feel great", now=NOON)] == ["feel"]
+    assert b.autocomplete(1, "I feel great", now=NOON) == []  # already done through a
+    assert b.claim(1, "feel", now=NOON)
+    assert not a.claim(1, "feel", now=NOON)  # claimed once, not once per worker
+
+    a.autocomplete(2, "good morning", now=NOON)  # 4 changes: a compacts
+    b.autocomplete(3, "valentine", now=NOON)
+    assert b.reloads == 1 and not a.claim(3, "feel", now=NOON)
+    assert a.claim(3, "event", now=NOON) and a.claim(2, "greet", now=NOON)
+    fresh = QuestEngine(DEFS, path)
+    assert {q["id"]: q["claimed"] for q in fresh.status(2, now=NOON)}["greet"]
+    assert [q["id"] for q in fresh.status(3, now=NOON) if q["claimed"]] == ["event"]
+    assert [q["id"] for q in fresh.status(1, now=NOON) if q["claimed"]] == ["feel"]
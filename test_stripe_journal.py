@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Test script for the Stripe event journal
+Posts locally signed fake events to the webhook blueprint and checks the
+ack-first flow, de-duplication of redeliveries, signature and payload
+rejection, the background applier's retries and polling, workers claiming
+events from one journal, and rebuilding users.json by replay.
+"""
+
+import sys
+import hmac
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+
+import pytest
+from flask import Flask
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent / "scripts"))
+
+import stripe_replay
+from src.metrics import db as metrics
+from src.payments import journal as journal_mod
+from src.payments import stripe_webhook
+from src.payments.journal import EventApplier, EventJournal
+
+SECRET = "whsec_test_local"
+
+
+def sign(payload: bytes, secret: str = SECRET, ts: int = None) -> str:
+    """Stripe-Signature header, computed the way Stripe does"""
+    ts = int(time.time()) if ts is None else ts
+    digest = hmac.new(secret.encode(), f"{ts}.".encode() + payload, hashlib.sha256).hexdigest()
+    return f"t={ts},v1={digest}"
+
+
+def checkout_event(event_id: str, uid: str, tier: str = "GOLD", amount: int = 1999) -> bytes:
+    return json.dumps({
+        "id": event_id,
+        "object": "event",
+        "type": "checkout.session.completed",
+        "created": 1_700_000_000,
+        "data": {"object": {
+            "object": "checkout.session",
+            "metadata": {"telegram_user_id": uid, "tier": tier},
+            "amount_total": amount,
+            "currency": "usd",
+        }},
+    }).encode()
+
+
+@pytest.fixture
+def hook(tmp_path, monkeypatch):
+    journal = EventJournal(tmp_path / "stripe_events.db")
+    applier = EventApplier(journal, stripe_webhook.apply_event, retries=2, retry_delay=0)
+    payments = []
+    monkeypatch.setattr(stripe_webhook, "ENDPOINT_SECRET", SECRET)
+    monkeypatch.setattr(stripe_webhook, "DB_PATH", tmp_path / "users.json")
+    monkeypatch.setattr(journal_mod, "_journal", journal)
+    monkeypatch.setattr(stripe_webhook, "_applier", applier)
+    wakes = []
+    monkeypatch.setattr(applier, "wake", lambda: wakes.append(1))  # tests drive the applier
+    applier.wakes = wakes
+    monkeypatch.setattr(metrics, "log_payment", lambda *a: payments.append(a))
+
+    app = Flask(__name__)
+    app.register_blueprint(stripe_webhook.bp)
+    yield app.test_client(), journal, applier, payments, tmp_path / "users.json"
+    journal.close()
+
+
+def post(client, payload: bytes, header: str = None):
+    return client.post("/stripe/webhook", data=payload,
+                       headers={"Stripe-Signature": header or sign(payload), "Content-Type": "application/json"})
+
+
+def test_ack_first_then_apply(hook):
+    client, journal, applier, payments, users = hook
+    start = time.perf_counter()
+    resp = post(client, checkout_event("evt_1", "42"))
+    assert resp.status_code == 200 and resp.get_json() == {"ok": True, "duplicate": False}
+    assert time.perf_counter() - start < 0.5
+    assert journal.stats()["pending"] == 1
+    assert not users.exists()  # nothing applied inside the request
+
+    assert applier.apply_pending() == 1
+    db = json.loads(users.read_text())
+    assert list(db["premium"]) == ["42"] and db["premium"]["42"]["tier"] == "GOLD"
+    assert payments == [("42", 1999, "usd")]
+    assert journal.stats() == {"pending": 0, "applied": 1, "failed": 0}
+
+
+def test_redelivery_and_bad_signatures(hook):
+    client, journal, applier, payments, users = hook
+    payload = checkout_event("evt_2", "7")
+    assert post(client, payload).get_json()["duplicate"] is False
+    assert post(client, payload).get_json()["duplicate"] is True
+    applier.apply_pending()
+    # A new event id for an already premium user changes nothing either
+    post(client, checkout_event("evt_3", "7"))
+    applier.apply_pending()
+    assert list(json.loads(users.read_text())["premium"]) == ["7"]
+    assert len(payments) == 1
+
+    assert post(client, checkout_event("evt_4", "8"), sign(b"other")).status_code == 400
+    assert post(client, checkout_event("evt_5", "8"), sign(checkout_event("evt_5", "8"), "whsec_wrong")).status_code == 400
+    old = checkout_event("evt_6", "8")
+    assert post(client, old, sign(old, ts=int(time.time()) - 3600)).status_code == 400  # outside tolerance
+    no_id = json.dumps({"object": "event", "type": "checkout.session.completed"}).encode()
+    assert post(client, no_id).status_code == 400
+    assert sum(journal.stats().values()) == 2
+    assert len(applier.wakes) == 3  # redeliveries wake the applier too
+
+
+def test_applier_polls_without_wakeups(tmp_path):
+    """Events journaled without a wake (before a restart, by another worker) are applied"""
+    journal = EventJournal(tmp_path / "stripe_events.db")
+    applied = []
+    applier = EventApplier(journal, applied.append, retry_delay=0, poll_interval=0.05)
+    applier.wake()
+    journal.record("evt_p", "checkout.session.completed", None, checkout_event("evt_p", "9").decode())
+    deadline = time.time() + 2
+    while not applied and time.time() < deadline:
+        time.sleep(0.01)
+    applier.close()
+    journal.close()
+    assert [e["id"] for e in applied] == ["evt_p"]
+
+
+def test_workers_apply_each_event_once(tmp_path):
+    """Appliers in two workers (separate connections) never apply an event twice"""
+    path = tmp_path / "stripe_events.db"
+    journals = [EventJournal(path), EventJournal(path)]
+    for i in range(30):
+        journals[0].record(f"evt_{i}", "checkout.session.completed", None, checkout_event(f"evt_{i}", str(i)).decode())
+    applied = []
+
+    def slow(event):
+        time.sleep(0.002)
+        applied.append(event["id"])
+    appliers = [EventApplier(j, slow, retry_delay=0) for j in journals]
+    threads = [threading.Thread(target=a.apply_pending) for a in appliers * 3]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    appliers[0].apply_pending()
+    assert applied == [f"evt_{i}" for i in range(30)]  # once each, in order
+    assert journals[1].stats() == {"pending": 0, "applied": 30, "failed": 0}
+
+    # A lease left by a worker that died is taken over once it expires
+    journals[0].record("evt_x", "checkout.session.completed", None, checkout_event("evt_x", "x").decode())
+    assert [e["id"] for e in journals[0].claim(lease_s=-1)] == ["evt_x"]
+    assert appliers[1].apply_pending() == 1 and applied[-1] == "evt_x"
+    for j in journals:
+        j.close()
+
+
+def test_failures_are_retried_then_parked(hook, monkeypatch):
+    client, journal, applier, payments, users = hook
+    post(client, checkout_event("evt_a", "1"))
+    post(client, checkout_event("evt_b", "2"))
+
+    real_save = stripe_webhook._save_db
+
+    def flaky(data):
+        raise OSError("disk full")
+    monkeypatch.setattr(stripe_webhook, "_save_db", flaky)
+    assert applier.apply_pending() == 0  # evt_a failed once; evt_b waits behind it
+    assert journal.stats()["pending"] == 2
+    assert applier.apply_pending() == 0  # second failure parks evt_a; evt_b fails once
+    assert journal.stats() == {"pending": 1, "applied": 0, "failed": 1}
+
+    monkeypatch.setattr(stripe_webhook, "_save_db", real_save)
+    assert applier.apply_pending() == 1
+    assert list(json.loads(users.read_text())["premium"]) == ["2"]
+
+    assert stripe_replay.retry(journal) == 1  # requeue the parked event
+    assert sorted(json.loads(users.read_text())["premium"]) == ["1", "2"]
+    assert [e["error"] for e in journal.events()] == [None, None]
+
+
+def test_rebuild_from_journal(hook):
+    client, journal, applier, payments, users = hook
+    for i in range(5):
+        post(client, checkout_event(f"evt_{i}", str(100 + i), tier="SILVER"))
+    applier.apply_pending()
+    assert len(payments) == 5
+
+    users.unlink()  # users.json lost
+    assert stripe_replay.rebuild(journal) == 5
+    db = json.loads(users.read_text())
+    assert list(db["premium"]) == [str(100 + i) for i in range(5)]
+    assert {r["tier"] for r in db["premium"].values()} == {"SILVER"}
+    assert len(payments) == 5  # replay does not log payments again
+
+    db["premium"]["999"] = {"tier": "", "since": 0, "expires": 0}  # granted outside Stripe
+    users.write_text(json.dumps(db))
+    stripe_replay.rebuild(journal, since=3, reset=True)
+    assert list(json.loads(users.read_text())["premium"]) == ["103", "104"]
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Test script for the async ElevenLabs client
+Runs a local aiohttp server (conftest.py) in place of the streaming
+endpoint to check sentence chunking, parallel synthesis, ordered
+concatenation, session reuse and closing sessions left on another event
+loop.
+"""
+
+import sys
+import time
+import asyncio
+import threading
+from pathlib import Path
+
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.voice import tts_elevenlabs as tts
+from conftest import FakeElevenLabs, with_server
+
+
+def test_split_sentences():
+    text = "Hey you! I missed you so much today. What have you been up to? Tell me everything, babe."
+    chunks = tts.split_sentences(text, max_chars=40)
+    assert chunks == ["Hey you! I missed you so much today.", "What have you been up to?",
+                      "Tell me everything, babe."]
+    assert tts.split_sentences(text, max_chars=500) == [text]
+    assert len(tts.split_sentences(text, max_chars=500, parts=4)) == 2  # one per parallel request, >= 40 chars
+    assert tts.split_sentences("Hey you! Miss me?", parts=4) == ["Hey you! Miss me?"]
+    long = tts.split_sentences("word " * 100, max_chars=60)
+    assert all(len(c) <= 60 for c in long)
+    assert " ".join(long) == ("word " * 100).strip()
+
+
+def test_long_reply_chunks_run_in_parallel(api):
+    fake = FakeElevenLabs(delay=0.3)
+    text = "First sentence here. Second one follows. Third and last."
+
+    async def body(url):
+        api(url)
+        client = tts.AsyncTTSClient(chunk_chars=25, concurrency=4)
+        start = time.perf_counter()
+        audio = await client.synthesize_long(text, voice_id="luna")
+        elapsed = time.perf_counter() - start
+        await client.close()
+        return audio, elapsed
+
+    audio, elapsed = asyncio.run(with_server(fake, body))
+    # One ID3 tag at the start, later tags stripped, chunks in order
+    assert audio == (b"ID3\x03\x00\x00\x00\x00\x00\x02xx<First sentence here.>"
+                     b"<Second one follows.><Third and last.>")
+    assert elapsed < 2 * fake.delay  # sequential would be 3 x delay
+    by_text = {p["text"]: p for p in fake.payloads}
+    assert by_text["Second one follows."]["previous_text"] == "First sentence here."
+    assert by_text["Second one follows."]["next_text"] == "Third and last."
+    assert "previous_text" not in by_text["First sentence here."]
+
+
+def test_session_is_reused(api):
+    fake = FakeElevenLabs(delay=0)
+
+    async def body(url):
+        api(url)
+        client = tts.AsyncTTSClient(concurrency=1)
+        for _ in range(3):
+            await client.synthesize("Hi.", voice_id="luna")
+        await client.close()
+        return client.requests
+
+    assert asyncio.run(with_server(fake, body)) == 3
+    assert len(fake.peers) == 1  # one keep-alive connection for all requests
+
+
+def test_loop_change_closes_previous_session(api):
+    """A session is closed on its own loop when another loop takes over the client"""
+    fake = FakeElevenLabs(delay=0)
+    background = asyncio.new_event_loop()
+    threading.Thread(target=background.run_forever, daemon=True).start()
+    client = tts.AsyncTTSClient(concurrency=1)
+
+    async def on_background(url):
+        api(url)
+        await client.synthesize("Hi.", voice_id="luna")
+        first = client._session
+        # a short-lived loop (asyncio.run in another thread) takes over the client
+        await asyncio.to_thread(asyncio.run, client.synthesize("Again.", voice_id="luna"))
+        await asyncio.sleep(0.05)
+        transient = client._session
+        await client.synthesize("Back.", voice_id="luna")  # that loop is gone by now
+        await client.close()
+        return first, transient
+
+    first, transient = asyncio.run_coroutine_threadsafe(with_server(fake, on_background), background).result(5)
+    background.call_soon_threadsafe(background.stop)
+    assert first.closed and transient.closed
+    assert client.requests == 3
+
+
+def test_stopped_loop_session_is_dropped(api):
+    """A session from a loop that is stopped but not closed is dropped, not driven"""
+    fake = FakeElevenLabs(delay=0)
+    background = asyncio.new_event_loop()
+    threading.Thread(target=background.run_forever, daemon=True).start()
+    client = tts.AsyncTTSClient(concurrency=1)
+    idle = asyncio.new_event_loop()
+
+    async def body(url):
+        api(url)
+        await asyncio.to_thread(idle.run_until_complete, client.synthesize("Hi.", voice_id="luna"))
+        stale = client._session
+        await client.synthesize("Again.", voice_id="luna")
+        await client.close()
+        return stale
+
+    stale = asyncio.run_coroutine_threadsafe(with_server(fake, body), background).result(5)
+    background.call_soon_threadsafe(background.stop)
+    idle.close()
+    assert stale.closed and client.requests == 2
+
+
+def test_missing_api_key(monkeypatch):
+    monkeypatch.setattr(tts, "API_KEY", None)
+    with pytest.raises(RuntimeError):
+        asyncio.run(tts.AsyncTTSClient().synthesize_long("Hello there."))
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Test script for the TTS audio cache
+Checks key normalization, whole-reply hits, phrase-level stitching, LRU
+byte cap and the daily hit-rate / characters-saved counters (buffered in
+memory and merged into stats.json).
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.voice import tts_elevenlabs as tts
+from src.voice.tts_cache import TTSCache, cache_key, normalize_text
+from conftest import FakeElevenLabs, with_server
+
+ID3 = b"ID3\x03\x00\x00\x00\x00\x00\x02xx"
+
+
+def run(fake, cache, *replies):
+    async def body(url):
+        tts.ELEVEN_API = url
+        client = tts.AsyncTTSClient(chunk_chars=60, concurrency=4, cache=cache)
+        out = [await client.synthesize_long(reply, voice_id="luna") for reply in replies]
+        await client.close()
+        return out
+
+    return asyncio.run(with_server(fake, body))
+
+
+def test_key_normalization():
+    settings = {"stability": 0.5}
+    assert normalize_text("  I’m  here\n for you — always ") == "I'm here for you - always"
+    assert cache_key("Hi  there", "luna", "m", settings) == cache_key("Hi there ", "luna", "m", settings)
+    assert cache_key("Hi there", "luna", "m", settings) != cache_key("Hi there", "rachel", "m", settings)
+    assert cache_key("Hi there", "luna", "m", settings) != cache_key("Hi there", "luna", "m", {"stability": 0.6})
+
+
+def test_repeated_reply_served_from_cache(api, tmp_path, monkeypatch):
+    monkeypatch.setattr(tts, "ELEVEN_API", tts.ELEVEN_API)
+    fake = FakeElevenLabs(delay=0)
+    cache = TTSCache(str(tmp_path), max_bytes=1_000_000, phrases=False)
+    first, second = run(fake, cache, "Hey you! I missed you.", "Hey  you! I missed you.")
+    assert first == second
+    assert len(fake.payloads) == 1
+
+    today = cache.daily_stats()[0]
+    assert (today["replies"], today["hits"], today["hit_rate"]) == (2, 1, 50.0)
+    assert today["chars_saved"] == len("Hey  you! I missed you.")
+
+    # Counters reach stats.json on flush (timer or exit) and survive a restart
+    assert not (tmp_path / "stats.json").exists()
+    assert cache.flush()
+    assert TTSCache(str(tmp_path), max_bytes=1_000_000).daily_stats()[0]["hits"] == 1
+
+
+def test_common_sentences_stitched(api, tmp_path, monkeypatch):
+    monkeypatch.setattr(tts, "ELEVEN_API", tts.ELEVEN_API)
+    fake = FakeElevenLabs(delay=0)
+    cache = TTSCache(str(tmp_path), max_bytes=1_000_000, phrase_min_seen=2)
+    greeting = "Hey you, I missed you."
+    replies = [f"{greeting} Rainy day here.", f"{greeting} Tell me about work.", f"{greeting} What's for dinner?"]
+    audio = run(fake, cache, *replies)
+
+    texts = [p["text"] for p in fake.payloads]
+    # 1st reply: greeting seen once, synthesized with its neighbour; 2nd: seen twice,
+    # synthesized alone and cached; 3rd: served from the phrase cache
+    assert texts == [replies[0], greeting, "Tell me about work.", "What's for dinner?"]
+    assert audio[2] == ID3 + f"<{greeting}>".encode() + b"<What's for dinner?>"
+    solo = next(p for p in fake.payloads if p["text"] == greeting)
+    assert "next_text" not in solo  # context-free so it can be reused anywhere
+    today = cache.daily_stats()[0]
+    assert today["phrase_hits"] == 1
+    assert today["chars_saved"] == len(greeting) + 1
+
+
+def test_byte_cap_and_disabled(api, tmp_path, monkeypatch):
+    monkeypatch.setattr(tts, "ELEVEN_API", tts.ELEVEN_API)
+    fake = FakeElevenLabs(delay=0)
+    cache = TTSCache(str(tmp_path / "small"), max_bytes=40, phrases=False)  # ~26 bytes per reply
+    run(fake, cache, "First reply.", "Second reply.", "First reply.")
+    assert len(fake.payloads) == 3  # the first reply was evicted
+    assert cache.stats()["bytes"] <= 40
+
+    off = TTSCache(str(tmp_path / "off"), max_bytes=0)
+    run(fake, off, "First reply.", "First reply.")
+    assert len(fake.payloads) == 5
+    assert off.daily_stats() == []
+
+
+def test_workers_add_to_shared_stats(tmp_path):
+    workers = [TTSCache(str(tmp_path), max_bytes=1_000_000, stats_flush_s=3600) for _ in range(2)]
+    workers[0].record(20, 0, hit=True)
+    workers[1].record(30, 30)
+    workers[1].record(10, 4, phrase_hits=1)
+    assert all(w.flush() for w in workers)
+    today = TTSCache(str(tmp_path), max_bytes=1_000_000).daily_stats()[0]
+    assert (today["replies"], today["hits"], today["phrase_hits"], today["chars_saved"]) == (3, 1, 1, 26)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Test script for the usage ledger
+Checks exact balances under 10k parallel deductions, idempotency keys,
+reserve/commit/release around slow work, crash recovery from snapshot +
+journal, seeding from the legacy JSON files, and several processes
+sharing one ledger across compactions.
+"""
+
+import sys
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.payment import ledger
+from src.payment.ledger import UsageLedger
+
+
+def test_parallel_deductions_are_exact(tmp_path):
+    book = UsageLedger(tmp_path / "ledger.json", compact_every=997)
+    users = 10
+    for u in range(users):
+        book.grant(u, "credits", 700)
+
+    # 10k taps from 32 threads: each user asks for 1000 images with 700 credits;
+    # every tenth tap is a redelivery of the previous update id
+    def tap(i):
+        u = i % users
+        key = f"img:{i - users if i % 10 == 0 and i >= users else i}"
+        return u, key, book.deduct(u, "credits", key=key)
+
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        results = list(pool.map(tap, range(10_000)))
+
+    spent = {}
+    for u, key, ok in results:
+        if ok:
+            spent.setdefault(u, set()).add(key)
+    for u in range(users):
+        assert book.balance(u, "credits") == 0
+        assert len(spent[u]) == 700  # a redelivered key never spends twice
+    assert book.stats()["compactions"] >= 7
+
+    # Reload from snapshot + journal: same balances
+    book.close()
+    reloaded = UsageLedger(tmp_path / "ledger.json")
+    assert all(reloaded.balance(u, "credits") == 0 for u in range(users))
+    reloaded.grant(5, "credits", 1)
+    assert reloaded.deduct(5, "credits", key=next(iter(spent[5])))  # remembered outcome...
+    assert reloaded.balance(5, "credits") == 1  # ...without a new spend
+
+
+def test_reserve_commit_release(tmp_path):
+    book = UsageLedger(tmp_path / "ledger.json")
+    book.grant(1, "credits", 2)
+
+    assert book.reserve(1, "credits", "a") and book.reserve(1, "credits", "b")
+    assert book.balance(1, "credits") == 0
+    assert not book.reserve(1, "credits", "c")  # both held while rendering
+    assert book.reserve(1, "credits", "a")  # retry of the same tap
+
+    assert book.commit("a") and book.commit("a")
+    assert book.release("b") and not book.release("b")
+    assert book.balance(1, "credits") == 1
+    assert not book.commit("b")
+    assert book.reservation("a") is None
+
+
+def test_parallel_reservations(tmp_path):
+    book = UsageLedger(tmp_path / "ledger.json")
+    book.grant(1, "trial", 50)
+    barrier = threading.Barrier(16)
+
+    def render(i):
+        key = f"img:{i}"
+        if i < 16:
+            barrier.wait()
+        if not book.reserve(1, "trial", key):
+            return False
+        # odd jobs fail and give the image back
+        return book.commit(key) if i % 2 == 0 else not book.release(key)
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        committed = sum(pool.map(render, range(200)))
+    # every image is either spent or back in the balance, none lost or doubled
+    assert committed + book.balance(1, "trial") == 50
+    assert committed >= 8 and book.stats()["holds"] == 0  # the 8 even jobs of the first wave
+
+
+def test_crash_recovery_and_stale_holds(tmp_path, monkeypatch):
+    path = tmp_path / "ledger.json"
+    book = UsageLedger(path, compact_every=3)
+    book.grant(1, "credits", 5)
+    book.reserve(1, "credits", "x")
+    book.deduct(1, "credits")  # 3rd entry -> snapshot, empty journal
+    book.deduct(1, "credits", key="y")
+    with open(path.with_suffix(".journal"), "a") as f:
+        f.write('[99, "add", null, "1", "cre')  # torn write
+
+    # Crash after writing the snapshot but before truncating the journal
+    snap = json.loads(path.read_text())
+    journal = path.with_suffix(".journal").read_text()
+    book.close()
+    path.with_suffix(".journal").write_text(
+        json.dumps([1, "add", None, "1", "credits", 5, 0]) + "\n" + journal)
+
+    reloaded = UsageLedger(path, hold_ttl=60)
+    assert snap["seq"] == 3
+    assert reloaded.balance(1, "credits") == 2  # 5 - hold - 2 deductions, the old entry skipped
+    assert reloaded.reservation("x") == ("1", "credits", 1)
+
+    monkeypatch.setattr(ledger.time, "time", lambda: 10**10)
+    reloaded.reserve(1, "credits", "z")  # expires the hold left by the "crash"
+    assert reloaded.reservation("x") is None
+    assert reloaded.balance(1, "credits") == 2
+
+
+def test_workers_share_one_ledger_across_compactions(tmp_path):
+    """Two ledgers on one path (as in two gunicorn workers) never diverge"""
+    workers = [UsageLedger(tmp_path / "ledger.json", compact_every=7) for _ in range(2)]
+    workers[0].grant(1, "credits", 50)
+    spent = [0, 0]
+    for i in range(60):  # alternate taps between the workers, compacting every 7 entries
+        w = i % 2
+        spent[w] += workers[w].deduct(1, "credits", key=f"img:{i}")
+    assert spent == [25, 25]
+    assert [w.balance(1, "credits") for w in workers] == [0, 0]
+    assert workers[1].deduct(1, "credits", key="img:0")  # the other worker's key: first outcome, not charged again
+    assert not workers[1].deduct(1, "credits", key="img:new")
+    assert sum(w.stats()["compactions"] for w in workers) >= 7
+    assert workers[0].stats()["reloads"] > 0 and workers[1].stats()["reloads"] > 0
+
+    restarted = UsageLedger(tmp_path / "ledger.json")
+    assert restarted.balance(1, "credits") == 0
+    for w in workers + [restarted]:
+        w.close()
+
+
+def test_opening_balances_seed_once(tmp_path):
+    calls = []
+
+    def opening():
+        calls.append(1)
+        return {("7", "credits"): 4, ("7", "trial"): 0}
+
+    path = tmp_path / "ledger.json"
+    book = UsageLedger(path, opening=opening)
+    assert book.balance(7, "credits") == 4 and book.balance(7, "trial") == 0
+    book.deduct(7, "credits")
+    book.close()
+    assert UsageLedger(path, opening=opening).balance(7, "credits") == 3
+    assert calls == [1]
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Test script for voice note transcoding
+Checks waveform packing, the VoiceNote cache format, MP3 passthrough
+without an encoder, caching of encoded notes, and (when ffmpeg is
+installed) a real MP3 -> OGG/Opus transcode.
+"""
+
+import math
+import sys
+import asyncio
+import subprocess
+from array import array
+from pathlib import Path
+
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.voice import transcode
+from src.voice import tts_elevenlabs as tts
+from src.voice.tts_cache import TTSCache
+from conftest import FakeElevenLabs, with_server
+
+
+def unpack_waveform(data, count):
+    bits = int.from_bytes(data, "little")
+    return [(bits >> (i * 5)) & 31 for i in range(count)]
+
+
+def tone_pcm(seconds=1.0, rate=transcode.SAMPLE_RATE):
+    """Sine that swells from silence to full scale"""
+    n = int(seconds * rate)
+    return array("h", (int(32000 * i / n * math.sin(2 * math.pi * 220 * i / rate)) for i in range(n))).tobytes()
+
+
+def test_waveform_packing():
+    values = [0, 31, 7, 16, 1, 30, 12, 5]
+    assert unpack_waveform(transcode.pack_waveform(values), len(values)) == values
+    assert len(transcode.pack_waveform([31] * 100)) == 63
+
+    levels = transcode.waveform_values(tone_pcm())
+    assert len(levels) == transcode.WAVEFORM_POINTS
+    assert levels[-1] == 31 and levels[0] <= 1
+    assert 13 <= levels[50] <= 17  # half-way through the swell
+    assert transcode.waveform_values(b"") == [0] * transcode.WAVEFORM_POINTS
+
+
+def test_voice_note_roundtrip():
+    note = transcode.VoiceNote(b"OggS...", transcode.OGG_MIME, 3.2, transcode.pack_waveform([5] * 100))
+    assert transcode.VoiceNote.unpack(note.pack()) == note
+    assert note.filename == "luna.ogg" and note.duration_s == 4
+    bare = transcode.VoiceNote(b"\xff\xfb", transcode.MP3_MIME)
+    assert transcode.VoiceNote.unpack(bare.pack()) == bare
+    assert bare.filename == "luna.mp3" and bare.duration_s is None
+    assert transcode.VoiceNote.unpack(b"\xff\xfb raw mp3") is None
+
+
+def test_passthrough_without_encoder(monkeypatch):
+    monkeypatch.setattr(transcode, "FFMPEG", "no-such-ffmpeg-binary")
+    before = transcode.stats()["passthrough"]
+    note = asyncio.run(transcode.transcode_async(b"\xff\xfbmp3"))
+    assert note == transcode.VoiceNote(b"\xff\xfbmp3", transcode.MP3_MIME)
+    assert transcode.stats()["passthrough"] == before + 1
+    assert not transcode.stats()["available"]
+
+
+def test_encoded_note_cached_by_text(api, tmp_path, monkeypatch):
+    monkeypatch.setattr(tts, "ELEVEN_API", tts.ELEVEN_API)
+    monkeypatch.setattr(transcode, "available", lambda: True)
+    encoded = []
+
+    def fake_transcode(mp3, bitrate_kbps=transcode.OPUS_BITRATE_KBPS):
+        encoded.append(mp3)
+        return transcode.VoiceNote(b"OggS" + mp3[-8:], transcode.OGG_MIME, 1.5, b"\x01" * 63)
+
+    monkeypatch.setattr(transcode, "transcode", fake_transcode)
+    fake = FakeElevenLabs(delay=0)
+    cache = TTSCache(str(tmp_path), max_bytes=1_000_000, phrases=False)
+
+    async def body(url):
+        tts.ELEVEN_API = url
+        client = tts.AsyncTTSClient(cache=cache)
+        notes = [await client.synthesize_voice("Miss you already.", voice_id="luna") for _ in range(2)]
+        await client.close()
+        return notes
+
+    first, second = asyncio.run(with_server(fake, body))
+    assert first == second and first.mime == transcode.OGG_MIME
+    assert len(fake.payloads) == 1 and len(encoded) == 1
+    assert cache.stats()["entries"] == 1  # the Opus note only, not the MP3 as well
+    assert cache.daily_stats()[0]["hits"] == 1
+
+
+@pytest.mark.skipif(not transcode.available(), reason="ffmpeg not installed")
+def test_real_transcode_shrinks_mp3():
+    mp3 = subprocess.run(
+        [transcode.ffmpeg_path(), "-loglevel", "error", "-f", "lavfi", "-i", "sine=frequency=220:duration=3",
+         "-c:a", "libmp3lame", "-b:a", "128k", "-f", "mp3", "pipe:1"],
+        capture_output=True, check=True).stdout
+    note = transcode.transcode(mp3)
+    assert note.audio.startswith(b"OggS") and b"OpusHead" in note.audio[:64]
+    assert abs(note.duration - 3) < 0.1
+    assert len(note.waveform) == 63
+    assert len(mp3) / len(note.audio) > 2.5
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test script for closed-form leveling and lazy bond decay
+Checks the level formula against the old level-by-level loop, batched XP
+awards, write-free profile reads and time-proportional bond decay.
+"""
+
+import sys
+import json
+from pathlib import Path
+
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.game import bond, leaderboard, xp
+
+
+@pytest.fixture
+def users(tmp_path, monkeypatch):
+    path = tmp_path / "users.json"
+    for mod in (xp, bond, leaderboard):
+        monkeypatch.setattr(mod, "USERS", path)
+    monkeypatch.setattr(leaderboard, "_index", leaderboard.LeaderboardIndex())
+    return path
+
+
+def loop_level(level, amount):
+    """The original level-by-level loop"""
+    p = {"level": level, "xp": amount}
+    while p["level"] < xp.LEVEL_CAP and p["xp"] >= xp.xp_for_next(p["level"]):
+        p["xp"] -= xp.xp_for_next(p["level"])
+        p["level"] += 1
+    return p["level"], p["xp"]
+
+
+def test_closed_form_matches_loop():
+    for total in list(range(0, 3000)) + [122_499, 122_500, 122_501, 10**6]:
+        assert xp.level_for_total(total) == loop_level(1, total)
+    assert xp.level_for_total(xp.total_xp(7, 30) + 1000) == loop_level(7, 30 + 1000)
+    assert xp.level_for_total(10**6)[0] == xp.LEVEL_CAP
+
+
+def test_apply_xp_events_single_write(users, monkeypatch):
+    writes = []
+    real_save = xp._save
+    monkeypatch.setattr(xp, "_save", lambda d: (writes.append(1), real_save(d)))
+    out = xp.apply_xp_events([(1, 60), (2, 10), (1, 60), (3, 0), (1, -5)])
+    assert len(writes) == 1
+    assert out["1"] == {"xp": 20, "level": 2, "need": 200}
+    assert out["2"]["xp"] == 10 and out["3"]["xp"] == 0
+    assert xp.get_profile(1) == out["1"]
+    assert xp.apply_xp_events([]) == {}
+    assert len(writes) == 1
+
+
+def test_profile_reads_do_not_write(users):
+    assert xp.get_profile(5) == {"xp": 0, "level": 1, "need": 100}
+    assert bond.get_bond(5) == {"score": 0, "last_update": 0}
+    assert not users.exists()
+
+    xp.gain_xp(5, 250, cooldown_sec=0)
+    before = users.stat().st_mtime_ns
+    for _ in range(3):
+        xp.get_profile(5)
+        bond.get_bond(5)
+    assert users.stat().st_mtime_ns == before
+
+
+def test_bond_decays_with_idle_time(users):
+    t0 = 1_700_000_000
+    bond.touch(9, inc=50, now=t0)
+    users_data = json.loads(users.read_text())
+    assert users_data["bond"]["9"] == {"score": 50, "last_update": t0}
+
+    day = 86400
+    assert bond.decayed(50, t0, t0 + day) == 50  # within the grace period
+    assert bond.decayed(50, t0, t0 + 2 * day) == 45
+    assert bond.decayed(50, t0, t0 + 10 * day) == 25  # five idle periods, not one
+    assert bond.decayed(50, t0, t0 + 100 * day) == 0
+
+    assert bond.touch(9, inc=1, now=t0 + 10 * day)["score"] == 26
+    assert bond.touch(9, inc=100, now=t0 + 10 * day)["score"] == bond.MAX